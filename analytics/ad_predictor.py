@@ -3,17 +3,15 @@ Facebook 社群數據分析框架 - 投廣預測模型
 識別高潛力貼文並建議投放廣告
 """
 
-import sqlite3
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
+from utils import db_utils, migrations
 from utils.config import DB_PATH
 
 
 def get_connection():
     """取得資料庫連線"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_utils.connect(DB_PATH)
 
 
 # ==================== 評分權重 ====================
@@ -268,7 +266,7 @@ def get_recommended_posts(conn, limit: int = 20, min_score: float = 30) -> List[
         SELECT p.post_id
         FROM posts p
         JOIN latest_performance lp ON p.post_id = lp.post_id
-        WHERE p.created_time >= datetime('now', '-90 days')
+        WHERE p.created_ts >= strftime('%s', 'now', '-90 days')
         ORDER BY lp.engagement_rate DESC
         LIMIT 100
     """)
@@ -308,7 +306,7 @@ def get_recent_high_performers(conn, hours: int = 48) -> List[Dict]:
         FROM posts p
         JOIN posts_performance pp ON p.post_id = pp.post_id
         LEFT JOIN posts_classification pc ON p.post_id = pc.post_id
-        WHERE p.created_time >= datetime('now', ? || ' hours')
+        WHERE p.created_ts >= strftime('%s', 'now', ? || ' hours')
         AND pp.engagement_rate >= (
             SELECT AVG(engagement_rate) * 1.5 FROM posts_performance
         )
@@ -335,13 +333,7 @@ def update_all_ad_potentials(conn):
     """
     cursor = conn.cursor()
     
-    # 確保欄位存在
-    try:
-        cursor.execute("ALTER TABLE posts_classification ADD COLUMN ad_potential_score REAL")
-        cursor.execute("ALTER TABLE posts_classification ADD COLUMN ad_recommendation TEXT")
-        conn.commit()
-    except:
-        pass  # 欄位已存在
+    # ad_potential_score / ad_recommendation 欄位由 schema 遷移建立（utils.migrations）
     
     # 取得所有貼文
     cursor.execute("SELECT post_id FROM posts_classification")
@@ -374,6 +366,7 @@ def update_all_ad_potentials(conn):
 def main():
     """示範投廣預測"""
     conn = get_connection()
+    migrations.migrate(conn)
     
     try:
         print("=== 更新投廣潛力分數 ===")
@@ -3,10 +3,10 @@ Facebook 社群數據分析框架 - 數據處理與 KPI 計算
 負責內容分類、KPI 計算、聚合統計
 """
 
-import sqlite3
 import re
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
+from utils import db_utils
 from utils.config import DB_PATH
 
 
@@ -64,9 +64,7 @@ CTA_KEYWORDS = {
 
 def get_connection():
     """取得資料庫連線"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_utils.connect(DB_PATH)
 
 
 def get_time_slot(hour: int) -> str:
@@ -316,20 +314,19 @@ def calculate_post_kpis(conn, snapshot_date: str = None):
     cursor = conn.cursor()
     
     # 取得每個貼文的最佳洞察數據（使用各指標的最大值，避免 API 回傳不完整數據）
-    # 因為 Facebook API 有時會回傳 0 值，我們取各指標歷史最大值
+    # 因為 Facebook API 有時會回傳 0 值，我們取各指標歷史最大值（post_latest_metrics.best_*）
     cursor.execute("""
         SELECT
             post_id,
-            MAX(likes_count) as likes_count,
-            MAX(comments_count) as comments_count,
-            MAX(shares_count) as shares_count,
-            MAX(post_clicks) as post_clicks,
-            MAX(post_impressions_unique) as post_impressions_unique,
-            MAX(post_reactions_like_total + post_reactions_love_total +
-                post_reactions_wow_total + post_reactions_haha_total +
-                post_reactions_sorry_total + post_reactions_anger_total) as total_reactions
-        FROM post_insights_snapshots
-        GROUP BY post_id
+            best_likes_count as likes_count,
+            best_comments_count as comments_count,
+            best_shares_count as shares_count,
+            best_post_clicks as post_clicks,
+            best_post_impressions_unique as post_impressions_unique,
+            best_post_reactions_like_total + best_post_reactions_love_total +
+                best_post_reactions_wow_total + best_post_reactions_haha_total +
+                best_post_reactions_sorry_total + best_post_reactions_anger_total as total_reactions
+        FROM post_latest_metrics
     """)
     
     posts_data = cursor.fetchall()
@@ -3,17 +3,24 @@ Facebook 社群數據分析框架 - 報表查詢工具
 提供常用分析查詢與報表產出
 """
 
-import sqlite3
 from datetime import datetime
 from typing import Dict, List
+from utils import db_utils
 from utils.config import DB_PATH
 
 
-def get_connection():
-    """取得資料庫連線"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+def get_connection(readonly: bool = False, engine: str = 'sqlite'):
+    """
+    取得資料庫連線（readonly=True 時以唯讀模式開啟，供 API 讀取報表）
+
+    engine='duckdb' 時以 DuckDB 執行報表查詢（唯讀，見 analytics.duckdb_engine），回傳的列相同
+    """
+    if engine == 'duckdb':
+        from analytics import duckdb_engine
+        return duckdb_engine.connect()
+    if engine != 'sqlite':
+        raise ValueError(f"不支援的引擎: {engine}")
+    return db_utils.connect(DB_PATH, readonly=readonly)
 
 
 # ==================== 發文時間分析 ====================
@@ -122,7 +129,7 @@ def get_best_posting_times_by_format(conn, limit: int = 30) -> List[Dict]:
             ROUND(AVG(pp.click_through_rate), 4) as avg_ctr
         FROM posts_classification pc
         JOIN posts_performance pp ON pc.post_id = pp.post_id
-        GROUP BY format_type, pc.time_slot, pc.day_of_week
+        GROUP BY COALESCE(pc.format_type, pc.topic_primary, 'unclassified'), pc.time_slot, pc.day_of_week
         ORDER BY format_type, avg_er DESC
     """)
     
@@ -142,12 +149,7 @@ def get_quadrant_analysis(conn) -> List[Dict]:
     cursor.execute("""
         WITH latest_snapshots AS (
             SELECT post_id, post_impressions_unique
-            FROM post_insights_snapshots
-            WHERE (post_id, fetch_date) IN (
-                SELECT post_id, MAX(fetch_date) 
-                FROM post_insights_snapshots 
-                GROUP BY post_id
-            )
+            FROM post_latest_metrics
         ),
         stats AS (
             SELECT 
@@ -169,12 +171,7 @@ def get_quadrant_analysis(conn) -> List[Dict]:
     cursor.execute("""
         WITH latest_insights AS (
             SELECT post_id, post_impressions_unique
-            FROM post_insights_snapshots
-            WHERE (post_id, fetch_date) IN (
-                SELECT post_id, MAX(fetch_date)
-                FROM post_insights_snapshots
-                GROUP BY post_id
-            )
+            FROM post_latest_metrics
         ),
         latest_performance AS (
             SELECT post_id, engagement_rate
@@ -267,7 +264,7 @@ def get_format_type_performance(conn) -> List[Dict]:
             SUM(CASE WHEN pp.performance_tier = 'high' THEN 1 ELSE 0 END) as high_count
         FROM posts_classification pc
         JOIN posts_performance pp ON pc.post_id = pp.post_id
-        GROUP BY format_type
+        GROUP BY COALESCE(pc.format_type, pc.topic_primary, 'unclassified')
         ORDER BY avg_er DESC
     """)
     
@@ -295,7 +292,7 @@ def get_issue_topic_performance(conn) -> List[Dict]:
             SUM(CASE WHEN pp.performance_tier = 'high' THEN 1 ELSE 0 END) as high_count
         FROM posts_classification pc
         JOIN posts_performance pp ON pc.post_id = pp.post_id
-        GROUP BY issue_topic
+        GROUP BY COALESCE(pc.issue_topic, pc.topic_secondary, 'unclassified')
         ORDER BY avg_er DESC
     """)
     
@@ -322,7 +319,7 @@ def get_format_issue_cross_performance(conn) -> List[Dict]:
             SUM(CASE WHEN pp.performance_tier IN ('viral', 'high') THEN 1 ELSE 0 END) as high_performer_count
         FROM posts_classification pc
         JOIN posts_performance pp ON pc.post_id = pp.post_id
-        GROUP BY format_type, issue_topic
+        GROUP BY COALESCE(pc.format_type, pc.topic_primary, 'unclassified'), COALESCE(pc.issue_topic, pc.topic_secondary, 'unclassified')
         HAVING post_count >= 2
         ORDER BY avg_er DESC
     """)
@@ -358,12 +355,7 @@ def get_top_posts(conn, days: int = 30, limit: int = 10) -> List[Dict]:
                    likes_count,
                    comments_count,
                    shares_count
-            FROM post_insights_snapshots
-            WHERE (post_id, fetch_date) IN (
-                SELECT post_id, MAX(fetch_date)
-                FROM post_insights_snapshots
-                GROUP BY post_id
-            )
+            FROM post_latest_metrics
         ),
         latest_performance AS (
             SELECT post_id, engagement_rate, performance_tier, percentile_rank
@@ -391,7 +383,7 @@ def get_top_posts(conn, days: int = 30, limit: int = 10) -> List[Dict]:
         JOIN posts_classification pc ON p.post_id = pc.post_id
         JOIN latest_performance lp ON p.post_id = lp.post_id
         JOIN latest_insights li ON p.post_id = li.post_id
-        WHERE p.created_time >= date('now', ? || ' days')
+        WHERE p.created_date >= date('now', ? || ' days')
         ORDER BY lp.engagement_rate DESC
         LIMIT ?
     """, (f'-{days}', limit))
@@ -431,28 +423,27 @@ def get_weekly_trends(conn, weeks: int = 52) -> List[Dict]:
     取得週度趨勢 - 週次以週一～週日為準
     """
     cursor = conn.cursor()
-    # 使用正確的週一計算：
+    # 以預先計算的 ISO 週（posts.created_week）分組，每週只計算一次週一：
     # strftime('%w') 返回 0=週日, 1=週一, ..., 6=週六
-    # 週一 = 日期 - ((weekday + 6) % 7) 天
+    # 週一 = 該週任一日期 - ((weekday + 6) % 7) 天（weekday 明確轉為整數，DuckDB 引擎不會隱式轉換文字）
     # 
-    # 使用 MAX 取得各指標最大值，避免不完整 snapshot 導致互動數為 0
+    # 使用各指標歷史最大值（post_latest_metrics.best_*），避免不完整 snapshot 導致互動數為 0
     cursor.execute("""
         WITH best_snapshots AS (
-            SELECT post_id, 
-                   MAX(post_impressions_unique) as post_impressions_unique, 
-                   MAX(likes_count) as likes_count, 
-                   MAX(comments_count) as comments_count, 
-                   MAX(shares_count) as shares_count
-            FROM post_insights_snapshots
-            GROUP BY post_id
+            SELECT post_id,
+                   best_post_impressions_unique as post_impressions_unique,
+                   best_likes_count as likes_count,
+                   best_comments_count as comments_count,
+                   best_shares_count as shares_count
+            FROM post_latest_metrics
         ),
         post_weeks AS (
-            SELECT 
-                p.post_id,
-                date(substr(p.created_time, 1, 10), 
-                     '-' || ((strftime('%w', substr(p.created_time, 1, 10)) + 6) % 7) || ' days'
-                ) as week_monday
-            FROM posts p
+            SELECT
+                created_week,
+                date(MIN(created_date), '-' || ((CAST(strftime('%w', MIN(created_date)) AS INTEGER) + 6) % 7) || ' days') as week_monday
+            FROM posts
+            WHERE created_week IS NOT NULL
+            GROUP BY created_week
         )
         SELECT
             pw.week_monday as week_start,
@@ -462,7 +453,7 @@ def get_weekly_trends(conn, weeks: int = 52) -> List[Dict]:
             SUM(bs.post_impressions_unique) as total_reach,
             SUM(bs.likes_count + bs.comments_count + bs.shares_count) as total_engagement
         FROM posts p
-        JOIN post_weeks pw ON p.post_id = pw.post_id
+        JOIN post_weeks pw ON p.created_week = pw.created_week
         JOIN posts_performance pp ON p.post_id = pp.post_id
         JOIN best_snapshots bs ON p.post_id = bs.post_id
         GROUP BY pw.week_monday
@@ -537,7 +528,7 @@ def generate_weekly_report(conn) -> str:
         FROM posts p
         JOIN posts_performance pp ON p.post_id = pp.post_id
         JOIN post_insights_snapshots pi ON p.post_id = pi.post_id
-        WHERE p.created_time >= date('now', '-7 days')
+        WHERE p.created_date >= date('now', '-7 days')
     """)
     week_stats = cursor.fetchone()
     
@@ -3,7 +3,7 @@ Facebook 社群數據分析框架 - 資料庫 Schema 擴展
 新增分類、表現、聚合、基準四張資料表
 """
 
-import sqlite3
+from utils import db_utils
 from utils.config import DB_PATH
 
 
@@ -186,9 +186,7 @@ def create_analytics_tables(conn):
 
 def get_connection():
     """取得資料庫連線"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_utils.connect(DB_PATH)
 
 
 def main():
@@ -3,43 +3,83 @@ Facebook 社群數據分析框架 - 趨勢分析模組
 追蹤貼文互動數據隨時間變化
 """
 
-import sqlite3
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import Dict, List, Optional
+from utils import db_utils, snapshot_archive
 from utils.config import DB_PATH
 
 
-def get_connection():
-    """取得資料庫連線"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+def get_connection(readonly: bool = False):
+    """取得資料庫連線（readonly=True 時以唯讀模式開啟，供 API 讀取報表）"""
+    return db_utils.connect(DB_PATH, readonly=readonly)
 
 
 # ==================== 貼文生命週期分析 ====================
 
-def get_post_lifecycle_curve(conn, post_id: str) -> List[Dict]:
+def get_post_lifecycle_curve(conn, post_id: str, archive_dir: Optional[str] = None) -> List[Dict]:
     """
     取得單一貼文的互動曲線
     
     返回每個抓取日期的互動數據，可繪製成長曲線
+    只儲存變動的 snapshot 會依 last_checked 展開為每日的階梯函數（與 post_insights_daily view 相同）
+    直接讀取 post_insights_store（day 為 1970-01-01 起算的日數），只掃描該貼文相鄰的主鍵範圍
+    已封存至 Parquet 的舊 snapshot（utils.snapshot_archive）會併入曲線，同一日期以資料庫為準
     """
     cursor = conn.cursor()
     cursor.execute("""
+        WITH RECURSIVE snapshots AS (
+            SELECT s.*
+            FROM post_keys k JOIN post_insights_store s ON s.post_key = k.post_key
+            WHERE k.post_id = ?
+        ),
+        days(start, day) AS (
+            SELECT day, day FROM snapshots
+            UNION ALL
+            SELECT d.start, d.day + 1
+            FROM days d JOIN snapshots s ON s.day = d.start
+            WHERE d.day < s.last_checked
+        )
         SELECT 
-            i.fetch_date,
+            date(d.day + 2440587.5) as fetch_date,
             i.likes_count,
             i.comments_count,
             i.shares_count,
             (i.likes_count + i.comments_count + i.shares_count) as total_engagement,
             i.post_impressions_unique as reach,
             i.post_clicks
-        FROM post_insights_snapshots i
-        WHERE i.post_id = ?
-        ORDER BY i.fetch_date ASC
+        FROM days d
+        JOIN snapshots i ON i.day = d.start
+        ORDER BY d.day ASC
     """, (post_id,))
-    
-    return [dict(row) for row in cursor.fetchall()]
+    curve = [dict(row) for row in cursor.fetchall()]
+
+    archived = snapshot_archive.read_archived_snapshots(post_id, archive_dir)
+    if not archived:
+        return curve
+    merged = {row['fetch_date']: row for row in _archived_curve(archived)}
+    merged.update((row['fetch_date'], row) for row in curve)
+    return [merged[fetch_date] for fetch_date in sorted(merged)]
+
+
+def _archived_curve(snapshots: List[Dict]) -> List[Dict]:
+    """封存的 snapshot 依 last_checked 展開為每日的曲線列（欄位同 get_post_lifecycle_curve）"""
+    rows = []
+    for snapshot in snapshots:
+        metrics = [snapshot['likes_count'], snapshot['comments_count'], snapshot['shares_count']]
+        day = date.fromisoformat(snapshot['fetch_date'])
+        last = date.fromisoformat(snapshot['last_checked'] or snapshot['fetch_date'])
+        while day <= last:
+            rows.append({
+                'fetch_date': day.isoformat(),
+                'likes_count': snapshot['likes_count'],
+                'comments_count': snapshot['comments_count'],
+                'shares_count': snapshot['shares_count'],
+                'total_engagement': None if None in metrics else sum(metrics),
+                'reach': snapshot['post_impressions_unique'],
+                'post_clicks': snapshot['post_clicks'],
+            })
+            day += timedelta(days=1)
+    return rows
 
 
 def get_posts_growth_rate(conn, days: int = 7) -> List[Dict]:
@@ -52,24 +92,24 @@ def get_posts_growth_rate(conn, days: int = 7) -> List[Dict]:
     cursor.execute("""
         WITH post_snapshots AS (
             SELECT 
-                post_id,
-                fetch_date,
+                post_key,
+                day,
                 likes_count + comments_count + shares_count as total_engagement,
-                ROW_NUMBER() OVER (PARTITION BY post_id ORDER BY fetch_date ASC) as rn_first,
-                ROW_NUMBER() OVER (PARTITION BY post_id ORDER BY fetch_date DESC) as rn_last
-            FROM post_insights_snapshots
-            WHERE fetch_date >= date('now', ? || ' days')
+                ROW_NUMBER() OVER (PARTITION BY post_key ORDER BY day ASC) as rn_first,
+                ROW_NUMBER() OVER (PARTITION BY post_key ORDER BY day DESC) as rn_last
+            FROM post_insights_store
+            WHERE day >= CAST(julianday(date('now', ? || ' days')) - 2440587.5 AS INTEGER)
         ),
         first_snapshot AS (
-            SELECT post_id, total_engagement as first_engagement, fetch_date as first_date
+            SELECT post_key, total_engagement as first_engagement, date(day + 2440587.5) as first_date
             FROM post_snapshots WHERE rn_first = 1
         ),
         last_snapshot AS (
-            SELECT post_id, total_engagement as last_engagement, fetch_date as last_date
+            SELECT post_key, total_engagement as last_engagement, date(day + 2440587.5) as last_date
             FROM post_snapshots WHERE rn_last = 1
         )
         SELECT 
-            f.post_id,
+            k.post_id,
             p.message,
             f.first_date,
             l.last_date,
@@ -82,8 +122,9 @@ def get_posts_growth_rate(conn, days: int = 7) -> List[Dict]:
                 ELSE 0 
             END as growth_rate_pct
         FROM first_snapshot f
-        JOIN last_snapshot l ON f.post_id = l.post_id
-        JOIN posts p ON f.post_id = p.post_id
+        JOIN last_snapshot l ON f.post_key = l.post_key
+        JOIN post_keys k ON f.post_key = k.post_key
+        JOIN posts p ON k.post_id = p.post_id
         WHERE f.first_date != l.last_date
         ORDER BY growth_rate_pct DESC
         LIMIT 50
@@ -99,20 +140,16 @@ def get_trending_posts(conn, hours: int = 96) -> List[Dict]:
     用於識別「正在起飛」的貼文（投廣候選）
     """
     cursor = conn.cursor()
-    # 計算每小時平均成長
-    # 注意: created_time 格式為 ISO 8601 (2026-01-14T09:06:06+0000)
-    # 需要轉換為 SQLite 可解析的格式
+    # 計算每小時平均成長（created_ts 為 UTC epoch 秒，可走索引）
     cursor.execute("""
         WITH recent_posts AS (
             SELECT
                 p.post_id,
                 SUBSTR(p.message, 1, 100) as message_preview,
                 p.created_time,
-                JULIANDAY('now') - JULIANDAY(
-                    REPLACE(REPLACE(p.created_time, 'T', ' '), '+0000', '')
-                ) as days_since_post
+                (strftime('%s', 'now') - p.created_ts) / 86400.0 as days_since_post
             FROM posts p
-            WHERE REPLACE(REPLACE(p.created_time, 'T', ' '), '+0000', '') >= datetime('now', ? || ' hours')
+            WHERE p.created_ts >= strftime('%s', 'now') - ? * 3600
         ),
         engagement_data AS (
             SELECT 
@@ -143,7 +180,7 @@ def get_trending_posts(conn, hours: int = 96) -> List[Dict]:
         JOIN engagement_data ed ON rp.post_id = ed.post_id
         ORDER BY engagement_per_hour DESC
         LIMIT 30
-    """, (f'-{hours}',))
+    """, (hours,))
     
     return [dict(row) for row in cursor.fetchall()]
 
@@ -198,7 +235,7 @@ def get_daily_engagement_summary(conn, days: int = 30) -> List[Dict]:
     cursor = conn.cursor()
     cursor.execute("""
         SELECT 
-            DATE(p.created_time) as post_date,
+            p.created_date as post_date,
             COUNT(DISTINCT p.post_id) as posts_count,
             SUM(i.likes_count + i.comments_count + i.shares_count) as total_engagement,
             SUM(i.post_impressions_unique) as total_reach,
@@ -206,7 +243,7 @@ def get_daily_engagement_summary(conn, days: int = 30) -> List[Dict]:
         FROM posts p
         JOIN post_insights_snapshots i ON p.post_id = i.post_id
         LEFT JOIN posts_performance pp ON p.post_id = pp.post_id
-        WHERE p.created_time >= date('now', ? || ' days')
+        WHERE p.created_date >= date('now', ? || ' days')
         GROUP BY post_date
         ORDER BY post_date DESC
     """, (f'-{days}',))
@@ -224,10 +261,10 @@ def get_post_age_performance(conn) -> List[Dict]:
     cursor.execute("""
         SELECT 
             CASE 
-                WHEN JULIANDAY(i.fetch_date) - JULIANDAY(DATE(p.created_time)) <= 1 THEN '0-1天'
-                WHEN JULIANDAY(i.fetch_date) - JULIANDAY(DATE(p.created_time)) <= 3 THEN '1-3天'
-                WHEN JULIANDAY(i.fetch_date) - JULIANDAY(DATE(p.created_time)) <= 7 THEN '3-7天'
-                WHEN JULIANDAY(i.fetch_date) - JULIANDAY(DATE(p.created_time)) <= 14 THEN '7-14天'
+                WHEN JULIANDAY(i.fetch_date) - JULIANDAY(p.created_date) <= 1 THEN '0-1天'
+                WHEN JULIANDAY(i.fetch_date) - JULIANDAY(p.created_date) <= 3 THEN '1-3天'
+                WHEN JULIANDAY(i.fetch_date) - JULIANDAY(p.created_date) <= 7 THEN '3-7天'
+                WHEN JULIANDAY(i.fetch_date) - JULIANDAY(p.created_date) <= 14 THEN '7-14天'
                 ELSE '14天以上'
             END as age_bucket,
             COUNT(*) as snapshot_count,
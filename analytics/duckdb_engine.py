@@ -0,0 +1,356 @@
+"""
+Facebook 社群數據分析框架 - DuckDB 分析引擎（可選）
+報表層的 OLAP 查詢（大量 GROUP BY / CTE）改由 DuckDB 欄式、向量化執行，回傳與 SQLite 相同的列。
+
+- 資料來源：SQLite 檔（以 sqlite 擴充套件唯讀 ATTACH），或 export_parquet 匯出的 Parquet 目錄
+- 兩種來源都在 DuckDB 中建立與 SQLite 同名的 view，欄位型別依 SQLite 宣告型別對應；
+  日期 / 時間維持 SQLite 的文字格式（posts.created_time 含時區位移，DuckDB 的 TIMESTAMP 會遺失）
+- ATTACH 時所有值以文字讀入再轉型（sqlite_all_varchar），REAL 欄位只保留 15 位有效數字，且每次查詢都重新掃描 SQLite 檔，
+  通常比直接查詢 SQLite 慢；報表主要使用 Parquet 匯出（數值與 SQLite 完全相同，欄式儲存，
+  見 tests/bench_report_engines.py）
+- SQLite 專屬的日期函式（date / datetime / time / strftime / julianday）改寫為由 SQLite 計算的函式，語意一致；
+  整數除法與 NULL 排序也設定為與 SQLite 相同
+- DuckDBConnection 提供報表函式使用的 cursor() / execute() / fetchone() / fetchall()，
+  列可用 row[0]、row['col'] 與 dict(row) 讀取，報表函式不需修改，傳入不同的連線即可切換引擎
+- 只供讀取；寫入仍使用 SQLite
+
+需要 duckdb（pip install duckdb）；匯出 Parquet 需要 pyarrow
+
+用法:
+    conn = analytics_reports.get_connection(readonly=True, engine='duckdb')
+    analytics_reports.get_weekly_trends(conn)
+    python -m analytics.duckdb_engine export data/parquet     # 匯出 Parquet
+    DUCKDB_SOURCE=data/parquet python main.py                  # engine=duckdb 時讀取 Parquet
+"""
+
+import functools
+import os
+import re
+import sqlite3
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils.config import DB_PATH
+from utils.db_utils import SNAPSHOT_METRIC_COLUMNS
+
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    DUCKDB_AVAILABLE = False
+
+# engine='duckdb' 的預設資料來源（SQLite 檔或 Parquet 目錄）
+DEFAULT_SOURCE = os.environ.get('DUCKDB_SOURCE', DB_PATH)
+
+# 由 SQLite 計算的函式與回傳型別
+SQLITE_FUNCTIONS = {
+    'date': 'VARCHAR',
+    'datetime': 'VARCHAR',
+    'time': 'VARCHAR',
+    'strftime': 'VARCHAR',
+    'julianday': 'DOUBLE',
+}
+
+_FUNCTION_CALL = re.compile(r'(?<![\w.])(' + '|'.join(SQLITE_FUNCTIONS) + r')\s*\(', re.IGNORECASE)
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+# post_insights_snapshots 在 SQLite 中是 post_insights_store 上的相容 view（見 utils.migrations），
+# 在 DuckDB 中以相同定義重建，避免逐列經過 SQLite 的 view
+SNAPSHOTS_VIEW = f"""
+    CREATE VIEW post_insights_snapshots AS
+    SELECT (s.post_key << 20) + s.day AS id, k.post_id,
+           CAST(DATE '1970-01-01' + CAST(s.day AS INTEGER) AS VARCHAR) AS fetch_date,
+           {', '.join(f's.{col}' for col in SNAPSHOT_METRIC_COLUMNS)},
+           CAST(DATE '1970-01-01' + CAST(s.last_checked AS INTEGER) AS VARCHAR) AS last_checked
+    FROM post_insights_store s JOIN post_keys k ON k.post_key = s.post_key
+"""
+
+
+def duckdb_type(declared: str) -> str:
+    """SQLite 宣告型別對應的 DuckDB 型別（依 SQLite 的型別親和性規則；日期與時間維持文字）"""
+    declared = (declared or '').upper()
+    if 'INT' in declared or declared == 'BOOLEAN':
+        return 'BIGINT'
+    if any(name in declared for name in ('REAL', 'FLOA', 'DOUB')):
+        return 'DOUBLE'
+    return 'VARCHAR'
+
+
+def sqlite_tables(path: str) -> Dict[str, List[tuple]]:
+    """SQLite 檔中的資料表：{表名: [(欄名, DuckDB 型別), ...]}"""
+    conn = sqlite3.connect(f"{Path(path).absolute().as_uri()}?mode=ro", uri=True)
+    try:
+        names = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+        return {name: [(row[1], duckdb_type(row[2])) for row in conn.execute(f'PRAGMA table_info("{name}")')]
+                for name in names}
+    finally:
+        conn.close()
+
+
+@functools.lru_cache(maxsize=256)
+def translate(sql: str) -> str:
+    """把 SQLite 日期函式呼叫改寫為 sqlite_<name>_<參數數>(...)（參數轉為文字，由 SQLite 計算）"""
+    literals = [match.span() for match in _STRING_LITERAL.finditer(sql)]
+    out, pos = [], 0
+    for match in _FUNCTION_CALL.finditer(sql):
+        if match.start() < pos or any(start < match.start() < end for start, end in literals):
+            continue          # 已包含在外層呼叫的參數中（遞迴改寫），或在字串常數中
+        args, end = _split_args(sql, match.end())
+        name = match.group(1).lower()
+        out.append(sql[pos:match.start()])
+        out.append(f"sqlite_{name}_{len(args)}(" +
+                   ', '.join(f"CAST({translate(arg)} AS VARCHAR)" for arg in args) + ")")
+        pos = end
+    out.append(sql[pos:])
+    return ''.join(out)
+
+
+def _split_args(sql: str, start: int):
+    """從左括號之後解析到對應的右括號，回傳 (參數列表, 右括號之後的位置)"""
+    args, depth, quote, begin = [], 0, None, start
+    for i in range(start, len(sql)):
+        char = sql[i]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            if depth == 0:
+                args.append(sql[begin:i].strip())
+                return [arg for arg in args if arg], i + 1
+            depth -= 1
+        elif char == ',' and depth == 0:
+            args.append(sql[begin:i].strip())
+            begin = i + 1
+    raise ValueError(f"無法解析的函式呼叫: {sql[start - 20:start + 40]}")
+
+
+class Row(tuple):
+    """與 sqlite3.Row 相同的讀取方式：row[0]、row['col']、dict(row)"""
+
+    def __new__(cls, columns: Dict[str, int], values):
+        row = super().__new__(cls, values)
+        row._columns = columns
+        return row
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = self._columns[key]
+        return super().__getitem__(key)
+
+    def keys(self):
+        return list(self._columns)
+
+
+def _normalize(value):
+    # DuckDB 的 DECIMAL（小數常數運算）與 BOOLEAN（比較運算）對應 SQLite 的 REAL 與 0 / 1
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+class DuckDBCursor:
+    def __init__(self, conn):
+        self._conn = conn
+        self._result = None
+        self._columns = {}
+        self._convert = []
+        self.description = None
+
+    def execute(self, sql: str, params=()):
+        self._result = self._conn.execute(translate(sql), list(params))
+        self.description = self._result.description
+        self._columns = {column[0]: i for i, column in enumerate(self.description or [])}
+        self._convert = [i for i, column in enumerate(self.description or [])
+                         if str(column[1]).startswith(('DECIMAL', 'BOOLEAN'))]
+        return self
+
+    def _row(self, values):
+        if self._convert:
+            values = list(values)
+            for i in self._convert:
+                values[i] = _normalize(values[i])
+        return Row(self._columns, values)
+
+    def fetchone(self):
+        values = self._result.fetchone()
+        return None if values is None else self._row(values)
+
+    def fetchall(self) -> List[Row]:
+        return [self._row(values) for values in self._result.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        pass
+
+
+class DuckDBConnection:
+    """報表函式使用的 sqlite3 連線介面（唯讀）"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self) -> DuckDBCursor:
+        return DuckDBCursor(self._conn)
+
+    def execute(self, sql: str, params=()) -> DuckDBCursor:
+        return self.cursor().execute(sql, params)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self._conn.close()
+
+
+# DuckDB 的 Python 函式需固定參數數
+_ARITY = {
+    1: lambda fn: lambda a: fn(a),
+    2: lambda fn: lambda a, b: fn(a, b),
+    3: lambda fn: lambda a, b, c: fn(a, b, c),
+    4: lambda fn: lambda a, b, c, d: fn(a, b, c, d),
+}
+
+
+def _register_sqlite_functions(conn):
+    # 每個連線一個 SQLite 記憶體資料庫計算日期函式；相同參數（如同一天的貼文）只計算一次，
+    # 'now' 的結果隨時間改變，不快取
+    evaluator = sqlite3.connect(':memory:', check_same_thread=False)
+
+    for name, return_type in SQLITE_FUNCTIONS.items():
+        for count, wrap in _ARITY.items():
+            sql = f"SELECT {name}({', '.join(['?'] * count)})"
+
+            def evaluate(*args, sql=sql):
+                return evaluator.execute(sql, args).fetchone()[0]
+
+            def call(*args, evaluate=evaluate, cached=functools.lru_cache(maxsize=65536)(evaluate)):
+                if any(arg and 'now' in arg.lower() for arg in args):
+                    return evaluate(*args)
+                return cached(*args)
+
+            # 無效的日期字串（如不含冒號的時區位移 +0800）在 SQLite 中回傳 NULL
+            conn.create_function(f'sqlite_{name}_{count}', wrap(call), ['VARCHAR'] * count, return_type,
+                                 null_handling='special')
+
+
+def _load_sqlite_extension(conn):
+    try:
+        conn.execute("LOAD sqlite")
+    except duckdb.Error:
+        # 無法下載擴充套件時，使用 pip 安裝的 duckdb-extension-sqlite-scanner
+        import duckdb_extension_sqlite_scanner
+        root = Path(duckdb_extension_sqlite_scanner.__file__).parent
+        conn.execute(f"LOAD '{next(root.glob('extensions/*/sqlite_scanner.duckdb_extension'))}'")
+
+
+def connect(source: Optional[str] = None) -> DuckDBConnection:
+    """
+    以 DuckDB 開啟報表資料來源
+
+    Args:
+        source: SQLite 檔或 export_parquet 匯出的目錄（預設 DUCKDB_SOURCE 環境變數或 DB_PATH）
+    """
+    if not DUCKDB_AVAILABLE:
+        raise RuntimeError("未安裝 duckdb，無法使用 DuckDB 分析引擎 (pip install duckdb)")
+
+    source = source or DEFAULT_SOURCE
+    conn = duckdb.connect()
+    # 與 SQLite 相同：整數相除取整數、ASC 時 NULL 排在最前
+    conn.execute("SET integer_division = true")
+    conn.execute("SET default_null_order = 'nulls_first_on_asc_last_on_desc'")
+    _register_sqlite_functions(conn)
+
+    if os.path.isdir(source):
+        tables = sorted(path.stem for path in Path(source).glob('*.parquet'))
+        for table in tables:
+            conn.execute(f"""CREATE VIEW "{table}" AS SELECT * FROM read_parquet('{Path(source, table + ".parquet")}')""")
+    else:
+        schema = sqlite_tables(source)
+        tables = list(schema)
+        _load_sqlite_extension(conn)
+        conn.execute("SET sqlite_all_varchar = true")
+        conn.execute(f"ATTACH '{Path(source).absolute()}' AS src (TYPE sqlite, READ_ONLY)")
+        for table, columns in schema.items():
+            select = ', '.join(f'TRY_CAST("{name}" AS {col_type}) AS "{name}"' for name, col_type in columns)
+            conn.execute(f'CREATE VIEW "{table}" AS SELECT {select} FROM src."{table}"')
+
+    if 'post_insights_store' in tables and 'post_insights_snapshots' not in tables:
+        conn.execute(SNAPSHOTS_VIEW)
+    return DuckDBConnection(conn)
+
+
+def export_parquet(directory: str, path: Optional[str] = None, chunk_size: int = 100_000) -> Dict[str, int]:
+    """
+    把 SQLite 的每個資料表匯出為 <directory>/<表名>.parquet（zstd 壓縮，型別同 connect 的 view）
+
+    數值直接由 sqlite3 取得，與 SQLite 查詢結果完全相同；先寫暫存檔再 os.replace
+
+    Returns:
+        {表名: 列數}
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = path or DB_PATH
+    arrow_types = {'BIGINT': pa.int64(), 'DOUBLE': pa.float64(), 'VARCHAR': pa.string()}
+    converters = {'BIGINT': int, 'DOUBLE': float, 'VARCHAR': str}
+    os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(f"{Path(path).absolute().as_uri()}?mode=ro", uri=True)
+    counts = {}
+    try:
+        for table, columns in sqlite_tables(path).items():
+            schema = pa.schema([(name, arrow_types[col_type]) for name, col_type in columns])
+            convert = [converters[col_type] for _, col_type in columns]
+            cursor = conn.execute(f'SELECT * FROM "{table}"')
+            target = os.path.join(directory, f'{table}.parquet')
+            tmp_path = os.path.join(directory, f'.{table}.parquet.tmp')
+            counts[table] = 0
+            with pq.ParquetWriter(tmp_path, schema, compression='zstd') as writer:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    # 空表也寫入一個空的 row group，保留欄位型別
+                    if rows or not counts[table]:
+                        writer.write_table(pa.Table.from_arrays(
+                            [[_convert(fn, row[i]) for row in rows] for i, fn in enumerate(convert)],
+                            schema=schema))
+                    if not rows:
+                        break
+                    counts[table] += len(rows)
+            os.replace(tmp_path, target)
+    finally:
+        conn.close()
+    return counts
+
+
+def _convert(fn, value):
+    # 與 TRY_CAST 相同：無法轉換的值（如整數欄位中的空字串）視為 NULL
+    if value is None:
+        return None
+    try:
+        return fn(value)
+    except (TypeError, ValueError):
+        return None
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='DuckDB 分析引擎')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export = subparsers.add_parser('export', help='把 SQLite 匯出為 Parquet（供 DUCKDB_SOURCE 使用）')
+    export.add_argument('directory')
+    export.add_argument('--db', default=None, help=f'SQLite 檔 (預設: {DB_PATH})')
+    args = parser.parse_args()
+
+    counts = export_parquet(args.directory, args.db)
+    print(f"✓ 已匯出 {len(counts)} 個資料表（{sum(counts.values()):,} 列）→ {args.directory}")
@@ -5,16 +5,23 @@ Facebook 社群數據分析框架 - 彈性查詢工具
 
 import argparse
 from datetime import datetime, timedelta
-import sqlite3
 from typing import List, Dict, Optional
+from utils import db_utils
 from utils.config import DB_PATH
 
 
-def get_connection():
-    """取得資料庫連線"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+def get_connection(readonly: bool = False, engine: str = 'sqlite'):
+    """
+    取得資料庫連線（readonly=True 時以唯讀模式開啟，供 API 讀取報表）
+
+    engine='duckdb' 時以 DuckDB 執行報表查詢（唯讀，見 analytics.duckdb_engine），回傳的列相同
+    """
+    if engine == 'duckdb':
+        from analytics import duckdb_engine
+        return duckdb_engine.connect()
+    if engine != 'sqlite':
+        raise ValueError(f"不支援的引擎: {engine}")
+    return db_utils.connect(DB_PATH, readonly=readonly)
 
 
 # ==================== 時間範圍查詢 ====================
@@ -33,23 +40,19 @@ def query_by_date_range(conn, start_date: str, end_date: str, granularity: str =
     """
     cursor = conn.cursor()
 
-    # 根據粒度選擇不同的時間分組
-    # 注意: created_time 格式為 '2025-12-11T01:30:00+0000'，需先移除時區
+    # 根據粒度選擇不同的時間分組（posts 的正規化時間欄位，UTC 日期 / ISO 週）
     if granularity == 'daily':
-        time_format = "%Y-%m-%d"
-        group_by = "SUBSTR(p.created_time, 1, 10)"
+        group_by = "p.created_date"
     elif granularity == 'weekly':
-        time_format = "%Y-W%W"
-        group_by = "strftime('%Y-W%W', SUBSTR(p.created_time, 1, 19))"
+        group_by = "p.created_week"
     elif granularity == 'monthly':
-        time_format = "%Y-%m"
-        group_by = "SUBSTR(p.created_time, 1, 7)"
+        group_by = "SUBSTR(p.created_date, 1, 7)"
     else:
         raise ValueError(f"不支援的粒度: {granularity}")
 
     query = f"""
         SELECT
-            {"strftime('" + time_format + "', SUBSTR(p.created_time, 1, 19))" if granularity in ['weekly'] else group_by} as time_period,
+            {group_by} as time_period,
             COUNT(DISTINCT p.post_id) as post_count,
 
             -- 互動指標
@@ -77,7 +80,7 @@ def query_by_date_range(conn, start_date: str, end_date: str, granularity: str =
         FROM posts p
         JOIN post_insights_snapshots pi ON p.post_id = pi.post_id
         JOIN posts_performance pp ON p.post_id = pp.post_id
-        WHERE SUBSTR(p.created_time, 1, 10) BETWEEN ? AND ?
+        WHERE p.created_date BETWEEN ? AND ?
         GROUP BY {group_by}
         ORDER BY time_period DESC
     """
@@ -97,7 +100,7 @@ def query_topic_performance(conn, start_date: str, end_date: str, topic: Optiona
     """
     cursor = conn.cursor()
 
-    where_clause = "WHERE SUBSTR(p.created_time, 1, 10) BETWEEN ? AND ?"
+    where_clause = "WHERE p.created_date BETWEEN ? AND ?"
     params = [start_date, end_date]
 
     if topic:
@@ -154,7 +157,7 @@ def query_time_slot_performance(conn, start_date: str, end_date: str) -> List[Di
         JOIN posts_classification pc ON p.post_id = pc.post_id
         JOIN posts_performance pp ON p.post_id = pp.post_id
         JOIN post_insights_snapshots pi ON p.post_id = pi.post_id
-        WHERE SUBSTR(p.created_time, 1, 10) BETWEEN ? AND ?
+        WHERE p.created_date BETWEEN ? AND ?
         GROUP BY pc.time_slot, pc.day_of_week
         HAVING post_count >= 2
         ORDER BY avg_engagement_rate DESC
@@ -178,7 +181,7 @@ def query_top_posts(conn, start_date: str, end_date: str, limit: int = 10,
     """
     cursor = conn.cursor()
 
-    where_clauses = ["SUBSTR(p.created_time, 1, 10) BETWEEN ? AND ?"]
+    where_clauses = ["p.created_date BETWEEN ? AND ?"]
     params = [start_date, end_date]
 
     if topic:
@@ -247,7 +250,7 @@ def query_comparison(conn, period1_start: str, period1_end: str,
         FROM posts p
         JOIN posts_performance pp ON p.post_id = pp.post_id
         JOIN post_insights_snapshots pi ON p.post_id = pi.post_id
-        WHERE SUBSTR(p.created_time, 1, 10) BETWEEN ? AND ?
+        WHERE p.created_date BETWEEN ? AND ?
     """
 
     # 查詢期間1
@@ -312,7 +315,7 @@ def generate_custom_report(conn, start_date: str, end_date: str, granularity: st
         FROM posts p
         JOIN posts_performance pp ON p.post_id = pp.post_id
         JOIN post_insights_snapshots pi ON p.post_id = pi.post_id
-        WHERE SUBSTR(p.created_time, 1, 10) BETWEEN ? AND ?
+        WHERE p.created_date BETWEEN ? AND ?
     """, (start_date, end_date))
 
     summary = cursor.fetchone()
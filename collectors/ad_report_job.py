@@ -0,0 +1,195 @@
+"""
+Marketing API 非同步廣告洞察報表
+以單一帳戶層級的 async insights job（level=ad、time_increment=1）取代逐一廣告的
+date_preset='maximum' 請求：送出 job、輪詢 report run 直到完成，
+再逐頁讀取結果並以 executemany 批次寫入 ad_insights（每個廣告每天一筆）。
+"""
+
+import json
+import time
+from typing import Dict, Iterator, List, Optional
+
+from utils.graph_batch import graph_base_url
+from utils.graph_client import graph_get, graph_post
+
+# 報表欄位（每列含 ad_id 與單日的 date_start / date_stop）
+REPORT_FIELDS = 'ad_id,impressions,reach,clicks,spend,cpm,cpc,ctr,actions,date_start,date_stop'
+
+# 最多往回抓的天數（Insights 最多保留 37 個月）
+MAX_HISTORY_DAYS = 37 * 30
+
+# 輪詢間隔：從 POLL_INTERVAL 秒開始，每次乘以 1.5，最多 MAX_POLL_INTERVAL 秒
+POLL_INTERVAL = 2.0
+MAX_POLL_INTERVAL = 30.0
+
+# 等待 job 完成的上限（秒）
+JOB_TIMEOUT = 1800
+
+# 結果每頁筆數
+PAGE_LIMIT = 500
+
+# 單一 job 的 ad.id 篩選上限
+AD_FILTER_LIMIT = 500
+
+JOB_COMPLETED = 'Job Completed'
+JOB_FAILED_STATUSES = ('Job Failed', 'Job Skipped')
+
+
+def submit_report_job(config: Dict, time_range: Dict[str, str], ad_ids: Optional[List[str]] = None) -> str:
+    """送出帳戶層級的 async insights job（可只篩選 ad_ids），回傳 report_run_id"""
+    url = f"{graph_base_url(config)}/{config['ad_account_id']}/insights"
+    data = {
+        'access_token': config['access_token'],
+        'level': 'ad',
+        'time_increment': 1,
+        'time_range': json.dumps(time_range),
+        'fields': REPORT_FIELDS,
+        'limit': PAGE_LIMIT,
+    }
+    if ad_ids:
+        data['filtering'] = json.dumps([{'field': 'ad.id', 'operator': 'IN', 'value': list(ad_ids)}])
+    response = graph_post(url, data=data)
+    body = response.json()
+    if 'report_run_id' not in body:
+        raise RuntimeError(f"建立報表失敗: {body.get('error', body)}")
+    return body['report_run_id']
+
+
+def wait_for_report(config: Dict, report_run_id: str, poll_interval: Optional[float] = None,
+                    timeout: Optional[float] = None, sleep=time.sleep) -> Dict:
+    """
+    輪詢 report run 直到完成
+
+    Returns:
+        最後一次的狀態 {'async_status', 'async_percent_completion', ...}
+    Raises:
+        RuntimeError: job 失敗、被略過或逾時
+    """
+    url = f"{graph_base_url(config)}/{report_run_id}"
+    params = {
+        'access_token': config['access_token'],
+        'fields': 'id,async_status,async_percent_completion',
+    }
+    deadline = time.monotonic() + (JOB_TIMEOUT if timeout is None else timeout)
+    interval = POLL_INTERVAL if poll_interval is None else poll_interval
+    while True:
+        status = graph_get(url, params=params).json()
+        async_status = status.get('async_status')
+        if async_status == JOB_COMPLETED and status.get('async_percent_completion') == 100:
+            return status
+        if async_status in JOB_FAILED_STATUSES or 'error' in status:
+            raise RuntimeError(f"報表 {report_run_id} 失敗: {status.get('error', async_status)}")
+        if time.monotonic() + interval > deadline:
+            raise RuntimeError(f"報表 {report_run_id} 逾時（{status.get('async_percent_completion', 0)}%）")
+        sleep(interval)
+        interval = min(MAX_POLL_INTERVAL, interval * 1.5)
+
+
+def iter_report_pages(config: Dict, report_run_id: str, limit: Optional[int] = None) -> Iterator[List[Dict]]:
+    """逐頁讀取報表結果（一次只保留一頁在記憶體中）"""
+    url = f"{graph_base_url(config)}/{report_run_id}/insights"
+    params = {'access_token': config['access_token'], 'limit': limit or PAGE_LIMIT}
+    while url:
+        response = graph_get(url, params=params)
+        body = response.json()
+        if 'error' in body:
+            raise RuntimeError(f"讀取報表 {report_run_id} 失敗: {body['error']}")
+        yield body.get('data', [])
+        url = body.get('paging', {}).get('next')
+        params = None
+
+
+def _insight_row(row: Dict):
+    return (
+        row.get('ad_id'),
+        row.get('date_start'),
+        row.get('date_stop'),
+        int(row.get('impressions', 0)),
+        int(row.get('reach', 0)),
+        int(row.get('clicks', 0)),
+        float(row.get('spend', 0)),
+        float(row.get('cpm', 0)),
+        float(row.get('cpc', 0)),
+        float(row.get('ctr', 0)),
+        str(row.get('actions', [])),
+    )
+
+
+def save_daily_insights(conn, rows: List[Dict]) -> int:
+    """批次寫入每日洞察（同一廣告同一天重複出現時覆寫；不 commit）"""
+    cursor = conn.cursor()
+    cursor.executemany("""
+        INSERT INTO ad_insights
+        (ad_id, date_start, date_stop, impressions, reach, clicks, spend, cpm, cpc, ctr, actions, fetch_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_DATE)
+        ON CONFLICT(ad_id, date_start, date_stop) DO UPDATE SET
+        impressions = excluded.impressions,
+        reach = excluded.reach,
+        clicks = excluded.clicks,
+        spend = excluded.spend,
+        cpm = excluded.cpm,
+        cpc = excluded.cpc,
+        ctr = excluded.ctr,
+        actions = excluded.actions,
+        fetch_date = excluded.fetch_date;
+    """, [_insight_row(row) for row in rows])
+    return len(rows)
+
+
+def drop_lifetime_rows(conn, ad_ids: List[str]) -> int:
+    """
+    刪除已有每日資料之廣告的舊版累計列（date_preset='maximum' 寫入的跨日區間），
+    避免依 ad_id 加總的報表重複計算
+    """
+    cursor = conn.cursor()
+    deleted = 0
+    for start in range(0, len(ad_ids), 500):
+        chunk = ad_ids[start:start + 500]
+        placeholders = ', '.join(['?'] * len(chunk))
+        cursor.execute(f"""
+            DELETE FROM ad_insights
+            WHERE ad_id IN ({placeholders}) AND date_start < date_stop
+        """, chunk)
+        deleted += cursor.rowcount
+    return deleted
+
+
+def collect_ad_insights_report(conn, config: Dict, time_range: Dict[str, str], ad_ids: Optional[List[str]] = None,
+                               poll_interval: Optional[float] = None, timeout: Optional[float] = None) -> Optional[Dict]:
+    """
+    以 async job 收集每日洞察（ad_ids 為 None 時為帳戶內所有廣告）
+
+    Returns:
+        {'report_run_id', 'since', 'until', 'rows', 'ads', 'pages', 'bytes'}；失敗時回傳 None（不寫入任何資料）
+    """
+    scope = f"{len(ad_ids)} 個廣告" if ad_ids else '所有廣告'
+    print(f"  報表區間: {time_range['since']} ~ {time_range['until']}（{scope}）")
+
+    try:
+        report_run_id = submit_report_job(config, time_range, ad_ids)
+        print(f"  ✓ 已建立報表 {report_run_id}，等待完成...")
+        wait_for_report(config, report_run_id, poll_interval, timeout)
+
+        rows, pages, size, delivered = 0, 0, 0, set()
+        for page in iter_report_pages(config, report_run_id):
+            rows += save_daily_insights(conn, page)
+            delivered.update(row.get('ad_id') for row in page)
+            size += sum(len(json.dumps(row)) for row in page)
+            pages += 1
+        drop_lifetime_rows(conn, sorted(delivered))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"  ✗ 廣告洞察報表失敗: {e}")
+        return None
+
+    print(f"  ✓ 寫入 {rows} 筆每日洞察（{len(delivered)} 個廣告，{pages} 頁）")
+    return {
+        'report_run_id': report_run_id,
+        'since': time_range['since'],
+        'until': time_range['until'],
+        'rows': rows,
+        'ads': len(delivered),
+        'pages': pages,
+        'bytes': size,
+    }
@@ -0,0 +1,120 @@
+"""
+廣告洞察增量水位
+記錄每個廣告已抓取到的 date_stop，下次只請求水位（減去歸因修正回溯天數）之後的區間；
+已封存 / 刪除且回溯期已過的廣告數據不會再變動，直接略過。
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from collectors.ad_report_job import MAX_HISTORY_DAYS
+
+# Facebook 會在數天內修正歸因數據，水位往前回溯的天數
+ATTRIBUTION_LOOKBACK_DAYS = 7
+
+# 不再投放的廣告狀態
+CLOSED_STATUSES = ('ARCHIVED', 'DELETED')
+
+
+def seed_watermarks(conn) -> int:
+    """尚無水位的廣告以既有的每日資料補上水位（舊版累計列不算，需重新抓取每日資料）"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT OR IGNORE INTO ad_insights_watermarks (ad_id, last_date_stop)
+        SELECT ad_id, MAX(date_stop)
+        FROM ad_insights
+        WHERE date_start = date_stop
+        GROUP BY ad_id
+    """)
+    conn.commit()
+    return cursor.rowcount
+
+
+def window_closed(last_delivery: Optional[str], last_date_stop: str,
+                  lookback_days: int = ATTRIBUTION_LOOKBACK_DAYS) -> bool:
+    """最後投放日之後的回溯期是否已完整抓取（從未投放視為已結束）"""
+    if not last_delivery:
+        return True
+    return date.fromisoformat(last_delivery) + timedelta(days=lookback_days) <= date.fromisoformat(last_date_stop)
+
+
+def plan_windows(conn, today: Optional[date] = None, lookback_days: int = ATTRIBUTION_LOOKBACK_DAYS) -> Dict:
+    """
+    依水位規劃本次要抓取的區間
+
+    已有水位的廣告從「水位 - lookback_days」開始；尚無水位的廣告共用一個區間，
+    從其中最早的建立日開始（最多往回 MAX_HISTORY_DAYS 天）。
+
+    Returns:
+        {'until': YYYY-MM-DD,
+         'windows': {since: [ad_id, ...]},
+         'skipped': 略過的 ad_id 列表,
+         'fetched_days': 本次請求的廣告日數,
+         'lifetime_days': 每次重抓完整期間時的廣告日數}
+    """
+    today = today or date.today()
+    history_start = today - timedelta(days=MAX_HISTORY_DAYS)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT a.ad_id, a.status, a.created_time, w.last_date_stop,
+               (SELECT MAX(ai.date_start) FROM ad_insights ai
+                WHERE ai.ad_id = a.ad_id AND ai.date_start = ai.date_stop AND ai.impressions > 0) as last_delivery
+        FROM ads a
+        LEFT JOIN ad_insights_watermarks w ON w.ad_id = a.ad_id
+        ORDER BY a.ad_id
+    """)
+
+    windows, skipped, new_ads = {}, [], []
+    fetched_days = lifetime_days = 0
+    new_since = today
+    for ad_id, status, created_time, last_date_stop, last_delivery in cursor.fetchall():
+        start = history_start
+        if created_time:
+            start = min(today, max(history_start, date.fromisoformat(created_time[:10])))
+        lifetime_days += (today - start).days + 1
+
+        if last_date_stop is None:
+            new_ads.append(ad_id)
+            new_since = min(new_since, start)
+            continue
+        if status in CLOSED_STATUSES and window_closed(last_delivery, last_date_stop, lookback_days):
+            skipped.append(ad_id)
+            continue
+
+        since = max(start, min(today, date.fromisoformat(last_date_stop) - timedelta(days=lookback_days)))
+        windows.setdefault(since.isoformat(), []).append(ad_id)
+        fetched_days += (today - since).days + 1
+
+    if new_ads:
+        windows.setdefault(new_since.isoformat(), []).extend(new_ads)
+        fetched_days += len(new_ads) * ((today - new_since).days + 1)
+
+    return {
+        'until': today.isoformat(),
+        'windows': windows,
+        'skipped': skipped,
+        'fetched_days': fetched_days,
+        'lifetime_days': lifetime_days,
+    }
+
+
+def update_watermarks(conn, ad_ids: Iterable[str], until: str):
+    """抓取成功後把水位推進到 until"""
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    cursor = conn.cursor()
+    cursor.executemany("""
+        INSERT INTO ad_insights_watermarks (ad_id, last_date_stop, last_fetched_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT(ad_id) DO UPDATE SET
+        last_date_stop = excluded.last_date_stop,
+        last_fetched_at = excluded.last_fetched_at;
+    """, [(ad_id, until, now) for ad_id in ad_ids])
+    conn.commit()
+
+
+def bytes_saved(plan: Dict, bytes_fetched: int) -> int:
+    """以本次每個廣告日的平均回應大小，估算相較於重抓完整期間省下的位元組數"""
+    if not plan['fetched_days']:
+        return 0
+    per_day = bytes_fetched / plan['fetched_days']
+    return int(per_day * max(0, plan['lifetime_days'] - plan['fetched_days']))
@@ -0,0 +1,161 @@
+"""
+非同步 Graph API 收集引擎
+以 asyncio + httpx 並行送出請求，透過全域並行上限與各端點 semaphore 控制負載，
+並與其他收集器共用 rate_limiter 的速率限制
+"""
+
+import asyncio
+import json
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from utils import cassette, db_utils, rate_limiter, response_cache
+from utils.graph_batch import graph_base_url, parse_insights
+
+# 全域並行上限
+DEFAULT_CONCURRENCY = 20
+
+# 各端點的並行上限（insights 較吃配額，限制較嚴）
+DEFAULT_ENDPOINT_LIMITS = {
+    'insights': 8,
+    'reactions': 10,
+    'comments': 10,
+    'object': 10,
+}
+
+
+def endpoint_of(path: str) -> str:
+    """由請求路徑判斷端點類型（例如 '{post_id}/insights' → 'insights'）"""
+    parts = path.strip('/').split('/')
+    return parts[1] if len(parts) > 1 else 'object'
+
+
+class AsyncGraphCollector:
+    """有並行上限的非同步 Graph API 用戶端"""
+
+    def __init__(self, config: Dict, concurrency: int = DEFAULT_CONCURRENCY,
+                 endpoint_limits: Optional[Dict[str, int]] = None, timeout: float = 15,
+                 limiter: Optional[rate_limiter.GraphRateLimiter] = None, max_retries: int = 3):
+        self.config = config
+        self.concurrency = concurrency
+        self.endpoint_limits = {**DEFAULT_ENDPOINT_LIMITS, **(endpoint_limits or {})}
+        self.timeout = timeout
+        self.limiter = limiter or rate_limiter.get_limiter()
+        self.max_retries = max_retries
+        self._reset_semaphores()
+
+    def _reset_semaphores(self):
+        self._global = asyncio.Semaphore(self.concurrency)
+        self._endpoints = {}
+
+    def _semaphore(self, endpoint: str) -> asyncio.Semaphore:
+        if endpoint not in self._endpoints:
+            limit = self.endpoint_limits.get(endpoint, self.concurrency)
+            self._endpoints[endpoint] = asyncio.Semaphore(limit)
+        return self._endpoints[endpoint]
+
+    async def get(self, client: httpx.AsyncClient, path: str, params: Optional[Dict] = None) -> Tuple[int, Dict]:
+        """
+        送出單一 GET 請求（遇到節流錯誤時由限制器退避後重試）
+
+        Returns:
+            (status_code, body)；連線錯誤時 status_code 為 0
+        """
+        params = {'access_token': self.config['access_token'], **(params or {})}
+        url = f"{graph_base_url(self.config)}/{path}"
+        cache = response_cache.get_cache()
+        if cache is not None:
+            entry = cache.get(url, params)
+            if entry is not None:
+                return entry['status'], json.loads(entry['content'])
+        token_limiter = rate_limiter.get_token_limiter(self.config['access_token'])
+        for attempt in range(self.max_retries + 1):
+            # 在取得 semaphore 前等待額度，避免排隊中的請求佔住並行名額
+            await self.limiter.acquire_async()
+            if token_limiter:
+                await token_limiter.acquire_async()
+            async with self._semaphore(endpoint_of(path)), self._global:
+                try:
+                    response = await client.get(url, params=params)
+                    status, body = response.status_code, response.json()
+                except (httpx.HTTPError, ValueError) as e:
+                    return 0, {'error': {'message': str(e)}}
+            throttled = self.limiter.observe(status, response.headers, body)
+            if token_limiter:
+                throttled = token_limiter.observe(status, response.headers, body) or throttled
+            if not throttled or attempt == self.max_retries:
+                if cache is not None:
+                    cache.put(url, params, status, response.headers, response.text)
+                return status, body
+
+    async def fetch_post_refresh(self, client: httpx.AsyncClient, post_id: str, metrics: List[str]) -> Tuple[Dict, Dict]:
+        """並行取得單一貼文的 insights 與基本統計，回傳 (insights, basic_stats)"""
+        insights_res, reactions_res, comments_res, shares_res = await asyncio.gather(
+            self.get(client, f"{post_id}/insights", {'metric': ','.join(metrics)}),
+            self.get(client, f"{post_id}/reactions", {'summary': 'total_count', 'limit': 0}),
+            self.get(client, f"{post_id}/comments", {'summary': 'total_count', 'limit': 0}),
+            self.get(client, post_id, {'fields': 'shares'}),
+        )
+
+        insights = parse_insights(insights_res[1]) if insights_res[0] == 200 else {}
+
+        basic_stats = {}
+        if reactions_res[0] == 200:
+            basic_stats['likes_count'] = reactions_res[1].get('summary', {}).get('total_count', 0)
+        if comments_res[0] == 200:
+            basic_stats['comments_count'] = comments_res[1].get('summary', {}).get('total_count', 0)
+        if shares_res[0] == 200:
+            basic_stats['shares_count'] = shares_res[1].get('shares', {}).get('count', 0)
+
+        return insights, basic_stats
+
+    async def refresh_posts(self, post_ids: List[str], metrics: List[str], on_result=None) -> Dict[str, Tuple[Dict, Dict]]:
+        """
+        並行更新多則貼文
+
+        Args:
+            on_result: 每則貼文完成時呼叫 on_result(post_id, insights, basic_stats)，
+                       於事件迴圈執行緒中依完成順序呼叫（可安全寫入 SQLite）
+        """
+        self._reset_semaphores()
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+
+        active = cassette.get_active()
+        transport = active.async_transport(limits=limits) if active else None
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits, transport=transport) as client:
+            async def one(post_id):
+                return post_id, await self.fetch_post_refresh(client, post_id, metrics)
+
+            results = {}
+            for future in asyncio.as_completed([one(post_id) for post_id in post_ids]):
+                post_id, (insights, basic_stats) = await future
+                results[post_id] = (insights, basic_stats)
+                if on_result:
+                    on_result(post_id, insights, basic_stats)
+            return results
+
+
+def collect_post_insights_async(conn, config: Dict, post_ids: List[str], metrics: List[str], fetch_date: str,
+                                concurrency: int = DEFAULT_CONCURRENCY,
+                                endpoint_limits: Optional[Dict[str, int]] = None) -> Tuple[int, int]:
+    """
+    以非同步引擎收集貼文 insights 並寫入資料庫（upsert 語意與同步版本相同）
+
+    Returns:
+        (success_count, skipped_count)
+    """
+    received = 0
+    writer = db_utils.BatchWriter(conn)
+
+    def save(post_id, insights, basic_stats):
+        nonlocal received
+        writer.upsert_post_insights(post_id, fetch_date, insights or {}, basic_stats)
+        received += 1
+        if received % 25 == 0:
+            print(f"  進度: {received}/{len(post_ids)}")
+
+    collector = AsyncGraphCollector(config, concurrency=concurrency, endpoint_limits=endpoint_limits)
+    with writer:
+        asyncio.run(collector.refresh_posts(post_ids, metrics, on_result=save))
+    return writer.stats['written'], writer.stats['failed']
@@ -0,0 +1,129 @@
+"""
+補收作業的檢查點
+長時間執行的補收作業（collectors.backfill_insights、scripts/fix_corrupted_insights.py）
+把每個項目的狀態、嘗試次數與最後錯誤寫入 backfill_checkpoints。
+逾時或中斷後重新執行時從中斷處繼續：已完成的項目不再抓取，失敗的項目在嘗試上限內重試。
+剩餘項目可依優先順序分成 N 份，由 N 個 worker 並行處理。
+"""
+
+import threading
+from typing import Callable, Dict, Iterable, List
+
+from utils import db_utils
+
+# 每個項目的嘗試上限，超過後不再重試（需以 reset 重新開始）
+MAX_ATTEMPTS = 3
+
+# 每個項目寫入檢查點的 SQLite 鎖等待上限（毫秒）
+BUSY_TIMEOUT_MS = 30000
+
+
+def remaining_keys(conn, job: str, keys: Iterable[str], max_attempts: int = MAX_ATTEMPTS) -> List[str]:
+    """登記項目並回傳尚未完成、且未超過嘗試上限的項目（保持原本順序）"""
+    keys = list(dict.fromkeys(keys))
+    cursor = conn.cursor()
+    cursor.executemany("INSERT OR IGNORE INTO backfill_checkpoints (job, item_key) VALUES (?, ?)",
+                       [(job, key) for key in keys])
+    conn.commit()
+    cursor.execute("""
+        SELECT item_key FROM backfill_checkpoints
+        WHERE job = ? AND (status = 'done' OR attempts >= ?)
+    """, (job, max_attempts))
+    finished = {row[0] for row in cursor.fetchall()}
+    return [key for key in keys if key not in finished]
+
+
+def record(conn, job: str, key: str, ok: bool, error: str = None):
+    """記錄一次處理結果"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE backfill_checkpoints
+        SET status = ?, attempts = attempts + 1, last_error = ?, updated_at = datetime('now')
+        WHERE job = ? AND item_key = ?
+    """, ('done' if ok else 'failed', None if ok else (error or 'no data')[:500], job, key))
+    conn.commit()
+
+
+def progress(conn, job: str) -> Dict[str, int]:
+    """各狀態的項目數"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT status, COUNT(*) FROM backfill_checkpoints WHERE job = ? GROUP BY status", (job,))
+    return {status: count for status, count in cursor.fetchall()}
+
+
+def reset(conn, job: str) -> int:
+    """清除作業的檢查點（下次執行從頭開始）"""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM backfill_checkpoints WHERE job = ?", (job,))
+    conn.commit()
+    return cursor.rowcount
+
+
+def partition(items: List, parts: int) -> List[List]:
+    """輪流分配成 parts 份（每份都保留優先順序）"""
+    parts = max(1, parts)
+    return [items[i::parts] for i in range(parts) if items[i::parts]]
+
+
+def run(job: str, planner, heap: List, process: Callable, key: Callable, parallel: int = 1,
+        progress_every: int = 25) -> Dict:
+    """
+    依優先順序處理 planner 佇列中的候選，每個項目完成後立即寫入檢查點
+
+    Args:
+        planner: collectors.call_planner.CallPlanner；預算以「已執行 + 進行中」的呼叫數計算
+        heap: planner.queue() 建立的佇列；結束時只留下未執行的候選（供 planner.defer 使用）
+        process: process(conn, candidate) -> bool，成功寫入時回傳 True，可拋出例外
+        key: key(candidate) -> 檢查點的 item_key
+        parallel: worker 數，剩餘項目依優先順序輪流分配
+
+    Returns:
+        {'executed': [candidate, ...], 'success': int, 'failed': int}
+    """
+    ranked = sorted(heap, key=lambda entry: entry[:2])
+    lock = threading.Lock()
+    state = {'executed': [], 'success': 0, 'failed': 0, 'in_flight': 0}
+    done = set()
+
+    def work(entries):
+        conn = db_utils.get_db_connection()
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        try:
+            for entry in entries:
+                candidate = entry[2]
+                with lock:
+                    if not planner.can_spend(state['in_flight'] + candidate['cost']):
+                        return
+                    state['in_flight'] += candidate['cost']
+                try:
+                    ok, error = bool(process(conn, candidate)), None
+                except Exception as e:
+                    ok, error = False, str(e)
+                    if 'timeout' not in error.lower():
+                        print(f"  ✗ {key(candidate)[-15:]}: {error[:50]}")
+                record(conn, job, key(candidate), ok, error)
+                with lock:
+                    state['in_flight'] -= candidate['cost']
+                    state['executed'].append(candidate)
+                    state['success' if ok else 'failed'] += 1
+                    done.add(id(entry))
+                    count = len(state['executed'])
+                    if count % progress_every == 0 or count == 1:
+                        print(f"\n進度: {count}/{len(ranked)} ({state['success']} 成功, {state['failed']} 失敗)")
+        finally:
+            conn.close()
+
+    parts = partition(ranked, parallel)
+    if len(parts) <= 1:
+        for part in parts:
+            work(part)
+    else:
+        threads = [threading.Thread(target=work, args=(part,)) for part in parts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    # 已排序的列表即為合法的 heap
+    heap[:] = [entry for entry in ranked if id(entry) not in done]
+    return {'executed': state['executed'], 'success': state['success'], 'failed': state['failed']}
@@ -3,30 +3,123 @@
 嘗試補收所有貼文的 insights（不限 30 天內）
 """
 
-import time
-import requests
-import sqlite3
 from datetime import datetime
-from utils.config import DB_PATH, FACEBOOK_CONFIG
+from utils.config import FACEBOOK_CONFIG
 from utils import db_utils
+from collectors import backfill_checkpoint, call_planner
+from utils.graph_batch import graph_base_url
+from utils.graph_client import graph_get
 
 
-def backfill_post_insights(limit=None, skip_existing=True):
+# Insights 指標
+POST_INSIGHTS_METRICS = [
+    'post_impressions_unique',
+    'post_clicks',
+    'post_reactions_like_total',
+    'post_reactions_love_total',
+    'post_reactions_wow_total',
+    'post_reactions_haha_total',
+    'post_reactions_sorry_total',
+    'post_reactions_anger_total',
+]
+
+# 檢查點的作業名稱（見 collectors.backfill_checkpoint）
+CHECKPOINT_JOB = 'backfill_insights'
+
+
+def backfill_one(conn, post, fetch_date):
+    """
+    補收單一貼文的 insights 與互動數
+
+    Returns:
+        是否取得並寫入任何數據
+    """
+    post_id = post['post_id']
+    days_ago = int(post['days_ago'])
+    base_url = f"{graph_base_url(FACEBOOK_CONFIG)}/{post_id}"
+    insights = {}
+    basic_stats = {}
+
+    # 取得 insights
+    params = {
+        'access_token': FACEBOOK_CONFIG['access_token'],
+        'metric': ','.join(POST_INSIGHTS_METRICS)
+    }
+
+    response = graph_get(f"{base_url}/insights", params=params, timeout=15)
+
+    if response.ok:
+        data = response.json().get('data', [])
+        for metric in data:
+            name = metric.get('name')
+            values = metric.get('values', [{}])
+            insights[name] = values[0].get('value', 0) if values else 0
+    else:
+        # API 可能不提供太舊的數據
+        error = response.json().get('error', {})
+        if 'Unsupported get request' in str(error) or response.status_code == 400:
+            # 這是正常的限制，跳過
+            pass
+        else:
+            print(f"  ⚠ {post_id[-15:]} ({days_ago}天前): {error.get('message', 'Unknown error')[:50]}")
+
+    # 取得基本統計
+    # Reactions
+    resp = graph_get(f"{base_url}/reactions", params={
+        'access_token': FACEBOOK_CONFIG['access_token'],
+        'summary': 'total_count',
+        'limit': 0
+    }, timeout=10)
+    if resp.ok:
+        basic_stats['likes_count'] = resp.json().get('summary', {}).get('total_count', 0)
+
+    # Comments
+    resp = graph_get(f"{base_url}/comments", params={
+        'access_token': FACEBOOK_CONFIG['access_token'],
+        'summary': 'total_count',
+        'limit': 0
+    }, timeout=10)
+    if resp.ok:
+        basic_stats['comments_count'] = resp.json().get('summary', {}).get('total_count', 0)
+
+    # Shares
+    resp = graph_get(base_url, params={
+        'access_token': FACEBOOK_CONFIG['access_token'],
+        'fields': 'shares'
+    }, timeout=10)
+    if resp.ok:
+        basic_stats['shares_count'] = resp.json().get('shares', {}).get('count', 0)
+
+    # 如果有任何數據，儲存
+    if insights or basic_stats:
+        return db_utils.upsert_post_insights(conn, post_id, fetch_date, insights, basic_stats)
+    return False
+
+
+def backfill_post_insights(limit=None, skip_existing=True, budget=None, deadline=None, parallel=1,
+                           restart=False):
     """
     補收歷史貼文的 insights
+
+    每則貼文完成後立即寫入檢查點，中斷後重新執行會從中斷處繼續，已完成的貼文不會再抓取
     
     Args:
         limit: 限制處理數量（None = 全部）
         skip_existing: 是否跳過已有 snapshot 的貼文
+        budget: 最多的 Graph API 呼叫數（None = 不限），用盡時其餘貼文記錄為延後
+        deadline: 執行期限秒數（None = 不限）
+        parallel: 並行的 worker 數（剩餘貼文依優先順序分配）
+        restart: 清除檢查點，從頭開始
     """
     print("=" * 60)
     print("歷史貼文 Insights 補收")
     print("=" * 60)
     print(f"執行時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = db_utils.get_db_connection()
     cursor = conn.cursor()
+    if restart:
+        print(f"已清除檢查點: {backfill_checkpoint.reset(conn, CHECKPOINT_JOB)} 筆")
     
     # 找出需要補收的貼文
     if skip_existing:
@@ -50,123 +143,62 @@ def backfill_post_insights(limit=None, skip_existing=True):
     if limit:
         posts = posts[:limit]
     
-    print(f"\n找到 {len(posts)} 篇貼文需要補收 insights")
+    # 依檢查點略過已完成（或已用完重試次數）的貼文
+    remaining = set(backfill_checkpoint.remaining_keys(conn, CHECKPOINT_JOB, [post['post_id'] for post in posts]))
+    if len(remaining) < len(posts):
+        print(f"\n從檢查點繼續: 略過 {len(posts) - len(remaining)} 篇已處理的貼文")
+    posts = [post for post in posts if post['post_id'] in remaining]
     
-    # Insights 指標
-    POST_INSIGHTS_METRICS = [
-        'post_impressions_unique',
-        'post_clicks',
-        'post_reactions_like_total',
-        'post_reactions_love_total',
-        'post_reactions_wow_total',
-        'post_reactions_haha_total',
-        'post_reactions_sorry_total',
-        'post_reactions_anger_total',
-    ]
+    print(f"\n找到 {len(posts)} 篇貼文需要補收 insights")
     
-    success_count = 0
-    failed_count = 0
     fetch_date = datetime.now().strftime('%Y-%m-%d')
     
-    for i, post in enumerate(posts, 1):
-        post_id = post['post_id']
-        days_ago = int(post['days_ago'])
-        
-        if i % 25 == 0 or i == 1:
-            print(f"\n進度: {i}/{len(posts)} ({success_count} 成功, {failed_count} 失敗)")
-        
-        insights = {}
-        basic_stats = {}
-        
-        try:
-            # 取得 insights
-            base_url = f"https://graph.facebook.com/{FACEBOOK_CONFIG['api_version']}/{post_id}/insights"
-            params = {
-                'access_token': FACEBOOK_CONFIG['access_token'],
-                'metric': ','.join(POST_INSIGHTS_METRICS)
-            }
-            
-            response = requests.get(base_url, params=params, timeout=15)
-            
-            if response.ok:
-                data = response.json().get('data', [])
-                for metric in data:
-                    name = metric.get('name')
-                    values = metric.get('values', [{}])
-                    insights[name] = values[0].get('value', 0) if values else 0
-            else:
-                # API 可能不提供太舊的數據
-                error = response.json().get('error', {})
-                if 'Unsupported get request' in str(error) or response.status_code == 400:
-                    # 這是正常的限制，跳過
-                    pass
-                else:
-                    print(f"  ⚠ {post_id[-15:]} ({days_ago}天前): {error.get('message', 'Unknown error')[:50]}")
-            
-            # 取得基本統計
-            base_url = f"https://graph.facebook.com/{FACEBOOK_CONFIG['api_version']}/{post_id}"
-            
-            # Reactions
-            resp = requests.get(f"{base_url}/reactions", params={
-                'access_token': FACEBOOK_CONFIG['access_token'],
-                'summary': 'total_count',
-                'limit': 0
-            }, timeout=10)
-            if resp.ok:
-                basic_stats['likes_count'] = resp.json().get('summary', {}).get('total_count', 0)
-            
-            # Comments
-            resp = requests.get(f"{base_url}/comments", params={
-                'access_token': FACEBOOK_CONFIG['access_token'],
-                'summary': 'total_count',
-                'limit': 0
-            }, timeout=10)
-            if resp.ok:
-                basic_stats['comments_count'] = resp.json().get('summary', {}).get('total_count', 0)
-            
-            # Shares
-            resp = requests.get(base_url, params={
-                'access_token': FACEBOOK_CONFIG['access_token'],
-                'fields': 'shares'
-            }, timeout=10)
-            if resp.ok:
-                basic_stats['shares_count'] = resp.json().get('shares', {}).get('count', 0)
-            
-            # 如果有任何數據，儲存
-            if insights or basic_stats:
-                if db_utils.upsert_post_insights(conn, post_id, fetch_date, insights, basic_stats):
-                    success_count += 1
-                else:
-                    failed_count += 1
-            else:
-                failed_count += 1
-                
-        except Exception as e:
-            failed_count += 1
-            if 'timeout' not in str(e).lower():
-                print(f"  ✗ {post_id[-15:]}: {str(e)[:50]}")
-        
-        time.sleep(0.2)  # API 速率限制
+    # 依預期資訊增益排序，在呼叫預算與執行期限內由高到低補收
+    planner = call_planner.CallPlanner(max_calls=budget, deadline_seconds=deadline)
+    posts_by_id = {post['post_id']: post for post in posts}
+    heap = planner.queue(call_planner.score_posts(conn, posts_by_id))
+    if parallel > 1:
+        print(f"並行 worker: {parallel}")
+    
+    result = backfill_checkpoint.run(
+        CHECKPOINT_JOB, planner, heap,
+        lambda worker_conn, candidate: backfill_one(worker_conn, posts_by_id[candidate['post_id']], fetch_date),
+        key=lambda candidate: candidate['post_id'], parallel=parallel
+    )
+    success_count, failed_count = result['success'], result['failed']
     
+    deferred = planner.defer(heap)
+    if deferred:
+        call_planner.record_deferred(conn, deferred, planner.stopped_by, source='backfill_insights')
+    call_planner.clear_deferred(conn, [c['post_id'] for c in result['executed']])
+    checkpoint = backfill_checkpoint.progress(conn, CHECKPOINT_JOB)
     conn.close()
     
     print("\n" + "=" * 60)
     print(f"補收完成:")
     print(f"  成功: {success_count}")
     print(f"  失敗: {failed_count}")
+    print(f"  檢查點: {checkpoint}")
+    planner.print_summary()
     print("=" * 60)
     
     return success_count, failed_count
 
 
 if __name__ == '__main__':
-    import sys
-    
-    limit = None
-    if len(sys.argv) > 1:
-        try:
-            limit = int(sys.argv[1])
-        except ValueError:
-            pass
-    
-    backfill_post_insights(limit=limit)
+    import argparse
+
+    parser = argparse.ArgumentParser(description='補收歷史貼文的 insights（可中斷後繼續）')
+    parser.add_argument('limit', type=int, nargs='?', default=None, help='限制處理數量')
+    parser.add_argument('budget', type=int, nargs='?', default=None, help='最多的 Graph API 呼叫數')
+    parser.add_argument('--parallel', type=int, default=1, metavar='N', help='並行的 worker 數 (預設: 1)')
+    parser.add_argument('--restart', action='store_true', help='清除檢查點，從頭開始')
+    parser.add_argument('--cache', nargs='?', const='data/graph_cache', default=None, metavar='DIR',
+                        help='啟用 Graph API GET 回應的磁碟快取 (與 run_pipeline --cache 共用)')
+    args = parser.parse_args()
+
+    if args.cache:
+        from utils import response_cache
+        response_cache.enable(response_cache.ResponseCache(args.cache))
+
+    backfill_post_insights(limit=args.limit, budget=args.budget, parallel=args.parallel, restart=args.restart)
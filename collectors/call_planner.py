@@ -0,0 +1,191 @@
+"""
+單次執行的 Graph API 呼叫預算規劃
+依預期資訊增益（貼文新舊、成長波動、缺漏資料、逾期天數）替候選貼文評分，
+以優先佇列由高到低執行，在呼叫預算或執行期限用盡時乾淨地停止，
+並把未執行的貼文記錄到 deferred_fetches 表，下次執行優先處理。
+
+已執行的呼叫數取自共用速率限制器的統計（batch 子請求逐一計入），
+因此列表、頁面 insights 等所有經過限制器的請求都會計入預算。
+"""
+
+import heapq
+import time
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+from collectors import refresh_scheduler
+from utils import rate_limiter
+from utils.graph_batch import REQUESTS_PER_POST
+
+# 評分權重
+WEIGHT_RECENCY = 0.35
+WEIGHT_VOLATILITY = 0.3
+WEIGHT_MISSING = 0.25
+WEIGHT_OVERDUE = 0.1
+
+
+def information_gain(age_days: float, growth: Optional[float], missing: bool, overdue_days: int = 0) -> float:
+    """
+    預期資訊增益（0-1）
+
+    Args:
+        age_days: 貼文發布天數（越新越可能變動）
+        growth: 最近兩次 snapshot 的每日相對成長率（None 表示資料不足）
+        missing: 是否沒有任何 snapshot 或最新 snapshot 缺少 insights
+        overdue_days: 超過排程到期日的天數
+    """
+    recency = 1 / (1 + max(age_days, 0) / 7)
+    volatility = min(1.0, (growth or 0) / refresh_scheduler.FAST_GROWTH)
+    overdue = min(1.0, max(overdue_days, 0) / 7)
+    return (WEIGHT_RECENCY * recency + WEIGHT_VOLATILITY * volatility
+            + WEIGHT_MISSING * (1.0 if missing else 0.0) + WEIGHT_OVERDUE * overdue)
+
+
+def score_posts(conn, post_ids: Iterable[str], today: Optional[date] = None,
+                cost: int = REQUESTS_PER_POST) -> List[Dict]:
+    """
+    依 posts / refresh_queue / 最近 snapshot 替貼文評分
+
+    Returns:
+        [{'post_id', 'score', 'cost'}, ...]
+    """
+    today = today or date.today()
+    cursor = conn.cursor()
+    candidates = []
+    for post_id in post_ids:
+        cursor.execute("""
+            SELECT p.created_time, q.next_due_date
+            FROM posts p LEFT JOIN refresh_queue q ON q.post_id = p.post_id
+            WHERE p.post_id = ?
+        """, (post_id,))
+        row = cursor.fetchone()
+        if row is None:
+            continue
+        created_time, next_due = row[0], row[1]
+
+        snapshots = refresh_scheduler.recent_snapshots(conn, post_id)
+        age_days = (today - date.fromisoformat(created_time[:10])).days if created_time else 0
+        # 最新 snapshot 沒有 reach 視為缺漏
+        missing = not snapshots or not snapshots[0][5]
+        overdue = 0
+        if next_due and next_due != refresh_scheduler.STOPPED_DATE:
+            overdue = (today - date.fromisoformat(next_due)).days
+
+        score = information_gain(age_days, refresh_scheduler.growth_per_day(snapshots), missing, overdue)
+        candidates.append({'post_id': post_id, 'score': round(score, 6), 'cost': cost})
+    return candidates
+
+
+class CallPlanner:
+    """
+    以呼叫預算與執行期限限制單次執行
+
+    Args:
+        max_calls: 本次執行最多的 Graph API 呼叫數（None 表示不限）
+        deadline_seconds: 自建立起的執行期限秒數（None 表示不限）
+        limiter: 計算已執行呼叫數的限制器（預設為共用限制器）
+    """
+
+    def __init__(self, max_calls: Optional[int] = None, deadline_seconds: Optional[float] = None,
+                 limiter: Optional[rate_limiter.GraphRateLimiter] = None):
+        self.max_calls = max_calls
+        self.deadline = time.monotonic() + deadline_seconds if deadline_seconds is not None else None
+        self.limiter = limiter or rate_limiter.get_limiter()
+        self._start_calls = self.limiter.stats['requests']
+        self.planned_calls = 0
+        self.deferred = []
+        self.stopped_by = None
+
+    @property
+    def executed_calls(self) -> int:
+        return int(self.limiter.stats['requests'] - self._start_calls)
+
+    def time_left(self) -> Optional[float]:
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def can_spend(self, cost: int) -> bool:
+        """剩餘預算與時間是否足夠再執行 cost 個呼叫（不足時記錄停止原因）"""
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.stopped_by = 'deadline'
+            return False
+        if self.max_calls is not None and self.executed_calls + cost > self.max_calls:
+            self.stopped_by = 'budget'
+            return False
+        return True
+
+    def queue(self, candidates: Iterable[Dict]) -> List:
+        """
+        建立優先佇列（score 高者優先）
+
+        規劃的呼叫數 = 建立佇列時已執行的呼叫（列表、頁面數據等）+ 佇列中所有候選的成本
+        """
+        heap = [(-c['score'], seq, c) for seq, c in enumerate(candidates)]
+        heapq.heapify(heap)
+        self.planned_calls = self.executed_calls + sum(entry[2]['cost'] for entry in heap)
+        return heap
+
+    def next_batch(self, heap: List, size: int) -> List[Dict]:
+        """
+        依優先順序取出最多 size 個候選，合計成本不超過剩餘預算
+
+        Returns:
+            候選列表；預算或期限用盡時回傳空列表（剩餘候選留在 heap 中）
+        """
+        batch, cost = [], 0
+        while heap and len(batch) < size:
+            if not self.can_spend(cost + heap[0][2]['cost']):
+                break
+            candidate = heapq.heappop(heap)[2]
+            batch.append(candidate)
+            cost += candidate['cost']
+        return batch
+
+    def take_all(self, heap: List) -> List[Dict]:
+        """一次取出預算內所有候選（非同步引擎等無法中途停止的執行方式使用）"""
+        return self.next_batch(heap, len(heap))
+
+    def defer(self, heap: List) -> List[Dict]:
+        """清空佇列，回傳依優先順序排列的未執行候選"""
+        remaining = [heapq.heappop(heap)[2] for _ in range(len(heap))]
+        self.deferred.extend(remaining)
+        return remaining
+
+    def summary(self) -> Dict:
+        return {
+            'max_calls': self.max_calls,
+            'planned_calls': self.planned_calls,
+            'executed_calls': self.executed_calls,
+            'deferred_posts': len(self.deferred),
+            'stopped_by': self.stopped_by,
+        }
+
+    def print_summary(self):
+        stats = self.summary()
+        budget = stats['max_calls'] if stats['max_calls'] is not None else '不限'
+        print(f"  API 呼叫: 規劃 {stats['planned_calls']} / 實際 {stats['executed_calls']} (預算 {budget})")
+        if stats['deferred_posts']:
+            reason = {'budget': '預算用盡', 'deadline': '超過執行期限'}.get(stats['stopped_by'], stats['stopped_by'])
+            print(f"  ⚠ 延後 {stats['deferred_posts']} 則貼文（{reason}）")
+
+
+def record_deferred(conn, candidates: List[Dict], reason: Optional[str], source: str = 'collect_post_data'):
+    """記錄本次未執行的貼文（重複延後時累計次數）"""
+    cursor = conn.cursor()
+    cursor.executemany("""
+        INSERT INTO deferred_fetches (post_id, source, reason, score, deferred_at, times_deferred)
+        VALUES (?, ?, ?, ?, datetime('now'), 1)
+        ON CONFLICT(post_id) DO UPDATE SET
+        source = excluded.source,
+        reason = excluded.reason,
+        score = excluded.score,
+        deferred_at = excluded.deferred_at,
+        times_deferred = times_deferred + 1;
+    """, [(c['post_id'], source, reason, c['score']) for c in candidates])
+    conn.commit()
+
+
+def clear_deferred(conn, post_ids: Iterable[str]):
+    """已執行的貼文移出延後清單"""
+    cursor = conn.cursor()
+    cursor.executemany("DELETE FROM deferred_fetches WHERE post_id = ?", [(post_id,) for post_id in post_ids])
+    conn.commit()
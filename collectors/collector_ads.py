@@ -3,13 +3,16 @@ Facebook Marketing API - 廣告數據收集器
 取得廣告活動數據並關聯貼文
 """
 
-import requests
-import sqlite3
 import os
 import base64
+import json
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+from collectors import ad_report_job, ad_watermarks
+from utils import db_utils
 from utils.config import DB_PATH
+from utils.graph_batch import graph_base_url
+from utils.graph_client import graph_get
 
 
 def get_marketing_token():
@@ -36,9 +39,7 @@ MARKETING_CONFIG = {
 
 def get_connection():
     """取得資料庫連線"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_utils.connect(DB_PATH)
 
 
 def setup_ad_tables(conn):
@@ -111,6 +112,15 @@ def setup_ad_tables(conn):
         )
     """)
     
+    # 廣告洞察水位（每個廣告已抓取到的 date_stop）
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ad_insights_watermarks (
+            ad_id TEXT PRIMARY KEY,
+            last_date_stop TEXT NOT NULL,
+            last_fetched_at TEXT
+        )
+    """)
+    
     # 貼文廣告標記視圖
     cursor.execute("""
         CREATE VIEW IF NOT EXISTS posts_with_ads AS
@@ -138,7 +148,7 @@ def setup_ad_tables(conn):
 
 def fetch_campaigns(config: Dict = MARKETING_CONFIG) -> List[Dict]:
     """取得廣告活動列表"""
-    url = f"https://graph.facebook.com/{config['api_version']}/{config['ad_account_id']}/campaigns"
+    url = f"{graph_base_url(config)}/{config['ad_account_id']}/campaigns"
     params = {
         'access_token': config['access_token'],
         'fields': 'id,name,objective,status,daily_budget,lifetime_budget,created_time',
@@ -146,7 +156,7 @@ def fetch_campaigns(config: Dict = MARKETING_CONFIG) -> List[Dict]:
     }
     
     try:
-        response = requests.get(url, params=params)
+        response = graph_get(url, params=params)
         response.raise_for_status()
         data = response.json()
         campaigns = data.get('data', [])
@@ -159,7 +169,7 @@ def fetch_campaigns(config: Dict = MARKETING_CONFIG) -> List[Dict]:
 
 def fetch_ads_with_posts(config: Dict = MARKETING_CONFIG) -> List[Dict]:
     """取得廣告及其關聯的貼文 ID"""
-    url = f"https://graph.facebook.com/{config['api_version']}/{config['ad_account_id']}/ads"
+    url = f"{graph_base_url(config)}/{config['ad_account_id']}/ads"
     params = {
         'access_token': config['access_token'],
         'fields': 'id,name,status,campaign_id,adset_id,creative{effective_object_story_id},created_time',
@@ -170,7 +180,7 @@ def fetch_ads_with_posts(config: Dict = MARKETING_CONFIG) -> List[Dict]:
     
     try:
         while url:
-            response = requests.get(url, params=params)
+            response = graph_get(url, params=params)
             response.raise_for_status()
             data = response.json()
             
@@ -195,29 +205,44 @@ def fetch_ads_with_posts(config: Dict = MARKETING_CONFIG) -> List[Dict]:
         return []
 
 
-def fetch_ad_insights(ad_id: str, date_preset: str = 'maximum', config: Dict = MARKETING_CONFIG, debug: bool = False) -> List[Dict]:
+def fetch_ad_insights(ad_id: str, date_preset: str = 'maximum', config: Dict = MARKETING_CONFIG, debug: bool = False,
+                      time_range: Optional[Dict[str, str]] = None) -> Optional[List[Dict]]:
     """取得單一廣告的洞察數據
     
     Note: Facebook Marketing API v23.0 不再支援 'lifetime'，
     改用 'maximum' 取得所有可用歷史資料
+    
+    指定 time_range ({'since', 'until'}) 時改為取得區間內的每日數據（分頁，依 paging.next 讀完所有頁）；
+    任一頁請求失敗時回傳 None（與「沒有數據」的空列表區分，水位不會推進）
     """
-    url = f"https://graph.facebook.com/{config['api_version']}/{ad_id}/insights"
+    url = f"{graph_base_url(config)}/{ad_id}/insights"
     params = {
         'access_token': config['access_token'],
         'fields': 'impressions,reach,clicks,spend,cpm,cpc,ctr,actions,date_start,date_stop',
         'date_preset': date_preset,
         'level': 'ad'
     }
+    if time_range:
+        del params['date_preset']
+        params['time_range'] = json.dumps(time_range)
+        params['time_increment'] = 1
     
+    insights = []
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        insights = data.get('data', [])
+        while url:
+            response = graph_get(url, params=params)
+            response.raise_for_status()
+            data = response.json()
+            insights.extend(data.get('data', []))
+            if debug:
+                print(f"\n  [DEBUG] Ad {ad_id[-15:]}:")
+                print(f"    API Response: {data}")
+
+            # 分頁（next URL 已含所有參數）
+            url = data.get('paging', {}).get('next')
+            params = {}
         
         if debug:
-            print(f"\n  [DEBUG] Ad {ad_id[-15:]}:")
-            print(f"    API Response: {data}")
             if insights:
                 for ins in insights:
                     print(f"    Period: {ins.get('date_start')} ~ {ins.get('date_stop')}")
@@ -230,13 +255,11 @@ def fetch_ad_insights(ad_id: str, date_preset: str = 'maximum', config: Dict = M
         print(f"  ✗ 取得廣告 {ad_id} 洞察失敗: {e}")
         if debug:
             print(f"    [DEBUG] Error details: {e}")
-        return []
+        return None
 
 
-def save_campaign(conn, campaign: Dict):
-    """儲存廣告活動"""
-    cursor = conn.cursor()
-    
+def campaign_statement(campaign: Dict) -> Tuple[str, Tuple]:
+    """save_campaign 的 (sql, values)，供 db_utils.BatchWriter 批次寫入"""
     # 處理 budget (可能是字串或數字)
     daily_budget = campaign.get('daily_budget')
     lifetime_budget = campaign.get('lifetime_budget')
@@ -251,7 +274,7 @@ def save_campaign(conn, campaign: Dict):
     except (TypeError, ValueError):
         lifetime_budget = None
     
-    cursor.execute("""
+    return """
         INSERT OR REPLACE INTO ad_campaigns 
         (campaign_id, name, objective, status, daily_budget, lifetime_budget, created_time, updated_at)
         VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
@@ -263,14 +286,19 @@ def save_campaign(conn, campaign: Dict):
         daily_budget,
         lifetime_budget,
         campaign.get('created_time')
-    ))
-    conn.commit()
+    )
 
 
-def save_ad(conn, ad: Dict):
-    """儲存廣告"""
-    cursor = conn.cursor()
-    cursor.execute("""
+def save_campaign(conn, campaign: Dict, commit: bool = True):
+    """儲存廣告活動"""
+    conn.execute(*campaign_statement(campaign))
+    if commit:
+        conn.commit()
+
+
+def ad_statement(ad: Dict) -> Tuple[str, Tuple]:
+    """save_ad 的 (sql, values)"""
+    return """
         INSERT OR REPLACE INTO ads 
         (ad_id, adset_id, campaign_id, name, status, post_id, creative_id, created_time, updated_at)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
@@ -283,36 +311,100 @@ def save_ad(conn, ad: Dict):
         ad.get('post_id'),
         ad.get('creative', {}).get('id'),
         ad.get('created_time')
-    ))
-    conn.commit()
+    )
 
 
-def save_ad_insights(conn, ad_id: str, insights: List[Dict]):
-    """儲存廣告洞察"""
-    cursor = conn.cursor()
-    for insight in insights:
-        cursor.execute("""
-            INSERT OR REPLACE INTO ad_insights 
-            (ad_id, date_start, date_stop, impressions, reach, clicks, spend, cpm, cpc, ctr, actions, fetch_date)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_DATE)
-        """, (
-            ad_id,
-            insight.get('date_start'),
-            insight.get('date_stop'),
-            insight.get('impressions', 0),
-            insight.get('reach', 0),
-            insight.get('clicks', 0),
-            float(insight.get('spend', 0)),
-            float(insight.get('cpm', 0)),
-            float(insight.get('cpc', 0)),
-            float(insight.get('ctr', 0)),
-            str(insight.get('actions', []))
-        ))
-    conn.commit()
+def save_ad(conn, ad: Dict, commit: bool = True):
+    """儲存廣告"""
+    conn.execute(*ad_statement(ad))
+    if commit:
+        conn.commit()
+
 
+def save_ad_insights(conn, ad_id: str, insights: List[Dict], commit: bool = True):
+    """儲存廣告洞察（同一個廣告的所有列以 executemany 寫入）"""
+    conn.executemany("""
+        INSERT OR REPLACE INTO ad_insights 
+        (ad_id, date_start, date_stop, impressions, reach, clicks, spend, cpm, cpc, ctr, actions, fetch_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_DATE)
+    """, [(
+        ad_id,
+        insight.get('date_start'),
+        insight.get('date_stop'),
+        insight.get('impressions', 0),
+        insight.get('reach', 0),
+        insight.get('clicks', 0),
+        float(insight.get('spend', 0)),
+        float(insight.get('cpm', 0)),
+        float(insight.get('cpc', 0)),
+        float(insight.get('ctr', 0)),
+        str(insight.get('actions', []))
+    ) for insight in insights])
+    if commit:
+        conn.commit()
 
-def collect_all_ad_data():
-    """收集所有廣告數據"""
+
+def collect_ad_insights(conn, config: Dict = MARKETING_CONFIG, use_report_job: bool = True,
+                        today=None) -> Dict:
+    """
+    依每個廣告的水位增量收集每日洞察
+
+    Args:
+        use_report_job: 以 async 報表（每個區間一個 job）收集；False 時逐一廣告請求
+
+    Returns:
+        {'skipped_ads', 'fetched_days', 'bytes_fetched', 'bytes_saved', 'failed_ads'}
+    """
+    ad_watermarks.seed_watermarks(conn)
+    plan = ad_watermarks.plan_windows(conn, today)
+    until = plan['until']
+    summary = {
+        'skipped_ads': len(plan['skipped']),
+        'fetched_days': plan['fetched_days'],
+        'bytes_fetched': 0,
+        'bytes_saved': 0,
+        'failed_ads': 0,
+    }
+
+    for since, ad_ids in sorted(plan['windows'].items()):
+        time_range = {'since': since, 'until': until}
+        if use_report_job:
+            for start in range(0, len(ad_ids), ad_report_job.AD_FILTER_LIMIT):
+                chunk = ad_ids[start:start + ad_report_job.AD_FILTER_LIMIT]
+                result = ad_report_job.collect_ad_insights_report(conn, config, time_range, chunk)
+                if result is None:
+                    summary['failed_ads'] += len(chunk)
+                    continue
+                summary['bytes_fetched'] += result['bytes']
+                ad_watermarks.update_watermarks(conn, chunk, until)
+        else:
+            for i, ad_id in enumerate(ad_ids, 1):
+                print(f"  處理 {i}/{len(ad_ids)}: {ad_id} ({since} ~ {until})", end='')
+                insights = fetch_ad_insights(ad_id, config=config, time_range=time_range)
+                if insights is None:
+                    summary['failed_ads'] += 1
+                    print(" - ✗")
+                    continue
+                rows = [dict(insight, ad_id=ad_id) for insight in insights]
+                if rows:
+                    ad_report_job.save_daily_insights(conn, rows)
+                    ad_report_job.drop_lifetime_rows(conn, [ad_id])
+                    conn.commit()
+                summary['bytes_fetched'] += sum(len(json.dumps(row)) for row in rows)
+                ad_watermarks.update_watermarks(conn, [ad_id], until)
+                print(" - ✓" if rows else " - ⊘")
+
+    summary['bytes_saved'] = ad_watermarks.bytes_saved(plan, summary['bytes_fetched'])
+    return summary
+
+
+def collect_all_ad_data(config: Dict = MARKETING_CONFIG, use_report_job: bool = True):
+    """
+    收集所有廣告數據
+
+    Args:
+        use_report_job: 以 async 報表收集每日洞察（預設）；False 時逐一廣告請求
+    """
     print("\n" + "="*60)
     print("開始收集 Marketing API 廣告數據")
     print("="*60)
@@ -325,29 +417,26 @@ def collect_all_ad_data():
         
         # 取得並儲存廣告活動
         print("\n[1/3] 取得廣告活動...")
-        campaigns = fetch_campaigns()
-        for campaign in campaigns:
-            save_campaign(conn, campaign)
+        campaigns = fetch_campaigns(config)
+        with db_utils.BatchWriter(conn) as writer:
+            for campaign in campaigns:
+                writer.add(*campaign_statement(campaign))
         
         # 取得並儲存廣告
         print("\n[2/3] 取得廣告及貼文關聯...")
-        ads = fetch_ads_with_posts()
-        for ad in ads:
-            save_ad(conn, ad)
+        ads = fetch_ads_with_posts(config)
+        with db_utils.BatchWriter(conn) as writer:
+            for ad in ads:
+                writer.add(*ad_statement(ad))
         
-        # 取得並儲存廣告洞察
+        # 取得並儲存廣告洞察（依水位增量）
         print("\n[3/3] 取得廣告洞察數據...")
-        for i, ad in enumerate(ads, 1):
-            ad_id = ad.get('id')
-            print(f"  處理 {i}/{len(ads)}: {ad_id}", end='')
-            insights = fetch_ad_insights(ad_id)
-            if insights:
-                save_ad_insights(conn, ad_id, insights)
-                print(" - ✓")
-            else:
-                print(" - ⊘")
+        insights_summary = collect_ad_insights(conn, config, use_report_job)
         
-        print("\n✓ 廣告數據收集完成")
+        if insights_summary['failed_ads']:
+            print(f"\n⚠ {insights_summary['failed_ads']} 個廣告的洞察收集失敗（水位未更新，下次重試）")
+        else:
+            print("\n✓ 廣告數據收集完成")
         
         # 顯示摘要
         cursor = conn.cursor()
@@ -362,8 +451,11 @@ def collect_all_ad_data():
         print(f"  廣告活動: {campaigns_count} 個")
         print(f"  廣告: {ads_count} 個")
         print(f"  關聯貼文: {linked_count} 個")
+        print(f"  略過已結束廣告: {insights_summary['skipped_ads']} 個")
+        print(f"  抓取區間: {insights_summary['fetched_days']} 廣告日")
+        print(f"  節省下載: 約 {insights_summary['bytes_saved'] / 1024:.1f} KB")
         
-        return True
+        return not insights_summary['failed_ads']
         
     except Exception as e:
         print(f"✗ 廣告數據收集失敗: {e}")
@@ -431,6 +523,9 @@ def get_organic_vs_paid_comparison(conn) -> Dict:
 def get_ad_roi_by_post_type(conn) -> List[Dict]:
     """
     分析各類貼文的廣告 ROI
+
+    ad_insights 為每個廣告每天一列；CPM / CPC / CTR 由加總的花費、曝光與點擊計算（依量加權），
+    不平均每日比率（無花費的日子會拉低平均）
     """
     cursor = conn.cursor()
     cursor.execute("""
@@ -441,9 +536,9 @@ def get_ad_roi_by_post_type(conn) -> List[Dict]:
             SUM(ai.spend) as total_spend,
             SUM(ai.impressions) as total_impressions,
             SUM(ai.clicks) as total_clicks,
-            ROUND(AVG(ai.cpm), 2) as avg_cpm,
-            ROUND(AVG(ai.cpc), 2) as avg_cpc,
-            ROUND(AVG(ai.ctr), 2) as avg_ctr
+            ROUND(SUM(ai.spend) * 1000.0 / NULLIF(SUM(ai.impressions), 0), 2) as avg_cpm,
+            ROUND(SUM(ai.spend) / NULLIF(SUM(ai.clicks), 0), 2) as avg_cpc,
+            ROUND(SUM(ai.clicks) * 100.0 / NULLIF(SUM(ai.impressions), 0), 2) as avg_ctr
         FROM ads a
         JOIN posts p ON a.post_id = p.post_id
         JOIN posts_classification pc ON p.post_id = pc.post_id
@@ -1,25 +1,34 @@
 # collector_page.py
-import requests
-import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from utils import config
 from utils import db_utils
+from utils.graph_client import graph_get
 
-def fetch_page_info(access_token, page_id, api_version):
-    url = f"https://graph.facebook.com/{api_version}/{page_id}"
+# Graph API rejects page insights ranges longer than 93 days between since and until
+MAX_WINDOW_DAYS = 90
+
+# Re-fetch this many days before the last stored date (Facebook restates recent page metrics)
+RESTATEMENT_LOOKBACK_DAYS = 3
+
+# Concurrent window requests
+WINDOW_WORKERS = 4
+
+def fetch_page_info(access_token, page_id, api_version, base_url=config.GRAPH_API_BASE):
+    url = f"{base_url}/{api_version}/{page_id}"
     params = {
         'access_token': access_token,
         'fields': 'id,name,fan_count,followers_count'
     }
-    response = requests.get(url, params=params)
+    response = graph_get(url, params=params)
     if response.status_code == 200:
         return response.json()
     else:
         print(f"Error fetching page info: {response.text}")
         return None
 
-def fetch_daily_insights(access_token, page_id, api_version, since, until, metrics):
-    url = f"https://graph.facebook.com/{api_version}/{page_id}/insights"
+def fetch_daily_insights(access_token, page_id, api_version, since, until, metrics, base_url=config.GRAPH_API_BASE):
+    url = f"{base_url}/{api_version}/{page_id}/insights"
     
     # metrics is a list of strings
     metric_param = ','.join(metrics)
@@ -32,23 +41,128 @@ def fetch_daily_insights(access_token, page_id, api_version, since, until, metri
         'until': until
     }
     
-    response = requests.get(url, params=params)
+    response = graph_get(url, params=params)
     if response.status_code == 200:
         return response.json()
     else:
         print(f"Error fetching insights: {response.text}")
         return None
 
-def process_and_save_page_data(days_back=7):
+def split_windows(since_date, until_date, max_days=MAX_WINDOW_DAYS):
+    """Split [since_date, until_date) into consecutive (since, until) windows of at most max_days days."""
+    start = datetime.strptime(since_date, '%Y-%m-%d')
+    end = datetime.strptime(until_date, '%Y-%m-%d')
+    windows = []
+    while start < end:
+        stop = min(start + timedelta(days=max_days), end)
+        windows.append((start.strftime('%Y-%m-%d'), stop.strftime('%Y-%m-%d')))
+        start = stop
+    return windows
+
+def parse_daily_records(insights_response):
+    """Transform an insights response into {date: {metric: value}}."""
+    daily_records = {} # {'2023-10-27': {'metric1': val, ...}}
+
+    for item in insights_response['data']:
+        metric_name = item['name']
+        for value_entry in item['values']:
+            # value_entry['end_time'] is like '2023-10-28T07:00:00+0000'
+            # The data represents the day BEFORE the end_time usually.
+            # However, typically we just take the date part of end_time - 1 day or as is depending on timezone. 
+            # Facebook Insights 'end_time' usually means the data extraction time for the previous period.
+            # E.g. Period=day, end_time=2023-10-28 means data for 2023-10-27.
+            
+            end_time_str = value_entry['end_time']
+            end_time_dt = datetime.strptime(end_time_str, "%Y-%m-%dT%H:%M:%S%z")
+            data_date = (end_time_dt - timedelta(days=1)).strftime('%Y-%m-%d')
+            
+            if data_date not in daily_records:
+                daily_records[data_date] = {}
+            
+            # Handle complex metrics like page_actions_post_reactions_total
+            val = value_entry['value']
+            
+            if metric_name == 'page_actions_post_reactions_total' and isinstance(val, dict):
+                daily_records[data_date]['reactions_like'] = val.get('like', 0)
+                daily_records[data_date]['reactions_love'] = val.get('love', 0)
+                daily_records[data_date]['reactions_wow'] = val.get('wow', 0)
+                daily_records[data_date]['reactions_haha'] = val.get('haha', 0)
+                daily_records[data_date]['reactions_sorry'] = val.get('sorry', 0)
+                daily_records[data_date]['reactions_anger'] = val.get('anger', 0)
+                daily_records[data_date]['reactions_total'] = sum(val.values())
+            else:
+                daily_records[data_date][metric_name] = val
+
+    return daily_records
+
+def fetch_windows(fb_config, windows, metrics, workers=WINDOW_WORKERS):
+    """
+    Fetch every window concurrently and merge the results.
+
+    Returns (daily_records, failed_windows).
+    """
+    base_url = fb_config.get('base_url', config.GRAPH_API_BASE)
+
+    def fetch(window):
+        # Convert to timestamps for API safety
+        since_ts = int(datetime.strptime(window[0], '%Y-%m-%d').timestamp())
+        until_ts = int(datetime.strptime(window[1], '%Y-%m-%d').timestamp())
+        return fetch_daily_insights(
+            fb_config['access_token'],
+            fb_config['page_id'],
+            fb_config['api_version'],
+            since_ts,
+            until_ts,
+            metrics,
+            base_url=base_url
+        )
+
+    daily_records, failed = {}, []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(windows)))) as executor:
+        for window, response in zip(windows, executor.map(fetch, windows)):
+            if response and 'data' in response:
+                daily_records.update(parse_daily_records(response))
+            else:
+                failed.append(window)
+    return daily_records, failed
+
+def latest_stored_date(conn, page_id):
+    cursor = conn.cursor()
+    cursor.execute("SELECT MAX(date) FROM page_daily_metrics WHERE page_id = ?", (page_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def incremental_since(conn, page_id, days_back, today=None):
+    """Start from the last stored date minus the restatement lookback; days_back only applies to an empty table."""
+    today = today or datetime.now()
+    latest = latest_stored_date(conn, page_id)
+    if latest:
+        since = datetime.strptime(latest, '%Y-%m-%d') - timedelta(days=RESTATEMENT_LOOKBACK_DAYS)
+    else:
+        since = today - timedelta(days=days_back)
+    return since.strftime('%Y-%m-%d')
+
+def process_and_save_page_data(days_back=7, backfill_since=None, workers=WINDOW_WORKERS, fb_config=None):
+    """
+    Collect page info and daily page insights.
+
+    Normal runs only fetch days after the last stored date (minus RESTATEMENT_LOOKBACK_DAYS);
+    days_back is the initial range when nothing is stored yet. backfill_since ('YYYY-MM-DD')
+    fetches everything from that date, split into MAX_WINDOW_DAYS windows fetched concurrently.
+    fb_config selects the page (defaults to config.FACEBOOK_CONFIG).
+    """
     conn = db_utils.get_db_connection()
     if not conn:
         return
 
+    fb_config = fb_config or config.FACEBOOK_CONFIG
+
     # 1. Fetch Page Info (Lifetime)
     page_info = fetch_page_info(
-        config.FACEBOOK_CONFIG['access_token'],
-        config.FACEBOOK_CONFIG['page_id'],
-        config.FACEBOOK_CONFIG['api_version']
+        fb_config['access_token'],
+        fb_config['page_id'],
+        fb_config['api_version'],
+        base_url=fb_config.get('base_url', config.GRAPH_API_BASE)
     )
     
     if page_info:
@@ -66,72 +180,47 @@ def process_and_save_page_data(days_back=7):
         return
 
     # 2. Fetch Daily Insights
-    since_date = (datetime.now() - timedelta(days=days_back)).strftime('%Y-%m-%d')
-    until_date = datetime.now().strftime('%Y-%m-%d') # Facebook 'until' is exclusive for timestamps, but for date strings it usually works as end date. Using timestamps is safer.
-    
-    # Convert to timestamps for API safety
-    since_ts = int(datetime.strptime(since_date, '%Y-%m-%d').timestamp())
-    until_ts = int(datetime.strptime(until_date, '%Y-%m-%d').timestamp())
+    incremental_start = incremental_since(conn, page_info['id'], days_back)
+    since_date = min(backfill_since, incremental_start) if backfill_since else incremental_start
+    until_date = datetime.now().strftime('%Y-%m-%d') # Facebook 'until' is exclusive for timestamps
+    windows = split_windows(since_date, until_date)
 
-    print(f"Fetching insights from {since_date} to {until_date}...")
-    
-    insights_response = fetch_daily_insights(
-        config.FACEBOOK_CONFIG['access_token'],
-        config.FACEBOOK_CONFIG['page_id'],
-        config.FACEBOOK_CONFIG['api_version'],
-        since_ts,
-        until_ts,
-        config.PAGE_METRICS
-    )
+    if not windows:
+        print("Page insights are up to date.")
+        conn.close()
+        return
 
-    if insights_response and 'data' in insights_response:
-        # Transform data: Date -> Metric -> Value
-        daily_records = {} # {'2023-10-27': {'metric1': val, ...}}
-        
-        for item in insights_response['data']:
-            metric_name = item['name']
-            for value_entry in item['values']:
-                # value_entry['end_time'] is like '2023-10-28T07:00:00+0000'
-                # The data represents the day BEFORE the end_time usually.
-                # However, typically we just take the date part of end_time - 1 day or as is depending on timezone. 
-                # Facebook Insights 'end_time' usually means the data extraction time for the previous period.
-                # E.g. Period=day, end_time=2023-10-28 means data for 2023-10-27.
-                
-                end_time_str = value_entry['end_time']
-                end_time_dt = datetime.strptime(end_time_str, "%Y-%m-%dT%H:%M:%S%z")
-                data_date = (end_time_dt - timedelta(days=1)).strftime('%Y-%m-%d')
-                
-                if data_date not in daily_records:
-                    daily_records[data_date] = {}
-                
-                # Handle complex metrics like page_actions_post_reactions_total
-                val = value_entry['value']
-                
-                if metric_name == 'page_actions_post_reactions_total' and isinstance(val, dict):
-                    daily_records[data_date]['reactions_like'] = val.get('like', 0)
-                    daily_records[data_date]['reactions_love'] = val.get('love', 0)
-                    daily_records[data_date]['reactions_wow'] = val.get('wow', 0)
-                    daily_records[data_date]['reactions_haha'] = val.get('haha', 0)
-                    daily_records[data_date]['reactions_sorry'] = val.get('sorry', 0)
-                    daily_records[data_date]['reactions_anger'] = val.get('anger', 0)
-                    daily_records[data_date]['reactions_total'] = sum(val.values())
-                else:
-                    daily_records[data_date][metric_name] = val
-
-        # Save to DB
-        for date_str, metrics in daily_records.items():
-            # Merge lifetime data
-            full_record = {**metrics, **lifetime_data}
-            success = db_utils.upsert_page_daily_metrics(conn, page_info['id'], date_str, full_record)
-            if success:
-                print(f"Saved data for {date_str}")
-            else:
-                print(f"Failed to save data for {date_str}")
+    print(f"Fetching insights from {since_date} to {until_date} ({len(windows)} windows)...")
+    daily_records, failed = fetch_windows(fb_config, windows, config.PAGE_METRICS, workers)
 
+    # Stop at the first failed window so the next run's incremental start does not skip the gap
+    save_until = min([s for s, _ in failed] + [until_date])
+
+    if daily_records:
+        # Save to DB (only days inside the requested range)
+        # Buffered writes: one transaction per BATCH_SIZE days instead of one commit per day
+        with db_utils.BatchWriter(conn) as writer:
+            for date_str, metrics in sorted(daily_records.items()):
+                if not since_date <= date_str < save_until:
+                    continue
+                # Only recent days get today's lifetime counts; older backfilled rows keep their stored values
+                full_record = {**metrics, **lifetime_data} if date_str >= incremental_start else metrics
+                writer.upsert_page_daily_metrics(page_info['id'], date_str, full_record)
+        if writer.stats['failed']:
+            print(f"Failed to save data for {writer.stats['failed']} days")
+        print(f"Saved data for {writer.stats['written']} days")
     else:
         print("No insights data returned.")
 
+    if failed:
+        print(f"Failed windows: {', '.join(f'{s}~{u}' for s, u in failed)} (days from {save_until} not saved)")
+
     conn.close()
 
 if __name__ == '__main__':
-    process_and_save_page_data(days_back=5)
+    import sys
+    if len(sys.argv) > 2 and sys.argv[1] == '--backfill':
+        # python -m collectors.collector_page --backfill 2022-01-01
+        process_and_save_page_data(backfill_since=sys.argv[2])
+    else:
+        process_and_save_page_data(days_back=5)
@@ -0,0 +1,89 @@
+"""
+多專頁並行收集
+把登記表中的專頁分配給 worker pool，每個 worker 依序收集一個專頁的頁面與貼文數據。
+每個 access token 有自己的限制器（專頁 / 使用者層級的用量與節流），
+共用限制器只處理 App 層級的用量；所有資料表仍以 page_id 區分。
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+from collectors import collector_page
+from utils import rate_limiter
+
+# 同時收集的專頁數
+PAGE_WORKERS = 4
+
+# 每個 access token 的限制器參數
+TOKEN_LIMITS = {'max_rate': 5.0, 'min_rate': 0.1, 'burst': 5, 'base_backoff': 2.0}
+
+
+def spread_by_token(page_configs: List[Dict]) -> List[Dict]:
+    """
+    依 token 輪流排列專頁，讓共用同一 token 的專頁不會被同時分配給相鄰的 worker
+    （各 token 內保持原本的順序）
+    """
+    groups = {}
+    for page_config in page_configs:
+        groups.setdefault(page_config['access_token'], []).append(page_config)
+    ordered = []
+    while groups:
+        for token in list(groups):
+            ordered.append(groups[token].pop(0))
+            if not groups[token]:
+                del groups[token]
+    return ordered
+
+
+def collect_page(page_config: Dict, days_back: int = 90, backfill_since: Optional[str] = None,
+                 use_async: bool = False, concurrency: Optional[int] = None, planner=None) -> Dict:
+    """收集單一專頁的頁面與貼文數據"""
+    import run_pipeline
+
+    start = time.monotonic()
+    collector_page.process_and_save_page_data(days_back=days_back, backfill_since=backfill_since,
+                                              fb_config=page_config)
+    success = run_pipeline.collect_post_data(use_async=use_async, concurrency=concurrency,
+                                             planner=planner, fb_config=page_config)
+    return {'page_id': page_config['page_id'], 'success': success, 'seconds': round(time.monotonic() - start, 1)}
+
+
+def collect_all_pages(page_configs: List[Dict], workers: int = PAGE_WORKERS,
+                      token_limits: Optional[Dict] = None, **kwargs) -> List[Dict]:
+    """
+    以 worker pool 收集所有專頁
+
+    Args:
+        page_configs: 每個專頁的 FACEBOOK_CONFIG（見 collectors.page_registry.page_configs）
+        token_limits: 每個 token 限制器的參數（預設 TOKEN_LIMITS）
+        kwargs: 傳給 collect_page 的參數
+
+    Returns:
+        [{'page_id', 'success', 'seconds'}, ...]（依完成順序）
+    """
+    ordered = spread_by_token(page_configs)
+    print(f"\n多專頁模式: {len(ordered)} 個專頁 / {min(workers, len(ordered))} 個 worker")
+
+    rate_limiter.enable_token_limits(**(token_limits or TOKEN_LIMITS))
+    results = []
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(ordered)))) as executor:
+            futures = {executor.submit(collect_page, page_config, **kwargs): page_config['page_id']
+                       for page_config in ordered}
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    print(f"✗ 專頁 {futures[future]} 收集失敗: {e}")
+                    results.append({'page_id': futures[future], 'success': False, 'seconds': None})
+        token_stats = rate_limiter.token_stats()
+    finally:
+        rate_limiter.disable_token_limits()
+
+    succeeded = sum(1 for r in results if r['success'])
+    print(f"\n✓ 多專頁收集完成: {succeeded}/{len(results)} 個專頁成功")
+    for token, stats in token_stats.items():
+        print(f"  token {token}: {int(stats['requests'])} 請求 / 節流 {stats['throttled']} 次 / "
+              f"等待 {stats['waited_seconds']:.1f} 秒")
+    return results
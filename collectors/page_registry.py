@@ -0,0 +1,89 @@
+"""
+多專頁登記表
+以 pages 表記錄要收集的專頁與各自的 access token（可用 'env:變數名稱' 指向環境變數，
+避免把 token 寫進資料庫），並組出每個專頁的 FACEBOOK_CONFIG。
+
+用法:
+    python -m collectors.page_registry add <page_id> <access_token|env:VAR> [page_name]
+    python -m collectors.page_registry disable <page_id>
+    python -m collectors.page_registry list
+"""
+
+import os
+from typing import Dict, List, Optional
+
+from utils import config, db_utils
+
+ENV_TOKEN_PREFIX = 'env:'
+
+
+def resolve_token(value: Optional[str]) -> Optional[str]:
+    """'env:VAR' 形式的 token 從環境變數取得"""
+    if value and value.startswith(ENV_TOKEN_PREFIX):
+        return os.environ.get(value[len(ENV_TOKEN_PREFIX):])
+    return value
+
+
+def register_page(conn, page_id: str, access_token: Optional[str] = None, page_name: Optional[str] = None,
+                  active: bool = True):
+    """登記或更新專頁（未提供的 token / 名稱保留既有值）"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO pages (page_id, page_name, access_token, is_active)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(page_id) DO UPDATE SET
+        page_name = COALESCE(excluded.page_name, page_name),
+        access_token = COALESCE(excluded.access_token, access_token),
+        is_active = excluded.is_active;
+    """, (page_id, page_name, access_token, 1 if active else 0))
+    conn.commit()
+
+
+def set_active(conn, page_id: str, active: bool):
+    cursor = conn.cursor()
+    cursor.execute("UPDATE pages SET is_active = ? WHERE page_id = ?", (1 if active else 0, page_id))
+    conn.commit()
+
+
+def page_configs(conn, base_config: Optional[Dict] = None) -> List[Dict]:
+    """
+    組出所有啟用中專頁的 FACEBOOK_CONFIG（最久未收集的專頁排在前面）
+
+    沒有任何登記了 token 的專頁時回傳 [base_config]（單一專頁模式）
+    """
+    base_config = base_config or config.FACEBOOK_CONFIG
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT page_id, access_token
+        FROM pages
+        WHERE COALESCE(is_active, 1) = 1 AND access_token IS NOT NULL
+        ORDER BY last_scraped_at IS NOT NULL, last_scraped_at, page_id
+    """)
+    configs = []
+    for page_id, access_token in cursor.fetchall():
+        token = resolve_token(access_token)
+        if not token:
+            print(f"⚠ 專頁 {page_id} 的 access token 未設定（{access_token}），略過")
+            continue
+        configs.append({**base_config, 'page_id': page_id, 'access_token': token})
+    return configs or [base_config]
+
+
+if __name__ == '__main__':
+    import sys
+
+    conn = db_utils.get_db_connection()
+    command = sys.argv[1] if len(sys.argv) > 1 else 'list'
+    if command == 'add' and len(sys.argv) >= 4:
+        register_page(conn, sys.argv[2], sys.argv[3], sys.argv[4] if len(sys.argv) > 4 else None)
+        print(f"✓ 已登記專頁 {sys.argv[2]}")
+    elif command == 'disable' and len(sys.argv) >= 3:
+        set_active(conn, sys.argv[2], False)
+        print(f"⊘ 已停用專頁 {sys.argv[2]}")
+    else:
+        cursor = conn.cursor()
+        cursor.execute("SELECT page_id, page_name, is_active, last_scraped_at, access_token IS NOT NULL FROM pages")
+        for page_id, page_name, is_active, last_scraped_at, has_token in cursor.fetchall():
+            status = '✓' if is_active != 0 and has_token else '⊘'
+            print(f"  {status} {page_id} {page_name or ''} (上次收集: {last_scraped_at or '-'})")
+    conn.close()
@@ -0,0 +1,105 @@
+"""
+貼文增量探索
+以每個專頁的 created_time 水位決定列表起點，每日只列出水位（減去安全重疊天數）之後的貼文；
+另以較低頻率的對帳流程輕量列出完整歷史，同步貼文內容的編輯並標記已刪除的貼文。
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from utils import db_utils
+
+# 尚無水位時的列表起點（舊版每次都從這天開始列出）
+DEFAULT_SINCE_DATE = '2024-01-01'
+
+# 水位往前重疊的天數，補抓時間戳相近或延遲出現的貼文
+WATERMARK_OVERLAP_DAYS = 3
+
+# 對帳週期（天）
+RECONCILE_INTERVAL_DAYS = 7
+
+# 對帳列表只取基本欄位（不含 insights 與互動數）
+RECONCILE_FIELDS = 'id,message,created_time,permalink_url'
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def incremental_since(conn, page_id: str, overlap_days: int = WATERMARK_OVERLAP_DAYS) -> str:
+    """依水位計算列表起點（YYYY-MM-DD）；尚無水位時回傳 DEFAULT_SINCE_DATE"""
+    watermark = db_utils.get_post_watermark(conn, page_id)
+    if not watermark or not watermark['max_created_time']:
+        return DEFAULT_SINCE_DATE
+
+    latest = datetime.strptime(watermark['max_created_time'][:10], '%Y-%m-%d')
+    return (latest - timedelta(days=overlap_days)).strftime('%Y-%m-%d')
+
+
+def reconcile_due(conn, page_id: str, interval_days: int = RECONCILE_INTERVAL_DAYS,
+                  now: Optional[datetime] = None) -> bool:
+    """距離上次對帳是否已超過 interval_days 天"""
+    watermark = db_utils.get_post_watermark(conn, page_id)
+    if not watermark or not watermark['last_reconciled_at']:
+        return True
+
+    last = datetime.strptime(watermark['last_reconciled_at'], TIMESTAMP_FORMAT)
+    return (now or datetime.now()) - last >= timedelta(days=interval_days)
+
+
+def save_listed_posts(conn, page_id: str, posts: List[Dict]) -> int:
+    """將列表取得的貼文基本資訊寫入 posts 表"""
+    with db_utils.BatchWriter(conn) as writer:
+        for post in posts:
+            writer.upsert_post({
+                'id': post.get('id'),
+                'page_id': page_id,
+                'created_time': post.get('created_time'),
+                'message': post.get('message', ''),
+                'type': None,
+                'permalink_url': post.get('permalink_url')
+            })
+    return len(posts)
+
+
+def record_listing(conn, page_id: str, posts: List[Dict], since_date: str, until_date: str) -> int:
+    """
+    列表完成後更新水位
+
+    若列表從 DEFAULT_SINCE_DATE 開始（首次或手動完整列出），同時視為一次對帳；
+    列表為空時不標記刪除，避免 API 異常把整個專頁標成已刪除
+
+    Returns:
+        新標記為已刪除的貼文數
+    """
+    now = datetime.now().strftime(TIMESTAMP_FORMAT)
+    deleted = 0
+    full_listing = since_date <= DEFAULT_SINCE_DATE and bool(posts)
+    if full_listing:
+        deleted = db_utils.mark_deleted_posts(conn, page_id, [p.get('id') for p in posts], since_date, until_date)
+    db_utils.update_post_watermark(conn, page_id, listed_at=now, reconciled_at=now if full_listing else None)
+    return deleted
+
+
+def reconcile_posts(conn, config: Dict, until_date: str, since_date: str = DEFAULT_SINCE_DATE,
+                    limit: int = 100) -> Optional[Dict]:
+    """
+    對帳：輕量列出完整歷史，更新貼文內容並標記已刪除的貼文
+
+    Returns:
+        {'listed': 列出的貼文數, 'deleted': 新標記為已刪除的貼文數}；列表失敗或為空時回傳 None（不做任何標記）
+    """
+    from main import fetch_page_posts
+
+    print(f"\n對帳: 列出 {since_date} ~ {until_date} 的所有貼文")
+    posts = fetch_page_posts(config, since_date, until_date, limit, fields=RECONCILE_FIELDS)
+    if not posts:
+        print("✗ 對帳列表失敗或為空，略過刪除標記")
+        return None
+
+    page_id = config['page_id']
+    save_listed_posts(conn, page_id, posts)
+    deleted = db_utils.mark_deleted_posts(conn, page_id, [p['id'] for p in posts], since_date, until_date)
+    now = datetime.now().strftime(TIMESTAMP_FORMAT)
+    db_utils.update_post_watermark(conn, page_id, reconciled_at=now)
+
+    print(f"✓ 對帳完成: {len(posts)} 則貼文 / 新標記刪除 {deleted} 則")
+    return {'listed': len(posts), 'deleted': deleted}
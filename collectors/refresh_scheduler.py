@@ -0,0 +1,206 @@
+"""
+貼文 insights 更新排程
+依貼文年齡與最近兩次 post_insights_snapshots 之間的成長率，替每則貼文決定下次更新日，
+存入有索引的 refresh_queue 表。每次執行只需取出到期的貼文（O(到期數)），
+成長已飽和的舊貼文降為每週更新或停止更新。
+"""
+
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 新貼文：發布後幾天內每日更新
+FRESH_DAYS = 3
+
+# 超過此天數的貼文若已飽和即停止更新
+ACTIVE_DAYS = 30
+
+# 每日相對成長率門檻
+FAST_GROWTH = 0.05       # 以上：每日更新
+SLOW_GROWTH = 0.01       # 以上：每 3 天更新
+SATURATED_GROWTH = 0.001  # 以下視為飽和（ACTIVE_DAYS 後停止更新）
+
+WEEKLY = 7
+
+# 停止更新的貼文保留在佇列中（避免重新列出時被當成新貼文），下次更新日設為此值
+STOPPED_DATE = '9999-12-31'
+
+
+def _total(row) -> Tuple[int, int]:
+    """(reach, 互動數)"""
+    likes, comments, shares, clicks, reach = (value or 0 for value in row[1:6])
+    return reach, likes + comments + shares + clicks
+
+
+def growth_per_day(snapshots: List) -> Optional[float]:
+    """
+    由最近兩次 snapshot 計算每日相對成長率（取 reach 與互動數中較大者）
+
+    Args:
+        snapshots: [(fetch_date, likes, comments, shares, clicks, reach), ...]，新到舊
+    Returns:
+        成長率；snapshot 不足兩筆時回傳 None
+    """
+    if len(snapshots) < 2:
+        return None
+    newer, older = snapshots[0], snapshots[1]
+    days = (date.fromisoformat(newer[0]) - date.fromisoformat(older[0])).days
+    if days <= 0:
+        return None
+
+    rates = []
+    for new_value, old_value in zip(_total(newer), _total(older)):
+        rates.append(max(0, new_value - old_value) / max(old_value, 1) / days)
+    return max(rates)
+
+
+def next_interval(age_days: float, growth: Optional[float]) -> Tuple[Optional[int], str]:
+    """
+    決定更新間隔（天）
+
+    Returns:
+        (interval_days, reason)；interval_days 為 None 表示停止更新
+    """
+    if age_days <= FRESH_DAYS:
+        return 1, 'fresh'
+    if growth is None:
+        # 舊貼文只有一筆 snapshot：與舊流程相同，補收一次即停止
+        return (1, 'no_history') if age_days <= ACTIVE_DAYS else (None, 'saturated')
+    if growth >= FAST_GROWTH:
+        return 1, 'growing'
+    if growth >= SLOW_GROWTH:
+        return 3, 'slowing'
+    if age_days <= ACTIVE_DAYS or growth > SATURATED_GROWTH:
+        return WEEKLY, 'weekly'
+    return None, 'saturated'
+
+
+def recent_snapshots(conn, post_id: str, limit: int = 2) -> List:
+    """
+    最近 limit 次收集結果（新到舊）：(fetch_date, likes, comments, shares, clicks, reach)
+
+    只儲存變動時，last_checked 代表當天也收集過且數值未變（成長率為 0）
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT fetch_date, likes_count, comments_count, shares_count, post_clicks, post_impressions_unique
+        FROM post_insights_snapshots
+        WHERE post_id = ?
+        UNION ALL
+        SELECT last_checked, likes_count, comments_count, shares_count, post_clicks, post_impressions_unique
+        FROM post_insights_snapshots
+        WHERE post_id = ? AND last_checked > fetch_date
+        ORDER BY 1 DESC
+        LIMIT ?
+    """, (post_id, post_id, limit))
+    return cursor.fetchall()
+
+
+def schedule_post(conn, post_id: str, created_time: str, today: Optional[date] = None,
+                  commit: bool = True) -> Optional[str]:
+    """
+    依目前的 snapshot 重新排程單一貼文
+
+    Returns:
+        下次更新日（YYYY-MM-DD）；停止更新時回傳 None
+    """
+    today = today or date.today()
+    snapshots = recent_snapshots(conn, post_id)
+    cursor = conn.cursor()
+
+    if not snapshots:
+        # 從未收集過：立即到期
+        interval, reason, due = 0, 'no_snapshot', today.isoformat()
+    else:
+        age_days = (today - date.fromisoformat(created_time[:10])).days
+        interval, reason = next_interval(age_days, growth_per_day(snapshots))
+        if interval is None:
+            due = STOPPED_DATE
+        else:
+            due = (date.fromisoformat(snapshots[0][0]) + timedelta(days=interval)).isoformat()
+
+    cursor.execute("""
+        INSERT INTO refresh_queue (post_id, next_due_date, interval_days, reason, updated_at)
+        VALUES (?, ?, ?, ?, datetime('now'))
+        ON CONFLICT(post_id) DO UPDATE SET
+        next_due_date = excluded.next_due_date,
+        interval_days = excluded.interval_days,
+        reason = excluded.reason,
+        updated_at = excluded.updated_at;
+    """, (post_id, due, interval, reason))
+    if commit:
+        conn.commit()
+    return None if due == STOPPED_DATE else due
+
+
+def reschedule(conn, post_ids: Iterable[str], today: Optional[date] = None) -> int:
+    """收集完成後重新排程，回傳仍在佇列中的貼文數"""
+    post_ids = list(post_ids)
+    cursor = conn.cursor()
+    queued = 0
+    # 分段查詢，避免超過 SQLite 的參數數量上限
+    for start in range(0, len(post_ids), 500):
+        chunk = post_ids[start:start + 500]
+        placeholders = ', '.join(['?'] * len(chunk))
+        cursor.execute(f"SELECT post_id, created_time FROM posts WHERE post_id IN ({placeholders})", chunk)
+        for post_id, created_time in cursor.fetchall():
+            if schedule_post(conn, post_id, created_time, today, commit=False):
+                queued += 1
+    conn.commit()
+    return queued
+
+
+def enqueue_new_posts(conn, post_ids: Iterable[str], today: Optional[date] = None) -> int:
+    """新發現的貼文加入佇列並立即到期（已在佇列中的貼文不受影響）"""
+    today = (today or date.today()).isoformat()
+    cursor = conn.cursor()
+    cursor.executemany("""
+        INSERT OR IGNORE INTO refresh_queue (post_id, next_due_date, interval_days, reason)
+        VALUES (?, ?, 0, 'new')
+    """, [(post_id, today) for post_id in post_ids])
+    conn.commit()
+    return cursor.rowcount
+
+
+def seed_queue(conn, today: Optional[date] = None) -> int:
+    """
+    佇列為空時（既有資料庫首次使用排程）依現有 snapshot 排程所有未刪除的貼文
+
+    Returns:
+        加入排程的貼文數（佇列已有資料時回傳 0）
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM refresh_queue LIMIT 1")
+    if cursor.fetchone():
+        return 0
+    cursor.execute("SELECT post_id FROM posts WHERE COALESCE(is_deleted, 0) = 0")
+    return reschedule(conn, [row[0] for row in cursor.fetchall()], today)
+
+
+def due_posts(conn, today: Optional[date] = None, limit: Optional[int] = None,
+              page_id: Optional[str] = None) -> List[str]:
+    """取出到期的貼文（最早到期者優先，已刪除的貼文除外；可只取單一專頁）"""
+    today = (today or date.today()).isoformat()
+    cursor = conn.cursor()
+    sql = """
+        SELECT q.post_id
+        FROM refresh_queue q
+        JOIN posts p ON p.post_id = q.post_id
+        WHERE q.next_due_date <= ? AND COALESCE(p.is_deleted, 0) = 0
+    """
+    params = [today]
+    if page_id is not None:
+        sql += " AND p.page_id = ?"
+        params.append(page_id)
+    sql += " ORDER BY q.next_due_date, p.created_time DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    cursor.execute(sql, params)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def queue_summary(conn) -> Dict[str, int]:
+    """各排程原因的貼文數（報表用）"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT reason, COUNT(*) FROM refresh_queue GROUP BY reason")
+    return {reason: count for reason, count in cursor.fetchall()}
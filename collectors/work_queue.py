@@ -0,0 +1,280 @@
+"""
+貼文 insights 收集工作佇列（SQLite，租約制）
+生產者把到期的貼文寫入 refresh_tasks；多個 worker（行程或執行個體，共用同一個資料庫檔案）
+以 BEGIN IMMEDIATE 原子地領取租約，收集期間定期延長租約（heartbeat），
+完成時在同一個交易中確認仍持有租約並寫入 snapshot，因此每個工作只會寫入一次。
+worker 當機時租約到期，工作由其他 worker 重新領取；超過重試上限的工作標記為 failed。
+
+用法:
+    python -m collectors.work_queue worker     # 持續領取工作直到佇列清空
+    python -m collectors.work_queue stats
+"""
+
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional
+
+from utils import db_utils
+
+# 租約秒數（worker 每 LEASE_SECONDS / 3 秒延長一次）
+LEASE_SECONDS = 60
+
+# 每個工作的重試上限（含第一次）
+MAX_ATTEMPTS = 3
+
+# 失敗後重新開放領取前的等待秒數
+RETRY_DELAY = 30
+
+# SQLite 鎖等待上限（毫秒），多個 worker 同時領取時需要較長的等待
+BUSY_TIMEOUT_MS = 30000
+
+
+def connect():
+    """取得 worker 使用的資料庫連線"""
+    conn = db_utils.get_db_connection()
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def enqueue_tasks(conn, post_ids: Iterable[str], fetch_date: str, page_id: Optional[str] = None,
+                  max_attempts: int = MAX_ATTEMPTS) -> int:
+    """加入工作（同一貼文同一天只會有一個工作），回傳新加入的數量"""
+    cursor = conn.cursor()
+    before = conn.total_changes
+    cursor.executemany("""
+        INSERT OR IGNORE INTO refresh_tasks (post_id, page_id, fetch_date, max_attempts)
+        VALUES (?, ?, ?, ?)
+    """, [(post_id, page_id, fetch_date, max_attempts) for post_id in post_ids])
+    conn.commit()
+    return conn.total_changes - before
+
+
+def lease_tasks(conn, worker_id: str, limit: int, lease_seconds: float = LEASE_SECONDS,
+                now: Optional[float] = None) -> List[Dict]:
+    """
+    原子地領取最多 limit 個工作（待處理，或租約已過期的工作）
+
+    Returns:
+        [{'task_id', 'post_id', 'page_id', 'fetch_date', 'attempts'}, ...]
+    """
+    now = time.time() if now is None else now
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        # 租約過期且已用完重試次數的工作不再領取
+        cursor.execute("""
+            UPDATE refresh_tasks
+            SET status = 'failed', lease_owner = NULL, last_error = COALESCE(last_error, 'lease expired')
+            WHERE status = 'leased' AND lease_expires_at < ? AND attempts >= max_attempts
+        """, (now,))
+        cursor.execute("""
+            UPDATE refresh_tasks
+            SET status = 'leased', lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1
+            WHERE task_id IN (
+                SELECT task_id FROM refresh_tasks
+                WHERE (status = 'pending' AND available_at <= ?)
+                   OR (status = 'leased' AND lease_expires_at < ?)
+                ORDER BY task_id
+                LIMIT ?
+            )
+            RETURNING task_id, post_id, page_id, fetch_date, attempts
+        """, (worker_id, now + lease_seconds, now, now, limit))
+        rows = cursor.fetchall()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    keys = ('task_id', 'post_id', 'page_id', 'fetch_date', 'attempts')
+    return sorted((dict(zip(keys, row)) for row in rows), key=lambda task: task['task_id'])
+
+
+def heartbeat(conn, worker_id: str, task_ids: Iterable[str], lease_seconds: float = LEASE_SECONDS) -> int:
+    """延長仍由 worker 持有的租約，回傳仍持有的工作數"""
+    task_ids = list(task_ids)
+    if not task_ids:
+        return 0
+    placeholders = ', '.join(['?'] * len(task_ids))
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        UPDATE refresh_tasks SET lease_expires_at = ?
+        WHERE task_id IN ({placeholders}) AND lease_owner = ? AND status = 'leased'
+    """, [time.time() + lease_seconds, *task_ids, worker_id])
+    conn.commit()
+    return cursor.rowcount
+
+
+def complete_task(conn, worker_id: str, task_id: int, write: Callable) -> bool:
+    """
+    完成工作：確認仍持有租約後，在同一個交易中呼叫 write(conn) 寫入結果
+
+    Returns:
+        True 表示已寫入；租約已被其他 worker 取回或寫入失敗時回傳 False（不寫入任何資料）
+    """
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute("""
+            UPDATE refresh_tasks
+            SET status = 'done', lease_owner = NULL, completed_at = datetime('now')
+            WHERE task_id = ? AND lease_owner = ? AND status = 'leased'
+        """, (task_id, worker_id))
+        if cursor.rowcount != 1 or write(conn) is False:
+            conn.rollback()
+            return False
+        # write 可能已自行 commit（例如 db_utils.upsert_post_insights）
+        if conn.in_transaction:
+            conn.commit()
+        return True
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+
+
+def fail_task(conn, worker_id: str, task_id: int, error: str, retry_delay: float = RETRY_DELAY):
+    """釋放失敗的工作：未達重試上限時延後重新開放，否則標記為 failed"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE refresh_tasks
+        SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END,
+            lease_owner = NULL, lease_expires_at = NULL, available_at = ?, last_error = ?
+        WHERE task_id = ? AND lease_owner = ? AND status = 'leased'
+    """, (time.time() + retry_delay, error[:500], task_id, worker_id))
+    conn.commit()
+
+
+def queue_stats(conn) -> Dict[str, int]:
+    """各狀態的工作數"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT status, COUNT(*) FROM refresh_tasks GROUP BY status")
+    return {status: count for status, count in cursor.fetchall()}
+
+
+class _Heartbeat(threading.Thread):
+    """背景執行緒：定期延長目前持有的租約"""
+
+    def __init__(self, worker_id: str, lease_seconds: float):
+        super().__init__(daemon=True)
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.task_ids = []
+        self.stop_event = threading.Event()
+
+    def run(self):
+        conn = connect()
+        try:
+            while not self.stop_event.wait(self.lease_seconds / 3):
+                heartbeat(conn, self.worker_id, list(self.task_ids), self.lease_seconds)
+        finally:
+            conn.close()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+
+def run_worker(fb_config: Dict, worker_id: Optional[str] = None, batch_size: Optional[int] = None,
+               lease_seconds: float = LEASE_SECONDS, max_batches: Optional[int] = None,
+               planner=None) -> Dict:
+    """
+    持續領取並收集工作，直到佇列清空（或達到 max_batches / 呼叫預算）
+
+    Args:
+        fb_config: 收集使用的專頁設定；工作的 page_id 已登記於 pages 表時改用該專頁的 access token
+        planner: collectors.call_planner.CallPlanner，預算或期限用盡時停止領取
+
+    Returns:
+        {'worker_id', 'done', 'lost', 'failed'}
+    """
+    from collectors import page_registry
+    from main import POST_INSIGHTS_METRICS
+    from utils import graph_batch
+
+    worker_id = worker_id or new_worker_id()
+    batch_size = batch_size or graph_batch.POSTS_PER_BATCH
+    result = {'worker_id': worker_id, 'done': 0, 'lost': 0, 'failed': 0}
+
+    conn = connect()
+    configs = {page_config['page_id']: page_config for page_config in page_registry.page_configs(conn, fb_config)}
+    beat = _Heartbeat(worker_id, lease_seconds)
+    beat.start()
+    try:
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            if planner and not planner.can_spend(batch_size * graph_batch.REQUESTS_PER_POST):
+                break
+            tasks = lease_tasks(conn, worker_id, batch_size, lease_seconds)
+            if not tasks:
+                break
+            batches += 1
+            beat.task_ids = [task['task_id'] for task in tasks]
+
+            # 依工作的專頁分組，各自以該專頁的 token 收集
+            by_page = {}
+            for task in tasks:
+                by_page.setdefault(task['page_id'], []).append(task)
+            for page_id, page_tasks in by_page.items():
+                try:
+                    refreshed = graph_batch.fetch_posts_refresh(
+                        configs.get(page_id, fb_config), [task['post_id'] for task in page_tasks],
+                        POST_INSIGHTS_METRICS)
+                except Exception as e:
+                    for task in page_tasks:
+                        fail_task(conn, worker_id, task['task_id'], str(e))
+                    result['failed'] += len(page_tasks)
+                    continue
+
+                for task in page_tasks:
+                    insights, basic_stats = refreshed[task['post_id']]
+                    written = complete_task(conn, worker_id, task['task_id'], lambda c: db_utils.upsert_post_insights(
+                        c, task['post_id'], task['fetch_date'], insights or {}, basic_stats))
+                    result['done' if written else 'lost'] += 1
+            beat.task_ids = []
+    finally:
+        beat.stop()
+        conn.close()
+    return result
+
+
+def drain(fb_config: Dict, workers: int = 1, **kwargs) -> List[Dict]:
+    """在本機以 workers 個執行緒同時執行 run_worker，直到佇列清空"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(run_worker, fb_config, **kwargs) for _ in range(max(1, workers))]
+        return [future.result() for future in futures]
+
+
+def completed_posts(conn, fetch_date: str, post_ids: Iterable[str]) -> List[str]:
+    """post_ids 中已於 fetch_date 完成的貼文"""
+    post_ids = list(post_ids)
+    done = set()
+    cursor = conn.cursor()
+    for i in range(0, len(post_ids), 500):
+        chunk = post_ids[i:i + 500]
+        cursor.execute(f"""
+            SELECT post_id FROM refresh_tasks
+            WHERE fetch_date = ? AND status = 'done' AND post_id IN ({', '.join(['?'] * len(chunk))})
+        """, [fetch_date, *chunk])
+        done.update(row[0] for row in cursor.fetchall())
+    return [post_id for post_id in post_ids if post_id in done]
+
+
+if __name__ == '__main__':
+    import sys
+    from utils import config
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'worker':
+        summary = run_worker(config.FACEBOOK_CONFIG)
+        print(f"✓ worker {summary['worker_id']}: 完成 {summary['done']} / 租約遺失 {summary['lost']} / "
+              f"失敗 {summary['failed']}")
+    conn = connect()
+    print(f"佇列狀態: {queue_stats(conn)}")
+    conn.close()
@@ -12,9 +12,10 @@ from google.oauth2 import service_account
 import json
 import os
 import base64
-import sqlite3
 from datetime import datetime, timedelta
 
+from utils import db_utils
+
 # Configuration
 SPREADSHEET_NAME = 'Facebook Insights Metrics_Data Warehouse'
 DB_PATH = 'data/engagement_data.db'
@@ -24,9 +25,7 @@ def get_connection():
     """Get SQLite database connection"""
     project_root = Path(__file__).parent.parent
     db_path = project_root / 'data' / 'engagement_data.db'
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_utils.connect(str(db_path), readonly=True)
 
 
 def setup_google_sheets_client():
@@ -121,9 +120,8 @@ def export_raw_posts(client, conn):
             pp.performance_tier
         FROM posts p
         LEFT JOIN posts_classification pc ON p.post_id = pc.post_id
-        LEFT JOIN post_insights_snapshots i ON p.post_id = i.post_id
+        JOIN post_latest_metrics i ON p.post_id = i.post_id
         LEFT JOIN posts_performance pp ON p.post_id = pp.post_id
-        WHERE i.fetch_date = (SELECT MAX(fetch_date) FROM post_insights_snapshots WHERE post_id = p.post_id)
         ORDER BY p.created_time DESC
     """)
     
@@ -203,9 +201,8 @@ def export_performance_summary(client, conn):
             SUM(i.post_clicks) as total_clicks,
             SUM(i.shares_count) as total_shares
         FROM posts p
-        JOIN post_insights_snapshots i ON p.post_id = i.post_id
+        JOIN post_latest_metrics i ON p.post_id = i.post_id
         JOIN posts_performance pp ON p.post_id = pp.post_id
-        WHERE i.fetch_date = (SELECT MAX(fetch_date) FROM post_insights_snapshots WHERE post_id = p.post_id)
     """)
     overall = cursor.fetchone()
     
@@ -217,8 +214,7 @@ def export_performance_summary(client, conn):
             AVG(pp.engagement_rate) as avg_er,
             AVG(i.post_impressions_unique) as avg_reach
         FROM posts_performance pp
-        JOIN post_insights_snapshots i ON pp.post_id = i.post_id
-        WHERE i.fetch_date = (SELECT MAX(fetch_date) FROM post_insights_snapshots WHERE post_id = pp.post_id)
+        JOIN post_latest_metrics i ON pp.post_id = i.post_id
         GROUP BY pp.performance_tier
         ORDER BY avg_er DESC
     """)
@@ -272,8 +268,7 @@ def export_best_times(client, conn):
             AVG(i.post_impressions_unique) as avg_reach
         FROM posts_classification pc
         JOIN posts_performance pp ON pc.post_id = pp.post_id
-        JOIN post_insights_snapshots i ON pc.post_id = i.post_id
-        WHERE i.fetch_date = (SELECT MAX(fetch_date) FROM post_insights_snapshots WHERE post_id = pc.post_id)
+        JOIN post_latest_metrics i ON pc.post_id = i.post_id
         GROUP BY pc.hour_of_day
         ORDER BY avg_er DESC
     """)
@@ -341,8 +336,7 @@ def export_content_analysis(client, conn):
             AVG(i.post_impressions_unique) as avg_reach
         FROM posts_classification pc
         JOIN posts_performance pp ON pc.post_id = pp.post_id
-        JOIN post_insights_snapshots i ON pc.post_id = i.post_id
-        WHERE i.fetch_date = (SELECT MAX(fetch_date) FROM post_insights_snapshots WHERE post_id = pc.post_id)
+        JOIN post_latest_metrics i ON pc.post_id = i.post_id
         GROUP BY pc.format_type
         ORDER BY avg_er DESC
     """)
@@ -357,8 +351,7 @@ def export_content_analysis(client, conn):
             SUM(i.shares_count) as total_shares
         FROM posts_classification pc
         JOIN posts_performance pp ON pc.post_id = pp.post_id
-        JOIN post_insights_snapshots i ON pc.post_id = i.post_id
-        WHERE i.fetch_date = (SELECT MAX(fetch_date) FROM post_insights_snapshots WHERE post_id = pc.post_id)
+        JOIN post_latest_metrics i ON pc.post_id = i.post_id
         GROUP BY pc.issue_topic
         ORDER BY avg_er DESC
     """)
@@ -423,8 +416,7 @@ def export_top_posts(client, conn):
         FROM posts p
         JOIN posts_classification pc ON p.post_id = pc.post_id
         JOIN posts_performance pp ON p.post_id = pp.post_id
-        JOIN post_insights_snapshots i ON p.post_id = i.post_id
-        WHERE i.fetch_date = (SELECT MAX(fetch_date) FROM post_insights_snapshots WHERE post_id = p.post_id)
+        JOIN post_latest_metrics i ON p.post_id = i.post_id
         ORDER BY pp.engagement_rate DESC
         LIMIT 50
     """)
@@ -457,9 +449,8 @@ def export_monthly_trends(client, conn):
             AVG(pp.engagement_rate) as avg_er,
             SUM(i.shares_count) as total_shares
         FROM posts p
-        JOIN post_insights_snapshots i ON p.post_id = i.post_id
+        JOIN post_latest_metrics i ON p.post_id = i.post_id
         JOIN posts_performance pp ON p.post_id = pp.post_id
-        WHERE i.fetch_date = (SELECT MAX(fetch_date) FROM post_insights_snapshots WHERE post_id = p.post_id)
         GROUP BY strftime('%Y-%m', p.created_time)
         ORDER BY month DESC
     """)
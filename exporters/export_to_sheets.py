@@ -16,6 +16,7 @@ import base64
 import re
 from datetime import datetime, timedelta
 from analytics import analytics_reports, analytics_trends, ad_predictor
+from utils import migrations
 
 
 
@@ -659,12 +660,7 @@ def export_raw_post_insights(client, conn):
         # 合併 posts + post_insights + posts_classification + ads
         # 廣告狀態邏輯：使用統計結束日期判斷是否已過期
         cursor.execute("""
-            WITH latest_snapshots AS (
-                SELECT post_id, MAX(fetch_date) as latest_date
-                FROM post_insights_snapshots
-                GROUP BY post_id
-            ),
-            ad_date_range AS (
+            WITH ad_date_range AS (
                 SELECT ad_id, MIN(date_start) as date_start, MAX(date_stop) as date_stop
                 FROM ad_insights
                 GROUP BY ad_id
@@ -706,8 +702,7 @@ def export_raw_post_insights(client, conn):
                 COALESCE(ads.paid_impressions, 0) as paid_impressions,
                 COALESCE(ads.paid_clicks, 0) as paid_clicks,
                 p.permalink_url
-            FROM post_insights_snapshots i
-            JOIN latest_snapshots ls ON i.post_id = ls.post_id AND i.fetch_date = ls.latest_date
+            FROM post_latest_metrics i
             JOIN posts p ON i.post_id = p.post_id
             LEFT JOIN posts_classification pc ON p.post_id = pc.post_id
             LEFT JOIN ad_summary ads ON p.post_id = ads.post_id
@@ -798,17 +793,11 @@ def export_page_daily_metrics(client, conn):
                 FROM posts
                 GROUP BY post_date
             ),
-            latest_snapshots AS (
-                SELECT post_id, MAX(fetch_date) as latest_date
-                FROM post_insights_snapshots
-                GROUP BY post_id
-            ),
             daily_shares AS (
                 SELECT
                     DATE(REPLACE(REPLACE(p.created_time, 'T', ' '), '+0000', '')) as post_date,
                     SUM(i.shares_count) as total_shares
-                FROM post_insights_snapshots i
-                JOIN latest_snapshots ls ON i.post_id = ls.post_id AND i.fetch_date = ls.latest_date
+                FROM post_latest_metrics i
                 JOIN posts p ON i.post_id = p.post_id
                 GROUP BY post_date
             )
@@ -875,10 +864,25 @@ def export_raw_ads(client, conn):
             print("  ⊘ 廣告資料表尚未建立")
             return True
 
-        # 合併 ads 與 ad_insights，取得最新數據
+        # 合併 ads 與 ad_insights（每日資料依廣告加總）
         cursor.execute("""
-            WITH latest_insights AS (
-                SELECT ad_id, MAX(date_stop) as latest_date
+            WITH ad_totals AS (
+                SELECT ad_id,
+                       MIN(date_start) as date_start,
+                       MAX(date_stop) as date_stop,
+                       SUM(impressions) as impressions,
+                       SUM(reach) as reach,
+                       SUM(clicks) as clicks,
+                       SUM(spend) as spend,
+                       CASE WHEN SUM(impressions) > 0
+                            THEN ROUND((SUM(spend) / SUM(impressions)) * 1000, 2)
+                            ELSE 0 END as cpm,
+                       CASE WHEN SUM(clicks) > 0
+                            THEN ROUND(SUM(spend) / SUM(clicks), 2)
+                            ELSE 0 END as cpc,
+                       CASE WHEN SUM(impressions) > 0
+                            THEN ROUND((SUM(clicks) / CAST(SUM(impressions) AS FLOAT)) * 100, 2)
+                            ELSE 0 END as ctr
                 FROM ad_insights
                 GROUP BY ad_id
             )
@@ -900,8 +904,7 @@ def export_raw_ads(client, conn):
                 COALESCE(ai.ctr, 0) as ctr
             FROM ads a
             LEFT JOIN ad_campaigns ac ON a.campaign_id = ac.campaign_id
-            LEFT JOIN latest_insights li ON a.ad_id = li.ad_id
-            LEFT JOIN ad_insights ai ON a.ad_id = ai.ad_id AND ai.date_stop = li.latest_date
+            LEFT JOIN ad_totals ai ON a.ad_id = ai.ad_id
             ORDER BY ai.spend DESC NULLS LAST, a.created_time DESC
         """)
         rows_data = cursor.fetchall()
@@ -1029,17 +1032,16 @@ def export_deep_dive_metrics(client, conn, limit=100):
         worksheet.clear()
 
         cursor = conn.cursor()
-        # 使用 MAX 聚合（與 posts_performance KPI 計算一致，避免數據不一致）
+        # 使用各指標歷史最大值（與 posts_performance KPI 計算一致，避免數據不一致）
         cursor.execute("""
             WITH max_snapshots AS (
                 SELECT post_id,
-                       MAX(post_impressions_unique) as post_impressions_unique,
-                       MAX(likes_count) as likes_count,
-                       MAX(comments_count) as comments_count,
-                       MAX(shares_count) as shares_count,
-                       MAX(post_clicks) as post_clicks
-                FROM post_insights_snapshots
-                GROUP BY post_id
+                       best_post_impressions_unique as post_impressions_unique,
+                       best_likes_count as likes_count,
+                       best_comments_count as comments_count,
+                       best_shares_count as shares_count,
+                       best_post_clicks as post_clicks
+                FROM post_latest_metrics
             )
             SELECT
                 p.post_id,
@@ -1309,14 +1311,9 @@ def export_organic_vs_paid(client, conn):
 
         cursor = conn.cursor()
         
-        # 取得最新的 post_insights_snapshots（避免重複）
+        # 最新 snapshot 取自 post_latest_metrics（每則貼文一列，避免重複）
         cursor.execute("""
-            WITH latest_snapshots AS (
-                SELECT post_id, MAX(fetch_date) as latest_date
-                FROM post_insights_snapshots
-                GROUP BY post_id
-            ),
-            promoted_posts AS (
+            WITH promoted_posts AS (
                 SELECT DISTINCT post_id FROM ads WHERE post_id IS NOT NULL
             )
             SELECT 
@@ -1339,8 +1336,7 @@ def export_organic_vs_paid(client, conn):
                 i.post_clicks,
                 p.permalink_url
             FROM posts p
-            JOIN latest_snapshots ls ON p.post_id = ls.post_id
-            JOIN post_insights_snapshots i ON p.post_id = i.post_id AND i.fetch_date = ls.latest_date
+            JOIN post_latest_metrics i ON p.post_id = i.post_id
             LEFT JOIN promoted_posts pp ON p.post_id = pp.post_id
             LEFT JOIN posts_classification pc ON p.post_id = pc.post_id
             LEFT JOIN posts_performance perf ON p.post_id = perf.post_id
@@ -1351,12 +1347,7 @@ def export_organic_vs_paid(client, conn):
 
         # 計算摘要統計
         cursor.execute("""
-            WITH latest_snapshots AS (
-                SELECT post_id, MAX(fetch_date) as latest_date
-                FROM post_insights_snapshots
-                GROUP BY post_id
-            ),
-            promoted_posts AS (
+            WITH promoted_posts AS (
                 SELECT DISTINCT post_id FROM ads WHERE post_id IS NOT NULL
             )
             SELECT 
@@ -1369,8 +1360,7 @@ def export_organic_vs_paid(client, conn):
                 SUM(i.post_impressions_unique) as total_reach,
                 SUM(i.likes_count + i.comments_count + i.shares_count) as total_engagement
             FROM posts p
-            JOIN latest_snapshots ls ON p.post_id = ls.post_id
-            JOIN post_insights_snapshots i ON p.post_id = i.post_id AND i.fetch_date = ls.latest_date
+            JOIN post_latest_metrics i ON p.post_id = i.post_id
             LEFT JOIN promoted_posts pp ON p.post_id = pp.post_id
             LEFT JOIN posts_performance perf ON p.post_id = perf.post_id
             GROUP BY ad_status
@@ -1736,6 +1726,74 @@ def export_ad_recommendations_data(client, conn):
         return False
 
 
+# 自然 vs 付費比較：每則貼文一列（廣告狀態、分類、成效與各指標歷史最大值）
+ORGANIC_VS_PAID_DATA_SQL = """
+    SELECT
+        p.post_id,
+        SUBSTR(p.message, 1, 50) as post_preview,
+        DATE(p.created_time) as created_date,
+        CASE WHEN a.post_id IS NOT NULL THEN 'paid' ELSE 'organic' END as ad_status,
+        COALESCE(pc.format_type, '未分類') as format_type,
+        COALESCE(pc.issue_topic, '未分類') as issue_topic,
+        perf.engagement_rate,
+        perf.share_rate,
+        perf.comment_rate,
+        perf.click_through_rate,
+        perf.performance_tier,
+        i.reach,
+        i.total_interactions,
+        i.reactions,
+        i.comments,
+        i.shares,
+        i.post_clicks,
+        p.permalink_url
+    FROM posts p
+    LEFT JOIN (SELECT DISTINCT post_id FROM ads) a ON p.post_id = a.post_id
+    LEFT JOIN (
+        SELECT
+            post_id,
+            best_post_impressions_unique as reach,
+            best_post_clicks as post_clicks,
+            best_post_reactions_like_total + best_post_reactions_love_total + best_post_reactions_wow_total + best_post_reactions_haha_total + best_post_reactions_sorry_total + best_post_reactions_anger_total as reactions,
+            best_comments_count as comments,
+            best_shares_count as shares,
+            (best_post_reactions_like_total + best_post_reactions_love_total + best_post_reactions_wow_total + best_post_reactions_haha_total + best_post_reactions_sorry_total + best_post_reactions_anger_total + best_comments_count + best_shares_count) as total_interactions
+        FROM post_latest_metrics
+    ) i ON p.post_id = i.post_id
+    LEFT JOIN posts_classification pc ON p.post_id = pc.post_id
+    LEFT JOIN posts_performance perf ON p.post_id = perf.post_id
+    ORDER BY created_date DESC
+"""
+
+# 按月份 + 時段 + 議題 + 行動分組的最佳發文時間
+# 使用 MAX 取各指標最大值，避免不完整 snapshot 導致數據為 0
+YEARLY_POSTING_ANALYSIS_SQL = """
+    SELECT
+        strftime('%m', substr(p.created_time, 1, 10)) as month,
+        pc.time_slot,
+        COALESCE(pc.issue_topic, '未分類') as issue_topic,
+        COALESCE(pc.format_type, '未分類') as format_type,
+        COUNT(*) as post_count,
+        ROUND(AVG(pp.engagement_rate), 4) as avg_er,
+        ROUND(AVG(pp.click_through_rate), 4) as avg_ctr,
+        ROUND(AVG(pp.share_rate), 4) as avg_sr,
+        SUM(CASE WHEN pp.performance_tier IN ('viral', 'high') THEN 1 ELSE 0 END) as high_performer_count,
+        COALESCE(SUM(bs.max_clicks), 0) as sum_max_clicks,
+        COALESCE(SUM(bs.max_shares), 0) as sum_max_shares
+    FROM posts p
+    JOIN posts_classification pc ON p.post_id = pc.post_id
+    JOIN posts_performance pp ON p.post_id = pp.post_id
+    LEFT JOIN (
+        SELECT post_id,
+               best_post_clicks as max_clicks,
+               best_shares_count as max_shares
+        FROM post_latest_metrics
+    ) bs ON p.post_id = bs.post_id
+    GROUP BY strftime('%m', substr(p.created_time, 1, 10)), pc.time_slot, pc.issue_topic, pc.format_type
+    ORDER BY month, avg_er DESC
+"""
+
+
 def export_organic_vs_paid_data(client, conn):
     """導出自然 vs 付費比較資料版 (Flat Sheet for Looker Studio)"""
     try:
@@ -1751,44 +1809,7 @@ def export_organic_vs_paid_data(client, conn):
         cursor = conn.cursor()
         
         # 取得詳細資料 (重複利用既有 SQL 邏輯，修正 latest_insights 為子查詢)
-        cursor.execute("""
-            SELECT 
-                p.post_id,
-                SUBSTR(p.message, 1, 50) as post_preview,
-                DATE(p.created_time) as created_date,
-                CASE WHEN a.post_id IS NOT NULL THEN 'paid' ELSE 'organic' END as ad_status,
-                COALESCE(pc.format_type, '未分類') as format_type,
-                COALESCE(pc.issue_topic, '未分類') as issue_topic,
-                perf.engagement_rate,
-                perf.share_rate,
-                perf.comment_rate,
-                perf.click_through_rate,
-                perf.performance_tier,
-                i.reach,
-                i.total_interactions,
-                i.reactions,
-                i.comments,
-                i.shares,
-                i.post_clicks,
-                p.permalink_url
-            FROM posts p
-            LEFT JOIN (SELECT DISTINCT post_id FROM ads) a ON p.post_id = a.post_id
-            LEFT JOIN (
-                SELECT 
-                    post_id,
-                    MAX(post_impressions_unique) as reach,
-                    MAX(post_clicks) as post_clicks,
-                    MAX(post_reactions_like_total + post_reactions_love_total + post_reactions_wow_total + post_reactions_haha_total + post_reactions_sorry_total + post_reactions_anger_total) as reactions,
-                    MAX(comments_count) as comments,
-                    MAX(shares_count) as shares,
-                    (MAX(post_reactions_like_total + post_reactions_love_total + post_reactions_wow_total + post_reactions_haha_total + post_reactions_sorry_total + post_reactions_anger_total) + MAX(comments_count) + MAX(shares_count)) as total_interactions
-                FROM post_insights_snapshots
-                GROUP BY post_id
-            ) i ON p.post_id = i.post_id
-            LEFT JOIN posts_classification pc ON p.post_id = pc.post_id
-            LEFT JOIN posts_performance perf ON p.post_id = perf.post_id
-            ORDER BY created_date DESC
-        """)
+        cursor.execute(ORGANIC_VS_PAID_DATA_SQL)
         rows_data = cursor.fetchall()
         
         # 標題 (Row 1)
@@ -2043,34 +2064,7 @@ def export_yearly_posting_analysis(client, conn):
 
         cursor = conn.cursor()
         
-        # 按月份 + 時段 + 議題 + 行動分組的最佳發文時間
-        # 使用 MAX 取各指標最大值，避免不完整 snapshot 導致數據為 0
-        cursor.execute("""
-            SELECT 
-                strftime('%m', substr(p.created_time, 1, 10)) as month,
-                pc.time_slot,
-                COALESCE(pc.issue_topic, '未分類') as issue_topic,
-                COALESCE(pc.format_type, '未分類') as format_type,
-                COUNT(*) as post_count,
-                ROUND(AVG(pp.engagement_rate), 4) as avg_er,
-                ROUND(AVG(pp.click_through_rate), 4) as avg_ctr,
-                ROUND(AVG(pp.share_rate), 4) as avg_sr,
-                SUM(CASE WHEN pp.performance_tier IN ('viral', 'high') THEN 1 ELSE 0 END) as high_performer_count,
-                COALESCE(SUM(bs.max_clicks), 0) as sum_max_clicks,
-                COALESCE(SUM(bs.max_shares), 0) as sum_max_shares
-            FROM posts p
-            JOIN posts_classification pc ON p.post_id = pc.post_id
-            JOIN posts_performance pp ON p.post_id = pp.post_id
-            LEFT JOIN (
-                SELECT post_id, 
-                       MAX(post_clicks) as max_clicks,
-                       MAX(shares_count) as max_shares
-                FROM post_insights_snapshots
-                GROUP BY post_id
-            ) bs ON p.post_id = bs.post_id
-            GROUP BY month, pc.time_slot, pc.issue_topic, pc.format_type
-            ORDER BY month, avg_er DESC
-        """)
+        cursor.execute(YEARLY_POSTING_ANALYSIS_SQL)
         rows_data = cursor.fetchall()
 
         # 月份對照
@@ -2729,12 +2723,7 @@ def export_ad_analytics(client, conn):
         rows.append(['⚖️ 自然 vs 付費貼文成效比較', '', '', '', '', '', '', ''])
 
         cursor.execute("""
-            WITH latest_snapshots AS (
-                SELECT post_id, MAX(fetch_date) as latest_date
-                FROM post_insights_snapshots
-                GROUP BY post_id
-            ),
-            promoted_posts AS (
+            WITH promoted_posts AS (
                 SELECT DISTINCT post_id FROM ads WHERE post_id IS NOT NULL
             )
             SELECT
@@ -2747,8 +2736,7 @@ def export_ad_analytics(client, conn):
                 SUM(i.post_impressions_unique) as total_reach,
                 SUM(i.likes_count + i.comments_count + i.shares_count) as total_engagement
             FROM posts p
-            JOIN latest_snapshots ls ON p.post_id = ls.post_id
-            JOIN post_insights_snapshots i ON p.post_id = i.post_id AND i.fetch_date = ls.latest_date
+            JOIN post_latest_metrics i ON p.post_id = i.post_id
             LEFT JOIN promoted_posts pp ON p.post_id = pp.post_id
             LEFT JOIN posts_performance perf ON p.post_id = perf.post_id
             GROUP BY ad_status
@@ -3038,8 +3026,9 @@ def main():
     print("🧹 清理舊分頁:")
     cleanup_old_tabs(client)
 
-    # 連接資料庫
+    # 連接資料庫（並套用待執行的 schema 遷移）
     conn = analytics_reports.get_connection()
+    migrations.migrate(conn)
 
     print("\n開始導出分析報表...\n")
 
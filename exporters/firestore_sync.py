@@ -10,6 +10,8 @@ from datetime import datetime
 from typing import Dict, List, Any, Optional
 import sqlite3
 
+from utils import db_utils
+
 try:
     import firebase_admin
     from firebase_admin import credentials, firestore
@@ -24,9 +26,7 @@ def get_connection():
     # Go up one level from exporters/ to project root, then into data/
     project_root = os.path.dirname(os.path.dirname(__file__))
     db_path = os.path.join(project_root, 'data', 'engagement_data.db')
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_utils.connect(db_path, readonly=True)
 
 
 def init_firestore() -> Optional[Any]:
@@ -137,15 +137,9 @@ def sync_posts_to_firestore(db_conn: sqlite3.Connection, firestore_db: Any) -> i
             pc.day_of_week,
             pc.is_weekend
         FROM posts p
-        LEFT JOIN post_insights_snapshots i ON p.post_id = i.post_id
+        LEFT JOIN post_latest_metrics i ON p.post_id = i.post_id
         LEFT JOIN posts_performance pp ON p.post_id = pp.post_id
         LEFT JOIN posts_classification pc ON p.post_id = pc.post_id
-        WHERE i.fetch_date = (
-            SELECT MAX(fetch_date)
-            FROM post_insights_snapshots
-            WHERE post_id = p.post_id
-        )
-        OR i.post_id IS NULL
         ORDER BY p.created_time DESC
     """)
 
@@ -248,11 +242,11 @@ def sync_daily_metrics_to_firestore(db_conn: sqlite3.Connection, firestore_db: A
     cursor = db_conn.cursor()
 
     # Calculate daily metrics from posts
-    # Note: Use SUBSTR for date extraction since SQLite DATE() doesn't handle timezone format
+    # created_date is the precomputed UTC date of created_time (indexed)
     # Calculate engagement rate directly from raw data for accuracy
     cursor.execute("""
         SELECT
-            SUBSTR(p.created_time, 1, 10) as date,
+            p.created_date as date,
             COUNT(*) as post_count,
             SUM(i.post_impressions_unique) as total_reach,
             SUM(i.likes_count + i.comments_count + i.shares_count) as total_engagement,
@@ -264,14 +258,9 @@ def sync_daily_metrics_to_firestore(db_conn: sqlite3.Connection, firestore_db: A
             SUM(i.shares_count) as total_shares,
             SUM(i.post_clicks) as total_clicks
         FROM posts p
-        JOIN post_insights_snapshots i ON p.post_id = i.post_id
-        WHERE (i.post_id, i.fetch_date) IN (
-            SELECT post_id, MAX(fetch_date)
-            FROM post_insights_snapshots
-            GROUP BY post_id
-        )
-        AND p.created_time IS NOT NULL
-        GROUP BY SUBSTR(p.created_time, 1, 10)
+        JOIN post_latest_metrics i ON p.post_id = i.post_id
+        WHERE p.created_date IS NOT NULL
+        GROUP BY p.created_date
         ORDER BY date DESC
         LIMIT 365
     """)
@@ -339,13 +328,8 @@ def sync_aggregates_to_firestore(db_conn: sqlite3.Connection, firestore_db: Any)
             AVG(i.post_impressions_unique) as avg_reach
         FROM posts_classification pc
         JOIN posts_performance pp ON pc.post_id = pp.post_id
-        JOIN post_insights_snapshots i ON pc.post_id = i.post_id
+        JOIN post_latest_metrics i ON pc.post_id = i.post_id
         WHERE pc.format_type IS NOT NULL AND pc.format_type != ''
-        AND i.fetch_date = (
-            SELECT MAX(fetch_date)
-            FROM post_insights_snapshots
-            WHERE post_id = pc.post_id
-        )
         GROUP BY pc.format_type
         ORDER BY count DESC
     """)
@@ -373,13 +357,8 @@ def sync_aggregates_to_firestore(db_conn: sqlite3.Connection, firestore_db: Any)
             AVG(i.post_impressions_unique) as avg_reach
         FROM posts_classification pc
         JOIN posts_performance pp ON pc.post_id = pp.post_id
-        JOIN post_insights_snapshots i ON pc.post_id = i.post_id
+        JOIN post_latest_metrics i ON pc.post_id = i.post_id
         WHERE pc.issue_topic IS NOT NULL AND pc.issue_topic != ''
-        AND i.fetch_date = (
-            SELECT MAX(fetch_date)
-            FROM post_insights_snapshots
-            WHERE post_id = pc.post_id
-        )
         GROUP BY pc.issue_topic
         ORDER BY count DESC
     """)
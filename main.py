@@ -10,9 +10,10 @@ from google.oauth2 import service_account
 import json
 import os
 import base64
+import threading
 from datetime import datetime, timedelta
-import time
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 from flask import Flask, jsonify, request
 
 # ==================== 設定區 ====================
@@ -50,6 +51,7 @@ GOOGLE_SHEETS_CONFIG = {
 #   - post_impressions_fan_unique, post_impressions_viral_unique
 #   - post_impressions, post_impressions_organic, post_impressions_paid
 from utils.config import POST_METRICS
+from utils.graph_client import graph_get
 POST_INSIGHTS_METRICS = POST_METRICS  # 使用 config.py 的統一定義
 
 # 保留原有列表作為參考 (已棄用)
@@ -74,7 +76,7 @@ def test_facebook_api_connection(config: Dict[str, str]) -> bool:
             'fields': 'id,name,fan_count'
         }
 
-        response = requests.get(url, params=params)
+        response = graph_get(url, params=params)
         response.raise_for_status()
 
         data = response.json()
@@ -92,11 +94,88 @@ def test_facebook_api_connection(config: Dict[str, str]) -> bool:
         return False
 
 
-def fetch_page_posts(config: Dict[str, str], since: str, until: str, limit: int = 100) -> Optional[List[Dict]]:
-    """從 Facebook API 獲取頁面貼文列表"""
+def build_post_listing_fields(metrics: List[str]) -> str:
+    """
+    組出貼文列表的欄位展開字串
+
+    在同一個分頁請求中一併取回反應數、留言數、分享數與 insights，
+    取代每則貼文額外 3 個 GET 請求
+    """
+    return ','.join([
+        'id', 'message', 'created_time', 'permalink_url',
+        'reactions.summary(total_count).limit(0)',
+        'comments.summary(total_count).limit(0)',
+        'shares',
+        f"insights.metric({','.join(metrics)})",
+    ])
+
+
+def extract_post_stats(post: Dict) -> Tuple[Dict, Dict]:
+    """
+    從欄位展開後的貼文取出 (insights, basic_stats)，格式與 db_utils.upsert_post_insights 相同
+    """
+    basic_stats = {
+        'likes_count': post.get('reactions', {}).get('summary', {}).get('total_count', 0),
+        'comments_count': post.get('comments', {}).get('summary', {}).get('total_count', 0),
+        'shares_count': post.get('shares', {}).get('count', 0),
+    }
+    return post.get('insights', {}), basic_stats
+
+
+def fetch_post_stats(config: Dict[str, str], post: Dict):
+    """逐筆模式：為單則貼文另發 3 個請求取得反應數、留言數與分享數"""
+    from utils.graph_batch import graph_base_url
+    post_id = post['id']
+
+    # 獲取反應總數
+    reactions_url = f"{graph_base_url(config)}/{post_id}/reactions"
+    reactions_params = {'access_token': config['access_token'], 'summary': 'total_count', 'limit': 0}
+    reactions_response = graph_get(reactions_url, params=reactions_params, timeout=10)
+    if reactions_response.status_code == 200:
+        reactions_data = reactions_response.json()
+        post['reactions'] = {'summary': {'total_count': reactions_data.get('summary', {}).get('total_count', 0)}}
+
+    # 獲取留言總數
+    comments_url = f"{graph_base_url(config)}/{post_id}/comments"
+    comments_params = {'access_token': config['access_token'], 'summary': 'total_count', 'limit': 0}
+    comments_response = graph_get(comments_url, params=comments_params, timeout=10)
+    if comments_response.status_code == 200:
+        comments_data = comments_response.json()
+        post['comments'] = {'summary': {'total_count': comments_data.get('summary', {}).get('total_count', 0)}}
+
+    # 獲取分享數
+    shares_url = f"{graph_base_url(config)}/{post_id}"
+    shares_params = {'access_token': config['access_token'], 'fields': 'shares'}
+    shares_response = graph_get(shares_url, params=shares_params, timeout=10)
+    if shares_response.status_code == 200:
+        shares_data = shares_response.json()
+        post['shares'] = shares_data.get('shares', {})
+
+
+def with_fields(url: str, params: Dict, fields: str) -> Tuple[str, Dict]:
+    """以指定的 fields 重新組出同一個分頁請求（下一頁的 URL 已含查詢參數，params 為空）"""
+    if params:
+        return url, dict(params, fields=fields)
+    split = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(split.query, keep_blank_values=True) if k != 'fields']
+    return urlunsplit(split._replace(query=urlencode(query + [('fields', fields)]))), params
+
+
+def fetch_page_posts(config: Dict[str, str], since: str, until: str, limit: int = 100,
+                     expand_fields: bool = False, fields: Optional[str] = None) -> Optional[List[Dict]]:
+    """
+    從 Facebook API 獲取頁面貼文列表
+
+    Args:
+        expand_fields: True 時以欄位展開在分頁請求中取回互動數與 insights（約 N/limit 個請求）；
+                       某一頁的展開請求被拒（400）時，該頁改用逐筆模式重新請求，之後的頁面仍使用欄位展開。
+                       False 時沿用舊模式，每則貼文另發 3 個請求取得互動數
+        fields: 指定時只以這些欄位列出貼文，不取互動數與 insights（對帳用的輕量列表）
+    """
     import calendar
+    from utils.graph_batch import graph_base_url, parse_insights
     try:
-        url = f"https://graph.facebook.com/{config['api_version']}/{config['page_id']}/posts"
+        url = f"{graph_base_url(config)}/{config['page_id']}/posts"
 
         # 轉換日期為 Unix timestamp (UTC)
         since_dt = datetime.strptime(since, '%Y-%m-%d')
@@ -104,9 +183,18 @@ def fetch_page_posts(config: Dict[str, str], since: str, until: str, limit: int
         since_ts = calendar.timegm(since_dt.timetuple())
         until_ts = calendar.timegm(until_dt.timetuple()) + 86400
 
+        list_only = fields is not None
+        basic_fields = 'id,message,created_time,permalink_url'
+        if list_only:
+            expand_fields = False
+        elif expand_fields:
+            fields = build_post_listing_fields(POST_INSIGHTS_METRICS)
+        else:
+            fields = basic_fields
+
         params = {
             'access_token': config['access_token'],
-            'fields': 'id,message,created_time,permalink_url',
+            'fields': fields,
             'since': since_ts,
             'until': until_ts,
             'limit': limit
@@ -117,46 +205,42 @@ def fetch_page_posts(config: Dict[str, str], since: str, until: str, limit: int
         print(f"日期範圍: {since} 到 {until}")
 
         while url:
-            response = requests.get(url, params=params)
+            response = graph_get(url, params=params, timeout=30)
+            page_expanded = expand_fields
+
+            if expand_fields and response.status_code == 400:
+                # 部分貼文的 insights 無法展開時，整個請求會失敗，此頁改用逐筆模式
+                print(f"⚠ 欄位展開請求失敗，此頁改用逐筆模式: "
+                      f"{response.json().get('error', {}).get('message', '')}")
+                url, params = with_fields(url, params, basic_fields)
+                response = graph_get(url, params=params, timeout=30)
+                page_expanded = False
+
             response.raise_for_status()
 
             data = response.json()
             posts = data.get('data', [])
 
-            # 為每則貼文獲取額外資訊
             for post in posts:
-                post_id = post['id']
-
-                # 獲取反應總數
-                reactions_url = f"https://graph.facebook.com/{config['api_version']}/{post_id}/reactions"
-                reactions_params = {'access_token': config['access_token'], 'summary': 'total_count', 'limit': 0}
-                reactions_response = requests.get(reactions_url, params=reactions_params)
-                if reactions_response.status_code == 200:
-                    reactions_data = reactions_response.json()
-                    post['reactions'] = {'summary': {'total_count': reactions_data.get('summary', {}).get('total_count', 0)}}
-
-                # 獲取留言總數
-                comments_url = f"https://graph.facebook.com/{config['api_version']}/{post_id}/comments"
-                comments_params = {'access_token': config['access_token'], 'summary': 'total_count', 'limit': 0}
-                comments_response = requests.get(comments_url, params=comments_params)
-                if comments_response.status_code == 200:
-                    comments_data = comments_response.json()
-                    post['comments'] = {'summary': {'total_count': comments_data.get('summary', {}).get('total_count', 0)}}
-
-                # 獲取分享數
-                shares_url = f"https://graph.facebook.com/{config['api_version']}/{post_id}"
-                shares_params = {'access_token': config['access_token'], 'fields': 'shares'}
-                shares_response = requests.get(shares_url, params=shares_params)
-                if shares_response.status_code == 200:
-                    shares_data = shares_response.json()
-                    post['shares'] = shares_data.get('shares', {})
+                if list_only:
+                    continue
+                if page_expanded:
+                    # 將展開的 insights 轉為 {metric_name: value}
+                    if 'insights' in post:
+                        post['insights'] = parse_insights(post['insights'])
+                    continue
+
+                # 為每則貼文獲取額外資訊
+                fetch_post_stats(config, post)
 
             all_posts.extend(posts)
 
-            # 檢查是否有下一頁
+            # 檢查是否有下一頁（逐筆模式的頁面回傳的下一頁 URL 不含欄位展開，需加回）
             paging = data.get('paging', {})
             url = paging.get('next')
             params = {}
+            if url and expand_fields and not page_expanded:
+                url, params = with_fields(url, params, fields)
 
             print(f"  已獲取 {len(all_posts)} 則貼文...")
 
@@ -180,7 +264,7 @@ def fetch_post_insights(config: Dict[str, str], post_id: str, metrics: List[str]
             'metric': ','.join(metrics)
         }
 
-        response = requests.get(url, params=params)
+        response = graph_get(url, params=params)
         response.raise_for_status()
 
         data = response.json()
@@ -406,7 +490,7 @@ def main_posts_collection(since_date: str = None, until_date: str = None) -> boo
     try:
         url = f"https://graph.facebook.com/{FACEBOOK_CONFIG['api_version']}/{FACEBOOK_CONFIG['page_id']}"
         params = {'access_token': FACEBOOK_CONFIG['access_token'], 'fields': 'id,name'}
-        response = requests.get(url, params=params)
+        response = graph_get(url, params=params)
         response.raise_for_status()
         page_data = response.json()
         page_name = page_data.get('name', '')
@@ -417,7 +501,7 @@ def main_posts_collection(since_date: str = None, until_date: str = None) -> boo
 
     # 獲取貼文列表
     print(f"\n步驟 1: 獲取貼文列表")
-    posts = fetch_page_posts(FACEBOOK_CONFIG, since_date, until_date)
+    posts = fetch_page_posts(FACEBOOK_CONFIG, since_date, until_date, expand_fields=True)
 
     if posts is None or not posts:
         print("⚠️ 無貼文或獲取失敗")
@@ -433,6 +517,15 @@ def main_posts_collection(since_date: str = None, until_date: str = None) -> boo
         post_id = post.get('id')
         print(f"  處理 {i}/{len(posts)}: {post_id}", end='')
 
+        # 欄位展開模式已在列表請求中取回 insights，不需再另外請求
+        if 'insights' in post:
+            if post['insights']:
+                success_count += 1
+                print(f" - ✓")
+            else:
+                print(f" - ⊘")
+            continue
+
         insights = fetch_post_insights(FACEBOOK_CONFIG, post_id, POST_INSIGHTS_METRICS)
 
         if insights:
@@ -443,8 +536,6 @@ def main_posts_collection(since_date: str = None, until_date: str = None) -> boo
             post['insights'] = {}
             print(f" - ⊘")
 
-        time.sleep(0.2)
-
     print(f"\n✓ Insights 數據獲取完成 (成功: {success_count})")
 
     # 處理數據
@@ -468,9 +559,37 @@ def main_posts_collection(since_date: str = None, until_date: str = None) -> boo
 
 app = Flask(__name__)
 
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+@app.before_request
+def apply_pending_migrations():
+    """
+    第一個請求前套用待執行的 schema 遷移（每個行程一次）
+
+    報表與查詢端點以唯讀連線開啟資料庫，無法自行遷移；映像中的舊版資料庫須先更新 schema
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            from utils import db_utils
+            conn = db_utils.get_db_connection()
+            if conn:
+                conn.close()
+            _schema_ready = True
+
 @app.route('/', methods=['GET', 'POST'])
 def run_collection():
-    """Cloud Scheduler 會呼叫這個端點來觸發完整數據收集流程"""
+    """
+    Cloud Scheduler 會呼叫這個端點來觸發完整數據收集流程
+
+    查詢參數 max_calls / deadline_seconds（或環境變數 GRAPH_CALL_BUDGET / RUN_DEADLINE_SECONDS）
+    限制本次執行的 Graph API 呼叫數與執行時間；multi_page=1（或環境變數 MULTI_PAGE=1）
+    收集 pages 登記表中所有啟用的專頁
+    """
     try:
         import run_pipeline
         from exporters import export_to_sheets as exporter
@@ -487,8 +606,17 @@ def run_collection():
         print("開始執行完整數據收集流程...")
         print("=" * 60)
 
+        # 呼叫預算與執行期限：可由查詢參數或環境變數設定（未設定表示不限）
+        budget = request.args.get('max_calls', os.environ.get('GRAPH_CALL_BUDGET'))
+        deadline = request.args.get('deadline_seconds', os.environ.get('RUN_DEADLINE_SECONDS'))
+        multi_page = request.args.get('multi_page', os.environ.get('MULTI_PAGE', '0'))
+
         try:
-            run_pipeline.run_full_pipeline()
+            run_pipeline.run_full_pipeline(
+                budget=int(budget) if budget else None,
+                deadline=float(deadline) if deadline else None,
+                multi_page=multi_page in ('1', 'true')
+            )
             results['pipeline'] = True
             print("✓ run_pipeline 完成")
         except Exception as e:
@@ -574,13 +702,41 @@ def run_analytics():
         }), 500
 
 
+def analytics_engine() -> str:
+    """報表查詢引擎：?engine= 參數，預設 ANALYTICS_ENGINE 環境變數（sqlite / duckdb）"""
+    return request.args.get('engine', os.environ.get('ANALYTICS_ENGINE', 'sqlite'))
+
+
+def engine_error(engine: str):
+    """引擎無法使用時回傳 400 回應（不支援的引擎，或未安裝 duckdb），否則回傳 None"""
+    if engine == 'duckdb':
+        from analytics import duckdb_engine
+        if duckdb_engine.DUCKDB_AVAILABLE:
+            return None
+        message = '未安裝 duckdb，無法使用 DuckDB 分析引擎 (pip install duckdb)，請改用 engine=sqlite'
+    elif engine == 'sqlite':
+        return None
+    else:
+        message = f'不支援的引擎: {engine} (sqlite/duckdb)'
+    return jsonify({
+        'status': 'error',
+        'message': message,
+        'timestamp': datetime.now().isoformat()
+    }), 400
+
+
 @app.route('/reports/weekly', methods=['GET'])
 def get_weekly_report():
     """取得週報端點"""
     try:
         from analytics import analytics_reports
 
-        conn = analytics_reports.get_connection()
+        engine = analytics_engine()
+        error = engine_error(engine)
+        if error:
+            return error
+
+        conn = analytics_reports.get_connection(readonly=True, engine=engine)
         report_text = analytics_reports.generate_weekly_report(conn)
         conn.close()
 
@@ -611,6 +767,7 @@ def query_custom():
         topic: 主題篩選 (可選)
         time_slot: 時段篩選 (可選)
         limit: 回傳筆數 (預設: 10)
+        engine: 查詢引擎 (sqlite/duckdb, 預設: ANALYTICS_ENGINE 環境變數或 sqlite)
 
     範例:
         /query?start_date=2025-11-01&end_date=2025-11-30&granularity=weekly&type=trends
@@ -635,7 +792,12 @@ def query_custom():
             end_date = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
             start_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
 
-        conn = query_analytics.get_connection()
+        engine = analytics_engine()
+        error = engine_error(engine)
+        if error:
+            return error
+
+        conn = query_analytics.get_connection(readonly=True, engine=engine)
 
         # 根據查詢類型執行不同查詢
         if query_type == 'trends':
@@ -701,7 +863,12 @@ def get_custom_report():
             end_date = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
             start_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
 
-        conn = query_analytics.get_connection()
+        engine = analytics_engine()
+        error = engine_error(engine)
+        if error:
+            return error
+
+        conn = query_analytics.get_connection(readonly=True, engine=engine)
         report_text = query_analytics.generate_custom_report(conn, start_date, end_date, granularity)
         conn.close()
 
@@ -3,13 +3,16 @@ Facebook 社群數據分析框架 - 完整執行流程
 整合數據收集、分析處理、報表產出
 """
 
+import contextlib
+import heapq
 import sys
 import time
 from datetime import datetime
 import requests
 
 # 導入各模組
-from utils import config, db_utils
+from utils import config, db_utils, graph_batch, graph_client
+from utils.graph_client import graph_get
 from collectors import collector_page, collector_ads
 from analytics import analytics_processor, analytics_reports
 
@@ -21,13 +24,13 @@ def test_api_connection():
     print("="*60)
 
     try:
-        url = f"https://graph.facebook.com/{config.FACEBOOK_CONFIG['api_version']}/{config.FACEBOOK_CONFIG['page_id']}"
+        url = f"{graph_batch.graph_base_url(config.FACEBOOK_CONFIG)}/{config.FACEBOOK_CONFIG['page_id']}"
         params = {
             'access_token': config.FACEBOOK_CONFIG['access_token'],
             'fields': 'id,name,fan_count,followers_count'
         }
 
-        response = requests.get(url, params=params)
+        response = graph_get(url, params=params)
         response.raise_for_status()
 
         data = response.json()
@@ -46,14 +49,21 @@ def test_api_connection():
         return False
 
 
-def collect_page_data(days_back=7):
-    """收集頁面層級數據"""
+def collect_page_data(days_back=7, backfill_since=None):
+    """
+    收集頁面層級數據
+    只抓取最後一筆已存日期之後的天數（見 collector_page.incremental_since）；
+    days_back 為尚無資料時的初始範圍，backfill_since 可回補指定日期之後的完整歷史
+    """
     print("\n" + "="*60)
-    print(f"Step 1: 收集頁面層級數據（最近 {days_back} 天）")
+    if backfill_since:
+        print(f"Step 1: 收集頁面層級數據（回補 {backfill_since} 起的歷史）")
+    else:
+        print(f"Step 1: 收集頁面層級數據（增量，初始 {days_back} 天）")
     print("="*60)
 
     try:
-        collector_page.process_and_save_page_data(days_back=days_back)
+        collector_page.process_and_save_page_data(days_back=days_back, backfill_since=backfill_since)
         print("✓ 頁面數據收集完成")
         return True
     except Exception as e:
@@ -61,29 +71,59 @@ def collect_page_data(days_back=7):
         return False
 
 
-def collect_post_data(since_date=None, until_date=None, limit=100):
+def collect_post_data(since_date=None, until_date=None, limit=100, use_async=False, concurrency=None,
+                      reconcile=None, planner=None, fb_config=None, queue_workers=None):
     """
     收集貼文層級數據
-    - 發布 30 天內的貼文：每日收集 insights（追蹤成長）
-    - 發布超過 30 天的貼文：只收集一次（如果還沒有 snapshot）
+    只收集 refresh_queue 中到期的貼文（見 collectors.refresh_scheduler）：
+    - 新貼文與仍在成長的貼文：每日收集 insights（追蹤成長）
+    - 成長趨緩的貼文：每 3 天或每週收集；已飽和的舊貼文停止收集
+
+    Args:
+        since_date: 列表起點；None 時依專頁水位只列出新貼文（見 collectors.post_discovery）
+        use_async: True 時以非同步引擎（collectors.async_collector）並行收集，否則使用 batch 請求
+        concurrency: 非同步引擎的全域並行上限（None 使用預設值）
+        reconcile: 是否執行對帳（列出完整歷史以同步編輯與刪除）；None 時依對帳週期決定
+        planner: collectors.call_planner.CallPlanner，限制呼叫預算與執行期限（None 表示不限）
+        fb_config: 要收集的專頁設定（None 時為 config.FACEBOOK_CONFIG；多專頁模式見 collectors.multi_page）
+        queue_workers: 設定時把到期貼文寫入工作佇列（collectors.work_queue），以此數量的本機 worker 領取收集；
+                       其他行程或執行個體的 worker 可同時領取同一個佇列
     """
+    from collectors import call_planner, post_discovery, refresh_scheduler
+
+    fb_config = fb_config or config.FACEBOOK_CONFIG
+    page_id = fb_config['page_id']
+
     print("\n" + "="*60)
-    print("Step 2: 收集貼文層級數據")
+    print(f"Step 2: 收集貼文層級數據（專頁 {page_id}）")
     print("="*60)
 
-    if until_date is None:
-        until_date = datetime.now().strftime('%Y-%m-%d')
-    if since_date is None:
-        # 抓取所有歷史資料（從 2024 年初開始）
-        since_date = '2024-01-01'
+    try:
+        from main import fetch_page_posts, extract_post_stats, POST_INSIGHTS_METRICS
+
+        conn = db_utils.get_db_connection()
+        if not conn:
+            print("✗ 無法連接資料庫")
+            return False
+
+        fetch_date = datetime.now().strftime('%Y-%m-%d')
+        today = datetime.strptime(fetch_date, '%Y-%m-%d').date()
 
-    print(f"日期範圍: {since_date} ~ {until_date}")
+        # 既有資料庫首次使用排程時，依現有 snapshot 建立佇列
+        seeded = refresh_scheduler.seed_queue(conn, today)
+        if seeded:
+            print(f"✓ 已建立更新排程: {seeded} 則貼文")
 
-    try:
-        from main import fetch_page_posts, fetch_post_insights, POST_INSIGHTS_METRICS
+        if until_date is None:
+            until_date = fetch_date
+        if since_date is None:
+            # 只列出水位之後的貼文（首次執行從 2024 年初開始）
+            since_date = post_discovery.incremental_since(conn, page_id)
+
+        print(f"日期範圍: {since_date} ~ {until_date}")
 
         # 獲取貼文列表
-        posts = fetch_page_posts(config.FACEBOOK_CONFIG, since_date, until_date, limit)
+        posts = fetch_page_posts(fb_config, since_date, until_date, limit, expand_fields=True)
 
         if not posts:
             print("⚠ 未找到新貼文")
@@ -91,94 +131,103 @@ def collect_post_data(since_date=None, until_date=None, limit=100):
         else:
             print(f"✓ 從 API 獲取 {len(posts)} 則貼文")
 
-        conn = db_utils.get_db_connection()
-        if not conn:
-            print("✗ 無法連接資料庫")
-            return False
+        # 儲存新貼文的基本資訊、更新水位，新貼文加入更新佇列
+        if posts is not None:
+            post_discovery.save_listed_posts(conn, page_id, posts)
+            post_discovery.record_listing(conn, page_id, posts, since_date, until_date)
+            refresh_scheduler.enqueue_new_posts(conn, [post['id'] for post in posts], today)
 
-        fetch_date = datetime.now().strftime('%Y-%m-%d')
-        cursor = conn.cursor()
+        # 定期對帳：同步舊貼文的編輯並標記已刪除的貼文
+        if reconcile is None:
+            reconcile = post_discovery.reconcile_due(conn, page_id)
+        if reconcile and since_date > post_discovery.DEFAULT_SINCE_DATE:
+            post_discovery.reconcile_posts(conn, fb_config, until_date, limit=limit)
 
-        # 儲存新貼文的基本資訊
-        if posts:
-            for post in posts:
-                post_data = {
-                    'id': post.get('id'),
-                    'page_id': config.FACEBOOK_CONFIG['page_id'],
-                    'created_time': post.get('created_time'),
-                    'message': post.get('message', ''),
-                    'type': None,
-                    'permalink_url': post.get('permalink_url')
-                }
-                db_utils.upsert_post(conn, post_data)
-
-        # 找出需要收集 insights 的貼文：
-        # 1. 發布 30 天內的貼文（每日追蹤）
-        # 2. 發布超過 30 天但今天還沒有任何 snapshot 的貼文（補收一次）
-        cursor.execute("""
-            SELECT p.post_id, p.created_time,
-                   julianday('now') - julianday(date(substr(p.created_time, 1, 10))) as days_since_post,
-                   (SELECT COUNT(*) FROM post_insights_snapshots WHERE post_id = p.post_id) as snapshot_count
-            FROM posts p
-            WHERE 
-                -- 30 天內的貼文
-                julianday('now') - julianday(date(substr(p.created_time, 1, 10))) <= 30
-                -- 或者沒有任何 snapshot 的貼文
-                OR (SELECT COUNT(*) FROM post_insights_snapshots WHERE post_id = p.post_id) = 0
-            ORDER BY p.created_time DESC
-        """)
-        posts_to_collect = cursor.fetchall()
-
-        print(f"✓ 需要收集 insights 的貼文: {len(posts_to_collect)} 則")
-        print(f"  (30天內: 每日追蹤 / 30天外: 補收一次)")
+        # 找出更新佇列中到期的貼文
+        due_post_ids = refresh_scheduler.due_posts(conn, today, page_id=page_id)
+
+        print(f"✓ 需要收集 insights 的貼文: {len(due_post_ids)} 則")
+        print(f"  (排程: {refresh_scheduler.queue_summary(conn)})")
 
         success_count = 0
         skipped_count = 0
 
-        for i, (post_id, created_time, days_since, snapshot_count) in enumerate(posts_to_collect, 1):
-            if i % 25 == 0:
-                print(f"  進度: {i}/{len(posts_to_collect)}")
-
-            # 獲取 post insights
-            insights = fetch_post_insights(config.FACEBOOK_CONFIG, post_id, POST_INSIGHTS_METRICS)
-
-            # 獲取基本統計（reactions, comments, shares）
-            basic_stats = {}
-            try:
-                import requests
-                base_url = f"https://graph.facebook.com/{config.FACEBOOK_CONFIG['api_version']}/{post_id}"
-                access_token = config.FACEBOOK_CONFIG['access_token']
-
-                # 獲取反應數
-                resp = requests.get(f"{base_url}/reactions", params={
-                    'access_token': access_token, 'summary': 'total_count', 'limit': 0
-                }, timeout=10)
-                if resp.ok:
-                    basic_stats['likes_count'] = resp.json().get('summary', {}).get('total_count', 0)
-
-                # 獲取留言數
-                resp = requests.get(f"{base_url}/comments", params={
-                    'access_token': access_token, 'summary': 'total_count', 'limit': 0
-                }, timeout=10)
-                if resp.ok:
-                    basic_stats['comments_count'] = resp.json().get('summary', {}).get('total_count', 0)
-
-                # 獲取分享數
-                resp = requests.get(f"{base_url}", params={
-                    'access_token': access_token, 'fields': 'shares'
-                }, timeout=10)
-                if resp.ok:
-                    basic_stats['shares_count'] = resp.json().get('shares', {}).get('count', 0)
-
-            except Exception:
-                pass  # 忽略錯誤，使用預設值
-
-            if db_utils.upsert_post_insights(conn, post_id, fetch_date, insights or {}, basic_stats):
-                success_count += 1
-            else:
-                skipped_count += 1
-
-            time.sleep(0.15)  # API 速率限制
+        # 列表與 batch 請求取得的 insights 先緩衝，每 BATCH_SIZE 則在單一交易中寫入；
+        # 離開 with 時寫入剩餘的列（中途發生例外也會寫入已取得的資料）
+        with db_utils.BatchWriter(conn) as writer:
+            # 列表請求已透過欄位展開取回 insights 與互動數的貼文，直接寫入
+            listed = {post['id']: post for post in posts or [] if 'insights' in post}
+            post_ids = []
+            for post_id in due_post_ids:
+                if post_id in listed:
+                    insights, basic_stats = extract_post_stats(listed[post_id])
+                    writer.upsert_post_insights(post_id, fetch_date, insights, basic_stats)
+                else:
+                    post_ids.append(post_id)
+
+            if listed:
+                print(f"  列表請求已含 insights: {len(due_post_ids) - len(post_ids)} 則 / 需另外請求: {len(post_ids)} 則")
+            executed_ids = [post_id for post_id in due_post_ids if post_id in listed]
+
+            # 依預期資訊增益排序，在呼叫預算與執行期限內由高到低執行
+            planner = planner or call_planner.CallPlanner()
+            heap = planner.queue(call_planner.score_posts(conn, post_ids, today))
+
+            if queue_workers:
+                from collectors import work_queue
+                # 依優先順序加入佇列（worker 依 task_id 順序領取）
+                ordered = [entry[2]['post_id'] for entry in sorted(heap, key=lambda entry: entry[:2])]
+                added = work_queue.enqueue_tasks(conn, ordered, fetch_date, page_id)
+                print(f"  使用工作佇列（新增 {added} 個工作 / {queue_workers} 個本機 worker）")
+                workers = work_queue.drain(fb_config, workers=queue_workers, planner=planner)
+                done_ids = work_queue.completed_posts(conn, fetch_date, ordered)
+                success_count += sum(worker['done'] for worker in workers)
+                skipped_count += sum(worker['failed'] for worker in workers)
+                executed_ids.extend(done_ids)
+                done_set = set(done_ids)
+                heap = [entry for entry in heap if entry[2]['post_id'] not in done_set]
+                heapq.heapify(heap)
+            elif use_async:
+                from collectors import async_collector
+                selected = [c['post_id'] for c in planner.take_all(heap)]
+                print(f"  使用非同步引擎（並行上限 {concurrency or async_collector.DEFAULT_CONCURRENCY}）")
+                async_success, async_skipped = async_collector.collect_post_insights_async(
+                    conn, fb_config, selected, POST_INSIGHTS_METRICS, fetch_date,
+                    concurrency=concurrency or async_collector.DEFAULT_CONCURRENCY
+                )
+                success_count += async_success
+                skipped_count += async_skipped
+                executed_ids.extend(selected)
+
+            # 其餘貼文以 Graph API batch 請求打包每則貼文的 4 個請求（每批 POSTS_PER_BATCH 則貼文）
+            batch_no = 0
+            while heap and not queue_workers:
+                chunk = [c['post_id'] for c in planner.next_batch(heap, graph_batch.POSTS_PER_BATCH)]
+                if not chunk:
+                    break
+                if batch_no and batch_no % 2 == 0:
+                    print(f"  進度: {len(executed_ids)}/{len(due_post_ids)}")
+                batch_no += 1
+
+                refreshed = graph_batch.fetch_posts_refresh(fb_config, chunk, POST_INSIGHTS_METRICS)
+
+                for post_id in chunk:
+                    insights, basic_stats = refreshed[post_id]
+                    writer.upsert_post_insights(post_id, fetch_date, insights or {}, basic_stats)
+                executed_ids.extend(chunk)
+
+        success_count += writer.stats['written']
+        skipped_count += writer.stats['failed']
+
+        # 預算或期限用盡：記錄延後的貼文（仍留在更新佇列中，下次執行優先處理）
+        deferred = planner.defer(heap)
+        if deferred:
+            call_planner.record_deferred(conn, deferred, planner.stopped_by)
+            print(f"  ⚠ 延後 {len(deferred)} 則貼文 ({planner.stopped_by})")
+        call_planner.clear_deferred(conn, executed_ids)
+
+        # 依最新 snapshot 重新排程
+        refresh_scheduler.reschedule(conn, executed_ids, today)
 
         conn.close()
         print(f"\n✓ 成功收集 {success_count} 則貼文的 insights")
@@ -193,6 +242,27 @@ def collect_post_data(since_date=None, until_date=None, limit=100):
         return False
 
 
+def collect_multi_page_data(workers=None, **kwargs):
+    """
+    多專頁模式：收集 pages 登記表中所有啟用的專頁
+
+    Returns:
+        是否至少一個專頁收集成功
+    """
+    from collectors import multi_page, page_registry
+
+    conn = db_utils.get_db_connection()
+    if not conn:
+        print("✗ 無法連接資料庫")
+        return False
+    page_configs = page_registry.page_configs(conn)
+    conn.close()
+
+    results = multi_page.collect_all_pages(page_configs, workers=workers or multi_page.PAGE_WORKERS,
+                                           days_back=90, **kwargs)
+    return any(result['success'] for result in results)
+
+
 def run_analytics():
     """執行數據分析"""
     print("\n" + "="*60)
@@ -293,6 +363,28 @@ def collect_ad_data():
         return False
 
 
+def apply_snapshot_retention():
+    """
+    snapshot 保留政策：舊 snapshot 降採樣，超過期限的移至 Parquet 封存（見 utils.snapshot_archive）
+
+    只在 main(retention=True)（--retention）時執行；未設定 SNAPSHOT_ARCHIVE_DIR 時只降採樣、不封存
+    """
+    from utils import snapshot_archive
+
+    print("\n" + "="*60)
+    print("Step 6: snapshot 保留政策")
+    print("="*60)
+
+    try:
+        conn = db_utils.get_db_connection()
+        snapshot_archive.run_retention(conn)
+        conn.close()
+        return True
+    except Exception as e:
+        print(f"⚠ snapshot 保留政策失敗: {e}")
+        return False
+
+
 def show_summary():
     """顯示數據摘要"""
     print("\n" + "="*60)
@@ -324,8 +416,24 @@ def show_summary():
         print(f"  ✗ 無法取得摘要: {e}")
 
 
-def main():
-    """主執行流程"""
+def main(use_async=False, concurrency=None, budget=None, deadline=None, page_backfill_since=None,
+         multi_page=False, page_workers=None, queue_workers=None, retention=False):
+    """
+    主執行流程
+
+    Args:
+        use_async: 貼文 insights 改用非同步收集引擎
+        concurrency: 非同步引擎的並行上限
+        budget: 本次執行最多的 Graph API 呼叫數（None 表示不限）
+        deadline: 本次執行的期限秒數，超過後停止收集（None 表示不限）
+        page_backfill_since: 回補此日期 (YYYY-MM-DD) 之後的頁面每日指標
+        multi_page: 收集 pages 登記表中所有啟用的專頁（見 collectors.multi_page）
+        page_workers: 多專頁模式同時收集的專頁數
+        queue_workers: 以工作佇列收集貼文 insights 的本機 worker 數（見 collectors.work_queue）
+        retention: 執行 snapshot 保留政策（降採樣，並封存至 SNAPSHOT_ARCHIVE_DIR）
+    """
+    from collectors.call_planner import CallPlanner
+
     print("\n" + "="*70)
     print(" " * 15 + "Facebook 社群數據分析框架")
     print(" " * 20 + "完整執行流程")
@@ -333,17 +441,33 @@ def main():
     print(f"執行時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
     start_time = time.time()
+    planner = CallPlanner(max_calls=budget, deadline_seconds=deadline)
+
+    # 啟動時套用待執行的 schema 遷移（之後的連線只檢查一次版本）
+    conn = db_utils.get_db_connection()
+    if conn:
+        conn.close()
 
     # Step 0: 測試 API 連接
     if not test_api_connection():
         print("\n✗ API 連接失敗，中止執行")
         return False
 
-    # Step 1: 收集頁面數據 (至少 3 個月)
-    collect_page_data(days_back=90)
+    if multi_page:
+        # Step 1 + 2: 以 worker pool 收集所有登記的專頁
+        posts_collected = collect_multi_page_data(
+            workers=page_workers, backfill_since=page_backfill_since,
+            use_async=use_async, concurrency=concurrency, planner=planner
+        )
+    else:
+        # Step 1: 收集頁面數據 (首次至少 3 個月，之後增量)
+        collect_page_data(days_back=90, backfill_since=page_backfill_since)
+
+        # Step 2: 收集貼文數據 (依更新排程收集到期的貼文)
+        posts_collected = collect_post_data(use_async=use_async, concurrency=concurrency, planner=planner,
+                                            queue_workers=queue_workers)
 
-    # Step 2: 收集貼文數據 (30天內每日追蹤，舊貼文補收一次)
-    if not collect_post_data():
+    if not posts_collected:
         print("\n⚠ 貼文數據收集失敗，跳過後續分析")
     else:
         # Step 3: 執行分析
@@ -352,11 +476,20 @@ def main():
         # Step 4: 產出報表
         generate_reports()
 
-    # Step 5: 收集廣告數據 (可選，失敗不影響主流程)
-    try:
-        collect_ad_data()
-    except Exception as e:
-        print(f"\n⚠ 廣告數據收集失敗 (非致命): {e}")
+    # Step 5: 收集廣告數據 (可選，失敗不影響主流程；預算或期限用盡時略過)
+    if not planner.can_spend(0):
+        print(f"\n⚠ 呼叫預算或執行期限已用盡，略過廣告數據收集")
+    else:
+        try:
+            collect_ad_data()
+        except Exception as e:
+            print(f"\n⚠ 廣告數據收集失敗 (非致命): {e}")
+
+    # Step 6: 舊 snapshot 降採樣與封存 (需明確啟用，失敗不影響主流程)
+    if retention:
+        apply_snapshot_retention()
+    else:
+        print("\n⊘ 略過 snapshot 保留政策 (以 --retention 啟用)")
 
     # 顯示摘要
     show_summary()
@@ -365,6 +498,8 @@ def main():
     elapsed_time = time.time() - start_time
     print("\n" + "="*70)
     print(f"✓ 完整流程執行完成 (耗時: {elapsed_time:.1f} 秒)")
+    graph_client.get_client().print_stats()
+    planner.print_summary()
     print("="*70 + "\n")
 
     # 記錄 Pipeline 執行紀錄
@@ -376,24 +511,10 @@ def main():
 def log_pipeline_run(duration_seconds: float, error_message: str = None):
     """記錄 Pipeline 執行結果"""
     try:
+        # pipeline_runs 表由 schema 遷移建立（utils.migrations）
         conn = db_utils.get_db_connection()
         cursor = conn.cursor()
         
-        # 確保 pipeline_runs 表存在
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS pipeline_runs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                run_date TEXT NOT NULL,
-                run_time TEXT NOT NULL,
-                status TEXT NOT NULL,
-                posts_collected INTEGER,
-                posts_analyzed INTEGER,
-                sheets_exported INTEGER,
-                error_message TEXT,
-                duration_seconds REAL
-            )
-        """)
-        
         # 取得統計數據
         cursor.execute("SELECT COUNT(*) FROM posts")
         posts_count = cursor.fetchone()[0]
@@ -428,14 +549,71 @@ def log_pipeline_run(duration_seconds: float, error_message: str = None):
 
 
 
-def run_full_pipeline():
+def run_full_pipeline(**kwargs):
     """Alias for main() - called by Cloud Run endpoint"""
-    return main()
+    return main(**kwargs)
 
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Facebook 社群數據分析框架 - 完整執行流程')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='以非同步引擎並行收集貼文 insights')
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help='非同步引擎的並行上限 (預設: 20)')
+    parser.add_argument('--budget', type=int, default=None,
+                        help='本次執行最多的 Graph API 呼叫數 (預設: 不限)')
+    parser.add_argument('--deadline', type=float, default=None,
+                        help='本次執行的期限秒數 (預設: 不限)')
+    parser.add_argument('--backfill-page-since', default=None, metavar='YYYY-MM-DD',
+                        help='回補此日期之後的頁面每日指標 (分段並行抓取)')
+    parser.add_argument('--multi-page', action='store_true',
+                        help='收集 pages 登記表中所有啟用的專頁 (見 collectors.page_registry)')
+    parser.add_argument('--page-workers', type=int, default=None,
+                        help='多專頁模式同時收集的專頁數 (預設: 4)')
+    parser.add_argument('--queue-workers', type=int, default=None,
+                        help='以工作佇列收集貼文 insights 的本機 worker 數 (其他行程可執行 python -m collectors.work_queue worker)')
+    parser.add_argument('--record', default=None, metavar='CASSETTE',
+                        help='錄製本次執行的 Graph API 回應 (.jsonl.gz，token 已遮蔽；見 utils.cassette)')
+    parser.add_argument('--replay', default=None, metavar='CASSETTE',
+                        help='不連網，重播錄製的 Graph API 回應')
+    parser.add_argument('--replay-latency', default='0', metavar='SECONDS|recorded',
+                        help='重播時每個請求的延遲 (預設: 0)')
+    parser.add_argument('--replay-throttle-every', type=int, default=None, metavar='N',
+                        help='重播時每 N 個請求注入一次節流錯誤 (code 4)')
+    parser.add_argument('--cache', nargs='?', const='data/graph_cache', default=None, metavar='DIR',
+                        help='啟用 Graph API GET 回應的磁碟快取 (預設目錄: data/graph_cache；見 utils.response_cache)')
+    parser.add_argument('--changes-only', action='store_true',
+                        help='貼文 insights 只在指標變動時新增 snapshot，未變動只更新 last_checked')
+    parser.add_argument('--retention', action='store_true',
+                        help='執行 snapshot 降採樣；設定 SNAPSHOT_ARCHIVE_DIR (持久儲存) 時另封存舊 snapshot')
+    args = parser.parse_args()
+
+    if args.changes_only:
+        config.SNAPSHOT_CHANGES_ONLY = True
+
+    if args.cache:
+        from utils import response_cache
+        response_cache.enable(response_cache.ResponseCache(args.cache))
+
+    if args.record or args.replay:
+        from utils import cassette
+        if args.record:
+            recording = cassette.use(args.record, mode='record')
+        else:
+            latency = args.replay_latency if args.replay_latency == 'recorded' else float(args.replay_latency)
+            recording = cassette.use(args.replay, mode='replay', latency=latency,
+                                     throttle_every=args.replay_throttle_every)
+    else:
+        recording = contextlib.nullcontext()
+
     try:
-        success = main()
+        with recording:
+            success = main(use_async=args.use_async, concurrency=args.concurrency,
+                           budget=args.budget, deadline=args.deadline,
+                           page_backfill_since=args.backfill_page_since,
+                           multi_page=args.multi_page, page_workers=args.page_workers,
+                           queue_workers=args.queue_workers, retention=args.retention)
         sys.exit(0 if success else 1)
     except KeyboardInterrupt:
         print("\n\n⚠ 使用者中斷執行")
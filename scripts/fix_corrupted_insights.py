@@ -8,23 +8,106 @@
 2. 重新抓取 reactions/comments/shares
 """
 
-import sqlite3
-import requests
-import time
 from datetime import datetime
+from collectors import backfill_checkpoint, call_planner
+from utils import db_utils
 from utils.config import DB_PATH, FACEBOOK_CONFIG
+from utils.graph_batch import graph_base_url
+from utils.graph_client import graph_get
 
+# 每筆修復需要的 API 呼叫數（reactions、comments、shares）
+CALLS_PER_FIX = 3
 
-def fix_corrupted_insights():
-    """修復損壞的 insights 資料"""
+
+# 檢查點的作業名稱（見 collectors.backfill_checkpoint）
+CHECKPOINT_JOB = 'fix_corrupted_insights'
+
+
+def checkpoint_key(row) -> str:
+    return f"{row['post_id']}@{row['fetch_date']}"
+
+
+def fix_one(conn, row):
+    """重新抓取一筆損壞 snapshot 的 reactions/comments/shares 並更新"""
+    post_id = row['post_id']
+    cursor = conn.cursor()
+    base_url = f"{graph_base_url(FACEBOOK_CONFIG)}/{post_id}"
+    
+    # 取得 Reactions (總讚數)
+    resp = graph_get(f"{base_url}/reactions", params={
+        'access_token': FACEBOOK_CONFIG['access_token'],
+        'summary': 'total_count',
+        'limit': 0
+    }, timeout=10)
+    
+    likes_count = 0
+    if resp.ok:
+        likes_count = resp.json().get('summary', {}).get('total_count', 0)
+    
+    # 取得 Comments
+    resp = graph_get(f"{base_url}/comments", params={
+        'access_token': FACEBOOK_CONFIG['access_token'],
+        'summary': 'total_count',
+        'limit': 0
+    }, timeout=10)
+    
+    comments_count = 0
+    if resp.ok:
+        comments_count = resp.json().get('summary', {}).get('total_count', 0)
+    
+    # 取得 Shares
+    resp = graph_get(base_url, params={
+        'access_token': FACEBOOK_CONFIG['access_token'],
+        'fields': 'shares'
+    }, timeout=10)
+    
+    shares_count = 0
+    if resp.ok:
+        shares_count = resp.json().get('shares', {}).get('count', 0)
+    
+    # 更新資料庫 - 只更新 likes/comments/shares
+    if likes_count > 0 or comments_count > 0 or shares_count > 0:
+        cursor.execute("""
+            UPDATE post_insights_snapshots 
+            SET likes_count = ?, comments_count = ?, shares_count = ?
+            WHERE post_id = ? AND fetch_date = ?
+        """, (likes_count, comments_count, shares_count, post_id, row['fetch_date']))
+    else:
+        # 如果還是抓不到，嘗試用 reactions 的總和作為 fallback
+        cursor.execute("""
+            UPDATE post_insights_snapshots 
+            SET likes_count = COALESCE(
+                post_reactions_like_total + post_reactions_love_total + 
+                post_reactions_wow_total + post_reactions_haha_total + 
+                post_reactions_sorry_total + post_reactions_anger_total, 0
+            )
+            WHERE post_id = ? AND fetch_date = ? AND likes_count = 0
+        """, (post_id, row['fetch_date']))
+    conn.commit()
+    return True
+
+
+def fix_corrupted_insights(budget=None, deadline=None, parallel=1, restart=False):
+    """
+    修復損壞的 insights 資料
+
+    每筆完成後立即寫入檢查點，中斷後重新執行會從中斷處繼續，已修復的資料不會再抓取
+
+    Args:
+        budget: 最多的 Graph API 呼叫數（None = 不限），用盡時其餘貼文記錄為延後
+        deadline: 執行期限秒數（None = 不限）
+        parallel: 並行的 worker 數（剩餘資料依優先順序分配）
+        restart: 清除檢查點，從頭開始
+    """
     print("=" * 60)
     print("修復損壞的 Post Insights 資料")
     print("=" * 60)
     print(f"執行時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = db_utils.get_db_connection()
     cursor = conn.cursor()
+    if restart:
+        print(f"已清除檢查點: {backfill_checkpoint.reset(conn, CHECKPOINT_JOB)} 筆")
     
     # 找出有問題的資料（likes_count=0 但有 reactions 數據）
     cursor.execute("""
@@ -37,6 +120,12 @@ def fix_corrupted_insights():
     """)
     corrupted = cursor.fetchall()
     
+    # 依檢查點略過已處理（或已用完重試次數）的資料
+    remaining = set(backfill_checkpoint.remaining_keys(conn, CHECKPOINT_JOB, [checkpoint_key(row) for row in corrupted]))
+    if len(remaining) < len(corrupted):
+        print(f"\n從檢查點繼續: 略過 {len(corrupted) - len(remaining)} 筆已處理的資料")
+    corrupted = [row for row in corrupted if checkpoint_key(row) in remaining]
+    
     print(f"\n找到 {len(corrupted)} 筆損壞資料")
     
     if not corrupted:
@@ -54,89 +143,35 @@ def fix_corrupted_insights():
     for date, count in sorted(date_counts.items()):
         print(f"  {date}: {count} 筆")
     
-    success_count = 0
-    failed_count = 0
     today = datetime.now().strftime('%Y-%m-%d')
     
     print(f"\n開始修復（使用今日日期 {today} 作為新的 fetch_date）...")
     
-    for i, row in enumerate(corrupted, 1):
-        post_id = row['post_id']
-        
-        if i % 25 == 0 or i == 1:
-            print(f"\n進度: {i}/{len(corrupted)} ({success_count} 成功, {failed_count} 失敗)")
-        
-        try:
-            base_url = f"https://graph.facebook.com/{FACEBOOK_CONFIG['api_version']}/{post_id}"
-            
-            # 取得 Reactions (總讚數)
-            resp = requests.get(f"{base_url}/reactions", params={
-                'access_token': FACEBOOK_CONFIG['access_token'],
-                'summary': 'total_count',
-                'limit': 0
-            }, timeout=10)
-            
-            likes_count = 0
-            if resp.ok:
-                likes_count = resp.json().get('summary', {}).get('total_count', 0)
-            
-            # 取得 Comments
-            resp = requests.get(f"{base_url}/comments", params={
-                'access_token': FACEBOOK_CONFIG['access_token'],
-                'summary': 'total_count',
-                'limit': 0
-            }, timeout=10)
-            
-            comments_count = 0
-            if resp.ok:
-                comments_count = resp.json().get('summary', {}).get('total_count', 0)
-            
-            # 取得 Shares
-            resp = requests.get(base_url, params={
-                'access_token': FACEBOOK_CONFIG['access_token'],
-                'fields': 'shares'
-            }, timeout=10)
-            
-            shares_count = 0
-            if resp.ok:
-                shares_count = resp.json().get('shares', {}).get('count', 0)
-            
-            # 更新資料庫 - 只更新 likes/comments/shares
-            if likes_count > 0 or comments_count > 0 or shares_count > 0:
-                cursor.execute("""
-                    UPDATE post_insights_snapshots 
-                    SET likes_count = ?, comments_count = ?, shares_count = ?
-                    WHERE post_id = ? AND fetch_date = ?
-                """, (likes_count, comments_count, shares_count, post_id, row['fetch_date']))
-                conn.commit()
-                success_count += 1
-            else:
-                # 如果還是抓不到，嘗試用 reactions 的總和作為 fallback
-                cursor.execute("""
-                    UPDATE post_insights_snapshots 
-                    SET likes_count = COALESCE(
-                        post_reactions_like_total + post_reactions_love_total + 
-                        post_reactions_wow_total + post_reactions_haha_total + 
-                        post_reactions_sorry_total + post_reactions_anger_total, 0
-                    )
-                    WHERE post_id = ? AND fetch_date = ? AND likes_count = 0
-                """, (post_id, row['fetch_date']))
-                conn.commit()
-                success_count += 1
-                
-        except Exception as e:
-            failed_count += 1
-            if 'timeout' not in str(e).lower():
-                print(f"  ✗ {post_id[-15:]}: {str(e)[:50]}")
-        
-        time.sleep(0.3)  # API 速率限制
-    
+    # 依預期資訊增益排序，在呼叫預算與執行期限內由高到低修復
+    planner = call_planner.CallPlanner(max_calls=budget, deadline_seconds=deadline)
+    scores = {c['post_id']: c['score']
+              for c in call_planner.score_posts(conn, {row['post_id'] for row in corrupted})}
+    heap = planner.queue([
+        {'post_id': row['post_id'], 'score': scores.get(row['post_id'], 0), 'cost': CALLS_PER_FIX, 'row': row}
+        for row in corrupted
+    ])
+    
+    result = backfill_checkpoint.run(
+        CHECKPOINT_JOB, planner, heap, lambda worker_conn, candidate: fix_one(worker_conn, candidate['row']),
+        key=lambda candidate: checkpoint_key(candidate['row']), parallel=parallel
+    )
+    success_count, failed_count = result['success'], result['failed']
+    
+    deferred = planner.defer(heap)
+    if deferred:
+        call_planner.record_deferred(conn, deferred, planner.stopped_by, source='fix_corrupted_insights')
     conn.close()
     
     print("\n" + "=" * 60)
     print(f"修復完成:")
     print(f"  成功: {success_count}")
     print(f"  失敗: {failed_count}")
+    planner.print_summary()
     print("=" * 60)
     
     return success_count, failed_count
@@ -148,7 +183,7 @@ def fallback_fix_from_reactions():
     print("備用方案：用 reactions 總和填補 likes_count")
     print("=" * 60)
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = db_utils.connect(DB_PATH)
     cursor = conn.cursor()
     
     # 計算 reactions 總和並更新 likes_count
@@ -175,9 +210,16 @@ def fallback_fix_from_reactions():
 
 
 if __name__ == '__main__':
-    import sys
-    
-    if len(sys.argv) > 1 and sys.argv[1] == '--fallback':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='修復損壞的 insights 資料（可中斷後繼續）')
+    parser.add_argument('--fallback', action='store_true', help='直接用 reactions 總和填補 likes_count')
+    parser.add_argument('--budget', type=int, default=None, help='最多的 Graph API 呼叫數')
+    parser.add_argument('--parallel', type=int, default=1, metavar='N', help='並行的 worker 數 (預設: 1)')
+    parser.add_argument('--restart', action='store_true', help='清除檢查點，從頭開始')
+    args = parser.parse_args()
+
+    if args.fallback:
         fallback_fix_from_reactions()
     else:
-        fix_corrupted_insights()
+        fix_corrupted_insights(budget=args.budget, parallel=args.parallel, restart=args.restart)
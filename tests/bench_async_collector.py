@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark：貼文 insights 收集吞吐量（逐筆同步 vs 非同步引擎）
+使用本機 Fake Graph 伺服器，可用 --latency 注入每個請求的延遲
+
+用法:
+    python -m tests.bench_async_collector --posts 200 --latency 0.05 --concurrency 1 10 50
+"""
+
+import argparse
+import asyncio
+import time
+
+import requests
+
+from collectors.async_collector import AsyncGraphCollector
+from tests.fake_graph_server import FakeGraphServer, make_post
+from utils import rate_limiter
+from utils.config import POST_METRICS
+from utils.graph_batch import graph_base_url
+
+PAGE_ID = '103640919705348'
+
+
+def sequential_refresh(config, post_ids):
+    """舊流程：每則貼文依序送出 4 個請求"""
+    base = graph_base_url(config)
+    token = {'access_token': config['access_token']}
+    for post_id in post_ids:
+        requests.get(f"{base}/{post_id}/insights", params={**token, 'metric': ','.join(POST_METRICS)}, timeout=10)
+        requests.get(f"{base}/{post_id}/reactions", params={**token, 'summary': 'total_count', 'limit': 0}, timeout=10)
+        requests.get(f"{base}/{post_id}/comments", params={**token, 'summary': 'total_count', 'limit': 0}, timeout=10)
+        requests.get(f"{base}/{post_id}", params={**token, 'fields': 'shares'}, timeout=10)
+
+
+def run(posts: int, latency: float, concurrency_levels):
+    # 本機伺服器不需限速，避免共用限制器影響量測
+    rate_limiter.set_limiter(rate_limiter.GraphRateLimiter(max_rate=100000, burst=100000))
+    with FakeGraphServer() as server:
+        server.state.add_page(PAGE_ID, 'Benchmark 專頁')
+        for i in range(posts):
+            server.state.add_post(make_post(PAGE_ID, i, '2025-12-01T08:00:00+0000'))
+        server.state.latency = latency
+        config = server.config(PAGE_ID)
+        post_ids = sorted(server.state.posts)
+
+        print(f"貼文數: {posts} / 模擬延遲: {latency * 1000:.0f} ms")
+        print(f"{'引擎':16s} {'耗時(秒)':>10s} {'貼文/秒':>10s} {'最大並行':>8s}")
+        print("-" * 48)
+
+        server.state.reset_counters()
+        start = time.perf_counter()
+        sequential_refresh(config, post_ids)
+        elapsed = time.perf_counter() - start
+        print(f"{'同步逐筆':16s} {elapsed:10.2f} {posts / elapsed:10.1f} {server.state.max_in_flight:8d}")
+
+        for concurrency in concurrency_levels:
+            server.state.reset_counters()
+            collector = AsyncGraphCollector(config, concurrency=concurrency,
+                                            endpoint_limits={k: concurrency for k in ('insights', 'reactions', 'comments', 'object')})
+            start = time.perf_counter()
+            asyncio.run(collector.refresh_posts(post_ids, POST_METRICS))
+            elapsed = time.perf_counter() - start
+            label = f"async c={concurrency}"
+            print(f"{label:16s} {elapsed:10.2f} {posts / elapsed:10.1f} {server.state.max_in_flight:8d}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='非同步收集引擎吞吐量 benchmark')
+    parser.add_argument('--posts', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.05, help='每個請求的模擬延遲（秒）')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 40])
+    args = parser.parse_args()
+    run(args.posts, args.latency, args.concurrency)
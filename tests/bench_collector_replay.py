@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark：以 cassette 重播量測貼文 insights 收集吞吐量（batch 請求 vs 非同步引擎）
+不需網路，同一份 cassette 每次重播的回應、延遲與節流錯誤都相同，結果可重現。
+未指定 --cassette 時先對本機 Fake Graph 伺服器錄製一份。
+
+用法:
+    python -m tests.bench_collector_replay --posts 200 --latency 0.05 --throttle-every 50
+    python -m tests.bench_collector_replay --cassette cassettes/daily.jsonl.gz --post-ids ids.txt
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from collectors.async_collector import AsyncGraphCollector
+from tests.fake_graph_server import FakeGraphServer, make_post
+from utils import cassette, graph_batch, rate_limiter
+from utils.config import POST_METRICS
+
+PAGE_ID = '103640919705348'
+
+
+def batch_refresh(config, post_ids):
+    for i in range(0, len(post_ids), graph_batch.POSTS_PER_BATCH):
+        graph_batch.fetch_posts_refresh(config, post_ids[i:i + graph_batch.POSTS_PER_BATCH], POST_METRICS)
+
+
+def async_refresh(config, post_ids, concurrency):
+    collector = AsyncGraphCollector(config, concurrency=concurrency,
+                                    endpoint_limits={k: concurrency for k in ('insights', 'reactions', 'comments', 'object')})
+    asyncio.run(collector.refresh_posts(post_ids, POST_METRICS))
+
+
+def record_fake(path: str, posts: int, concurrency_levels):
+    """對 Fake 伺服器執行一次兩種引擎並錄製"""
+    with FakeGraphServer() as server:
+        for i in range(posts):
+            server.state.add_post(make_post(PAGE_ID, i, '2025-12-01T08:00:00+0000'))
+        config = server.config(PAGE_ID)
+        post_ids = sorted(server.state.posts)
+        with cassette.use(path, mode='record'):
+            batch_refresh(config, post_ids)
+            async_refresh(config, post_ids, max(concurrency_levels))
+    return config, post_ids
+
+
+def run(path: str, config, post_ids, latency, throttle_every, concurrency_levels):
+    print(f"貼文數: {len(post_ids)} / 重播延遲: {latency} / 每 {throttle_every or '-'} 個請求注入節流")
+    print(f"{'引擎':16s} {'耗時(秒)':>10s} {'貼文/秒':>10s} {'節流':>6s}")
+    print("-" * 46)
+
+    engines = [('batch', lambda: batch_refresh(config, post_ids))]
+    engines += [(f"async c={c}", lambda c=c: async_refresh(config, post_ids, c)) for c in concurrency_levels]
+    for label, refresh in engines:
+        # 每個引擎使用新的限制器與 cassette，從相同的狀態開始
+        rate_limiter.set_limiter(rate_limiter.GraphRateLimiter(max_rate=100000, min_rate=1000, burst=100000,
+                                                                base_backoff=0.01))
+        with cassette.use(path, mode='replay', latency=latency, throttle_every=throttle_every) as replay:
+            start = time.perf_counter()
+            refresh()
+            elapsed = time.perf_counter() - start
+        misses = f" (未錄製 {replay.stats['misses']})" if replay.stats['misses'] else ''
+        print(f"{label:16s} {elapsed:10.2f} {len(post_ids) / elapsed:10.1f} "
+              f"{replay.stats['injected_throttles']:6d}{misses}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='以 cassette 重播量測收集吞吐量')
+    parser.add_argument('--cassette', default=None, help='重播既有的 cassette（預設對 Fake 伺服器錄製）')
+    parser.add_argument('--post-ids', default=None, help='搭配 --cassette：每行一個貼文 ID 的檔案')
+    parser.add_argument('--page-id', default=PAGE_ID)
+    parser.add_argument('--posts', type=int, default=100)
+    parser.add_argument('--latency', default='0.05', help="每個請求的延遲秒數，或 'recorded'")
+    parser.add_argument('--throttle-every', type=int, default=None)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 40])
+    args = parser.parse_args()
+
+    latency = args.latency if args.latency == 'recorded' else float(args.latency)
+    if args.cassette:
+        with open(args.post_ids, encoding='utf-8') as f:
+            ids = [line.strip() for line in f if line.strip()]
+        bench_config = {'page_id': args.page_id, 'access_token': 'replay', 'api_version': 'v23.0'}
+        run(args.cassette, bench_config, ids, latency, args.throttle_every, args.concurrency)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            cassette_path = os.path.join(tmp, 'bench.jsonl.gz')
+            bench_config, ids = record_fake(cassette_path, args.posts, args.concurrency)
+            run(cassette_path, bench_config, ids, latency, args.throttle_every, args.concurrency)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark：post_insights_snapshots 寫入吞吐量（逐列 commit vs BatchWriter）
+在暫存目錄的檔案資料庫寫入合成的 snapshot（每次 commit 都包含一次 fsync，與正式資料庫相同）
+
+用法:
+    python -m tests.bench_db_writes --rows 100000
+    python -m tests.bench_db_writes --rows 100000 --single-rows 5000   # 逐列模式只量測前 5000 列再推算
+"""
+
+import argparse
+import io
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+
+from utils import db_utils
+from utils.setup_database import create_tables
+
+
+def synthetic_rows(rows: int, posts: int = 2000):
+    """rows 筆合成 snapshot：posts 則貼文 × 每日一筆"""
+    for i in range(rows):
+        post_id, day = f'page_{i % posts}', i // posts
+        yield post_id, (date(2020, 1, 1) + timedelta(days=day)).isoformat(), {
+            'likes_count': i % 500, 'comments_count': i % 40, 'shares_count': i % 25,
+            'post_clicks': i % 300, 'post_impressions_unique': 1000 + i % 5000,
+        }
+
+
+def open_db(directory: str, name: str):
+    conn = sqlite3.connect(os.path.join(directory, name))
+    with redirect_stdout(io.StringIO()):
+        create_tables(conn)
+    return conn
+
+
+def write_single(conn, rows):
+    for post_id, fetch_date, insights in rows:
+        db_utils.upsert_post_insights(conn, post_id, fetch_date, insights, changes_only=False)
+
+
+def write_batched(conn, rows, flush_every):
+    with db_utils.BatchWriter(conn, flush_every=flush_every, changes_only=False) as writer:
+        for post_id, fetch_date, insights in rows:
+            writer.upsert_post_insights(post_id, fetch_date, insights)
+
+
+def run(rows: int, single_rows: int, flush_every: int):
+    print(f"合成 snapshot: {rows} 列 / 每批: {flush_every} 列")
+    print(f"{'模式':16s} {'列數':>8s} {'耗時(秒)':>10s} {'列/秒':>10s}")
+    print("-" * 48)
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for label, count, write in (
+            ('逐列 commit', min(single_rows or rows, rows), write_single),
+            ('BatchWriter', rows, lambda conn, data: write_batched(conn, data, flush_every)),
+        ):
+            conn = open_db(tmp, f'{len(results)}.db')
+            start = time.perf_counter()
+            write(conn, synthetic_rows(count))
+            elapsed = time.perf_counter() - start
+            stored = conn.execute("SELECT COUNT(*) FROM post_insights_snapshots").fetchone()[0]
+            conn.close()
+            assert stored == count
+            results[label] = count / elapsed
+            print(f"{label:16s} {count:8d} {elapsed:10.2f} {count / elapsed:10.0f}")
+        print(f"\n加速: {results['BatchWriter'] / results['逐列 commit']:.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SQLite 寫入吞吐量 benchmark')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--single-rows', type=int, default=None,
+                        help='逐列模式只寫入前 N 列（預設與 --rows 相同）')
+    parser.add_argument('--flush-every', type=int, default=db_utils.BATCH_SIZE)
+    args = parser.parse_args()
+    run(args.rows, args.single_rows, args.flush_every)
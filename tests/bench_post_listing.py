@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Benchmark：貼文列表請求數比較（逐筆模式 vs 欄位展開模式）
+使用本機 Fake Graph 伺服器計算請求數，可用 --latency 模擬網路延遲
+
+用法:
+    python -m tests.bench_post_listing --posts 500 --latency 0.02
+"""
+
+import argparse
+import io
+import time
+from contextlib import redirect_stdout
+
+import main
+from tests.fake_graph_server import FakeGraphServer, make_post
+from utils import rate_limiter
+
+PAGE_ID = '103640919705348'
+
+
+def run(posts: int, latency: float, limit: int):
+    # 本機伺服器不需限速，避免共用限制器影響量測
+    rate_limiter.set_limiter(rate_limiter.GraphRateLimiter(max_rate=100000, burst=100000))
+    with FakeGraphServer() as server:
+        server.state.add_page(PAGE_ID, 'Benchmark 專頁')
+        for i in range(posts):
+            server.state.add_post(make_post(PAGE_ID, i, f'2025-{1 + i % 12:02d}-{1 + i % 28:02d}T08:00:00+0000'))
+        server.state.latency = latency
+        config = server.config(PAGE_ID)
+
+        print(f"貼文數: {posts} / 每頁: {limit} / 模擬延遲: {latency * 1000:.0f} ms")
+        print(f"{'模式':12s} {'請求數':>8s} {'耗時(秒)':>10s}")
+        print("-" * 34)
+
+        for label, expand in (('逐筆 (舊)', False), ('欄位展開', True)):
+            server.state.reset_counters()
+            start = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                result = main.fetch_page_posts(config, '2025-01-01', '2025-12-31', limit, expand_fields=expand)
+            elapsed = time.perf_counter() - start
+            assert result is not None and len(result) == posts
+            print(f"{label:12s} {server.state.count():8d} {elapsed:10.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='貼文列表請求數 benchmark')
+    parser.add_argument('--posts', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=0.0, help='每個請求的模擬延遲（秒）')
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+    run(args.posts, args.latency, args.limit)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark：報表查詢在 SQLite 與 DuckDB（ATTACH SQLite 檔 / Parquet 匯出）上的執行時間
+以合成貼文、分類、成效快照與 snapshot 建立資料庫，逐一執行報表並確認三者結果相同
+
+用法:
+    python -m tests.bench_report_engines                    # 50000 則貼文 × 30 筆 snapshot
+    python -m tests.bench_report_engines --posts 5000       # 快速版
+"""
+
+import argparse
+import io
+import os
+import random
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import date, datetime, timedelta
+
+from analytics import analytics_reports, duckdb_engine, query_analytics
+from exporters import export_to_sheets
+from utils import db_utils, migrations
+
+SLOTS = ['morning', 'noon', 'afternoon', 'evening', 'night']
+TIERS = ['viral', 'high', 'average', 'low']
+TOPICS = ['climate', 'energy', 'plastic', 'biodiversity', None]
+FORMATS = ['event', 'petition', 'education', 'news', None]
+
+
+def build(path: str, posts: int, snapshots: int):
+    rng = random.Random(1)
+    today = date.today()
+    conn = db_utils.connect(path)
+    with redirect_stdout(io.StringIO()):
+        migrations.migrate(conn)
+    conn.execute("CREATE TABLE ads (ad_id TEXT PRIMARY KEY, post_id TEXT, created_time TEXT)")
+    created = [datetime.combine(today - timedelta(days=rng.randrange(1500)), datetime.min.time()) +
+               timedelta(minutes=rng.randrange(1440)) for _ in range(posts)]
+    ids = [f'103640919705348_{1234567890000 + i}' for i in range(posts)]
+    conn.executemany("INSERT INTO posts (post_id, page_id, created_time, message) VALUES (?, 'page', ?, ?)",
+                     [(ids[i], created[i].strftime('%Y-%m-%dT%H:%M:%S+0000'), f'貼文 #{i}') for i in range(posts)])
+    conn.executemany("""
+        INSERT INTO posts_classification (post_id, media_type, message_length, message_length_tier, hashtag_count,
+            has_cta, topic_primary, topic_secondary, format_type, issue_topic, hour_of_day, day_of_week, month,
+            time_slot)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(ids[i], rng.choice(['photo', 'video', 'link']), rng.randrange(500), rng.choice(['short', 'long']),
+           rng.randrange(5), rng.randrange(2), rng.choice(TOPICS), rng.choice(TOPICS), rng.choice(FORMATS),
+           rng.choice(TOPICS), created[i].hour, created[i].weekday(), created[i].month, rng.choice(SLOTS))
+          for i in range(posts)])
+    conn.executemany("""
+        INSERT INTO posts_performance (post_id, snapshot_date, engagement_rate, click_through_rate, share_rate,
+            comment_rate, performance_tier, percentile_rank)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(ids[i], str(today), rng.random() * 10, rng.random() * 3, rng.random(), rng.random(),
+           rng.choice(TIERS), rng.random() * 100) for i in range(posts)])
+    conn.executemany("INSERT INTO ads VALUES (?, ?, ?)",
+                     [(f'ad_{i}', ids[i], created[i].isoformat()) for i in range(0, posts, 7)])
+    with db_utils.BatchWriter(conn) as writer:
+        for i in range(posts):
+            for n in range(snapshots):
+                fetch_date = created[i].date() + timedelta(days=n * 3)
+                if fetch_date > today:
+                    break
+                writer.upsert_post_insights(ids[i], fetch_date.isoformat(), {
+                    column: n * 10 + rng.randrange(10) for column in db_utils.SNAPSHOT_METRIC_COLUMNS})
+    conn.commit()
+    conn.close()
+
+
+def reports():
+    today = date.today()
+    start, end = str(today - timedelta(days=365)), str(today)
+    return [
+        ('get_quadrant_analysis', analytics_reports.get_quadrant_analysis),
+        ('get_format_issue_cross_performance', analytics_reports.get_format_issue_cross_performance),
+        ('get_weekly_trends', lambda c: analytics_reports.get_weekly_trends(c, 200)),
+        ('get_top_posts', lambda c: analytics_reports.get_top_posts(c, 90, 50)),
+        ('generate_weekly_report', analytics_reports.generate_weekly_report),
+        ('query_by_date_range (weekly)', lambda c: query_analytics.query_by_date_range(c, start, end, 'weekly')),
+        ('query_topic_performance', lambda c: query_analytics.query_topic_performance(c, start, end)),
+        ('query_comparison', lambda c: query_analytics.query_comparison(
+            c, str(today - timedelta(days=730)), start, start, end)),
+        ('yearly_posting_analysis', lambda c: c.cursor().execute(
+            export_to_sheets.YEARLY_POSTING_ANALYSIS_SQL).fetchall()),
+        ('organic_vs_paid_data', lambda c: c.cursor().execute(export_to_sheets.ORGANIC_VS_PAID_DATA_SQL).fetchall()),
+    ]
+
+
+def canonical(result):
+    if isinstance(result, str):
+        return result
+    if isinstance(result, dict):
+        return repr({key: canonical([value]) if isinstance(value, dict) else value for key, value in result.items()})
+    return sorted(repr([round(v, 6) if isinstance(v, float) else v for v in dict(row).values()]) for row in result)
+
+
+def timed(fn, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def run(posts: int, snapshots: int, repeat: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path, parquet = os.path.join(tmp, 'insights.db'), os.path.join(tmp, 'parquet')
+        _, elapsed = timed(lambda: build(path, posts, snapshots), 1)
+        print(f"合成資料: {posts:,} 則貼文（{elapsed:.1f} 秒），SQLite {os.path.getsize(path) / 1024 ** 2:,.0f} MB")
+        _, elapsed = timed(lambda: duckdb_engine.export_parquet(parquet, path), 1)
+        size = sum(os.path.getsize(os.path.join(parquet, name)) for name in os.listdir(parquet))
+        print(f"Parquet 匯出: {elapsed:.1f} 秒，{size / 1024 ** 2:,.0f} MB")
+
+        engines = {'sqlite': db_utils.connect(path, readonly=True), 'parquet': duckdb_engine.connect(parquet)}
+        try:
+            engines['attach'] = duckdb_engine.connect(path)
+        except Exception as e:
+            print(f"⊘ 略過 ATTACH（無法載入 sqlite 擴充套件: {e}）")
+
+        print(f"\n{'報表':36s}" + ''.join(f"{name:>12s}" for name in engines) + '   (ms，平均 ' + f'{repeat} 次)')
+        totals = dict.fromkeys(engines, 0.0)
+        for label, report in reports():
+            results, line = {}, f"{label:36s}"
+            for name, conn in engines.items():
+                report(conn)                                    # 暖機（頁面快取、UDF 快取）
+                results[name], elapsed = timed(lambda: report(conn), repeat)
+                totals[name] += elapsed
+                line += f"{elapsed * 1000:12.1f}"
+            same = all(canonical(result) == canonical(results['sqlite']) for result in results.values())
+            print(line + ('' if same else '   ✗ 結果不同'))
+        print(f"{'合計':36s}" + ''.join(f"{totals[name] * 1000:12.1f}" for name in engines))
+        for name in engines:
+            if name != 'sqlite':
+                print(f"  {name}: {totals['sqlite'] / totals[name]:.1f}x")
+        for conn in engines.values():
+            conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='報表查詢引擎 benchmark（SQLite vs DuckDB）')
+    parser.add_argument('--posts', type=int, default=50000)
+    parser.add_argument('--snapshots', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.posts, args.snapshots, args.repeat)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Benchmark：post_insights_snapshots 儲存配置（AUTOINCREMENT rowid + UNIQUE 索引 vs WITHOUT ROWID 叢集表）
+以每日收集的順序寫入合成 snapshot（同一貼文的列在舊配置中分散於整個檔案），
+再以遷移轉為 (post_key, day) 叢集配置，比較生命週期曲線與成長查詢
+
+用法:
+    python -m tests.bench_snapshot_layout                          # 20000 則貼文 × 500 天 = 1000 萬列
+    python -m tests.bench_snapshot_layout --posts 2000 --days 100  # 快速版
+"""
+
+import argparse
+import io
+import os
+import random
+import shutil
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+
+from analytics import analytics_trends
+from collectors import refresh_scheduler
+from utils import db_utils, migrations
+
+# 版本 8 之前 get_post_lifecycle_curve / get_posts_growth_rate 的查詢
+LEGACY_LIFECYCLE_SQL = """
+    WITH RECURSIVE snapshots AS (
+        SELECT * FROM post_insights_snapshots WHERE post_id = ?
+    ),
+    days(id, day) AS (
+        SELECT id, fetch_date FROM snapshots
+        UNION ALL
+        SELECT d.id, date(d.day, '+1 day')
+        FROM days d JOIN snapshots s ON s.id = d.id
+        WHERE d.day < s.last_checked
+    )
+    SELECT d.day as fetch_date, i.likes_count, i.comments_count, i.shares_count,
+           (i.likes_count + i.comments_count + i.shares_count) as total_engagement,
+           i.post_impressions_unique as reach, i.post_clicks
+    FROM days d JOIN snapshots i ON i.id = d.id
+    ORDER BY d.day ASC
+"""
+
+LEGACY_GROWTH_SQL = """
+    WITH post_snapshots AS (
+        SELECT post_id, fetch_date,
+               likes_count + comments_count + shares_count as total_engagement,
+               ROW_NUMBER() OVER (PARTITION BY post_id ORDER BY fetch_date ASC) as rn_first,
+               ROW_NUMBER() OVER (PARTITION BY post_id ORDER BY fetch_date DESC) as rn_last
+        FROM post_insights_snapshots
+        WHERE fetch_date >= date('now', ? || ' days')
+    ),
+    first_snapshot AS (
+        SELECT post_id, total_engagement as first_engagement, fetch_date as first_date
+        FROM post_snapshots WHERE rn_first = 1
+    ),
+    last_snapshot AS (
+        SELECT post_id, total_engagement as last_engagement, fetch_date as last_date
+        FROM post_snapshots WHERE rn_last = 1
+    )
+    SELECT f.post_id, p.message, f.first_date, l.last_date, f.first_engagement, l.last_engagement,
+           (l.last_engagement - f.first_engagement) as engagement_growth,
+           CASE WHEN f.first_engagement > 0
+                THEN ROUND((l.last_engagement - f.first_engagement) * 100.0 / f.first_engagement, 2)
+                ELSE 0 END as growth_rate_pct
+    FROM first_snapshot f
+    JOIN last_snapshot l ON f.post_id = l.post_id
+    JOIN posts p ON f.post_id = p.post_id
+    WHERE f.first_date != l.last_date
+    ORDER BY growth_rate_pct DESC
+    LIMIT 50
+"""
+
+
+def post_id(i: int) -> str:
+    return f'103640919705348_{1234567890000 + i}'
+
+
+def build_legacy(path: str, posts: int, days: int):
+    """版本 7 的資料庫：依收集日期（每天所有貼文）寫入"""
+    conn = db_utils.connect(path)
+    with redirect_stdout(io.StringIO()):
+        migrations.migrate(conn, target=7)
+    # 大量載入時略過 post_latest_metrics 的 trigger（本 benchmark 不使用）
+    for event in ('insert', 'update', 'delete'):
+        conn.execute(f"DROP TRIGGER trg_post_latest_metrics_{event}")
+    conn.executemany("INSERT INTO posts (post_id, page_id, created_time, message) VALUES (?, 'page', ?, ?)",
+                     [(post_id(i), '2024-01-01T08:00:00+0000', f'#{i}') for i in range(posts)])
+    first = date.today() - timedelta(days=days - 1)
+    columns = db_utils.SNAPSHOT_METRIC_COLUMNS
+    sql = (f"INSERT INTO post_insights_snapshots (post_id, fetch_date, {', '.join(columns)}) "
+           f"VALUES ({', '.join(['?'] * (len(columns) + 2))})")
+    for day in range(days):
+        fetch_date = (first + timedelta(days=day)).isoformat()
+        conn.executemany(sql, ((post_id(i), fetch_date, *(day * 3 + i % 50 + n for n in range(len(columns))))
+                               for i in range(posts)))
+        conn.commit()
+    conn.close()
+
+
+def migrate_clustered(path: str):
+    conn = db_utils.connect(path)
+    with redirect_stdout(io.StringIO()):
+        migrations.migrate(conn)
+    conn.execute("VACUUM")
+    conn.close()
+
+
+def timed(label: str, fn, repeat: int = 1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {label:34s} {elapsed * 1000:10.1f} ms")
+    return result, elapsed
+
+
+def run(posts: int, days: int, samples: int):
+    rows = posts * days
+    print(f"合成 snapshot: {posts} 則貼文 × {days} 天 = {rows:,} 列")
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path, clustered_path = os.path.join(tmp, 'legacy.db'), os.path.join(tmp, 'clustered.db')
+        _, elapsed = timed('建立舊配置資料庫', lambda: build_legacy(legacy_path, posts, days))
+        print(f"  （{rows / elapsed:,.0f} 列/秒）")
+        shutil.copy(legacy_path, clustered_path)
+        timed('遷移至叢集配置（版本 8）', lambda: migrate_clustered(clustered_path))
+        for label, path in (('舊配置', legacy_path), ('叢集配置', clustered_path)):
+            print(f"  {label} 檔案大小: {os.path.getsize(path) / 1024 ** 2:,.0f} MB")
+
+        sample = [post_id(i) for i in random.Random(1).sample(range(posts), min(samples, posts))]
+        legacy, clustered = db_utils.connect(legacy_path, readonly=True), db_utils.connect(clustered_path, readonly=True)
+
+        print(f"\n生命週期曲線（{len(sample)} 則貼文合計）")
+        old, t_old = timed('舊配置', lambda: [legacy.execute(LEGACY_LIFECYCLE_SQL, (p,)).fetchall() for p in sample])
+        new, t_new = timed('叢集配置', lambda: [analytics_trends.get_post_lifecycle_curve(clustered, p)
+                                                for p in sample])
+        assert [[tuple(row) for row in curve] for curve in old] == \
+            [[tuple(row.values()) for row in curve] for curve in new]
+        print(f"  加速: {t_old / t_new:.1f}x")
+
+        print(f"\n最近成長（refresh_scheduler.recent_snapshots，{len(sample)} 則貼文）")
+        old, t_old = timed('舊配置', lambda: [refresh_scheduler.recent_snapshots(legacy, p) for p in sample])
+        new, t_new = timed('叢集配置（相容 view）', lambda: [refresh_scheduler.recent_snapshots(clustered, p)
+                                                        for p in sample])
+        assert [[tuple(row) for row in rows] for rows in old] == [[tuple(row) for row in rows] for rows in new]
+        print(f"  加速: {t_old / t_new:.1f}x")
+
+        print("\n近 7 天成長率（全表，get_posts_growth_rate）")
+        old, t_old = timed('舊配置', lambda: legacy.execute(LEGACY_GROWTH_SQL, ('-7',)).fetchall())
+        new, t_new = timed('叢集配置', lambda: analytics_trends.get_posts_growth_rate(clustered, 7))
+        assert [tuple(row) for row in old] == [tuple(row.values()) for row in new]
+        print(f"  加速: {t_old / t_new:.1f}x")
+        legacy.close()
+        clustered.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='snapshot 儲存配置 benchmark')
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--days', type=int, default=500)
+    parser.add_argument('--samples', type=int, default=200)
+    args = parser.parse_args()
+    run(args.posts, args.days, args.samples)
@@ -0,0 +1,71 @@
+"""
+pytest 共用設定
+"""
+
+import io
+import sqlite3
+from contextlib import redirect_stdout
+
+import pytest
+
+from tests.fake_graph_server import FakeGraphServer, make_post
+from utils import db_utils, graph_client, migrations, rate_limiter
+
+PAGE_ID = '103640919705348'
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers', 'graph(page_id, page, posts, created): server fixture 建立的專頁與貼文（見 server）')
+
+
+def make_conn(target: int = migrations.LATEST_VERSION) -> sqlite3.Connection:
+    """記憶體資料庫，套用 schema 遷移至 target 版本（預設最新）"""
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    with redirect_stdout(io.StringIO()):
+        migrations.migrate(conn, target=target)
+    return conn
+
+
+@pytest.fixture
+def server(request, tmp_path, monkeypatch):
+    """
+    本機 Fake Graph 伺服器，資料庫改用 tmp_path 下的檔案（db_utils.DB_PATH）
+
+    測試資料以 @pytest.mark.graph(...)（整個模組用 pytestmark）或 indirect 參數化設定：
+        page_id: 專頁 ID（預設 PAGE_ID）
+        page: 是否建立專頁「測試專頁」（預設 True）
+        posts: 貼文數（預設 0）
+        created: index → created_time（預設皆為 2025-12-01T01:30:00+0000）
+    其他資料（廣告帳號、多個專頁、模組設定）由測試模組中同名的 server fixture 接續建立
+    """
+    marker = request.node.get_closest_marker('graph')
+    options = dict(marker.kwargs if marker else {}, **getattr(request, 'param', {}))
+    page_id = options.get('page_id', PAGE_ID)
+    created = options.get('created', lambda i: '2025-12-01T01:30:00+0000')
+    with FakeGraphServer() as srv:
+        if options.get('page', True):
+            srv.state.add_page(page_id, '測試專頁')
+        for i in range(options.get('posts', 0)):
+            srv.state.add_post(make_post(page_id, i, created(i)))
+        monkeypatch.setattr(db_utils, 'DB_PATH', str(tmp_path / 'engagement_data.db'))
+        yield srv
+
+
+@pytest.fixture(autouse=True)
+def fast_rate_limiter():
+    """測試使用本機伺服器，改用高速率、短退避的共用限制器"""
+    limiter = rate_limiter.GraphRateLimiter(max_rate=5000, min_rate=50, burst=500, base_backoff=0.01)
+    rate_limiter.set_limiter(limiter)
+    yield limiter
+    rate_limiter.set_limiter(None)
+
+
+@pytest.fixture(autouse=True)
+def fresh_graph_client():
+    """每個測試使用獨立的連線池與計數器，重試不等待"""
+    client = graph_client.GraphClient(backoff_factor=0)
+    graph_client.set_client(client)
+    yield client
+    graph_client.set_client(None)
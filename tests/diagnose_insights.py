@@ -2,7 +2,7 @@
 診斷工具：檢查 Facebook Insights API 實際返回的數據
 """
 
-import requests
+from utils.graph_client import graph_get
 import json
 from datetime import datetime
 import config
@@ -22,7 +22,7 @@ def test_single_post_insights(post_id):
         'fields': 'id,message,created_time,permalink_url'
     }
 
-    response = requests.get(url, params=params)
+    response = graph_get(url, params=params)
     if response.status_code == 200:
         data = response.json()
         print(f"  Created: {data.get('created_time')}")
@@ -42,7 +42,7 @@ def test_single_post_insights(post_id):
         'summary': 'total_count',
         'limit': 0
     }
-    resp = requests.get(url_reactions, params=params_reactions)
+    resp = graph_get(url_reactions, params=params_reactions)
     if resp.status_code == 200:
         reactions = resp.json().get('summary', {}).get('total_count', 0)
         print(f"  Reactions: {reactions}")
@@ -54,7 +54,7 @@ def test_single_post_insights(post_id):
         'summary': 'total_count',
         'limit': 0
     }
-    resp = requests.get(url_comments, params=params_comments)
+    resp = graph_get(url_comments, params=params_comments)
     if resp.status_code == 200:
         comments = resp.json().get('summary', {}).get('total_count', 0)
         print(f"  Comments: {comments}")
@@ -65,7 +65,7 @@ def test_single_post_insights(post_id):
         'access_token': config.FACEBOOK_CONFIG['access_token'],
         'fields': 'shares'
     }
-    resp = requests.get(url_shares, params=params_shares)
+    resp = graph_get(url_shares, params=params_shares)
     if resp.status_code == 200:
         shares = resp.json().get('shares', {}).get('count', 0)
         print(f"  Shares: {shares}")
@@ -81,7 +81,7 @@ def test_single_post_insights(post_id):
         'metric': ','.join(metrics_to_test)
     }
 
-    response = requests.get(url_insights, params=params_insights)
+    response = graph_get(url_insights, params=params_insights)
 
     if response.status_code == 200:
         insights_data = response.json()
@@ -0,0 +1,541 @@
+"""
+本機 Fake Graph API 伺服器（測試與 benchmark 用）
+模擬粉絲專頁、頁面每日 insights、貼文列表、貼文 insights、reactions/comments/shares 與 batch 請求，
+以及 Marketing API 廣告帳戶與 async insights report job 的生命週期，
+並記錄每個請求以便驗證請求次數；可注入用量標頭與節流錯誤。
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from utils.config import POST_METRICS
+
+API_VERSION = 'v23.0'
+
+
+def make_post(page_id: str, index: int, created_time: str, **overrides) -> Dict:
+    """建立一則測試貼文（數值依 index 遞增，方便驗證拆解結果）"""
+    post = {
+        'id': f'{page_id}_{1000 + index}',
+        'page_id': page_id,
+        'created_time': created_time,
+        'message': f'測試貼文 {index}',
+        'permalink_url': f'https://www.facebook.com/{page_id}/posts/{1000 + index}',
+        'reactions': 10 + index,
+        'comments': 2 + index,
+        'shares': 1 + index,
+        'insights': {metric: 100 * (i + 1) + index for i, metric in enumerate(POST_METRICS)},
+    }
+    post.update(overrides)
+    return post
+
+
+def make_ad_insight(ad_id: str, day: str, index: int = 0) -> Dict:
+    """建立一筆單日廣告洞察（Marketing API 以字串回傳數值）"""
+    impressions = 1000 + 10 * index
+    clicks = 20 + index
+    spend = 50.0 + index
+    return {
+        'ad_id': ad_id,
+        'date_start': day,
+        'date_stop': day,
+        'impressions': str(impressions),
+        'reach': str(800 + 10 * index),
+        'clicks': str(clicks),
+        'spend': f'{spend:.2f}',
+        'cpm': f'{spend / impressions * 1000:.2f}',
+        'cpc': f'{spend / clicks:.2f}',
+        'ctr': f'{clicks / impressions * 100:.2f}',
+    }
+
+
+class FakeGraphState:
+    """伺服器資料與請求紀錄"""
+
+    def __init__(self):
+        self.pages = {}
+        self.posts = {}
+        self.latency = 0.0
+        self.requests = []
+        self.batch_sub_requests = 0
+        self.null_batch_items = set()
+        self.usage_headers = {}
+        self.throttle_next = 0
+        self.throttle_code = 4
+        self.fail_next = 0
+        # 這些分頁位移（after）的貼文列表若要求展開 insights，回傳 400（部分貼文的 insights 無法展開）
+        self.reject_expansion_offsets = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.page_insights_start = {}
+        # 設定後，專頁與其貼文只接受對應的 access token
+        self.page_tokens = {}
+        # 依 access token 注入的用量標頭與專頁層級節流錯誤 (code 32) 次數
+        self.token_usage_headers = {}
+        self.token_throttle_next = {}
+        self.ad_accounts = {}
+        self.ad_insights = []
+        self.report_runs = {}
+        # async job 完成前回傳「進行中」的輪詢次數；report_fail 為 True 時 job 失敗
+        self.report_polls = 2
+        self.report_fail = False
+        self.lock = threading.Lock()
+
+    def add_page(self, page_id: str, name: str, fan_count: int = 1000, followers_count: int = 1200):
+        self.pages[page_id] = {
+            'id': page_id,
+            'name': name,
+            'fan_count': fan_count,
+            'followers_count': followers_count,
+        }
+
+    def add_page_insights(self, page_id: str, start_date: str):
+        """從 start_date 起每天都有頁面 insights（數值由日期決定）"""
+        self.page_insights_start[page_id] = start_date
+
+    def add_post(self, post: Dict):
+        self.posts[post['id']] = post
+
+    def add_ad_account(self, account_id: str, campaigns: Optional[List[Dict]] = None,
+                       ads: Optional[List[Dict]] = None):
+        self.ad_accounts[account_id] = {'campaigns': campaigns or [], 'ads': ads or []}
+
+    def add_ad_insight(self, row: Dict):
+        self.ad_insights.append(row)
+
+    def log(self, method: str, path: str):
+        with self.lock:
+            self.requests.append((method, path))
+
+    def count(self, suffix: str = '') -> int:
+        """計算路徑結尾符合 suffix 的請求數"""
+        with self.lock:
+            return sum(1 for _, path in self.requests if path.endswith(suffix))
+
+    def enter(self):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def take_throttle(self) -> bool:
+        """若仍有待注入的節流錯誤則消耗一次並回傳 True"""
+        with self.lock:
+            if self.throttle_next > 0:
+                self.throttle_next -= 1
+                return True
+            return False
+
+    def take_token_throttle(self, token: Optional[str]) -> bool:
+        """若此 token 仍有待注入的專頁層級節流錯誤則消耗一次並回傳 True"""
+        with self.lock:
+            if self.token_throttle_next.get(token, 0) > 0:
+                self.token_throttle_next[token] -= 1
+                return True
+            return False
+
+    def take_failure(self) -> bool:
+        """若仍有待注入的 503 錯誤則消耗一次並回傳 True"""
+        with self.lock:
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return True
+            return False
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = []
+            self.batch_sub_requests = 0
+            self.max_in_flight = 0
+
+
+def _error(message: str, code: int = 100, status: int = 400) -> Tuple[int, Dict]:
+    return status, {'error': {'message': message, 'type': 'GraphMethodException', 'code': code}}
+
+
+def _single(params: Dict, key: str, default: Optional[str] = None) -> Optional[str]:
+    value = params.get(key)
+    if isinstance(value, list):
+        return value[0] if value else default
+    return value if value is not None else default
+
+
+def _created_ts(post: Dict) -> int:
+    from datetime import datetime
+    return int(datetime.strptime(post['created_time'], '%Y-%m-%dT%H:%M:%S%z').timestamp())
+
+
+def route(state: FakeGraphState, base_url: str, method: str, path: str, params: Dict) -> Tuple[int, Dict]:
+    """依路徑回傳 (status_code, body)，一般請求與 batch 子請求共用"""
+    parts = [p for p in path.strip('/').split('/') if p]
+    if parts and parts[0].startswith('v') and parts[0][1:2].isdigit():
+        parts = parts[1:]
+    if not parts:
+        return _error('Unsupported get request')
+
+    object_id = parts[0]
+    edge = parts[1] if len(parts) > 1 else None
+
+    owner = object_id if object_id in state.pages else state.posts.get(object_id, {}).get('page_id')
+    expected_token = state.page_tokens.get(owner)
+    if expected_token and _single(params, 'access_token') != expected_token:
+        return _error('Invalid OAuth access token for this page', code=190)
+
+    if object_id in state.pages:
+        page = state.pages[object_id]
+        if edge is None:
+            fields = (_single(params, 'fields') or 'id,name').split(',')
+            return 200, {f: page[f] for f in fields if f in page}
+        if edge == 'posts':
+            return _list_posts(state, base_url, path, object_id, params)
+        if edge == 'insights':
+            return _page_insights(state, object_id, params)
+        return _error(f'Unknown edge {edge}')
+
+    if object_id in state.ad_accounts:
+        account = state.ad_accounts[object_id]
+        if edge in ('campaigns', 'ads'):
+            return 200, {'data': account[edge]}
+        return _error(f'Unknown edge {edge}')
+
+    if object_id in state.report_runs:
+        return _report_run(state, base_url, path, object_id, edge, params)
+
+    if edge == 'insights' and any(object_id == ad['id'] for account in state.ad_accounts.values()
+                                  for ad in account['ads']):
+        # 單一廣告的每日洞察（只支援 time_range + time_increment=1，與 Marketing API 相同每頁 25 天）
+        if _single(params, 'time_increment') != '1':
+            return _error('Fake server only supports time_increment=1 for ad insights')
+        rows = _ad_insight_rows(state, {object_id}, json.loads(_single(params, 'time_range') or '{}'))
+        return 200, _paged([{k: v for k, v in row.items() if k != 'ad_id'} for row in rows], base_url, path, params)
+
+    post = state.posts.get(object_id)
+    if post is None:
+        return _error(f'Object {object_id} does not exist')
+
+    if edge is None:
+        fields = (_single(params, 'fields') or 'id').split(',')
+        body = {'id': post['id']}
+        for field in fields:
+            if field == 'shares':
+                if post['shares']:
+                    body['shares'] = {'count': post['shares']}
+            elif field in post:
+                body[field] = post[field]
+        return 200, body
+    if edge in ('reactions', 'comments'):
+        return 200, {'data': [], 'summary': {'total_count': post[edge]}}
+    if edge == 'insights':
+        if post.get('insights') is None:
+            return _error('Unsupported get request', code=100)
+        metrics = (_single(params, 'metric') or '').split(',')
+        return 200, {'data': _insights_payload(post, metrics)}
+    return _error(f'Unknown edge {edge}')
+
+
+def _insights_payload(post: Dict, metrics: List[str]) -> List[Dict]:
+    return [
+        {'name': m, 'period': 'lifetime', 'values': [{'value': post['insights'][m]}]}
+        for m in metrics if m in post['insights']
+    ]
+
+
+# Graph API 頁面 insights 的 since / until 最大間隔
+MAX_PAGE_INSIGHTS_RANGE = 93 * 86400
+
+
+def page_metric_value(metric: str, day: str):
+    """頁面某日的指標值（測試可用同一函式驗證寫入結果）"""
+    from datetime import date
+    base = date.fromisoformat(day).toordinal() % 1000
+    if metric == 'page_actions_post_reactions_total':
+        return {'like': base, 'love': 2, 'wow': 1}
+    return base + 10 * len(metric)
+
+
+def _page_insights(state: FakeGraphState, page_id: str, params: Dict) -> Tuple[int, Dict]:
+    from datetime import datetime, timedelta
+    since, until = int(_single(params, 'since')), int(_single(params, 'until'))
+    if until - since > MAX_PAGE_INSIGHTS_RANGE:
+        return _error('There cannot be more than 93 days (8035200 s) between since and until', code=100)
+    start = state.page_insights_start.get(page_id)
+    metrics = (_single(params, 'metric') or '').split(',')
+    days = []
+    day = datetime.fromtimestamp(since)
+    while day < datetime.fromtimestamp(until):
+        if start and day.strftime('%Y-%m-%d') >= start:
+            days.append(day)
+        day += timedelta(days=1)
+    data = [{
+        'name': metric,
+        'period': 'day',
+        'values': [{'value': page_metric_value(metric, d.strftime('%Y-%m-%d')),
+                    'end_time': (d + timedelta(days=1)).strftime('%Y-%m-%dT07:00:00+0000')} for d in days],
+    } for metric in metrics]
+    return 200, {'data': data}
+
+
+def split_fields(fields: str) -> List[str]:
+    """拆解 fields 參數（忽略括號內的逗號，例如 insights.metric(a,b)）"""
+    result, depth, current = [], 0, ''
+    for ch in fields:
+        if ch == ',' and depth == 0:
+            result.append(current)
+            current = ''
+            continue
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        current += ch
+    if current:
+        result.append(current)
+    return result
+
+
+def _expand_post(post: Dict, fields: List[str]) -> Dict:
+    """依 fields（含欄位展開語法）組出貼文回應"""
+    item = {}
+    for field in fields:
+        name = field.split('.', 1)[0]
+        if name in ('id', 'message', 'created_time', 'permalink_url'):
+            item[name] = post[name]
+        elif name in ('reactions', 'comments'):
+            item[name] = {'data': [], 'summary': {'total_count': post[name]}}
+        elif name == 'shares':
+            if post['shares']:
+                item['shares'] = {'count': post['shares']}
+        elif name == 'insights' and post.get('insights') is not None:
+            metrics = field[field.index('metric(') + 7:field.index(')')].split(',')
+            item['insights'] = {'data': _insights_payload(post, metrics)}
+    return item
+
+
+def _list_posts(state: FakeGraphState, base_url: str, path: str, page_id: str, params: Dict) -> Tuple[int, Dict]:
+    limit = int(_single(params, 'limit', '25'))
+    since = _single(params, 'since')
+    until = _single(params, 'until')
+    offset = int(_single(params, 'after', '0'))
+
+    posts = [p for p in state.posts.values() if p['page_id'] == page_id]
+    if since:
+        posts = [p for p in posts if _created_ts(p) >= int(since)]
+    if until:
+        posts = [p for p in posts if _created_ts(p) < int(until)]
+    posts.sort(key=_created_ts, reverse=True)
+
+    fields = split_fields(_single(params, 'fields') or 'id')
+    if offset in state.reject_expansion_offsets and any(f.startswith('insights') for f in fields):
+        return _error('(#100) Cannot expand insights for some posts in this page')
+    page = posts[offset:offset + limit]
+    data = [_expand_post(post, fields) for post in page]
+
+    body = {'data': data}
+    if offset + limit < len(posts):
+        next_params = {k: _single(params, k) for k in params if k != 'after'}
+        next_params['after'] = str(offset + limit)
+        body['paging'] = {'next': f"{base_url}{path}?{urlencode(next_params)}"}
+    return 200, body
+
+
+def _ad_insight_rows(state: FakeGraphState, ad_ids, time_range: Dict) -> List[Dict]:
+    rows = [
+        row for row in state.ad_insights
+        if row['ad_id'] in ad_ids and time_range.get('since', '') <= row['date_start'] <= time_range.get('until', '9999')
+    ]
+    return sorted(rows, key=lambda row: (row['date_start'], row['ad_id']))
+
+
+def _create_report_run(state: FakeGraphState, account_id: str, form: Dict) -> Tuple[int, Dict]:
+    """建立 async insights job：依 time_range 取出該帳戶廣告的每日資料"""
+    if _single(form, 'level') != 'ad' or _single(form, 'time_increment') != '1':
+        return _error('Fake server only supports level=ad, time_increment=1')
+    time_range = json.loads(_single(form, 'time_range') or '{}')
+    ad_ids = {ad['id'] for ad in state.ad_accounts[account_id]['ads']}
+    for rule in json.loads(_single(form, 'filtering') or '[]'):
+        if rule['field'] == 'ad.id' and rule['operator'] == 'IN':
+            ad_ids &= set(rule['value'])
+    rows = _ad_insight_rows(state, ad_ids, time_range)
+    with state.lock:
+        run_id = f'{len(state.report_runs) + 1:015d}'
+        state.report_runs[run_id] = {
+            'rows': rows,
+            'time_range': time_range,
+            'polls_left': state.report_polls,
+            'failed': state.report_fail,
+        }
+    return 200, {'report_run_id': run_id}
+
+
+def _report_run(state: FakeGraphState, base_url: str, path: str, run_id: str, edge: Optional[str],
+                params: Dict) -> Tuple[int, Dict]:
+    """report run 狀態（每次輪詢推進進度）與分頁結果"""
+    run = state.report_runs[run_id]
+    if edge is None:
+        with state.lock:
+            if run['failed']:
+                return 200, {'id': run_id, 'async_status': 'Job Failed', 'async_percent_completion': 0}
+            if run['polls_left'] > 0:
+                run['polls_left'] -= 1
+                percent = 100 * (state.report_polls - run['polls_left']) // (state.report_polls + 1)
+                return 200, {'id': run_id, 'async_status': 'Job Running', 'async_percent_completion': percent}
+        return 200, {'id': run_id, 'async_status': 'Job Completed', 'async_percent_completion': 100}
+
+    if edge != 'insights':
+        return _error(f'Unknown edge {edge}')
+    if run['failed'] or run['polls_left'] > 0:
+        return _error('Report is not ready', code=2601)
+    return 200, _paged(run['rows'], base_url, path, params)
+
+
+def _paged(rows: List[Dict], base_url: str, path: str, params: Dict) -> Dict:
+    """依 limit（預設 25）/ after 分頁，還有下一頁時附上 paging.next"""
+    limit = int(_single(params, 'limit', '25'))
+    offset = int(_single(params, 'after', '0'))
+    body = {'data': rows[offset:offset + limit]}
+    if offset + limit < len(rows):
+        next_params = {k: _single(params, k) for k in params if k != 'after'}
+        next_params['after'] = str(offset + limit)
+        body['paging'] = {'next': f"{base_url}{path}?{urlencode(next_params)}"}
+    return body
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # 支援 keep-alive，才能驗證連線重用
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    state: FakeGraphState = None
+    base_url: str = ''
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body, token: Optional[str] = None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        headers = {**self.state.usage_headers, **self.state.token_usage_headers.get(token, {})}
+        for name, value in headers.items():
+            self.send_header(name, json.dumps(value))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        split = urlsplit(self.path)
+        self.state.log('GET', split.path)
+        params = parse_qs(split.query)
+        token = _single(params, 'access_token')
+        self.state.enter()
+        try:
+            if self.state.latency:
+                time.sleep(self.state.latency)
+            if self.state.take_failure():
+                status, body = 503, {'error': {'message': 'Service temporarily unavailable', 'code': 2}}
+            elif self.state.take_throttle():
+                status, body = _error('Application request limit reached', code=self.state.throttle_code, status=403)
+            elif self.state.take_token_throttle(token):
+                status, body = _error('Page request limit reached', code=32, status=403)
+            else:
+                status, body = route(self.state, self.base_url, 'GET', split.path, params)
+        finally:
+            self.state.leave()
+        self._send(status, body, token)
+
+    def do_POST(self):
+        split = urlsplit(self.path)
+        self.state.log('POST', split.path)
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode('utf-8'))
+
+        if self.state.take_failure():
+            self._send(503, {'error': {'message': 'Service temporarily unavailable', 'code': 2}})
+            return
+
+        if 'batch' not in form:
+            parts = [p for p in split.path.strip('/').split('/') if p]
+            if len(parts) == 3 and parts[1] in self.state.ad_accounts and parts[2] == 'insights':
+                self._send(*_create_report_run(self.state, parts[1], form))
+            else:
+                self._send(*_error('Unsupported post request'))
+            return
+
+        sub_requests = json.loads(form['batch'][0])
+        if len(sub_requests) > 50:
+            self._send(*_error('Too many requests in batch message. Maximum batch size is 50', code=1))
+            return
+
+        results = []
+        for sub in sub_requests:
+            with self.state.lock:
+                self.state.batch_sub_requests += 1
+            relative = urlsplit('/' + sub['relative_url'].lstrip('/'))
+            sub_params = parse_qs(relative.query)
+            sub_params.setdefault('access_token', form.get('access_token', []))
+            if relative.path.strip('/') in self.state.null_batch_items:
+                # 模擬 Graph API 子請求逾時回傳 null
+                self.state.null_batch_items.discard(relative.path.strip('/'))
+                results.append(None)
+                continue
+            status, body = route(self.state, self.base_url, sub.get('method', 'GET'),
+                                 relative.path, sub_params)
+            results.append({
+                'code': status,
+                'headers': [{'name': 'Content-Type', 'value': 'application/json'}],
+                'body': json.dumps(body),
+            })
+        self._send(200, results, _single(form, 'access_token'))
+
+
+class FakeGraphServer:
+    """在背景執行緒啟動的 Fake Graph API 伺服器"""
+
+    def __init__(self, state: Optional[FakeGraphState] = None):
+        self.state = state or FakeGraphState()
+        handler = type('FakeGraphHandler', (_Handler,), {'state': self.state})
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        handler.base_url = self.url
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def marketing_config(self, ad_account_id: str, access_token: str = 'test-token') -> Dict:
+        """回傳指向本伺服器的 MARKETING_CONFIG"""
+        return {
+            'ad_account_id': ad_account_id,
+            'access_token': access_token,
+            'api_version': API_VERSION,
+            'base_url': self.url,
+        }
+
+    def config(self, page_id: str, access_token: str = 'test-token') -> Dict:
+        """回傳指向本伺服器的 FACEBOOK_CONFIG"""
+        return {
+            'page_id': page_id,
+            'access_token': access_token,
+            'api_version': API_VERSION,
+            'base_url': self.url,
+        }
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
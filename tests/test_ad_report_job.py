@@ -0,0 +1,141 @@
+"""
+測試 Marketing API async 廣告洞察報表（使用本機 Fake Graph 伺服器模擬 job 生命週期）
+"""
+
+import io
+import sqlite3
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+
+import pytest
+
+from collectors import ad_report_job, ad_watermarks, collector_ads
+from tests.fake_graph_server import make_ad_insight
+
+ACCOUNT_ID = 'act_1234567890'
+AD_IDS = [f'2385000000000{i:02d}' for i in range(6)]
+TODAY = date.today()
+
+pytestmark = pytest.mark.graph(page=False)
+
+
+def day(offset: int) -> str:
+    return (TODAY - timedelta(days=offset)).isoformat()
+
+
+@pytest.fixture
+def server(server, tmp_path, monkeypatch):
+    ads = [{'id': ad_id, 'name': f'廣告 {i}', 'status': 'ACTIVE', 'campaign_id': 'c1', 'adset_id': 's1',
+            'creative': {'id': f'cr{i}', 'effective_object_story_id': f'103640919705348_{1000 + i}'}}
+           for i, ad_id in enumerate(AD_IDS)]
+    server.state.add_ad_account(ACCOUNT_ID, campaigns=[{'id': 'c1', 'name': '活動', 'status': 'ACTIVE'}], ads=ads)
+    # 每個廣告過去 10 天每天一筆
+    for i, ad_id in enumerate(AD_IDS):
+        for offset in range(1, 11):
+            server.state.add_ad_insight(make_ad_insight(ad_id, day(offset), i))
+    monkeypatch.setattr(collector_ads, 'DB_PATH', str(tmp_path / 'engagement_data.db'))
+    monkeypatch.setattr(ad_report_job, 'POLL_INTERVAL', 0)
+    monkeypatch.setattr(ad_report_job, 'PAGE_LIMIT', 25)
+    return server
+
+
+def collect(srv, **kwargs):
+    with redirect_stdout(io.StringIO()):
+        return collector_ads.collect_all_ad_data(srv.marketing_config(ACCOUNT_ID), **kwargs)
+
+
+def insight_rows():
+    conn = sqlite3.connect(collector_ads.DB_PATH)
+    rows = conn.execute("SELECT ad_id, date_start, date_stop, impressions, spend FROM ad_insights").fetchall()
+    conn.close()
+    return rows
+
+
+def test_single_job_replaces_per_ad_requests(server):
+    assert collect(server)
+
+    # 1 個 job、輪詢直到完成、60 筆結果分 3 頁；沒有任何逐一廣告的 insights 請求
+    assert server.state.count(f'{ACCOUNT_ID}/insights') == 1
+    run_id = next(iter(server.state.report_runs))
+    assert server.state.count(f'/{run_id}') == server.state.report_polls + 1
+    assert server.state.count(f'{run_id}/insights') == 3
+    for ad_id in AD_IDS:
+        assert server.state.count(f'{ad_id}/insights') == 0
+
+    rows = insight_rows()
+    assert len(rows) == len(AD_IDS) * 10
+    assert all(start == stop for _, start, stop, _, _ in rows)
+
+
+def test_incremental_range_upserts_without_duplicates(server):
+    assert collect(server)
+    first = sorted(insight_rows())
+
+    # 新的一天的資料，並修正前一天的數值
+    for ad_id in AD_IDS:
+        server.state.add_ad_insight(make_ad_insight(ad_id, day(0), 50))
+    server.state.ad_insights = [
+        dict(row, impressions='9999') if row['date_start'] == day(1) else row
+        for row in server.state.ad_insights
+    ]
+    assert collect(server)
+
+    lookback = ad_watermarks.ATTRIBUTION_LOOKBACK_DAYS
+    second_run = server.state.report_runs[max(server.state.report_runs)]
+    assert second_run['time_range'] == {'since': day(lookback), 'until': TODAY.isoformat()}
+    # 第二次只下載回溯區間（含新的一天）
+    assert len(second_run['rows']) == len(AD_IDS) * (lookback + 1)
+
+    rows = insight_rows()
+    assert len(rows) == len(first) + len(AD_IDS)
+    assert {r[3] for r in rows if r[1] == day(1)} == {9999}
+
+
+def test_daily_rows_replace_lifetime_rows(server):
+    with redirect_stdout(io.StringIO()):
+        conn = collector_ads.get_connection()
+        collector_ads.setup_ad_tables(conn)
+        # 舊版 date_preset='maximum' 寫入的累計列
+        collector_ads.save_ad_insights(conn, AD_IDS[0], [{
+            'date_start': day(30), 'date_stop': day(1), 'impressions': 123456, 'spend': '999'}])
+        conn.close()
+
+    assert collect(server)
+    conn = sqlite3.connect(collector_ads.DB_PATH)
+    total = conn.execute("SELECT SUM(impressions) FROM ad_insights WHERE ad_id = ?", (AD_IDS[0],)).fetchone()[0]
+    conn.close()
+    assert total == 1000 * 10
+
+
+def test_failed_job_writes_nothing(server):
+    server.state.report_fail = True
+    assert collect(server) is False
+    assert insight_rows() == []
+    assert server.state.count(f'{next(iter(server.state.report_runs))}/insights') == 0
+
+
+def test_per_ad_path_still_available(server):
+    assert collect(server, use_report_job=False)
+    assert server.state.count(f'{ACCOUNT_ID}/insights') == 0
+    assert server.state.count('/insights') == len(AD_IDS)
+    assert len(insight_rows()) == len(AD_IDS) * 10
+
+
+def test_roi_ratios_are_weighted_by_volume():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    with redirect_stdout(io.StringIO()):
+        collector_ads.setup_ad_tables(conn)
+    conn.execute("CREATE TABLE posts (post_id TEXT PRIMARY KEY)")
+    conn.execute("CREATE TABLE posts_classification (post_id TEXT, format_type TEXT, issue_topic TEXT)")
+    conn.execute("INSERT INTO posts VALUES ('p1')")
+    conn.execute("INSERT INTO posts_classification VALUES ('p1', 'event', 'energy')")
+    conn.execute("INSERT INTO ads (ad_id, post_id) VALUES ('a1', 'p1')")
+    # 有花費的一天 + 無花費的一天（每日比率平均會把 CPM 從 50 拉低到 25）
+    conn.executemany("""
+        INSERT INTO ad_insights (ad_id, date_start, date_stop, impressions, clicks, spend, cpm, cpc, ctr)
+        VALUES ('a1', ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(day(2), day(2), 2000, 40, 100.0, 50.0, 2.5, 2.0), (day(1), day(1), 0, 0, 0.0, 0.0, 0.0, 0.0)])
+
+    row = collector_ads.get_ad_roi_by_post_type(conn)[0]
+    assert (row['avg_cpm'], row['avg_cpc'], row['avg_ctr']) == (50.0, 2.5, 2.0)
@@ -0,0 +1,137 @@
+"""
+測試廣告洞察增量水位（使用本機 Fake Graph 伺服器）
+"""
+
+import io
+import sqlite3
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+
+import pytest
+
+from collectors import ad_report_job, ad_watermarks, collector_ads
+from tests.fake_graph_server import make_ad_insight
+
+ACCOUNT_ID = 'act_1234567890'
+TODAY = date.today()
+LOOKBACK = ad_watermarks.ATTRIBUTION_LOOKBACK_DAYS
+
+pytestmark = pytest.mark.graph(page=False)
+
+
+def day(offset: int) -> str:
+    return (TODAY - timedelta(days=offset)).isoformat()
+
+
+def make_ad(ad_id: str, status: str = 'ACTIVE', created_offset: int = 60) -> dict:
+    return {'id': ad_id, 'name': ad_id, 'status': status, 'campaign_id': 'c1', 'adset_id': 's1',
+            'creative': {'id': f'cr_{ad_id}'}, 'created_time': f'{day(created_offset)}T08:00:00+0800'}
+
+
+@pytest.fixture
+def server(server, tmp_path, monkeypatch):
+    server.state.add_ad_account(ACCOUNT_ID, ads=[
+        make_ad('ad_active'),
+        make_ad('ad_archived_old', 'ARCHIVED'),
+        make_ad('ad_archived_recent', 'ARCHIVED'),
+    ])
+    for offset in range(1, 31):
+        server.state.add_ad_insight(make_ad_insight('ad_active', day(offset)))
+        # 30 天前停止投放
+        server.state.add_ad_insight(make_ad_insight('ad_archived_old', day(offset + 30)))
+        # 昨天才停止投放，仍在歸因修正期內
+        server.state.add_ad_insight(make_ad_insight('ad_archived_recent', day(offset)))
+    monkeypatch.setattr(collector_ads, 'DB_PATH', str(tmp_path / 'engagement_data.db'))
+    monkeypatch.setattr(ad_report_job, 'POLL_INTERVAL', 0)
+    return server
+
+
+def run(srv, **kwargs):
+    output = io.StringIO()
+    with redirect_stdout(output):
+        assert collector_ads.collect_all_ad_data(srv.marketing_config(ACCOUNT_ID), **kwargs)
+    return output.getvalue()
+
+
+def watermarks():
+    conn = sqlite3.connect(collector_ads.DB_PATH)
+    rows = dict(conn.execute("SELECT ad_id, last_date_stop FROM ad_insights_watermarks").fetchall())
+    conn.close()
+    return rows
+
+
+def test_first_run_sets_watermarks_for_every_ad(server):
+    run(server)
+    assert watermarks() == {ad_id: TODAY.isoformat() for ad_id in
+                            ('ad_active', 'ad_archived_old', 'ad_archived_recent')}
+
+
+@pytest.mark.parametrize('use_report_job', [True, False])
+def test_second_run_skips_closed_ads_and_fetches_lookback_only(server, use_report_job):
+    run(server, use_report_job=use_report_job)
+    server.state.reset_counters()
+    output = run(server, use_report_job=use_report_job)
+
+    if use_report_job:
+        job = server.state.report_runs[max(server.state.report_runs)]
+        assert job['time_range'] == {'since': day(LOOKBACK), 'until': TODAY.isoformat()}
+        assert {row['ad_id'] for row in job['rows']} == {'ad_active', 'ad_archived_recent'}
+    else:
+        assert server.state.count('ad_archived_old/insights') == 0
+        assert server.state.count('ad_active/insights') == 1
+
+    assert '略過已結束廣告: 1 個' in output
+    assert f'抓取區間: {2 * (LOOKBACK + 1)} 廣告日' in output
+    assert '節省下載: 約 ' in output and '約 0.0 KB' not in output
+
+
+def test_per_ad_requests_read_every_page(server):
+    # 新廣告的區間為 61 天，每日洞察超過一頁（25 天）
+    run(server, use_report_job=False)
+    assert server.state.count('ad_active/insights') == 2
+    conn = sqlite3.connect(collector_ads.DB_PATH)
+    days = dict(conn.execute("SELECT ad_id, COUNT(*) FROM ad_insights GROUP BY ad_id").fetchall())
+    conn.close()
+    assert days == {'ad_active': 30, 'ad_archived_old': 30, 'ad_archived_recent': 30}
+    assert set(watermarks().values()) == {TODAY.isoformat()}
+
+
+def test_plan_windows_counts_days(server):
+    run(server)
+    conn = sqlite3.connect(collector_ads.DB_PATH)
+    plan = ad_watermarks.plan_windows(conn, TODAY)
+    assert plan['skipped'] == ['ad_archived_old']
+    assert plan['windows'] == {day(LOOKBACK): ['ad_active', 'ad_archived_recent']}
+    assert plan['fetched_days'] == 2 * (LOOKBACK + 1)
+    assert plan['lifetime_days'] == 3 * 61
+
+    # 水位推進到最後投放日 + 回溯天數後，最近停止投放的封存廣告也會被略過
+    closed_at = TODAY + timedelta(days=LOOKBACK - 1)
+    ad_watermarks.update_watermarks(conn, ['ad_archived_recent'], closed_at.isoformat())
+    plan = ad_watermarks.plan_windows(conn, closed_at)
+    conn.close()
+    assert plan['skipped'] == ['ad_archived_old', 'ad_archived_recent']
+
+
+def test_failed_job_keeps_watermarks(server):
+    run(server)
+    server.state.report_fail = True
+    with redirect_stdout(io.StringIO()):
+        assert collector_ads.collect_all_ad_data(server.marketing_config(ACCOUNT_ID)) is False
+    assert set(watermarks().values()) == {TODAY.isoformat()}
+
+    conn = sqlite3.connect(collector_ads.DB_PATH)
+    last_fetched = conn.execute("SELECT COUNT(DISTINCT last_fetched_at) FROM ad_insights_watermarks").fetchone()[0]
+    conn.close()
+    assert last_fetched == 1
+
+
+def test_existing_daily_rows_seed_watermarks(server):
+    with redirect_stdout(io.StringIO()):
+        conn = collector_ads.get_connection()
+        collector_ads.setup_ad_tables(conn)
+        ad_report_job.save_daily_insights(conn, [make_ad_insight('ad_active', day(2))])
+        conn.commit()
+        assert ad_watermarks.seed_watermarks(conn) == 1
+        conn.close()
+    assert watermarks() == {'ad_active': day(2)}
@@ -1,7 +1,7 @@
 """
 測試 Facebook API 指標可用性
 """
-import requests
+from utils.graph_client import graph_get
 
 # Page Access Token (從 /me/accounts 取得)
 ACCESS_TOKEN = 'EAAPbnmTSpmoBQEIJ3H6KCC1ZA6YFROcXcZAHJAhf2g8eoG4cyParQdkxKXRYyb8ww9vFGIDogWbDqO8kAwY9aVjrV0zfJdqNuDQDLA5JiKas095i3od2NZCHLAgMTo7CFf9kXGza1okttRrAPHZBe70GXUEAlnzh1yZBFIHPmFFkTImusaTBN6F94uIeNsFZBfjD8ms9kZD'
@@ -18,7 +18,7 @@ def test_api_connection():
         'fields': 'id,name,fan_count'
     }
     
-    response = requests.get(url, params=params)
+    response = graph_get(url, params=params)
     if response.status_code == 200:
         data = response.json()
         print(f"✓ API 連線成功")
@@ -42,7 +42,7 @@ def test_deprecated_metrics():
         'limit': 1
     }
     
-    response = requests.get(url, params=params)
+    response = graph_get(url, params=params)
     if response.status_code != 200:
         print(f"✗ 無法取得貼文列表: {response.json()}")
         return
@@ -71,7 +71,7 @@ def test_deprecated_metrics():
             'metric': metric
         }
         
-        response = requests.get(url, params=params)
+        response = graph_get(url, params=params)
         data = response.json()
         
         if 'error' in data:
@@ -95,7 +95,7 @@ def test_is_published_and_targeting():
         'limit': 3
     }
     
-    response = requests.get(url, params=params)
+    response = graph_get(url, params=params)
     if response.status_code == 200:
         posts = response.json().get('data', [])
         print(f"取得 {len(posts)} 則貼文:")
@@ -0,0 +1,76 @@
+"""
+測試非同步收集引擎（使用本機 Fake Graph 伺服器）
+"""
+
+import asyncio
+import sqlite3
+
+import httpx
+import pytest
+
+from collectors import async_collector
+from utils.config import POST_METRICS
+from utils.setup_database import create_tables
+
+PAGE_ID = '103640919705348'
+
+pytestmark = pytest.mark.graph(posts=40)
+
+
+def test_endpoint_of():
+    assert async_collector.endpoint_of('123_456/insights') == 'insights'
+    assert async_collector.endpoint_of('123_456') == 'object'
+
+
+def test_refresh_respects_concurrency_limit(server):
+    server.state.latency = 0.02
+    collector = async_collector.AsyncGraphCollector(server.config(PAGE_ID), concurrency=6)
+    post_ids = sorted(server.state.posts)
+
+    results = asyncio.run(collector.refresh_posts(post_ids, POST_METRICS))
+
+    assert server.state.count() == 4 * len(post_ids)
+    assert 1 < server.state.max_in_flight <= 6
+    for post_id in post_ids:
+        insights, basic_stats = results[post_id]
+        assert insights == server.state.posts[post_id]['insights']
+        assert basic_stats['comments_count'] == server.state.posts[post_id]['comments']
+
+
+def test_endpoint_semaphore_limits_insights(server):
+    server.state.latency = 0.02
+    post_ids = sorted(server.state.posts)[:10]
+
+    async def only_insights():
+        collector = async_collector.AsyncGraphCollector(
+            server.config(PAGE_ID), concurrency=20, endpoint_limits={'insights': 2}
+        )
+        async with httpx.AsyncClient() as client:
+            await asyncio.gather(*[
+                collector.get(client, f'{post_id}/insights', {'metric': 'post_clicks'}) for post_id in post_ids
+            ])
+
+    asyncio.run(only_insights())
+    assert server.state.max_in_flight == 2
+
+
+def test_collect_keeps_upsert_semantics(server):
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    create_tables(conn)
+    post_ids = sorted(server.state.posts)
+
+    success, skipped = async_collector.collect_post_insights_async(
+        conn, server.config(PAGE_ID), post_ids, POST_METRICS, '2025-12-31', concurrency=10
+    )
+    # 同一天重跑會覆寫同一筆 snapshot
+    async_collector.collect_post_insights_async(
+        conn, server.config(PAGE_ID), post_ids, POST_METRICS, '2025-12-31', concurrency=10
+    )
+
+    assert (success, skipped) == (40, 0)
+    assert conn.execute("SELECT COUNT(*) FROM post_insights_snapshots").fetchone()[0] == 40
+    row = conn.execute(
+        "SELECT shares_count FROM post_insights_snapshots WHERE post_id = ?", (post_ids[3],)
+    ).fetchone()
+    assert row['shares_count'] == server.state.posts[post_ids[3]]['shares']
@@ -0,0 +1,105 @@
+"""
+測試補收作業的檢查點與並行續跑（使用本機 Fake Graph 伺服器）
+"""
+
+import io
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+import pytest
+
+from collectors import backfill_checkpoint, backfill_insights
+from utils import db_utils
+
+PAGE_ID = '103640919705348'
+POST_COUNT = 30
+
+pytestmark = pytest.mark.graph(
+    page=False, posts=POST_COUNT,
+    created=lambda i: (datetime(2024, 1, 1, 8, 0) + timedelta(days=i)).strftime('%Y-%m-%dT%H:%M:%S+0000'))
+
+
+@pytest.fixture
+def server(server, monkeypatch):
+    monkeypatch.setattr(backfill_insights, 'FACEBOOK_CONFIG', server.config(PAGE_ID))
+    with redirect_stdout(io.StringIO()):
+        conn = db_utils.get_db_connection()
+    for post in server.state.posts.values():
+        db_utils.upsert_post(conn, {'id': post['id'], 'page_id': PAGE_ID, 'created_time': post['created_time']})
+    conn.close()
+    return server
+
+
+def backfill(**kwargs):
+    with redirect_stdout(io.StringIO()):
+        return backfill_insights.backfill_post_insights(skip_existing=False, **kwargs)
+
+
+def insights_requests(server):
+    return {post_id: server.state.count(f'{post_id}/insights') for post_id in server.state.posts}
+
+
+def test_partition_keeps_priority_order():
+    assert backfill_checkpoint.partition(list(range(7)), 3) == [[0, 3, 6], [1, 4], [2, 5]]
+    assert backfill_checkpoint.partition([1], 4) == [[1]]
+    assert backfill_checkpoint.partition([], 2) == []
+
+
+def test_crash_resumes_in_parallel_without_refetching(server, monkeypatch):
+    calls = {'n': 0}
+    real_graph_get = backfill_insights.graph_get
+
+    def crashing_graph_get(*args, **kwargs):
+        # 第 11 則貼文的第一個請求時中斷（模擬逾時被終止）
+        calls['n'] += 1
+        if calls['n'] > 10 * 4:
+            raise KeyboardInterrupt
+        return real_graph_get(*args, **kwargs)
+
+    monkeypatch.setattr(backfill_insights, 'graph_get', crashing_graph_get)
+    with pytest.raises(KeyboardInterrupt):
+        backfill()
+
+    conn = db_utils.get_db_connection()
+    assert backfill_checkpoint.progress(conn, backfill_insights.CHECKPOINT_JOB) == {'done': 10, 'pending': 20}
+    assert sum(insights_requests(server).values()) == 10
+
+    monkeypatch.setattr(backfill_insights, 'graph_get', real_graph_get)
+    server.state.latency = 0.01
+    assert backfill(parallel=3) == (20, 0)
+
+    assert backfill_checkpoint.progress(conn, backfill_insights.CHECKPOINT_JOB) == {'done': POST_COUNT}
+    # 每則貼文只抓取一次
+    assert insights_requests(server) == {post_id: 1 for post_id in server.state.posts}
+    assert server.state.max_in_flight > 1
+    assert conn.execute("SELECT COUNT(DISTINCT post_id) FROM post_insights_snapshots").fetchone()[0] == POST_COUNT
+
+    # 全部完成後再次執行不會發出任何請求
+    server.state.reset_counters()
+    assert backfill(parallel=3) == (0, 0)
+    assert server.state.count() == 0
+    conn.close()
+
+
+def test_budget_stop_then_resume_completes_remaining(server):
+    assert backfill(budget=4 * 12) == (12, 0)
+    assert backfill(parallel=2) == (POST_COUNT - 12, 0)
+    assert insights_requests(server) == {post_id: 1 for post_id in server.state.posts}
+
+
+def test_failed_posts_retry_until_max_attempts(server):
+    conn = db_utils.get_db_connection()
+    db_utils.upsert_post(conn, {'id': 'deleted_post', 'page_id': PAGE_ID, 'created_time': '2024-03-01T00:00:00+0000'})
+
+    for attempt in range(1, backfill_checkpoint.MAX_ATTEMPTS + 1):
+        assert backfill() == ((POST_COUNT, 1) if attempt == 1 else (0, 1))
+    row = conn.execute("""
+        SELECT status, attempts, last_error FROM backfill_checkpoints WHERE job = ? AND item_key = 'deleted_post'
+    """, (backfill_insights.CHECKPOINT_JOB,)).fetchone()
+    assert tuple(row) == ('failed', backfill_checkpoint.MAX_ATTEMPTS, 'no data')
+
+    # 超過嘗試上限後不再重試；restart 清除檢查點後重新開始
+    assert backfill() == (0, 0)
+    # 最新的 5 則貼文（含已刪除的貼文）重新處理
+    assert backfill(restart=True, limit=5) == (4, 1)
+    conn.close()
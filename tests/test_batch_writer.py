@@ -0,0 +1,95 @@
+"""
+測試批次寫入（db_utils.BatchWriter）
+"""
+
+import io
+from contextlib import redirect_stdout
+
+import pytest
+
+from tests.conftest import make_conn
+from utils import db_utils, migrations
+
+METRICS = {'likes_count': 5, 'comments_count': 1, 'post_clicks': 3, 'post_impressions_unique': 80}
+
+
+def commits(conn):
+    """記錄連線上執行的 COMMIT 次數"""
+    statements = []
+    conn.set_trace_callback(statements.append)
+    return lambda: sum(1 for sql in statements if sql.strip().upper() == 'COMMIT')
+
+
+def post(i, page_id='page'):
+    return {'id': f'page_{i}', 'page_id': page_id, 'created_time': '2026-03-01T08:00:00+0000', 'message': f'#{i}'}
+
+
+def dump(conn, table):
+    return conn.execute(f"SELECT * FROM {table} ORDER BY 1").fetchall()
+
+
+def test_batches_match_row_by_row_writes_with_one_commit_per_flush():
+    single, batched = make_conn(), make_conn()
+    count_single, count_batched = commits(single), commits(batched)
+    for conn in (single, batched):
+        conn.execute("INSERT INTO posts (post_id, page_id) VALUES ('page_0', 'page')")
+        conn.commit()
+
+    for i in range(1000):
+        db_utils.upsert_post(single, post(i))
+        db_utils.upsert_post_insights(single, f'page_{i}', '2026-03-02', dict(METRICS, shares_count=i))
+    db_utils.upsert_page_daily_metrics(single, 'page', '2026-03-02', {'fan_count': 10})
+
+    with db_utils.BatchWriter(batched, flush_every=500) as writer:
+        for i in range(1000):
+            writer.upsert_post(post(i))
+            writer.upsert_post_insights(f'page_{i}', '2026-03-02', dict(METRICS, shares_count=i))
+        writer.upsert_page_daily_metrics('page', '2026-03-02', {'fan_count': 10})
+
+    for table in ('posts', 'post_insights_snapshots', 'page_daily_metrics'):
+        assert dump(batched, table) == dump(single, table)
+    assert writer.stats == {'written': 2001, 'failed': 0, 'flushes': 5}
+    assert count_single() == 2002
+    assert count_batched() == 1 + 5
+
+
+def test_failed_row_is_skipped_and_rest_of_batch_is_written():
+    conn = make_conn()
+    with redirect_stdout(io.StringIO()) as out:
+        with db_utils.BatchWriter(conn) as writer:
+            writer.upsert_post(post(1))
+            writer.upsert_post(post(2, page_id=None))   # page_id NOT NULL
+            writer.upsert_post(post(3))
+    assert writer.stats['written'] == 2 and writer.stats['failed'] == 1
+    assert [row[0] for row in dump(conn, 'posts')] == ['page_1', 'page_3']
+    assert 'retrying row by row' in out.getvalue()
+
+
+def test_rows_buffered_before_an_exception_are_still_written():
+    conn = make_conn()
+    with pytest.raises(RuntimeError):
+        with db_utils.BatchWriter(conn) as writer:
+            writer.upsert_post(post(1))
+            raise RuntimeError('API 失敗')
+    assert len(dump(conn, 'posts')) == 1
+
+
+def test_changes_only_mode_compares_within_batch():
+    conn = make_conn()
+    with db_utils.BatchWriter(conn, changes_only=True) as writer:
+        for day in range(1, 6):
+            writer.upsert_post_insights('page_1', f'2026-03-0{day}', dict(METRICS))
+    rows = [tuple(row) for row in conn.execute("SELECT fetch_date, last_checked FROM post_insights_snapshots")]
+    assert rows == [('2026-03-01', '2026-03-05')]
+    assert writer.stats['written'] == 5
+
+
+def test_connections_check_schema_once_per_database(tmp_path, monkeypatch):
+    checked = []
+    monkeypatch.setattr(migrations, 'migrate', lambda conn: checked.append(db_utils.DB_PATH))
+    monkeypatch.setattr(db_utils, 'DB_PATH', str(tmp_path / 'a.db'))
+    for _ in range(3):
+        db_utils.get_db_connection().close()
+    monkeypatch.setattr(db_utils, 'DB_PATH', str(tmp_path / 'b.db'))
+    db_utils.get_db_connection().close()
+    assert checked == [str(tmp_path / 'a.db'), str(tmp_path / 'b.db')]
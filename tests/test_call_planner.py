@@ -0,0 +1,104 @@
+"""
+測試 Graph API 呼叫預算規劃（使用本機 Fake Graph 伺服器）
+"""
+
+import io
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+import pytest
+
+import run_pipeline
+from collectors import call_planner
+from tests.fake_graph_server import FakeGraphServer, make_post
+from utils import db_utils
+
+PAGE_ID = '103640919705348'
+
+
+def test_information_gain_prefers_recent_volatile_and_missing():
+    fresh = call_planner.information_gain(age_days=1, growth=None, missing=False)
+    old = call_planner.information_gain(age_days=200, growth=None, missing=False)
+    volatile = call_planner.information_gain(age_days=200, growth=0.2, missing=False)
+    missing = call_planner.information_gain(age_days=200, growth=None, missing=True)
+    overdue = call_planner.information_gain(age_days=200, growth=None, missing=False, overdue_days=10)
+
+    assert fresh > old
+    assert volatile > old
+    assert missing > old
+    assert overdue > old
+    assert 0 <= old < fresh <= 1
+
+
+def test_budget_stops_at_limit(fast_rate_limiter):
+    planner = call_planner.CallPlanner(max_calls=20)
+    heap = planner.queue([{'post_id': f'p{i}', 'score': i / 10, 'cost': 4} for i in range(10)])
+
+    batch = planner.next_batch(heap, 12)
+    fast_rate_limiter.acquire(sum(c['cost'] for c in batch))
+
+    assert [c['post_id'] for c in batch] == ['p9', 'p8', 'p7', 'p6', 'p5']
+    assert planner.next_batch(heap, 12) == []
+    assert planner.stopped_by == 'budget'
+    assert [c['post_id'] for c in planner.defer(heap)] == ['p4', 'p3', 'p2', 'p1', 'p0']
+    assert planner.summary() == {
+        'max_calls': 20, 'planned_calls': 40, 'executed_calls': 20,
+        'deferred_posts': 5, 'stopped_by': 'budget',
+    }
+
+
+def test_deadline_stops_before_any_call():
+    planner = call_planner.CallPlanner(deadline_seconds=0)
+    heap = planner.queue([{'post_id': 'p', 'score': 1.0, 'cost': 4}])
+    assert planner.next_batch(heap, 12) == []
+    assert planner.stopped_by == 'deadline'
+
+
+def test_equal_scores_do_not_break_heap():
+    planner = call_planner.CallPlanner()
+    heap = planner.queue([{'post_id': 'same', 'score': 0.5, 'cost': 3, 'row': {}} for _ in range(3)])
+    assert len(planner.next_batch(heap, 10)) == 3
+
+
+@pytest.fixture
+def backlog(tmp_path, monkeypatch):
+    with FakeGraphServer() as srv:
+        srv.state.add_page(PAGE_ID, '測試專頁')
+        monkeypatch.setattr(run_pipeline.config, 'FACEBOOK_CONFIG', srv.config(PAGE_ID))
+        monkeypatch.setattr(db_utils, 'DB_PATH', str(tmp_path / 'engagement_data.db'))
+
+        # 資料庫中有 40 則尚未收集 insights 的舊貼文（不在本次列表範圍內）
+        conn = db_utils.get_db_connection()
+        start = datetime(2025, 1, 1, 8, 0)
+        for i in range(40):
+            post = make_post(PAGE_ID, i, (start + timedelta(days=i)).strftime('%Y-%m-%dT%H:%M:%S+0000'))
+            srv.state.add_post(post)
+            db_utils.upsert_post(conn, {'id': post['id'], 'page_id': PAGE_ID, 'created_time': post['created_time']})
+        conn.close()
+        yield srv
+
+
+def test_collect_post_data_respects_budget(backlog):
+    # 1 個列表請求 + 15 則貼文 × 4 個子請求
+    planner = call_planner.CallPlanner(max_calls=61)
+    with redirect_stdout(io.StringIO()):
+        assert run_pipeline.collect_post_data(since_date='2026-06-01', until_date='2026-06-30',
+                                              reconcile=False, planner=planner)
+
+    conn = db_utils.get_db_connection()
+    collected = {row[0] for row in conn.execute("SELECT post_id FROM post_insights_snapshots")}
+    deferred = conn.execute("SELECT post_id, reason, times_deferred FROM deferred_fetches").fetchall()
+
+    assert planner.executed_calls == 61
+    assert planner.planned_calls == 1 + 4 * 40
+    assert len(collected) == 15
+    # 全部缺資料時，越新的貼文優先
+    assert collected == {make_post(PAGE_ID, i, '')['id'] for i in range(25, 40)}
+    assert len(deferred) == 25
+    assert {row[1] for row in deferred} == {'budget'}
+
+    # 下次執行（不限預算）補完延後的貼文並清除延後紀錄
+    with redirect_stdout(io.StringIO()):
+        assert run_pipeline.collect_post_data(since_date='2026-06-01', until_date='2026-06-30', reconcile=False)
+    assert conn.execute("SELECT COUNT(DISTINCT post_id) FROM post_insights_snapshots").fetchone()[0] == 40
+    assert conn.execute("SELECT COUNT(*) FROM deferred_fetches").fetchone()[0] == 0
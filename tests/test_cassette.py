@@ -0,0 +1,138 @@
+"""
+測試 Graph API 錄製 / 重播層（以本機 Fake Graph 伺服器錄製，關閉伺服器後重播）
+"""
+
+import asyncio
+import gzip
+import io
+import sqlite3
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+
+import run_pipeline
+from collectors import collector_page
+from collectors.async_collector import AsyncGraphCollector
+from tests.fake_graph_server import FakeGraphServer, make_post
+from utils import cassette, config, db_utils, graph_client
+from utils.config import POST_METRICS
+from utils.graph_batch import graph_base_url
+
+PAGE_ID = '103640919705348'
+SECRET_TOKEN = 'EAAB-secret-page-token-123'
+
+
+@pytest.fixture
+def recorded(tmp_path, monkeypatch):
+    """對 Fake 伺服器執行一次頁面與貼文收集並錄製，回傳 (cassette 路徑, 錄製時的資料庫內容)"""
+    path = str(tmp_path / 'cassettes' / 'run.jsonl.gz')
+    with FakeGraphServer() as server:
+        server.state.add_page(PAGE_ID, '測試專頁')
+        server.state.add_page_insights(PAGE_ID, '2024-01-01')
+        start = datetime.now() - timedelta(days=20)
+        for i in range(15):
+            server.state.add_post(make_post(PAGE_ID, i, (start + timedelta(days=i)).strftime('%Y-%m-%dT%H:%M:%S+0000')))
+        monkeypatch.setattr(config, 'FACEBOOK_CONFIG', server.config(PAGE_ID, access_token=SECRET_TOKEN))
+        monkeypatch.setattr(db_utils, 'DB_PATH', str(tmp_path / 'recorded.db'))
+        with cassette.use(path, mode='record') as recording:
+            run()
+        assert recording.stats['recorded'] == len(server.state.requests)
+        expected = snapshot_tables()
+    # 重播時伺服器已關閉，寫入新的資料庫
+    monkeypatch.setattr(db_utils, 'DB_PATH', str(tmp_path / 'replayed.db'))
+    return path, expected
+
+
+def run(**kwargs):
+    with redirect_stdout(io.StringIO()):
+        collector_page.process_and_save_page_data(days_back=30)
+        assert run_pipeline.collect_post_data(reconcile=False, **kwargs)
+
+
+def snapshot_tables():
+    conn = sqlite3.connect(db_utils.DB_PATH)
+    tables = {
+        'posts': conn.execute("SELECT post_id, message, created_time FROM posts ORDER BY post_id").fetchall(),
+        'snapshots': conn.execute("""
+            SELECT post_id, likes_count, comments_count, shares_count, post_clicks, post_impressions_unique
+            FROM post_insights_snapshots ORDER BY post_id
+        """).fetchall(),
+        'page_days': conn.execute("""
+            SELECT date, page_impressions_unique, reactions_like FROM page_daily_metrics ORDER BY date
+        """).fetchall(),
+    }
+    conn.close()
+    return tables
+
+
+def test_recording_is_compressed_and_scrubbed(recorded):
+    path, _ = recorded
+    with open(path, 'rb') as f:
+        assert f.read(2) == b'\x1f\x8b'
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        text = f.read()
+    assert SECRET_TOKEN not in text
+    assert 'access_token=REDACTED' in text
+
+
+def test_scrub_masks_query_and_json_tokens():
+    text = 'https://x/v23.0/me?fields=id&access_token=abc123&limit=5 {"access_token": "def456"}'
+    assert cassette.scrub(text) == ('https://x/v23.0/me?fields=id&access_token=REDACTED&limit=5 '
+                                    '{"access_token": "REDACTED"}')
+    assert cassette.scrub('token is xyz', secrets=['xyz']) == 'token is REDACTED'
+
+
+def test_replay_reproduces_run_without_network(recorded, monkeypatch):
+    path, expected = recorded
+    # 重播時使用不同的 token 與主機仍可比對
+    monkeypatch.setattr(config, 'FACEBOOK_CONFIG', {**config.FACEBOOK_CONFIG, 'access_token': 'other-token',
+                                                    'base_url': 'http://127.0.0.1:9'})
+    with cassette.use(path, mode='replay') as replay:
+        run()
+    assert replay.stats['misses'] == 0
+    assert snapshot_tables() == expected
+
+
+def test_throttles_injected_into_replay_are_retried(recorded, fast_rate_limiter):
+    path, expected = recorded
+    with cassette.use(path, mode='replay', throttle_every=2) as replay:
+        run()
+    assert replay.stats['injected_throttles'] > 0 and replay.stats['misses'] == 0
+    # 注入的節流錯誤由限制器退避後重試，結果與錄製時相同
+    assert fast_rate_limiter.stats['throttled'] == replay.stats['injected_throttles']
+    assert snapshot_tables() == expected
+
+
+def test_async_engine_records_and_replays(tmp_path, fast_rate_limiter):
+    path = str(tmp_path / 'async.jsonl.gz')
+    with FakeGraphServer() as server:
+        for i in range(10):
+            server.state.add_post(make_post(PAGE_ID, i, '2025-12-01T08:00:00+0000'))
+        fb_config = server.config(PAGE_ID)
+        post_ids = sorted(server.state.posts)
+        with cassette.use(path, mode='record'):
+            expected = asyncio.run(AsyncGraphCollector(fb_config, concurrency=5).refresh_posts(post_ids, POST_METRICS))
+        assert server.state.count() == 4 * len(post_ids)
+
+    with cassette.use(path, mode='replay', latency=0.001, throttle_every=3) as replay:
+        replayed = asyncio.run(AsyncGraphCollector(fb_config, concurrency=5).refresh_posts(post_ids, POST_METRICS))
+    assert replayed == expected
+    assert replay.stats['replayed'] == 4 * len(post_ids)
+    assert fast_rate_limiter.stats['throttled'] == replay.stats['injected_throttles'] > 0
+
+
+def test_unrecorded_request_fails_and_dates_match_loosely(recorded):
+    path, _ = recorded
+    client = graph_client.GraphClient(backoff_factor=0, cassette=cassette.Cassette(path))
+    base = graph_base_url({'api_version': config.FACEBOOK_CONFIG['api_version']})
+    with pytest.raises(requests.ConnectionError):
+        client.get(f"{base}/unknown_object", params={'access_token': 't'})
+
+    # 日期參數不同（例如隔天重播）時忽略日期比對
+    response = client.get(f"{base}/{PAGE_ID}/insights", params={
+        'access_token': 't', 'since': '2001-01-01', 'until': '2001-02-01',
+        'metric': ','.join(config.PAGE_METRICS), 'period': 'day',
+    })
+    assert response.ok and response.json()['data']
@@ -0,0 +1,89 @@
+"""
+測試 post_insights_store（WITHOUT ROWID、整數 post_key / day）與相容 view post_insights_snapshots
+"""
+
+import io
+import sqlite3
+from contextlib import redirect_stdout
+
+import pytest
+
+from analytics import analytics_trends
+from tests.conftest import make_conn
+from utils import db_utils, migrations
+
+COLUMNS = ', '.join(['post_id', 'fetch_date'] + db_utils.SNAPSHOT_METRIC_COLUMNS + ['last_checked'])
+
+
+def rows(conn, sql):
+    return [tuple(row) for row in conn.execute(sql)]
+
+
+def snapshot_rows(conn, table='post_insights_snapshots'):
+    return [tuple(row) for row in conn.execute(f"SELECT {COLUMNS} FROM {table} ORDER BY post_id, fetch_date")]
+
+
+def write_history(conn):
+    for day in range(1, 10):
+        for post in range(3):
+            metrics = {'likes_count': min(day, 4) * (post + 1), 'post_impressions_unique': 100 + post}
+            db_utils.upsert_post_insights(conn, f'103640919705348_{post}', f'2026-03-0{day}', metrics,
+                                          changes_only=post != 0)
+
+
+def test_existing_snapshots_are_converted_unchanged():
+    conn = make_conn(target=7)
+    write_history(conn)
+    before = snapshot_rows(conn)
+    daily = rows(conn, "SELECT * FROM post_insights_daily ORDER BY post_id, fetch_date")
+    latest = rows(conn, "SELECT * FROM post_latest_metrics ORDER BY post_id")
+
+    with redirect_stdout(io.StringIO()):
+        assert migrations.migrate(conn) == [8]
+    assert snapshot_rows(conn) == before
+    assert any(row[-1] for row in before)          # 含 last_checked
+    assert rows(conn, "SELECT * FROM post_insights_daily ORDER BY post_id, fetch_date") == daily
+    assert rows(conn, "SELECT * FROM post_latest_metrics ORDER BY post_id") == latest
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'post_insights_store'").fetchone()[0]
+    assert 'WITHOUT ROWID' in sql
+    assert rows(conn, "SELECT DISTINCT typeof(post_key), typeof(day) FROM post_insights_store") == \
+        [('integer', 'integer')]
+
+
+def test_writes_through_view_keep_old_semantics():
+    conn = make_conn()
+    write_history(conn)
+    full = make_conn(target=7)
+    write_history(full)
+    assert snapshot_rows(conn) == snapshot_rows(full)
+    assert rows(conn, "SELECT COUNT(*) FROM post_keys") == [(3,)]
+
+    # 同一天重新寫入覆寫指標；修正腳本的 UPDATE / DELETE 也作用在底層表
+    db_utils.upsert_post_insights(conn, '103640919705348_0', '2026-03-09', {'likes_count': 99}, changes_only=False)
+    conn.execute("UPDATE post_insights_snapshots SET shares_count = 7 WHERE post_id = '103640919705348_0' "
+                 "AND fetch_date = '2026-03-01'")
+    conn.execute("DELETE FROM post_insights_snapshots WHERE post_id = '103640919705348_0' AND fetch_date = '2026-03-02'")
+    likes = dict(rows(conn, "SELECT fetch_date, likes_count FROM post_insights_snapshots "
+                            "WHERE post_id = '103640919705348_0'"))
+    assert likes['2026-03-09'] == 99 and '2026-03-02' not in likes
+    assert rows(conn, "SELECT shares_count FROM post_insights_snapshots WHERE fetch_date = '2026-03-01' "
+                      "AND post_id = '103640919705348_0'") == [(7,)]
+    assert rows(conn, "SELECT likes_count, best_likes_count FROM post_latest_metrics "
+                      "WHERE post_id = '103640919705348_0'") == [(99, 99)]
+
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO post_insights_snapshots (post_id, fetch_date) VALUES (NULL, '2026-03-01')")
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO post_insights_snapshots (post_id, fetch_date) VALUES ('p', 'not a date')")
+
+
+def test_per_post_queries_use_clustered_primary_key():
+    conn = make_conn()
+    write_history(conn)
+    for sql in ("SELECT * FROM post_insights_snapshots WHERE post_id = ?",
+                "SELECT * FROM post_keys k JOIN post_insights_store s ON s.post_key = k.post_key WHERE k.post_id = ?"):
+        plan = ' '.join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, ('103640919705348_1',)))
+        assert 'SEARCH s USING PRIMARY KEY (post_key=?)' in plan
+    curve = analytics_trends.get_post_lifecycle_curve(conn, '103640919705348_1')
+    assert [row['fetch_date'] for row in curve] == [f'2026-03-0{day}' for day in range(1, 10)]
+    assert [row['likes_count'] for row in curve] == [2, 4, 6, 8, 8, 8, 8, 8, 8]
@@ -0,0 +1,104 @@
+"""
+測試共用的 SQLite 連線設定（WAL、busy timeout、唯讀連線）
+"""
+
+import importlib
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from utils import db_utils
+
+READERS = ['analytics.analytics_reports', 'analytics.analytics_trends', 'analytics.query_analytics']
+MODULES = READERS + ['analytics.analytics_processor', 'analytics.ad_predictor', 'analytics.analytics_schema',
+                     'collectors.collector_ads']
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'engagement_data.db')
+    conn = db_utils.connect(path)
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.execute("INSERT INTO items (name) VALUES ('a')")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def pragma(conn, name):
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def test_connections_use_wal_and_tuned_pragmas(db_path):
+    conn = db_utils.connect(db_path)
+    assert pragma(conn, 'journal_mode') == 'wal'
+    assert pragma(conn, 'synchronous') == 1            # NORMAL
+    assert pragma(conn, 'temp_store') == 2             # MEMORY
+    assert pragma(conn, 'cache_size') == -64 * 1024
+    assert pragma(conn, 'busy_timeout') == db_utils.BUSY_TIMEOUT_SECONDS * 1000
+    assert isinstance(conn.execute("SELECT * FROM items").fetchone(), sqlite3.Row)
+    conn.close()
+
+
+@pytest.mark.parametrize('module_name', MODULES)
+def test_module_connections_use_factory(module_name, db_path, monkeypatch):
+    module = importlib.import_module(module_name)
+    monkeypatch.setattr(module, 'DB_PATH', db_path)
+    conn = module.get_connection()
+    assert pragma(conn, 'journal_mode') == 'wal'
+    assert pragma(conn, 'busy_timeout') == db_utils.BUSY_TIMEOUT_SECONDS * 1000
+    conn.close()
+
+
+@pytest.mark.parametrize('module_name', READERS)
+def test_report_readers_can_open_read_only(module_name, db_path, monkeypatch):
+    module = importlib.import_module(module_name)
+    monkeypatch.setattr(module, 'DB_PATH', db_path)
+    conn = module.get_connection(readonly=True)
+    assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 1
+    with pytest.raises(sqlite3.OperationalError, match='readonly'):
+        conn.execute("INSERT INTO items (name) VALUES ('b')")
+    conn.close()
+
+
+def test_readers_are_not_blocked_by_open_write_transaction(db_path):
+    writer = db_utils.connect(db_path)
+    writer.execute("BEGIN IMMEDIATE")
+    writer.execute("INSERT INTO items (name) VALUES ('b')")
+
+    reader = db_utils.connect(db_path, readonly=True)
+    start = time.perf_counter()
+    # 讀取到寫入前的資料，且不需等待寫入交易結束
+    assert reader.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 1
+    assert time.perf_counter() - start < 1
+
+    writer.commit()
+    assert reader.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 2
+    reader.close()
+    writer.close()
+
+
+def test_second_writer_waits_instead_of_failing(db_path):
+    locked, released = threading.Event(), threading.Event()
+
+    def hold_write_lock():
+        holder = db_utils.connect(db_path)
+        holder.execute("BEGIN IMMEDIATE")
+        locked.set()
+        time.sleep(0.3)
+        released.set()
+        holder.commit()
+        holder.close()
+
+    thread = threading.Thread(target=hold_write_lock)
+    thread.start()
+    locked.wait()
+    writer = db_utils.connect(db_path)
+    writer.execute("INSERT INTO items (name) VALUES ('c')")
+    assert released.is_set()
+    writer.commit()
+    thread.join()
+    assert writer.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 2
+    writer.close()
@@ -0,0 +1,214 @@
+"""
+測試 DuckDB 分析引擎（analytics.duckdb_engine）：合成資料上兩種引擎的報表結果相同
+"""
+
+import io
+import math
+import random
+import re
+import sqlite3
+from contextlib import redirect_stdout
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from analytics import analytics_reports, duckdb_engine, query_analytics
+from exporters import export_to_sheets
+from utils import db_utils
+from utils.setup_database import create_tables
+
+duckdb = pytest.importorskip('duckdb')
+
+TODAY = date.today()
+OFFSETS = ['+0000', '+0800', '-0530']
+FORMATS = ['event', 'petition', 'education', None]
+TOPICS = ['climate', 'energy', 'plastic', None]
+SLOTS = ['morning', 'noon', 'afternoon', 'evening', 'night']
+TIERS = ['viral', 'high', 'average', 'low']
+
+
+def build_database(path):
+    """約兩年的合成貼文：多種時區、缺分類、多次成效快照、廣告與 snapshot"""
+    rng = random.Random(7)
+    conn = sqlite3.connect(path)
+    with redirect_stdout(io.StringIO()):
+        create_tables(conn)
+    conn.execute("CREATE TABLE ads (ad_id TEXT PRIMARY KEY, post_id TEXT, created_time TEXT)")
+
+    with db_utils.BatchWriter(conn) as writer:
+        for i in range(400):
+            post_id = f'103640919705348_{i}'
+            created = datetime.combine(TODAY - timedelta(days=rng.randrange(720)), datetime.min.time()) + \
+                timedelta(minutes=rng.randrange(24 * 60))
+            db_utils.upsert_post(conn, {
+                'id': post_id, 'page_id': 'page', 'message': f'貼文 {i} ' + '#減塑 ' * (i % 4),
+                'created_time': created.strftime('%Y-%m-%dT%H:%M:%S') + rng.choice(OFFSETS),
+                'permalink_url': f'https://facebook.com/{post_id}',
+            })
+            if i % 13 == 0:
+                continue            # 未分類、無成效的貼文
+            conn.execute("""
+                INSERT INTO posts_classification (post_id, media_type, has_link, has_hashtag, hashtag_count,
+                    message_length, message_length_tier, topic_primary, topic_secondary, format_type,
+                    issue_topic, has_cta, hour_of_day, day_of_week, month, time_slot, is_weekend)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (post_id, rng.choice(['photo', 'video', 'link']), i % 2, i % 4 > 0, i % 4, 20 + i,
+                  rng.choice(['short', 'medium', 'long']), rng.choice(TOPICS), rng.choice(TOPICS),
+                  rng.choice(FORMATS), rng.choice(TOPICS), i % 3 == 0, created.hour, created.weekday(), created.month,
+                  rng.choice(SLOTS), created.weekday() >= 5))
+            for snapshot in range(1 + i % 2):
+                conn.execute("""
+                    INSERT INTO posts_performance (post_id, snapshot_date, engagement_rate, click_through_rate,
+                        share_rate, comment_rate, performance_tier, percentile_rank)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (post_id, (TODAY - timedelta(days=snapshot)).isoformat(), rng.random() * 10,
+                      rng.random() * 3, rng.random(), rng.random() / 3, rng.choice(TIERS), rng.random() * 100))
+            if i % 5 == 0:
+                conn.execute("INSERT INTO ads VALUES (?, ?, ?)", (f'ad_{i}', post_id, created.isoformat()))
+            for day in range(0, 30, 7):
+                fetch_date = created.date() + timedelta(days=day)
+                if fetch_date <= TODAY:
+                    writer.upsert_post_insights(post_id, fetch_date.isoformat(), {
+                        column: rng.randrange(50 * (day + 1)) for column in db_utils.SNAPSHOT_METRIC_COLUMNS})
+    conn.execute("""
+        INSERT INTO benchmarks (benchmark_type, benchmark_key, period, avg_engagement_rate, sample_size)
+        VALUES ('overall', 'all', '30d', 3.14159, 12), ('topic', 'energy', '30d', NULL, 0)
+    """)
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture(scope='module')
+def engines(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp('duckdb')
+    path = str(tmp / 'insights.db')
+    build_database(path)
+    duckdb_engine.export_parquet(str(tmp / 'parquet'), path)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    sources = {'parquet': duckdb_engine.connect(str(tmp / 'parquet'))}
+    try:
+        sources['attach'] = duckdb_engine.connect(path)
+    except (duckdb.Error, ImportError, StopIteration):
+        pass                        # 無法載入 sqlite 擴充套件（離線環境）時只比較 Parquet
+    yield conn, sources, str(tmp / 'parquet')
+    conn.close()
+    for source in sources.values():
+        source.close()
+
+
+def normalize(rows):
+    # 浮點聚合的加總順序不同，比較到 1e-9
+    def value(v):
+        return round(v, 9) if isinstance(v, float) and not math.isnan(v) else v
+
+    if isinstance(rows, str):
+        return re.sub(r'產出時間: .*', '', rows)       # 文字報表含產出的時間（秒）
+    if isinstance(rows, dict):
+        return {key: value(v) for key, v in rows.items()}
+    return [{key: value(v) for key, v in dict(row).items()} for row in rows]
+
+
+def since(days):
+    return str(TODAY - timedelta(days=days))
+
+
+# (名稱, 報表, ORDER BY 欄位)：ORDER BY 有同值時兩個引擎的順序可能不同，
+# 此時比較排序欄位的順序與整體的列（不計順序）
+REPORTS = [
+    ('best_posting_times', lambda c: analytics_reports.get_best_posting_times(c, 50), None),
+    ('hourly_performance', analytics_reports.get_hourly_performance, None),
+    ('by_topic', lambda c: analytics_reports.get_best_posting_times_by_topic(c, 100), None),
+    ('by_format', lambda c: analytics_reports.get_best_posting_times_by_format(c, 100), None),
+    ('quadrant', analytics_reports.get_quadrant_analysis, None),
+    ('format_type', analytics_reports.get_format_type_performance, None),
+    ('issue_topic', analytics_reports.get_issue_topic_performance, None),
+    ('format_issue', analytics_reports.get_format_issue_cross_performance, None),
+    ('topic', analytics_reports.get_topic_performance, None),
+    ('top_posts', lambda c: analytics_reports.get_top_posts(c, 90, 20), None),
+    ('viral_patterns', analytics_reports.get_viral_post_patterns, 'viral_count'),
+    ('weekly_trends', lambda c: analytics_reports.get_weekly_trends(c, 200), None),
+    ('distribution', analytics_reports.get_performance_distribution, None),
+    ('benchmarks', analytics_reports.get_benchmarks_summary, None),
+    ('weekly_report', analytics_reports.generate_weekly_report, None),
+    ('date_range_daily', lambda c: query_analytics.query_by_date_range(c, since(400), since(0), 'daily'), None),
+    ('date_range_weekly', lambda c: query_analytics.query_by_date_range(c, since(400), since(0), 'weekly'), None),
+    ('date_range_monthly', lambda c: query_analytics.query_by_date_range(c, since(400), since(0), 'monthly'), None),
+    ('topic_range', lambda c: query_analytics.query_topic_performance(c, since(365), since(0)), None),
+    ('topic_filter', lambda c: query_analytics.query_topic_performance(c, since(365), since(0), 'energy'), None),
+    ('time_slot', lambda c: query_analytics.query_time_slot_performance(c, since(365), since(0)),
+     'avg_engagement_rate'),
+    ('query_top', lambda c: query_analytics.query_top_posts(c, since(365), since(0), 5000), 'engagement_rate'),
+    ('comparison', lambda c: query_analytics.query_comparison(c, since(400), since(200), since(199), since(0)),
+     None),
+    ('custom_report', lambda c: query_analytics.generate_custom_report(c, since(365), since(0), 'monthly'), None),
+    ('yearly_posting', lambda c: c.cursor().execute(export_to_sheets.YEARLY_POSTING_ANALYSIS_SQL).fetchall(),
+     ('month', 'avg_er')),
+    ('organic_vs_paid', lambda c: c.cursor().execute(export_to_sheets.ORGANIC_VS_PAID_DATA_SQL).fetchall(),
+     'created_date'),
+]
+
+
+@pytest.mark.parametrize('report, order_by', [(r, o) for _, r, o in REPORTS], ids=[n for n, _, _ in REPORTS])
+def test_reports_match_sqlite(engines, report, order_by):
+    conn, sources, _ = engines
+    expected = normalize(report(conn))
+    assert expected
+    for source, duck in sources.items():
+        actual = normalize(report(duck))
+        if order_by is None:
+            assert actual == expected, source
+            continue
+        columns = [order_by] if isinstance(order_by, str) else list(order_by)
+        assert [[row[c] for c in columns] for row in actual] == [[row[c] for c in columns] for row in expected], source
+        if order_by != 'viral_count':       # LIMIT 15 截斷在同值的列之間，只比較排序欄位
+            assert sorted(actual, key=repr) == sorted(expected, key=repr), source
+
+
+def test_rows_behave_like_sqlite_rows(engines):
+    conn, sources, _ = engines
+    sql = ("SELECT post_id, created_time, is_deleted, date(substr(created_time, 1, 19)) AS d, "
+           "date(created_time) AS invalid, 7 / 2 AS quotient FROM posts WHERE post_id = ?")
+    expected = conn.execute(sql, ('103640919705348_1',)).fetchone()
+    for duck in sources.values():
+        row = duck.execute(sql, ('103640919705348_1',)).fetchone()
+        assert row[0] == row['post_id'] == '103640919705348_1'
+        assert list(dict(row)) == list(expected.keys())
+        assert tuple(row) == tuple(expected)
+        assert row['d'] == row['created_time'][:10] and row['invalid'] is None and row['quotient'] == 3
+
+
+def test_translate_rewrites_sqlite_date_functions():
+    sql = duckdb_engine.translate(
+        "SELECT date(MIN(t.x), '-' || (CAST(strftime('%w', x) AS INTEGER)) || ' days'), p.date, "
+        "DATE('now'), updated_date(x) FROM t")
+    assert sql == ("SELECT sqlite_date_2(CAST(MIN(t.x) AS VARCHAR), CAST('-' || (CAST("
+                   "sqlite_strftime_2(CAST('%w' AS VARCHAR), CAST(x AS VARCHAR)) AS INTEGER)) || ' days' AS VARCHAR)), "
+                   "p.date, sqlite_date_1(CAST('now' AS VARCHAR)), updated_date(x) FROM t")
+    assert duckdb_engine.translate("SELECT 'date(x)', 'it''s', date(x) FROM t") == \
+        "SELECT 'date(x)', 'it''s', sqlite_date_1(CAST(x AS VARCHAR)) FROM t"
+
+
+def test_engine_switch(engines, monkeypatch):
+    with pytest.raises(ValueError):
+        analytics_reports.get_connection(engine='postgres')
+    monkeypatch.setattr(duckdb_engine, 'DEFAULT_SOURCE', engines[2])
+    conn = query_analytics.get_connection(readonly=True, engine='duckdb')
+    assert isinstance(conn, duckdb_engine.DuckDBConnection)
+    assert conn.execute("SELECT COUNT(*) AS n FROM posts").fetchone()['n'] == 400
+    conn.close()
+
+
+def test_api_rejects_unavailable_engine(tmp_path, monkeypatch):
+    import main
+
+    monkeypatch.setattr(db_utils, 'DB_PATH', str(tmp_path / 'engagement_data.db'))
+    monkeypatch.setattr(main, '_schema_ready', False)
+    client = main.app.test_client()
+    response = client.get('/reports/weekly?engine=postgres')
+    assert response.status_code == 400 and 'postgres' in response.get_json()['message']
+    # 未安裝 duckdb 時回傳明確的 400，而非 500
+    monkeypatch.setattr(duckdb_engine, 'DUCKDB_AVAILABLE', False)
+    for path in ['/reports/weekly', '/query', '/reports/custom']:
+        response = client.get(f'{path}?engine=duckdb')
+        assert response.status_code == 400 and 'duckdb' in response.get_json()['message']
@@ -0,0 +1,76 @@
+"""
+測試 Graph API batch 傳輸層（使用本機 Fake Graph 伺服器，不連線 Facebook）
+"""
+
+import sqlite3
+
+import pytest
+
+from utils import db_utils, graph_batch
+from utils.config import POST_METRICS
+from utils.setup_database import create_tables
+
+PAGE_ID = '103640919705348'
+
+pytestmark = pytest.mark.graph(posts=30, created=lambda i: f'2025-12-{1 + i % 28:02d}T01:30:00+0000')
+
+
+def test_post_refresh_is_packed_into_batches(server):
+    config = server.config(PAGE_ID)
+    post_ids = sorted(server.state.posts)
+
+    refreshed = graph_batch.fetch_posts_refresh(config, post_ids, POST_METRICS)
+
+    # 30 則貼文 × 4 個子請求 = 120 個子請求 → 3 個 batch HTTP 請求
+    assert server.state.count() == 3
+    assert server.state.batch_sub_requests == 120
+
+    for post_id in post_ids:
+        post = server.state.posts[post_id]
+        insights, basic_stats = refreshed[post_id]
+        assert insights == post['insights']
+        assert basic_stats == {
+            'likes_count': post['reactions'],
+            'comments_count': post['comments'],
+            'shares_count': post['shares'],
+        }
+
+
+def test_null_sub_requests_are_retried(server):
+    config = server.config(PAGE_ID)
+    post_id = sorted(server.state.posts)[0]
+    server.state.null_batch_items.add(f'{post_id}/comments')
+
+    refreshed = graph_batch.fetch_posts_refresh(config, [post_id], POST_METRICS)
+
+    assert refreshed[post_id][1]['comments_count'] == server.state.posts[post_id]['comments']
+    assert server.state.count() == 2
+
+
+def test_failed_sub_requests_keep_defaults(server):
+    config = server.config(PAGE_ID)
+    post_id = sorted(server.state.posts)[0]
+    server.state.posts[post_id]['insights'] = None
+
+    insights, basic_stats = graph_batch.fetch_posts_refresh(config, [post_id], POST_METRICS)[post_id]
+
+    assert insights == {}
+    assert basic_stats['likes_count'] == server.state.posts[post_id]['reactions']
+
+
+def test_demultiplexed_results_upsert(server):
+    config = server.config(PAGE_ID)
+    post_ids = sorted(server.state.posts)[:5]
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    create_tables(conn)
+
+    for post_id, (insights, basic_stats) in graph_batch.fetch_posts_refresh(config, post_ids, POST_METRICS).items():
+        assert db_utils.upsert_post_insights(conn, post_id, '2025-12-31', insights, basic_stats)
+
+    row = conn.execute(
+        "SELECT likes_count, post_clicks FROM post_insights_snapshots WHERE post_id = ?", (post_ids[0],)
+    ).fetchone()
+    post = server.state.posts[post_ids[0]]
+    assert row['likes_count'] == post['reactions']
+    assert row['post_clicks'] == post['insights']['post_clicks']
@@ -0,0 +1,56 @@
+"""
+測試共用 Graph API 用戶端（使用本機 Fake Graph 伺服器）
+"""
+
+import pytest
+
+import main
+from utils import graph_client
+from utils.graph_batch import graph_base_url
+
+PAGE_ID = '103640919705348'
+
+pytestmark = pytest.mark.graph(posts=20)
+
+
+def test_connections_are_reused(server, fresh_graph_client):
+    config = server.config(PAGE_ID)
+    posts = main.fetch_page_posts(config, '2025-11-01', '2025-12-31', limit=100, expand_fields=False)
+
+    stats = fresh_graph_client.stats()
+    assert len(posts) == 20
+    assert stats['requests'] == 1 + 3 * 20
+    assert stats['connections'] == 1
+    assert stats['reuse_rate'] > 0.95
+    assert stats['retries'] == 0
+
+
+def test_server_errors_are_retried(server, fresh_graph_client):
+    server.state.fail_next = 2
+    config = server.config(PAGE_ID)
+
+    response = graph_client.graph_get(f"{graph_base_url(config)}/{PAGE_ID}",
+                                      params={'access_token': 'test-token', 'fields': 'id,name'})
+
+    assert response.status_code == 200
+    assert server.state.count() == 3
+    stats = fresh_graph_client.stats()
+    assert stats['retries'] == 2
+    assert stats['retry_rate'] == 2.0
+
+
+def test_post_is_not_retried(server, fresh_graph_client):
+    server.state.fail_next = 1
+    config = server.config(PAGE_ID)
+
+    response = graph_client.graph_post(f"{graph_base_url(config)}/", data={'batch': '[]'})
+
+    # batch 由 graph_batch 自行處理失敗重送，連線層不重試 POST
+    assert response.status_code == 503
+    assert server.state.count() == 1
+    assert fresh_graph_client.stats()['retries'] == 0
+
+
+def test_default_timeout_and_gzip(fresh_graph_client):
+    assert fresh_graph_client.timeout == graph_client.DEFAULT_TIMEOUT
+    assert 'gzip' in fresh_graph_client.session.headers['Accept-Encoding']
@@ -3,7 +3,7 @@
 Test which post-level insights metrics are available
 """
 
-import requests
+from utils.graph_client import graph_get
 from datetime import datetime, timedelta
 import json
 
@@ -45,7 +45,7 @@ def get_recent_post():
         'limit': 1
     }
 
-    response = requests.get(url, params=params)
+    response = graph_get(url, params=params)
     if response.status_code == 200:
         data = response.json()
         posts = data.get('data', [])
@@ -62,7 +62,7 @@ def test_insights_metric(post_id, metric):
     }
 
     try:
-        response = requests.get(url, params=params)
+        response = graph_get(url, params=params)
         data = response.json()
 
         if response.status_code == 200:
@@ -92,7 +92,7 @@ def test_batch_insights(post_id, metrics):
     }
 
     try:
-        response = requests.get(url, params=params)
+        response = graph_get(url, params=params)
         data = response.json()
 
         if response.status_code == 200:
@@ -207,7 +207,7 @@ def main():
         'limit': 20
     }
 
-    response = requests.get(url, params=params)
+    response = graph_get(url, params=params)
     if response.status_code == 200:
         posts = response.json().get('data', [])
 
@@ -0,0 +1,98 @@
+"""
+測試 post_latest_metrics（每則貼文的最新 snapshot 與各指標最大值）
+"""
+
+import io
+import random
+import sqlite3
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+
+from analytics import analytics_reports
+from tests.conftest import make_conn
+from utils import db_utils, migrations
+from utils.db_utils import SNAPSHOT_METRIC_COLUMNS
+
+
+def stored(conn):
+    return [tuple(row) for row in conn.execute("SELECT * FROM post_latest_metrics ORDER BY post_id")]
+
+
+def recomputed(conn):
+    """由完整 snapshot 歷史重新計算（遷移前各報表使用的子查詢）"""
+    return [tuple(row) for row in conn.execute(f"""
+        SELECT s.post_id, s.fetch_date, {', '.join(f's.{col}' for col in SNAPSHOT_METRIC_COLUMNS)},
+               {', '.join(f'b.best_{col}' for col in SNAPSHOT_METRIC_COLUMNS)}
+        FROM post_insights_snapshots s
+        JOIN (SELECT post_id, MAX(fetch_date) AS fetch_date,
+                     {', '.join(f'MAX({col}) AS best_{col}' for col in SNAPSHOT_METRIC_COLUMNS)}
+              FROM post_insights_snapshots GROUP BY post_id) b
+          ON s.post_id = b.post_id AND s.fetch_date = b.fetch_date
+        ORDER BY s.post_id
+    """)]
+
+
+def random_metrics(rng):
+    return {col: rng.randrange(0, 50) for col in SNAPSHOT_METRIC_COLUMNS}
+
+
+def test_table_tracks_latest_and_best_values_for_every_write_path():
+    rng = random.Random(7)
+    conn = make_conn()
+    days = [(date(2026, 3, 1) + timedelta(days=i)).isoformat() for i in range(10)]
+    for _ in range(300):
+        post_id, fetch_date = f'p{rng.randrange(8)}', rng.choice(days)   # 含補抓較舊日期與同日覆寫
+        db_utils.upsert_post_insights(conn, post_id, fetch_date, random_metrics(rng), changes_only=rng.random() < 0.5)
+    with db_utils.BatchWriter(conn, flush_every=20) as writer:
+        for _ in range(100):
+            writer.upsert_post_insights(f'p{rng.randrange(12)}', rng.choice(days), random_metrics(rng))
+    assert stored(conn) == recomputed(conn)
+    assert len(stored(conn)) == 12
+
+    # 修正腳本直接改寫 / 刪除 snapshot
+    conn.execute("UPDATE post_insights_snapshots SET likes_count = 0 WHERE post_id = 'p1'")
+    conn.execute("DELETE FROM post_insights_snapshots WHERE post_id = 'p2' AND fetch_date = "
+                 "(SELECT MAX(fetch_date) FROM post_insights_snapshots WHERE post_id = 'p2')")
+    conn.execute("DELETE FROM post_insights_snapshots WHERE post_id = 'p3'")
+    assert stored(conn) == recomputed(conn)
+    assert 'p3' not in [row[0] for row in stored(conn)]
+
+
+def test_failed_write_leaves_table_unchanged():
+    conn = make_conn()
+    db_utils.upsert_post_insights(conn, 'p1', '2026-03-01', {'likes_count': 5}, changes_only=False)
+    before = stored(conn)
+    conn.execute("INSERT INTO post_insights_snapshots (post_id, fetch_date, likes_count) VALUES ('p1', '2026-03-02', 9)")
+    conn.rollback()
+    assert stored(conn) == before
+
+
+def test_migration_backfills_existing_snapshots():
+    conn = sqlite3.connect(':memory:')
+    with redirect_stdout(io.StringIO()):
+        migrations.migrate(conn, target=6)
+        for day, likes in (('2026-03-01', 40), ('2026-03-03', 30), ('2026-03-02', 35)):
+            db_utils.upsert_post_insights(conn, 'p1', day, {'likes_count': likes}, changes_only=False)
+        assert migrations.migrate(conn, target=7) == [7]
+    row = conn.execute("SELECT fetch_date, likes_count, best_likes_count FROM post_latest_metrics").fetchone()
+    assert row == ('2026-03-03', 30, 40)
+
+
+def test_reports_read_latest_values():
+    conn = make_conn()
+    for i in range(3):
+        post_id = f'p{i}'
+        conn.execute("INSERT INTO posts (post_id, page_id, created_time) VALUES (?, 'page', ?)",
+                     (post_id, f'2026-03-0{i + 1}T08:00:00+0000'))
+        conn.execute("INSERT INTO posts_classification (post_id, issue_topic, format_type) VALUES (?, 'energy', 'event')",
+                     (post_id,))
+        conn.execute("INSERT INTO posts_performance (post_id, snapshot_date, engagement_rate) VALUES (?, '2026-03-05', ?)",
+                     (post_id, i + 1.0))
+        db_utils.upsert_post_insights(conn, post_id, '2026-03-04', {'post_impressions_unique': 500}, changes_only=False)
+        db_utils.upsert_post_insights(conn, post_id, '2026-03-05', {'post_impressions_unique': 100 * (i + 1)},
+                                      changes_only=False)
+    conn.commit()
+    quadrant = analytics_reports.get_quadrant_analysis(conn)
+    assert sorted(row['reach'] for row in quadrant) == [100, 200, 300]
+    trends = analytics_reports.get_weekly_trends(conn)
+    assert sum(row['total_reach'] for row in trends) == 3 * 500   # 各指標最大值
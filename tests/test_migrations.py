@@ -0,0 +1,115 @@
+"""
+測試 schema 版本與遷移
+"""
+
+import io
+import multiprocessing
+import sqlite3
+from contextlib import redirect_stdout
+
+import pytest
+
+from utils import db_utils, migrations
+
+
+def tables(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+
+
+def migrate_file(path):
+    """子行程：同時對同一個資料庫執行遷移"""
+    conn = db_utils.connect(path)
+    with redirect_stdout(io.StringIO()):
+        migrations.migrate(conn)
+    conn.close()
+
+
+def test_fresh_database_applies_all_migrations_once():
+    conn = sqlite3.connect(':memory:')
+    with redirect_stdout(io.StringIO()) as out:
+        assert migrations.migrate(conn) == [version for version, _, _ in migrations.MIGRATIONS]
+    assert '更新至版本' in out.getvalue()
+    assert migrations.current_version(conn) == migrations.LATEST_VERSION
+    assert {'posts', 'post_insights_snapshots', 'pipeline_runs', 'post_insights_daily', 'schema_version'} <= tables(conn)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(posts_classification)")}
+    assert {'ad_potential_score', 'ad_recommendation'} <= columns
+
+    # 已是最新版本：不執行任何 DDL
+    statements = []
+    conn.set_trace_callback(statements.append)
+    assert migrations.migrate(conn) == []
+    assert statements == ['SELECT MAX(version) FROM schema_version']
+
+
+def test_existing_database_only_runs_pending_migrations(monkeypatch):
+    conn = sqlite3.connect(':memory:')
+    with redirect_stdout(io.StringIO()):
+        migrations.migrate(conn, target=3)
+        # 舊版在執行期間自行建立過其中一個欄位
+        conn.execute("ALTER TABLE posts_classification ADD COLUMN ad_potential_score REAL")
+
+        pending = [version for version, _, _ in migrations.MIGRATIONS if version > 3]
+        calls = []
+        monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS + [
+            (99, 'record_call', lambda c: calls.append(99)),
+        ])
+        assert migrations.migrate(conn, target=99) == pending + [99]
+        assert migrations.migrate(conn, target=99) == []
+    assert calls == [99]
+    assert [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")] == \
+        [1, 2, 3] + pending + [99]
+
+
+def test_failed_migration_rolls_back(monkeypatch):
+    conn = sqlite3.connect(':memory:')
+    with redirect_stdout(io.StringIO()):
+        migrations.migrate(conn)
+
+    def broken(c):
+        c.execute("CREATE TABLE half_done (id INTEGER)")
+        raise RuntimeError('遷移失敗')
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS + [(99, 'broken', broken)])
+    with pytest.raises(RuntimeError):
+        migrations.migrate(conn, target=99)
+    assert migrations.current_version(conn) == migrations.LATEST_VERSION
+    assert 'half_done' not in tables(conn)
+
+
+def test_concurrent_startups_apply_each_migration_once(tmp_path):
+    path = str(tmp_path / 'shared.db')
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=migrate_file, args=(path,)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+    assert all(process.exitcode == 0 for process in processes)
+
+    conn = sqlite3.connect(path)
+    versions = [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+    assert versions == [version for version, _, _ in migrations.MIGRATIONS]
+    conn.close()
+
+
+def test_api_migrates_old_database_before_read_only_reports(tmp_path, monkeypatch):
+    import main
+    from analytics import analytics_reports, query_analytics
+
+    path = str(tmp_path / 'engagement_data.db')
+    conn = sqlite3.connect(path)
+    with redirect_stdout(io.StringIO()):
+        migrations.migrate(conn, target=1)
+    conn.close()
+    for module in (db_utils, analytics_reports, query_analytics):
+        monkeypatch.setattr(module, 'DB_PATH', path)
+    monkeypatch.setattr(main, '_schema_ready', False)
+
+    client = main.app.test_client()
+    with redirect_stdout(io.StringIO()):
+        for url in ['/query?type=trends', '/reports/weekly', '/reports/custom']:
+            response = client.get(url)
+            assert response.status_code == 200, response.get_json()['message']
+    conn = sqlite3.connect(path)
+    assert migrations.current_version(conn) == migrations.LATEST_VERSION
+    conn.close()
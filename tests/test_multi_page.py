@@ -0,0 +1,148 @@
+"""
+測試多專頁並行收集與每個 token 的限制器（使用本機 Fake Graph 伺服器託管多個專頁）
+"""
+
+import io
+import sqlite3
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+import pytest
+
+import run_pipeline
+from collectors import multi_page, page_registry
+from tests.fake_graph_server import make_post
+from utils import config, db_utils, rate_limiter
+from utils.graph_batch import graph_base_url
+from utils.graph_client import graph_get
+
+PAGE_IDS = [f'10364091970{i:04d}' for i in range(6)]
+POSTS_PER_PAGE = 12
+FAST_TOKEN_LIMITS = {'max_rate': 5000, 'min_rate': 50, 'burst': 500, 'base_backoff': 0.01}
+
+pytestmark = pytest.mark.graph(page=False)
+
+
+def token_of(page_id: str) -> str:
+    return f'token-{page_id}'
+
+
+@pytest.fixture
+def server(server, monkeypatch):
+    start = datetime.now() - timedelta(days=40)
+    for page_id in PAGE_IDS:
+        server.state.add_page(page_id, f'專頁 {page_id[-4:]}')
+        server.state.add_page_insights(page_id, '2024-01-01')
+        server.state.page_tokens[page_id] = token_of(page_id)
+        for i in range(POSTS_PER_PAGE):
+            created = (start + timedelta(days=3 * i)).strftime('%Y-%m-%dT%H:%M:%S+0000')
+            server.state.add_post(make_post(page_id, i, created))
+    monkeypatch.setattr(config, 'FACEBOOK_CONFIG', server.config(PAGE_IDS[0], access_token='unused'))
+
+    with redirect_stdout(io.StringIO()):
+        conn = db_utils.get_db_connection()
+        for page_id in PAGE_IDS:
+            page_registry.register_page(conn, page_id, token_of(page_id))
+        conn.close()
+    return server
+
+
+def test_page_configs_use_registered_tokens(server, monkeypatch):
+    monkeypatch.setenv('PAGE_TOKEN_X', 'from-env')
+    conn = db_utils.get_db_connection()
+    page_registry.register_page(conn, 'env_page', 'env:PAGE_TOKEN_X')
+    page_registry.set_active(conn, PAGE_IDS[5], False)
+    configs = page_registry.page_configs(conn)
+    conn.close()
+
+    tokens = {c['page_id']: c['access_token'] for c in configs}
+    assert tokens == {**{p: token_of(p) for p in PAGE_IDS[:5]}, 'env_page': 'from-env'}
+    # 其餘設定（api_version、base_url）沿用 FACEBOOK_CONFIG
+    assert all(c['base_url'] == server.url for c in configs)
+
+
+def test_page_configs_fall_back_to_single_page(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, 'DB_PATH', str(tmp_path / 'empty.db'))
+    with redirect_stdout(io.StringIO()):
+        conn = db_utils.get_db_connection()
+    assert page_registry.page_configs(conn) == [config.FACEBOOK_CONFIG]
+    conn.close()
+
+
+def test_spread_by_token_interleaves_shared_tokens():
+    configs = [{'page_id': p, 'access_token': t} for p, t in
+               [('a1', 'A'), ('a2', 'A'), ('a3', 'A'), ('b1', 'B'), ('c1', 'C')]]
+    assert [c['page_id'] for c in multi_page.spread_by_token(configs)] == ['a1', 'b1', 'c1', 'a2', 'a3']
+
+
+def test_collects_every_page_with_its_own_token(server):
+    server.state.latency = 0.01
+    with redirect_stdout(io.StringIO()):
+        assert run_pipeline.collect_multi_page_data(workers=3, token_limits=FAST_TOKEN_LIMITS)
+
+    conn = sqlite3.connect(db_utils.DB_PATH)
+    snapshots = dict(conn.execute("""
+        SELECT p.page_id, COUNT(*) FROM post_insights_snapshots s
+        JOIN posts p ON p.post_id = s.post_id
+        WHERE s.post_impressions_unique IS NOT NULL
+        GROUP BY p.page_id
+    """).fetchall())
+    page_days = dict(conn.execute("SELECT page_id, COUNT(*) FROM page_daily_metrics GROUP BY page_id").fetchall())
+    conn.close()
+
+    # 每個專頁的貼文都以自己的 token 收集成功（token 錯誤時 Fake 伺服器回傳 code 190）
+    assert snapshots == {page_id: POSTS_PER_PAGE for page_id in PAGE_IDS}
+    assert set(page_days) == set(PAGE_IDS)
+    assert server.state.max_in_flight > 1
+    # 結束後恢復單一專頁模式
+    assert rate_limiter.get_token_limiter(token_of(PAGE_IDS[0])) is None
+
+
+def test_page_throttle_only_blocks_its_token(server, fast_rate_limiter):
+    rate_limiter.enable_token_limits(**FAST_TOKEN_LIMITS)
+    try:
+        server.state.token_throttle_next[token_of(PAGE_IDS[0])] = 1
+        base = graph_base_url(server.config(PAGE_IDS[0]))
+        for page_id in PAGE_IDS[:2]:
+            response = graph_get(f"{base}/{page_id}", params={'access_token': token_of(page_id), 'fields': 'id'})
+            assert response.status_code == 200
+
+        throttled = rate_limiter.get_token_limiter(token_of(PAGE_IDS[0]))
+        other = rate_limiter.get_token_limiter(token_of(PAGE_IDS[1]))
+        assert throttled.stats['throttled'] == 1 and throttled.stats['requests'] == 2
+        assert other.stats['throttled'] == 0 and other.blocked_until == 0
+        # 專頁層級的節流 (code 32) 不影響 App 層級的共用限制器
+        assert fast_rate_limiter.stats['throttled'] == 0
+    finally:
+        rate_limiter.disable_token_limits()
+    assert fast_rate_limiter.throttle_codes == rate_limiter.THROTTLE_ERROR_CODES
+
+
+def test_paging_url_token_uses_its_limiter(server, fast_rate_limiter):
+    # 分頁的 next URL 已含 access_token，params 為空
+    rate_limiter.enable_token_limits(**FAST_TOKEN_LIMITS)
+    try:
+        base = graph_base_url(server.config(PAGE_IDS[1]))
+        response = graph_get(f"{base}/{PAGE_IDS[1]}?fields=id&access_token={token_of(PAGE_IDS[1])}")
+        assert response.status_code == 200
+        assert rate_limiter.get_token_limiter(token_of(PAGE_IDS[1])).stats['requests'] == 1
+    finally:
+        rate_limiter.disable_token_limits()
+
+
+def test_queue_worker_uses_task_page_token(server, fast_rate_limiter):
+    from collectors import work_queue
+
+    with redirect_stdout(io.StringIO()):
+        conn = work_queue.connect()
+        for page_id in PAGE_IDS[1:3]:
+            post_ids = [post_id for post_id in server.state.posts if post_id.startswith(page_id)]
+            work_queue.enqueue_tasks(conn, post_ids, '2025-01-15', page_id)
+        # 基本設定的 token 無法讀取其他專頁，須改用工作所屬專頁登記的 token
+        result = work_queue.run_worker(config.FACEBOOK_CONFIG, batch_size=10)
+
+    assert result['done'] == 2 * POSTS_PER_PAGE and result['failed'] == 0
+    assert work_queue.queue_stats(conn) == {'done': 2 * POSTS_PER_PAGE}
+    clicks = conn.execute("SELECT COUNT(*) FROM post_insights_snapshots WHERE post_clicks > 0").fetchone()[0]
+    assert clicks == 2 * POSTS_PER_PAGE
+    conn.close()
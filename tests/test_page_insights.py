@@ -0,0 +1,119 @@
+"""
+測試頁面 insights 分段並行收集（使用本機 Fake Graph 伺服器）
+"""
+
+import io
+import math
+import sqlite3
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+import pytest
+
+from collectors import collector_page
+from tests.fake_graph_server import page_metric_value
+from utils import config, db_utils
+
+PAGE_ID = '103640919705348'
+TODAY = datetime.now().strftime('%Y-%m-%d')
+
+
+def days_ago(days: int) -> str:
+    return (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+
+
+@pytest.fixture
+def server(server, monkeypatch):
+    server.state.add_page(PAGE_ID, '測試專頁', fan_count=5000, followers_count=5200)
+    server.state.add_page_insights(PAGE_ID, '2020-01-01')
+    monkeypatch.setattr(config, 'FACEBOOK_CONFIG', server.config(PAGE_ID))
+    return server
+
+
+def collect(**kwargs):
+    with redirect_stdout(io.StringIO()):
+        collector_page.process_and_save_page_data(**kwargs)
+
+
+def stored_rows():
+    conn = sqlite3.connect(db_utils.DB_PATH)
+    rows = conn.execute("""
+        SELECT date, page_impressions_unique, reactions_like, fan_count
+        FROM page_daily_metrics ORDER BY date
+    """).fetchall()
+    conn.close()
+    return rows
+
+
+def test_split_windows_covers_range_without_gaps():
+    windows = collector_page.split_windows('2022-01-01', '2024-07-01')
+    assert windows[0][0] == '2022-01-01' and windows[-1][1] == '2024-07-01'
+    for (_, stop), (start, _) in zip(windows, windows[1:]):
+        assert stop == start
+    for start, stop in windows:
+        days = (datetime.strptime(stop, '%Y-%m-%d') - datetime.strptime(start, '%Y-%m-%d')).days
+        assert 0 < days <= collector_page.MAX_WINDOW_DAYS
+    assert collector_page.split_windows(TODAY, TODAY) == []
+
+
+def test_backfill_fetches_years_in_concurrent_windows(server):
+    server.state.latency = 0.05
+    since = days_ago(3 * 365)
+    collect(backfill_since=since)
+
+    expected_days = 3 * 365
+    assert server.state.count(f'{PAGE_ID}/insights') == math.ceil(expected_days / collector_page.MAX_WINDOW_DAYS)
+    assert server.state.max_in_flight > 1
+
+    rows = stored_rows()
+    assert len(rows) == expected_days
+    assert rows[0][0] == since and rows[-1][0] == days_ago(1)
+    assert rows[0][1] == page_metric_value('page_impressions_unique', since)
+    assert rows[0][2] == page_metric_value('page_actions_post_reactions_total', since)['like']
+    # 只有最近的資料帶入目前的粉絲數，回補的舊日期不寫入
+    assert rows[-1][3] == 5000
+    assert rows[0][3] is None
+
+
+def test_incremental_run_fetches_only_new_days(server):
+    collect(days_back=90)
+    assert len(stored_rows()) == 90
+    assert server.state.count(f'{PAGE_ID}/insights') == 1
+
+    # 模擬兩天後執行：刪除最後兩天，並標記較舊與回溯期內的資料
+    conn = sqlite3.connect(db_utils.DB_PATH)
+    conn.execute("DELETE FROM page_daily_metrics WHERE date >= ?", (days_ago(2),))
+    conn.execute("UPDATE page_daily_metrics SET page_impressions_unique = -1 WHERE date IN (?, ?)",
+                 (days_ago(50), days_ago(3)))
+    conn.commit()
+    conn.close()
+
+    server.state.reset_counters()
+    collect(days_back=90)
+    assert server.state.count(f'{PAGE_ID}/insights') == 1
+    rows = {row[0]: row[1] for row in stored_rows()}
+    assert len(rows) == 90
+    # 只重抓回溯期之後的天數
+    assert rows[days_ago(50)] == -1
+    assert rows[days_ago(3)] == page_metric_value('page_impressions_unique', days_ago(3))
+
+
+def test_incremental_window_starts_at_lookback(server):
+    collect(days_back=30)
+    conn = sqlite3.connect(db_utils.DB_PATH)
+    since = collector_page.incremental_since(conn, PAGE_ID, days_back=30)
+    conn.close()
+    assert since == days_ago(1 + collector_page.RESTATEMENT_LOOKBACK_DAYS)
+
+
+def test_backfill_does_not_overwrite_existing_fan_count(server):
+    collect(days_back=30)
+    before = {row[0]: row[3] for row in stored_rows()}
+    server.state.pages[PAGE_ID]['fan_count'] = 9999
+    collect(backfill_since=days_ago(200))
+
+    after = {row[0]: row[3] for row in stored_rows()}
+    assert len(after) == 200
+    # 回溯區間之前的既有資料保留原本的粉絲數
+    assert after[days_ago(30)] == before[days_ago(30)] == 5000
+    assert after[days_ago(1)] == 9999
@@ -0,0 +1,107 @@
+"""
+測試貼文增量探索（水位與對帳，使用本機 Fake Graph 伺服器）
+"""
+
+import io
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+import pytest
+
+import run_pipeline
+from collectors import call_planner, post_discovery
+from tests.fake_graph_server import make_post
+from utils import db_utils
+
+PAGE_ID = '103640919705348'
+START = datetime(2024, 1, 2, 8, 0)
+
+# 兩年多的歷史：每 3 天一則貼文
+pytestmark = pytest.mark.graph(
+    posts=300, created=lambda i: (START + timedelta(days=3 * i)).strftime('%Y-%m-%dT%H:%M:%S+0000'))
+
+
+@pytest.fixture
+def server(server, monkeypatch):
+    monkeypatch.setattr(run_pipeline.config, 'FACEBOOK_CONFIG', server.config(PAGE_ID))
+    return server
+
+
+def collect(**kwargs):
+    with redirect_stdout(io.StringIO()):
+        assert run_pipeline.collect_post_data(until_date='2026-06-30', **kwargs)
+
+
+def test_first_run_lists_full_history_then_uses_watermark(server):
+    collect()
+    first_run = server.state.count('/posts')
+    conn = db_utils.get_db_connection()
+    watermark = db_utils.get_post_watermark(conn, PAGE_ID)
+
+    assert first_run == 3
+    assert conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0] == 300
+    assert watermark['max_created_time'] == max(p['created_time'] for p in server.state.posts.values())
+    assert watermark['last_reconciled_at'] is not None
+
+    # 新增一則貼文：第二次只列出水位減重疊天數之後的貼文
+    server.state.add_post(make_post(PAGE_ID, 500, '2026-06-20T08:00:00+0000'))
+    server.state.reset_counters()
+    collect()
+
+    assert server.state.count('/posts') == 1
+    assert conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0] == 301
+    assert post_discovery.incremental_since(conn, PAGE_ID) == '2026-06-17'
+
+
+def test_reconciliation_marks_deleted_posts(server):
+    collect()
+    deleted_id = sorted(server.state.posts)[10]
+    del server.state.posts[deleted_id]
+    edited_id = sorted(server.state.posts)[20]
+    server.state.posts[edited_id]['message'] = '已編輯'
+
+    # 一般執行不會發現舊貼文的刪除
+    collect(reconcile=False)
+    conn = db_utils.get_db_connection()
+    assert conn.execute("SELECT is_deleted FROM posts WHERE post_id = ?", (deleted_id,)).fetchone()[0] == 0
+
+    server.state.reset_counters()
+    collect(reconcile=True)
+
+    row = conn.execute("SELECT is_deleted FROM posts WHERE post_id = ?", (deleted_id,)).fetchone()
+    assert row[0] == 1
+    assert conn.execute("SELECT message FROM posts WHERE post_id = ?", (edited_id,)).fetchone()[0] == '已編輯'
+    # 對帳只做輕量列表：1 個水位列表 + 3 頁完整歷史
+    assert server.state.count('/posts') == 4
+    assert server.state.count('/insights') == 0
+
+
+def test_reconcile_due_follows_interval(server):
+    conn = db_utils.get_db_connection()
+    assert post_discovery.reconcile_due(conn, PAGE_ID)
+
+    db_utils.update_post_watermark(conn, PAGE_ID, reconciled_at='2026-06-01 00:00:00')
+    assert not post_discovery.reconcile_due(conn, PAGE_ID, now=datetime(2026, 6, 5))
+    assert post_discovery.reconcile_due(conn, PAGE_ID, now=datetime(2026, 6, 8))
+
+
+def test_empty_listing_never_marks_deletions(server):
+    collect()
+    conn = db_utils.get_db_connection()
+    server.state.posts.clear()
+
+    assert post_discovery.reconcile_posts(conn, server.config(PAGE_ID), '2026-06-30') is None
+    assert conn.execute("SELECT COUNT(*) FROM posts WHERE is_deleted = 1").fetchone()[0] == 0
+
+
+def test_failure_after_listing_keeps_buffered_snapshots(server, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('planner failed')
+
+    monkeypatch.setattr(call_planner, 'score_posts', fail)
+    with redirect_stdout(io.StringIO()):
+        assert not run_pipeline.collect_post_data(until_date='2026-06-30')
+    # 列表請求已取回的 insights 仍寫入資料庫
+    conn = db_utils.get_db_connection()
+    assert conn.execute("SELECT COUNT(DISTINCT post_id) FROM post_insights_snapshots").fetchone()[0] == 300
+    conn.close()
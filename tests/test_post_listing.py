@@ -0,0 +1,74 @@
+"""
+測試欄位展開模式的貼文列表（使用本機 Fake Graph 伺服器）
+"""
+
+import pytest
+
+import main
+
+PAGE_ID = '103640919705348'
+
+pytestmark = pytest.mark.graph(posts=120,
+                                created=lambda i: f'2025-{1 + i % 12:02d}-{1 + i % 28:02d}T0{i % 10}:00:00+0000')
+
+
+@pytest.fixture
+def server(server):
+    # 分享數為 0 的貼文，Graph API 不會回傳 shares 欄位
+    server.state.posts[f'{PAGE_ID}_1000']['shares'] = 0
+    return server
+
+
+def test_build_post_listing_fields():
+    fields = main.build_post_listing_fields(['post_clicks', 'post_impressions_unique'])
+    assert 'reactions.summary(total_count).limit(0)' in fields
+    assert 'comments.summary(total_count).limit(0)' in fields
+    assert fields.endswith('insights.metric(post_clicks,post_impressions_unique)')
+
+
+def test_expanded_listing_costs_one_request_per_page(server):
+    posts = main.fetch_page_posts(server.config(PAGE_ID), '2025-01-01', '2025-12-31', limit=50,
+                                  expand_fields=True)
+
+    assert len(posts) == 120
+    assert server.state.count() == 3  # ceil(120 / 50)
+
+    for post in posts:
+        expected = server.state.posts[post['id']]
+        insights, basic_stats = main.extract_post_stats(post)
+        assert insights == expected['insights']
+        assert basic_stats == {
+            'likes_count': expected['reactions'],
+            'comments_count': expected['comments'],
+            'shares_count': expected['shares'],
+        }
+
+
+def test_expanded_listing_matches_legacy_mode(server):
+    config = server.config(PAGE_ID)
+    expanded = main.fetch_page_posts(config, '2025-01-01', '2025-12-31', limit=50, expand_fields=True)
+    server.state.reset_counters()
+    legacy = main.fetch_page_posts(config, '2025-01-01', '2025-12-31', limit=50, expand_fields=False)
+
+    assert server.state.count() == 3 + 3 * 120
+    legacy_counts = {p['id']: main.extract_post_stats(p)[1] for p in legacy}
+    assert {p['id']: main.extract_post_stats(p)[1] for p in expanded} == legacy_counts
+
+
+def test_rejected_page_falls_back_without_losing_other_pages(server):
+    # 第二頁的展開請求被拒：只有該頁改用逐筆模式，第三頁仍使用欄位展開
+    server.state.reject_expansion_offsets = {50}
+    posts = main.fetch_page_posts(server.config(PAGE_ID), '2025-01-01', '2025-12-31', limit=50,
+                                  expand_fields=True)
+
+    assert len(posts) == 120
+    assert server.state.count('/posts') == 4
+    assert sum('insights' in post for post in posts) == 70
+    for post in posts:
+        expected = server.state.posts[post['id']]
+        assert main.extract_post_stats(post)[1]['likes_count'] == expected['reactions']
+
+
+def test_listing_mode_defaults_to_per_post_requests(server):
+    posts = main.fetch_page_posts(server.config(PAGE_ID), '2025-01-01', '2025-12-31', limit=50)
+    assert len(posts) == 120 and not any('insights' in post for post in posts)
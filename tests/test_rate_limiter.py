@@ -0,0 +1,117 @@
+"""
+測試 Graph API 自適應速率限制器（使用本機 Fake Graph 伺服器）
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from collectors.async_collector import AsyncGraphCollector
+from utils import rate_limiter
+from utils.config import POST_METRICS
+from utils.graph_batch import graph_base_url
+
+PAGE_ID = '103640919705348'
+
+pytestmark = pytest.mark.graph(posts=5)
+
+
+def test_parse_usage_headers_takes_highest_usage():
+    headers = {
+        'X-App-Usage': json.dumps({'call_count': 12, 'total_time': 30, 'total_cputime': 8}),
+        'X-Page-Usage': json.dumps({'call_count': 55, 'total_time': 10, 'total_cputime': 4}),
+        'X-Business-Use-Case-Usage': json.dumps({
+            '1234': [{'type': 'pages', 'call_count': 70, 'total_time': 5, 'estimated_time_to_regain_access': 2}]
+        }),
+    }
+    usage = rate_limiter.parse_usage_headers(headers)
+    assert usage == {'usage': 70.0, 'regain_seconds': 120.0}
+    assert rate_limiter.parse_usage_headers({}) == {'usage': 0.0, 'regain_seconds': 0.0}
+    assert rate_limiter.parse_usage_headers({'X-App-Usage': 'not json'})['usage'] == 0.0
+
+
+def test_rate_follows_usage():
+    limiter = rate_limiter.GraphRateLimiter(max_rate=10, min_rate=1)
+    limiter.observe(200, {'X-App-Usage': json.dumps({'call_count': 75})})
+    assert limiter.rate == pytest.approx(5.5)
+    limiter.observe(200, {'X-App-Usage': json.dumps({'call_count': 100})})
+    assert limiter.rate == 1
+    limiter.observe(200, {'X-App-Usage': json.dumps({'call_count': 20})})
+    assert limiter.rate == 10
+
+
+def test_batch_items_without_headers_keep_learned_usage():
+    limiter = rate_limiter.GraphRateLimiter(max_rate=10, min_rate=1)
+    limiter.observe(200, {'X-App-Usage': json.dumps({'call_count': 95})})
+    rate = limiter.rate
+    assert not limiter.observe(200, None, {'data': []})
+    assert (limiter.usage, limiter.rate) == (95.0, rate)
+    assert limiter.observe(200, None, {'error': {'code': 613}})
+    assert limiter.rate == limiter.min_rate and limiter.usage == 95.0
+
+
+@pytest.mark.parametrize('code', sorted(rate_limiter.THROTTLE_ERROR_CODES))
+def test_throttle_codes_back_off_with_jitter(code):
+    limiter = rate_limiter.GraphRateLimiter(base_backoff=1.0)
+    body = {'error': {'code': code, 'message': 'limit reached'}}
+
+    start = time.monotonic()
+    assert limiter.observe(403, None, body)
+    first = limiter.blocked_until - start
+    assert 1.0 <= first <= 1.5 + 0.1
+    assert limiter.observe(403, None, body)
+    assert 2.0 <= limiter.blocked_until - start <= 3.0 + 0.1
+    assert limiter.rate == limiter.min_rate
+
+    # 成功回應後重置連續節流計數
+    assert not limiter.observe(200, None, {'data': []})
+    assert limiter.consecutive_throttles == 0
+    assert not limiter.observe(400, None, {'error': {'code': 100}})
+
+
+def test_token_bucket_paces_requests():
+    limiter = rate_limiter.GraphRateLimiter(max_rate=50, burst=1)
+    start = time.monotonic()
+    for _ in range(11):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.18
+
+
+def test_throttled_get_retries_after_throttle(server, fast_rate_limiter):
+    server.state.throttle_next = 2
+    config = server.config(PAGE_ID)
+
+    response = rate_limiter.throttled_get(f"{graph_base_url(config)}/{PAGE_ID}",
+                                          params={'access_token': 'test-token', 'fields': 'id,name'})
+
+    assert response.status_code == 200
+    assert response.json()['name'] == '測試專頁'
+    assert server.state.count() == 3
+    assert fast_rate_limiter.stats['throttled'] == 2
+
+
+def test_usage_headers_slow_down_shared_limiter(server, fast_rate_limiter):
+    server.state.usage_headers = {'X-App-Usage': {'call_count': 90, 'total_time': 10, 'total_cputime': 10}}
+    config = server.config(PAGE_ID)
+
+    rate_limiter.throttled_get(f"{graph_base_url(config)}/{PAGE_ID}", params={'access_token': 'test-token'})
+
+    assert fast_rate_limiter.usage == 90
+    assert fast_rate_limiter.rate < fast_rate_limiter.max_rate / 4
+
+
+def test_async_collector_retries_throttled_requests(server, fast_rate_limiter):
+    server.state.throttle_next = 3
+    post_ids = sorted(server.state.posts)
+    collector = AsyncGraphCollector(server.config(PAGE_ID), concurrency=4)
+
+    results = asyncio.run(collector.refresh_posts(post_ids, POST_METRICS))
+
+    assert server.state.count() == 4 * len(post_ids) + 3
+    assert fast_rate_limiter.stats['throttled'] == 3
+    for post_id in post_ids:
+        insights, basic_stats = results[post_id]
+        assert insights == server.state.posts[post_id]['insights']
+        assert basic_stats['likes_count'] == server.state.posts[post_id]['reactions']
@@ -0,0 +1,102 @@
+"""
+測試貼文 insights 更新排程
+"""
+
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+from collectors import refresh_scheduler
+from utils.setup_database import create_tables
+
+TODAY = date(2026, 3, 1)
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    create_tables(conn)
+    yield conn
+    conn.close()
+
+
+def add_post(conn, post_id, age_days, snapshots=()):
+    """snapshots: [(距今天數, 互動數, reach), ...]"""
+    created = (TODAY - timedelta(days=age_days)).isoformat() + 'T08:00:00+0000'
+    conn.execute("INSERT INTO posts (post_id, page_id, created_time) VALUES (?, 'page', ?)", (post_id, created))
+    for days_ago, interactions, reach in snapshots:
+        conn.execute("""
+            INSERT INTO post_insights_snapshots (post_id, fetch_date, likes_count, comments_count,
+                                                 shares_count, post_clicks, post_impressions_unique)
+            VALUES (?, ?, ?, 0, 0, 0, ?)
+        """, (post_id, (TODAY - timedelta(days=days_ago)).isoformat(), interactions, reach))
+    conn.commit()
+
+
+@pytest.mark.parametrize('age_days, growth, expected', [
+    (1, None, (1, 'fresh')),
+    (10, None, (1, 'no_history')),
+    (200, None, (None, 'saturated')),
+    (10, 0.2, (1, 'growing')),
+    (10, 0.02, (3, 'slowing')),
+    (10, 0.0, (7, 'weekly')),
+    (200, 0.005, (7, 'weekly')),
+    (200, 0.0, (None, 'saturated')),
+])
+def test_next_interval(age_days, growth, expected):
+    assert refresh_scheduler.next_interval(age_days, growth) == expected
+
+
+def test_growth_uses_larger_of_reach_and_interactions():
+    snapshots = [('2026-03-01', 110, 0, 0, 0, 1000), ('2026-02-27', 100, 0, 0, 0, 1000)]
+    assert refresh_scheduler.growth_per_day(snapshots) == pytest.approx(0.05)
+    assert refresh_scheduler.growth_per_day(snapshots[:1]) is None
+
+
+def test_schedule_by_age_and_growth(conn):
+    add_post(conn, 'fresh', 1, [(0, 10, 100)])
+    add_post(conn, 'growing', 10, [(0, 200, 2000), (1, 100, 1000)])
+    add_post(conn, 'slowing', 10, [(0, 102, 1000), (1, 100, 1000)])
+    add_post(conn, 'saturated', 90, [(0, 100, 1000), (7, 100, 1000)])
+    add_post(conn, 'backlog', 400)
+
+    refresh_scheduler.seed_queue(conn, TODAY)
+    due = dict(conn.execute("SELECT post_id, next_due_date FROM refresh_queue").fetchall())
+
+    assert due == {
+        'fresh': '2026-03-02',
+        'growing': '2026-03-02',
+        'slowing': '2026-03-04',
+        'saturated': refresh_scheduler.STOPPED_DATE,
+        'backlog': '2026-03-01',
+    }
+    assert refresh_scheduler.due_posts(conn, TODAY) == ['backlog']
+    assert sorted(refresh_scheduler.due_posts(conn, TODAY + timedelta(days=1))) == ['backlog', 'fresh', 'growing']
+    assert refresh_scheduler.queue_summary(conn)['saturated'] == 1
+
+
+def test_new_posts_enqueue_once_and_seed_runs_once(conn):
+    add_post(conn, 'old', 90, [(0, 100, 1000), (7, 100, 1000)])
+    assert refresh_scheduler.seed_queue(conn, TODAY) == 0  # 飽和貼文不算在佇列中
+    assert refresh_scheduler.seed_queue(conn, TODAY) == 0
+
+    # 停止更新的貼文重新出現在列表中時不會被當成新貼文
+    add_post(conn, 'new', 0)
+    assert refresh_scheduler.enqueue_new_posts(conn, ['old', 'new'], TODAY) == 1
+    assert refresh_scheduler.due_posts(conn, TODAY) == ['new']
+
+
+def test_deleted_posts_are_not_due(conn):
+    add_post(conn, 'gone', 5)
+    refresh_scheduler.enqueue_new_posts(conn, ['gone'], TODAY)
+    conn.execute("UPDATE posts SET is_deleted = 1 WHERE post_id = 'gone'")
+    assert refresh_scheduler.due_posts(conn, TODAY) == []
+
+
+def test_due_selection_uses_index(conn):
+    plan = conn.execute("""
+        EXPLAIN QUERY PLAN
+        SELECT post_id FROM refresh_queue WHERE next_due_date <= ?
+    """, (TODAY.isoformat(),)).fetchall()
+    assert any('idx_refresh_queue_due' in row[-1] for row in plan)
@@ -0,0 +1,139 @@
+"""
+測試 Graph API GET 回應的磁碟快取（使用本機 Fake Graph 伺服器）
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+
+import pytest
+
+from collectors.async_collector import AsyncGraphCollector
+from utils import graph_batch, graph_client, response_cache
+from utils.config import POST_METRICS
+
+PAGE_ID = '103640919705348'
+BASE = 'https://graph.facebook.com/v23.0'
+
+pytestmark = pytest.mark.graph(posts=24, created=lambda i: '2025-12-01T08:00:00+0000')
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def write_entries(directory, worker, count):
+    """子行程：反覆寫入相同的鍵"""
+    cache = response_cache.ResponseCache(directory, post_age=lambda post_id: 1)
+    for i in range(count):
+        cache.put(f"{BASE}/{PAGE_ID}_{i % 10}/insights", {'metric': 'post_clicks'}, 200, {},
+                  json.dumps({'data': [{'worker': worker, 'i': i, 'pad': 'x' * (i % 50) * 100}]}))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = response_cache.ResponseCache(str(tmp_path / 'cache'), post_age=lambda post_id: 10, clock=FakeClock())
+    response_cache.enable(cache)
+    yield cache
+    response_cache.enable(None)
+
+
+def test_ttl_depends_on_endpoint_and_post_age(tmp_path):
+    ages = {f'{PAGE_ID}_1': 5, f'{PAGE_ID}_2': 400}
+    cache = response_cache.ResponseCache(str(tmp_path), post_age=ages.get)
+    assert cache.ttl_for(f"{BASE}/{PAGE_ID}?fields=id,name") == 3600
+    assert cache.ttl_for(f"{BASE}/{PAGE_ID}_1/insights?metric=post_clicks") == 900
+    assert cache.ttl_for(f"{BASE}/{PAGE_ID}_2/insights?metric=post_clicks") == 7 * 86400
+    assert cache.ttl_for(f"{BASE}/{PAGE_ID}_2/comments?summary=total_count") == 7 * 86400
+    # 貼文列表與廣告帳戶不快取
+    assert cache.ttl_for(f"{BASE}/{PAGE_ID}/posts?limit=100") == 0
+    assert cache.ttl_for(f"{BASE}/act_123/insights") == 0
+
+
+def test_batch_refresh_reuses_cached_sub_requests(server, cache):
+    config = server.config(PAGE_ID)
+    post_ids = sorted(server.state.posts)
+    first = graph_batch.fetch_posts_refresh(config, post_ids, POST_METRICS)
+    assert server.state.batch_sub_requests == 4 * len(post_ids)
+
+    # 同一天重跑：全部命中快取，不再送出任何請求；token 不同仍共用
+    server.state.reset_counters()
+    again = graph_batch.fetch_posts_refresh({**config, 'access_token': 'another'}, post_ids, POST_METRICS)
+    assert again == first
+    assert server.state.count() == 0
+    stats = cache.summary()
+    assert stats['hits'] == 4 * len(post_ids) and stats['stores'] == 4 * len(post_ids)
+    assert stats['hit_rate'] == 0.5
+
+    # 過期後重新下載
+    cache.clock.now += 901
+    graph_batch.fetch_posts_refresh(config, post_ids[:2], POST_METRICS)
+    assert server.state.batch_sub_requests == 8
+    assert cache.summary()['expired'] == 8
+
+
+def test_single_gets_and_async_engine_use_cache(server, cache):
+    config = server.config(PAGE_ID)
+    url = f"{graph_batch.graph_base_url(config)}/{PAGE_ID}"
+    for _ in range(3):
+        response = graph_client.graph_get(url, params={'access_token': 'test-token', 'fields': 'id,name'})
+        assert response.json() == {'id': PAGE_ID, 'name': '測試專頁'}
+    assert server.state.count(PAGE_ID) == 1
+
+    post_ids = sorted(server.state.posts)[:5]
+    results = [asyncio.run(AsyncGraphCollector(config, concurrency=5).refresh_posts(post_ids, POST_METRICS))
+               for _ in range(2)]
+    assert results[0] == results[1]
+    assert server.state.count('/insights') == 5
+
+
+def test_error_responses_are_not_cached(server, cache):
+    url = f"{graph_batch.graph_base_url(server.config(PAGE_ID))}/missing_post/insights"
+    for _ in range(2):
+        assert graph_client.graph_get(url, params={'access_token': 'test-token'}).status_code == 400
+    assert server.state.count('missing_post/insights') == 2
+    assert cache.summary()['stores'] == 0
+
+
+def test_lru_eviction_keeps_recently_used_entries(tmp_path):
+    cache = response_cache.ResponseCache(str(tmp_path), max_bytes=6000, post_age=lambda post_id: 1)
+    urls = [f"{BASE}/{PAGE_ID}_{i}/insights" for i in range(8)]
+    for i, url in enumerate(urls[:5]):
+        cache.put(url, None, 200, {}, json.dumps({'data': 'x' * 1000}))
+        # 以遞增的修改時間代表寫入順序
+        path = cache._path(response_cache.cache_key(response_cache.full_url(url)))
+        os.utime(path, (1000 + i, 1000 + i))
+    assert cache.get(urls[0]) is not None
+
+    for url in urls[5:]:
+        cache.put(url, None, 200, {}, json.dumps({'data': 'x' * 1000}))
+
+    kept = [url for url in urls if cache.get(url) is not None]
+    assert cache.summary()['evictions'] > 0
+    assert urls[0] in kept and urls[-1] in kept
+    assert urls[1] not in kept
+    assert cache.summary()['bytes'] <= 6000
+
+
+def test_concurrent_writers_never_leave_corrupt_entries(tmp_path):
+    directory = str(tmp_path / 'shared')
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=write_entries, args=(directory, worker, 200)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+    assert all(process.exitcode == 0 for process in processes)
+
+    files = [os.path.join(root, name) for root, _, names in os.walk(directory) for name in names]
+    assert len(files) == 10
+    assert all(name.endswith('.json') for name in files)
+    for path in files:
+        with open(path, encoding='utf-8') as f:
+            entry = json.load(f)
+        assert json.loads(entry['content'])['data'][0]['worker'] in range(4)
@@ -0,0 +1,127 @@
+"""
+測試 snapshot 保留政策（utils.snapshot_archive）：降採樣、Parquet 封存與冷熱資料合併
+"""
+
+import io
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+
+import pytest
+
+from analytics import analytics_trends
+from tests.conftest import make_conn
+from utils import db_utils, snapshot_archive
+
+START = date(2023, 1, 2)   # 週一
+DAYS = 500
+
+
+def write_history(conn, post_id='103640919705348_1', created=True):
+    if created:
+        db_utils.upsert_post(conn, {'id': post_id, 'page_id': 'page', 'created_time': f'{START}T02:00:00+0000'})
+    with db_utils.BatchWriter(conn) as writer:
+        for i in range(DAYS):
+            writer.upsert_post_insights(post_id, (START + timedelta(days=i)).isoformat(),
+                                        {'likes_count': i, 'comments_count': i % 7, 'post_impressions_unique': 1000 - i})
+
+
+def fetch_dates(conn, post_id='103640919705348_1'):
+    return [date.fromisoformat(row[0]) for row in conn.execute(
+        "SELECT fetch_date FROM post_insights_snapshots WHERE post_id = ? ORDER BY fetch_date", (post_id,))]
+
+
+def latest(conn):
+    return [tuple(row) for row in conn.execute("SELECT * FROM post_latest_metrics ORDER BY post_id")]
+
+
+def test_downsampling_keeps_daily_then_weekly_then_monthly_points():
+    conn = make_conn()
+    write_history(conn)
+    before = latest(conn)
+
+    deleted = snapshot_archive.downsample_snapshots(conn)
+    kept = fetch_dates(conn)
+    assert deleted == DAYS - len(kept)
+    daily = [d for d in kept if (d - START).days < snapshot_archive.DAILY_DAYS]
+    weekly = [d for d in kept if snapshot_archive.DAILY_DAYS <= (d - START).days < snapshot_archive.WEEKLY_DAYS]
+    monthly = [d for d in kept if (d - START).days >= snapshot_archive.WEEKLY_DAYS]
+    assert len(daily) == snapshot_archive.DAILY_DAYS
+    # 每週保留週日（該週最後一筆）；跨越分層邊界的週在兩側各保留一筆
+    assert all(d.weekday() == 6 for d in weekly[:-1])
+    assert len({d.isocalendar()[:2] for d in weekly}) == len(weekly)
+    # 每月保留最後一天，最近 2 筆不降採樣
+    last = START + timedelta(days=DAYS - 1)
+    assert monthly[-2:] == [last - timedelta(days=1), last]
+    assert all((d + timedelta(days=1)).day == 1 for d in monthly[:-2] if d.month != last.month)
+    assert len({(d.year, d.month) for d in monthly[:-2]}) == len(monthly[:-2])
+
+    # 保留的列數值不變，post_latest_metrics（含 best_*）不受影響
+    assert latest(conn) == before
+    row = conn.execute("SELECT likes_count FROM post_insights_snapshots WHERE fetch_date = ?",
+                       (weekly[0].isoformat(),)).fetchone()
+    assert row[0] == (weekly[0] - START).days
+    assert snapshot_archive.downsample_snapshots(conn) == 0
+
+
+def test_posts_without_created_time_use_first_snapshot():
+    conn = make_conn()
+    write_history(conn, created=False)
+    snapshot_archive.downsample_snapshots(conn)
+    assert fetch_dates(conn)[:snapshot_archive.DAILY_DAYS] == \
+        [START + timedelta(days=i) for i in range(snapshot_archive.DAILY_DAYS)]
+
+
+def test_archive_moves_old_snapshots_to_parquet_and_curve_is_stitched(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    conn = make_conn()
+    write_history(conn)
+    write_history(conn, post_id='103640919705348_2')
+    snapshot_archive.downsample_snapshots(conn)
+    curve = analytics_trends.get_post_lifecycle_curve(conn, '103640919705348_1', archive_dir=str(tmp_path))
+    before = latest(conn)
+    hot_before = fetch_dates(conn)
+
+    today = START + timedelta(days=DAYS + 30)
+    archived = snapshot_archive.archive_snapshots(conn, today, archive_days=120, archive_dir=str(tmp_path))
+    cutoff = today - timedelta(days=120)
+    assert fetch_dates(conn) == [d for d in hot_before if d >= cutoff]
+    assert archived == 2 * len([d for d in hot_before if d < cutoff])
+    assert latest(conn) == before
+
+    files = sorted(tmp_path.glob('year=*/*.parquet'))
+    assert [f.parent.name for f in files] == ['year=2023', 'year=2024']
+    assert pq.ParquetFile(files[0]).metadata.row_group(0).column(0).compression == 'ZSTD'
+    assert not list(tmp_path.glob('year=*/.*'))
+
+    archived_rows = snapshot_archive.read_archived_snapshots('103640919705348_1', str(tmp_path))
+    assert [date.fromisoformat(row['fetch_date']) for row in archived_rows] == [d for d in hot_before if d < cutoff]
+    assert analytics_trends.get_post_lifecycle_curve(conn, '103640919705348_1', archive_dir=str(tmp_path)) == curve
+
+    # 重複封存（寫入後刪除前失敗）時讀取端去除重複
+    for path in files:
+        (path.parent / f'part-retry-{path.name}').write_bytes(path.read_bytes())
+    assert snapshot_archive.read_archived_snapshots('103640919705348_1', str(tmp_path)) == archived_rows
+
+
+def test_archive_is_skipped_without_pyarrow(tmp_path, monkeypatch):
+    conn = make_conn()
+    write_history(conn)
+    monkeypatch.setattr(snapshot_archive, 'PYARROW_AVAILABLE', False)
+    with redirect_stdout(io.StringIO()) as out:
+        assert snapshot_archive.archive_snapshots(conn, START + timedelta(days=DAYS), archive_days=30,
+                                                  archive_dir=str(tmp_path)) == 0
+    assert 'pyarrow' in out.getvalue()
+    assert len(fetch_dates(conn)) == DAYS
+
+
+def test_archive_requires_configured_dir(monkeypatch):
+    conn = make_conn()
+    write_history(conn)
+    monkeypatch.setattr(snapshot_archive, 'ARCHIVE_DIR', None)
+    with redirect_stdout(io.StringIO()) as out:
+        result = snapshot_archive.run_retention(conn, START + timedelta(days=DAYS))
+    # 未設定（持久的）封存目錄時只降採樣，不刪除超過期限的 snapshot
+    assert result['archived'] == 0 and result['downsampled'] > 0
+    assert 'SNAPSHOT_ARCHIVE_DIR' in out.getvalue()
+    assert fetch_dates(conn)[0] == START
+    assert snapshot_archive.read_archived_snapshots('103640919705348_1') == []
@@ -0,0 +1,118 @@
+"""
+測試只儲存變動的 post_insights_snapshots（last_checked 與階梯函數 view）
+"""
+
+import io
+import sqlite3
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+
+import pytest
+
+from analytics import analytics_trends
+from collectors import refresh_scheduler
+from tests import conftest
+from utils import db_utils
+from utils.setup_database import create_tables
+
+START = date(2026, 3, 1)
+METRICS = ['likes_count', 'comments_count', 'shares_count', 'post_clicks', 'post_impressions_unique']
+
+# 前 4 天持續成長，之後數值不變（舊貼文的常見情況）
+SERIES = [{'likes_count': 10 + min(day, 3) * 5, 'comments_count': 2, 'shares_count': min(day, 2),
+           'post_clicks': 7, 'post_impressions_unique': 100 + min(day, 3) * 50} for day in range(12)]
+
+
+def make_conn():
+    conn = conftest.make_conn()
+    conn.execute("INSERT INTO posts (post_id, page_id, created_time) VALUES ('p1', 'page', ?)",
+                 ((START - timedelta(days=30)).isoformat() + 'T08:00:00+0000',))
+    conn.commit()
+    return conn
+
+
+def collect(conn, changes_only, days=len(SERIES)):
+    for day in range(days):
+        fetch_date = (START + timedelta(days=day)).isoformat()
+        assert db_utils.upsert_post_insights(conn, 'p1', fetch_date, dict(SERIES[day]), changes_only=changes_only)
+
+
+@pytest.fixture
+def conns():
+    full, changes = make_conn(), make_conn()
+    collect(full, changes_only=False)
+    collect(changes, changes_only=True)
+    yield full, changes
+    full.close()
+    changes.close()
+
+
+def rows(conn, table):
+    return [tuple(row) for row in conn.execute(
+        f"SELECT fetch_date, {', '.join(METRICS)} FROM {table} WHERE post_id = 'p1' ORDER BY fetch_date")]
+
+
+def test_unchanged_days_only_update_last_checked(conns):
+    full, changes = conns
+    assert full.execute("SELECT COUNT(*) FROM post_insights_snapshots").fetchone()[0] == len(SERIES)
+    stored = changes.execute("SELECT fetch_date, last_checked FROM post_insights_snapshots ORDER BY fetch_date").fetchall()
+    assert [tuple(row) for row in stored] == [
+        ('2026-03-01', None), ('2026-03-02', None), ('2026-03-03', None),
+        ('2026-03-04', (START + timedelta(days=len(SERIES) - 1)).isoformat()),
+    ]
+
+
+def test_daily_view_and_lifecycle_curve_match_full_storage(conns):
+    full, changes = conns
+    assert rows(changes, 'post_insights_daily') == rows(full, 'post_insights_snapshots')
+    assert rows(full, 'post_insights_daily') == rows(full, 'post_insights_snapshots')
+    assert analytics_trends.get_post_lifecycle_curve(changes, 'p1') == \
+        analytics_trends.get_post_lifecycle_curve(full, 'p1')
+    carried = changes.execute("SELECT SUM(carried) FROM post_insights_daily").fetchone()[0]
+    assert carried == len(SERIES) - 4
+
+
+def test_refresh_scheduler_sees_no_op_days(conns):
+    full, changes = conns
+    today = START + timedelta(days=len(SERIES) - 1)
+    latest = refresh_scheduler.recent_snapshots(changes, 'p1')
+    assert latest[0][0] == today.isoformat()
+    assert refresh_scheduler.growth_per_day(latest) == refresh_scheduler.growth_per_day(
+        refresh_scheduler.recent_snapshots(full, 'p1')) == 0
+    assert refresh_scheduler.schedule_post(changes, 'p1', '2026-01-30', today) == \
+        refresh_scheduler.schedule_post(full, 'p1', '2026-01-30', today)
+
+
+def test_change_after_no_op_days_starts_new_step():
+    conn = make_conn()
+    collect(conn, changes_only=True, days=6)
+    db_utils.upsert_post_insights(conn, 'p1', '2026-03-08', {**SERIES[-1], 'likes_count': 99}, changes_only=True)
+    # 同一天重新收集時直接覆寫
+    db_utils.upsert_post_insights(conn, 'p1', '2026-03-08', {**SERIES[-1], 'likes_count': 100}, changes_only=True)
+    daily = rows(conn, 'post_insights_daily')
+    # 03-07 未收集：與每日完整寫入相同，不產生列
+    assert [row[0] for row in daily] == ['2026-03-0%d' % day for day in (1, 2, 3, 4, 5, 6, 8)]
+    assert daily[-2][1] == 25 and daily[-1][1] == 100
+
+
+def test_existing_database_gains_last_checked_column(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'old.db'))
+    # 模擬加入 last_checked 之前（也尚未有 schema_version）的資料庫
+    conn.execute(f"""
+        CREATE TABLE post_insights_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            post_id TEXT NOT NULL,
+            fetch_date DATE NOT NULL,
+            {', '.join(f'{col} INTEGER' for col in db_utils.SNAPSHOT_METRIC_COLUMNS)},
+            UNIQUE(post_id, fetch_date)
+        )
+    """)
+    conn.execute("INSERT INTO post_insights_snapshots (post_id, fetch_date, likes_count) VALUES ('p1', '2026-03-01', 5)")
+    conn.commit()
+    with redirect_stdout(io.StringIO()):
+        create_tables(conn)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(post_insights_snapshots)")]
+    assert 'last_checked' in columns
+    assert conn.execute("SELECT post_id, fetch_date, likes_count FROM post_insights_daily").fetchall() == \
+        [('p1', '2026-03-01', 5)]
+    conn.close()
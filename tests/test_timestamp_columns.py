@@ -0,0 +1,105 @@
+"""
+測試 posts 的正規化時間欄位（created_ts / created_date / GMT+8 日期與小時 / ISO 週）
+"""
+
+import io
+import sqlite3
+from contextlib import redirect_stdout
+from datetime import date, datetime, timedelta, timezone
+
+from analytics import analytics_reports, query_analytics
+from tests.conftest import make_conn
+from utils import db_utils, migrations
+
+GMT8 = timezone(timedelta(hours=8))
+
+
+def derived(conn, post_id):
+    row = conn.execute("""
+        SELECT created_ts, created_date, created_local_date, created_local_hour, created_week
+        FROM posts WHERE post_id = ?
+    """, (post_id,)).fetchone()
+    return tuple(row)
+
+
+def expected(created_time):
+    dt = datetime.strptime(created_time, '%Y-%m-%dT%H:%M:%S%z')
+    utc, local = dt.astimezone(timezone.utc), dt.astimezone(GMT8)
+    year, week, _ = utc.date().isocalendar()
+    return (int(dt.timestamp()), utc.date().isoformat(), local.date().isoformat(), local.hour,
+            f'{year}-W{week:02d}')
+
+
+def add_post(conn, post_id, created_time):
+    db_utils.upsert_post(conn, {'id': post_id, 'page_id': 'page', 'created_time': created_time})
+
+
+def test_columns_are_filled_on_insert_and_update():
+    conn = make_conn()
+    add_post(conn, 'p1', '2025-12-11T20:30:00+0000')
+    add_post(conn, 'p2', '2025-12-31T20:00:00-0530')
+    assert derived(conn, 'p1') == expected('2025-12-11T20:30:00+0000')
+    assert derived(conn, 'p1')[2:4] == ('2025-12-12', 4)      # GMT+8 已跨日
+    assert derived(conn, 'p2') == expected('2025-12-31T20:00:00-0530')
+
+    # 修正 created_time 時重新計算
+    conn.execute("UPDATE posts SET created_time = '2026-01-05T01:00:00+0000' WHERE post_id = 'p1'")
+    assert derived(conn, 'p1') == expected('2026-01-05T01:00:00+0000')
+
+    conn.execute("INSERT INTO posts (post_id, page_id) VALUES ('p3', 'page')")
+    assert derived(conn, 'p3') == (None,) * 5
+
+
+def test_iso_week_matches_python_across_year_boundaries():
+    conn = make_conn()
+    days = [date(2019, 12, 25) + timedelta(days=i) for i in range(0, 2300, 3)]
+    with db_utils.BatchWriter(conn) as writer:
+        for day in days:
+            writer.upsert_post({'id': f'p{day}', 'page_id': 'page', 'created_time': f'{day}T12:00:00+0000'})
+    weeks = dict(conn.execute("SELECT created_date, created_week FROM posts").fetchall())
+    assert weeks == {day.isoformat(): '%d-W%02d' % day.isocalendar()[:2] for day in days}
+
+
+def test_migration_backfills_existing_posts():
+    conn = sqlite3.connect(':memory:')
+    with redirect_stdout(io.StringIO()):
+        migrations.migrate(conn, target=5)
+        conn.execute("INSERT INTO posts (post_id, page_id, created_time) VALUES ('p1', 'page', '2021-01-03T23:59:59+00:00')")
+        assert migrations.migrate(conn, target=6) == [6]
+    assert derived(conn, 'p1') == expected('2021-01-03T23:59:59+0000')
+    assert derived(conn, 'p1')[4] == '2020-W53'
+
+
+def test_date_range_queries_use_index():
+    conn = make_conn()
+    sql = "SELECT post_id FROM posts p WHERE p.created_date BETWEEN ? AND ?"
+    plan = ' '.join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, ('2025-01-01', '2025-01-31')))
+    assert 'USING INDEX idx_posts_created_date' in plan
+    plan = ' '.join(row[3] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT post_id FROM posts p WHERE p.created_ts >= strftime('%s', 'now') - 3600"))
+    assert 'USING INDEX idx_posts_created_ts' in plan
+
+
+def test_reports_group_by_precomputed_columns():
+    conn = make_conn()
+    for i, created_time in enumerate(['2026-03-02T01:00:00+0000', '2026-03-08T23:00:00+0000',
+                                      '2026-03-09T00:30:00+0000', '2026-04-01T10:00:00+0000']):
+        post_id = f'p{i}'
+        add_post(conn, post_id, created_time)
+        db_utils.upsert_post_insights(conn, post_id, '2026-04-02', {'likes_count': 10 * (i + 1),
+                                                                   'post_impressions_unique': 100})
+        conn.execute("INSERT INTO posts_performance (post_id, snapshot_date, engagement_rate) VALUES (?, ?, ?)",
+                     (post_id, '2026-04-02', i + 1.0))
+    conn.commit()
+
+    daily = query_analytics.query_by_date_range(conn, '2026-03-01', '2026-03-31', 'daily')
+    assert [row['time_period'] for row in daily] == ['2026-03-09', '2026-03-08', '2026-03-02']
+    weekly = query_analytics.query_by_date_range(conn, '2026-03-01', '2026-04-30', 'weekly')
+    assert [(row['time_period'], row['post_count']) for row in weekly] == \
+        [('2026-W14', 1), ('2026-W11', 1), ('2026-W10', 2)]
+    monthly = query_analytics.query_by_date_range(conn, '2026-03-01', '2026-04-30', 'monthly')
+    assert [(row['time_period'], row['total_likes']) for row in monthly] == [('2026-04', 40), ('2026-03', 60)]
+
+    trends = analytics_reports.get_weekly_trends(conn)
+    assert [(row['week_start'], row['week_end'], row['post_count']) for row in trends] == [
+        ('2026-03-30', '2026-04-05', 1), ('2026-03-09', '2026-03-15', 1), ('2026-03-02', '2026-03-08', 2)]
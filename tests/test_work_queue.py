@@ -0,0 +1,157 @@
+"""
+測試貼文 insights 工作佇列（多個行程同時領取同一個 SQLite 佇列，使用本機 Fake Graph 伺服器）
+"""
+
+import io
+import multiprocessing
+import os
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+import pytest
+
+import run_pipeline
+from collectors import work_queue
+from utils import db_utils, graph_client, rate_limiter
+
+PAGE_ID = '103640919705348'
+FETCH_DATE = '2025-01-15'
+POST_COUNT = 60
+
+pytestmark = pytest.mark.graph(
+    page=False, posts=POST_COUNT,
+    created=lambda i: (datetime(2025, 1, 1) + timedelta(hours=i)).strftime('%Y-%m-%dT%H:%M:%S+0000'))
+
+
+def worker_process(db_path, fb_config, lease_seconds, batch_size, results):
+    """子行程：以獨立的連線與限制器執行 worker"""
+    db_utils.DB_PATH = db_path
+    rate_limiter.set_limiter(rate_limiter.GraphRateLimiter(max_rate=5000, min_rate=50, burst=500, base_backoff=0.01))
+    graph_client.set_client(graph_client.GraphClient(backoff_factor=0))
+    with redirect_stdout(io.StringIO()):
+        results.put(work_queue.run_worker(fb_config, lease_seconds=lease_seconds, batch_size=batch_size))
+
+
+def crashed_process(db_path, lease_seconds, batch_size):
+    """子行程：領取工作後直接結束（模擬 worker 當機，不釋放租約）"""
+    db_utils.DB_PATH = db_path
+    with redirect_stdout(io.StringIO()):
+        conn = work_queue.connect()
+    work_queue.lease_tasks(conn, 'crashed-worker', batch_size, lease_seconds)
+    os._exit(1)
+
+
+@pytest.fixture
+def queue(server):
+    """建立佇列，並以 trigger 記錄每一次 snapshot 寫入"""
+    with redirect_stdout(io.StringIO()):
+        conn = work_queue.connect()
+    conn.executescript("""
+        CREATE TABLE snapshot_writes (post_id TEXT, fetch_date TEXT);
+        CREATE TRIGGER log_snapshot_insert AFTER INSERT ON post_insights_store
+        BEGIN INSERT INTO snapshot_writes
+              SELECT post_id, NEW.day FROM post_keys WHERE post_key = NEW.post_key; END;
+        CREATE TRIGGER log_snapshot_update AFTER UPDATE ON post_insights_store
+        BEGIN INSERT INTO snapshot_writes
+              SELECT post_id, NEW.day FROM post_keys WHERE post_key = NEW.post_key; END;
+    """)
+    post_ids = sorted(server.state.posts)
+    assert work_queue.enqueue_tasks(conn, post_ids, FETCH_DATE, PAGE_ID) == POST_COUNT
+    # 重複加入同一天的工作會被忽略
+    assert work_queue.enqueue_tasks(conn, post_ids[:5], FETCH_DATE, PAGE_ID) == 0
+    yield conn
+    conn.close()
+
+
+def run_processes(targets):
+    processes = [multiprocessing.get_context('spawn').Process(target=target, args=args) for target, args in targets]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=120)
+    return processes
+
+
+def write_counts(conn):
+    return dict(conn.execute("SELECT post_id, COUNT(*) FROM snapshot_writes GROUP BY post_id").fetchall())
+
+
+def test_workers_write_each_snapshot_exactly_once(server, queue):
+    server.state.latency = 0.02
+    results = multiprocessing.get_context('spawn').Queue()
+    fb_config = server.config(PAGE_ID)
+    processes = run_processes([(worker_process, (db_utils.DB_PATH, fb_config, 5, 3, results))] * 4)
+    assert all(process.exitcode == 0 for process in processes)
+    summaries = [results.get(timeout=5) for _ in processes]
+
+    assert work_queue.queue_stats(queue) == {'done': POST_COUNT}
+    assert write_counts(queue) == {post_id: 1 for post_id in server.state.posts}
+    assert sum(summary['done'] for summary in summaries) == POST_COUNT
+    # 工作確實分散給多個 worker
+    assert sum(1 for summary in summaries if summary['done']) > 1
+
+
+def test_crashed_worker_tasks_are_reclaimed(server, queue):
+    run_processes([(crashed_process, (db_utils.DB_PATH, 0.5, 10))])
+    stats = work_queue.queue_stats(queue)
+    assert stats == {'leased': 10, 'pending': POST_COUNT - 10}
+
+    time.sleep(0.6)
+    results = multiprocessing.get_context('spawn').Queue()
+    processes = run_processes([(worker_process, (db_utils.DB_PATH, server.config(PAGE_ID), 5, 6, results))] * 2)
+    assert all(process.exitcode == 0 for process in processes)
+
+    assert work_queue.queue_stats(queue) == {'done': POST_COUNT}
+    assert write_counts(queue) == {post_id: 1 for post_id in server.state.posts}
+    attempts = dict(queue.execute("SELECT attempts, COUNT(*) FROM refresh_tasks GROUP BY attempts").fetchall())
+    assert attempts == {1: POST_COUNT - 10, 2: 10}
+
+
+def test_expired_lease_cannot_complete(queue):
+    now = time.time()
+    stale = work_queue.lease_tasks(queue, 'slow-worker', 2, lease_seconds=1, now=now - 10)
+    reclaimed = work_queue.lease_tasks(queue, 'fast-worker', 2, lease_seconds=60, now=now)
+    assert [t['task_id'] for t in stale] == [t['task_id'] for t in reclaimed]
+    assert work_queue.heartbeat(queue, 'slow-worker', [t['task_id'] for t in stale]) == 0
+
+    def write(conn):
+        return db_utils.upsert_post_insights(conn, stale[0]['post_id'], FETCH_DATE, {'post_clicks': 1})
+
+    assert not work_queue.complete_task(queue, 'slow-worker', stale[0]['task_id'], write)
+    assert write_counts(queue) == {}
+    assert work_queue.complete_task(queue, 'fast-worker', reclaimed[0]['task_id'], write)
+    assert write_counts(queue) == {stale[0]['post_id']: 1}
+
+
+def test_failed_tasks_retry_until_max_attempts(queue):
+    now = time.time()
+    for attempt in range(1, work_queue.MAX_ATTEMPTS + 1):
+        task, = work_queue.lease_tasks(queue, 'worker', 1, now=now + attempt * 100)
+        assert task['attempts'] == attempt
+        work_queue.fail_task(queue, 'worker', task['task_id'], 'HTTP 500', retry_delay=0)
+    row = queue.execute("SELECT status, last_error FROM refresh_tasks WHERE task_id = ?",
+                        (task['task_id'],)).fetchone()
+    assert tuple(row) == ('failed', 'HTTP 500')
+    # 失敗的工作不再被領取，其他工作照常領取
+    assert work_queue.lease_tasks(queue, 'worker', 1)[0]['task_id'] != task['task_id']
+
+
+def test_pipeline_drains_due_posts_through_queue(server, monkeypatch):
+    server.state.add_page(PAGE_ID, '測試專頁')
+    monkeypatch.setattr(run_pipeline.config, 'FACEBOOK_CONFIG', server.config(PAGE_ID))
+    with redirect_stdout(io.StringIO()):
+        conn = work_queue.connect()
+        for post in server.state.posts.values():
+            db_utils.upsert_post(conn, {'id': post['id'], 'page_id': PAGE_ID, 'created_time': post['created_time']})
+        assert run_pipeline.collect_post_data(since_date='2026-06-01', until_date='2026-06-30',
+                                              reconcile=False, queue_workers=3)
+
+    fetch_date = datetime.now().strftime('%Y-%m-%d')
+    assert work_queue.queue_stats(conn) == {'done': POST_COUNT}
+    assert work_queue.completed_posts(conn, fetch_date, server.state.posts) == list(server.state.posts)
+    assert conn.execute("SELECT COUNT(DISTINCT post_id) FROM post_insights_snapshots").fetchone()[0] == POST_COUNT
+    # 完成的貼文已依最新 snapshot 重新排程
+    assert conn.execute("SELECT COUNT(*) FROM refresh_queue WHERE next_due_date > ?",
+                        (fetch_date,)).fetchone()[0] == POST_COUNT
+    conn.close()
@@ -0,0 +1,344 @@
+"""
+Graph API 錄製 / 重播層（cassette）
+record 模式把真實回應寫入 gzip 壓縮的 JSON Lines 檔（access token 等憑證一律遮蔽），
+replay 模式完全不連網，依請求內容重播錄製的回應，並可注入固定延遲與節流錯誤 (code 4)，
+讓整個 pipeline 可離線執行、收集器吞吐量可重現地量測。
+
+同步請求經由 GraphClient 的 requests adapter，非同步引擎經由 httpx transport，共用同一份錄製內容。
+
+用法:
+    python run_pipeline.py --record cassettes/daily.jsonl.gz
+    python run_pipeline.py --replay cassettes/daily.jsonl.gz
+    GRAPH_CASSETTE=cassettes/daily.jsonl.gz GRAPH_CASSETTE_MODE=replay python -m collectors.collector_page
+
+比對規則：先以 方法 + 路徑 + 參數（不含憑證）完全比對；找不到時忽略日期類參數
+（since/until/time_range，隨執行日期變動）再比對。同一請求錄到多個回應時依序重播，
+用完後重複最後一個（例如輪詢非同步報表的狀態）。
+"""
+
+import atexit
+import gzip
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+FORMAT_VERSION = 1
+
+MODES = ('record', 'replay')
+
+# 不列入比對、寫入檔案前遮蔽的參數
+SECRET_PARAMS = ('access_token', 'appsecret_proof', 'client_secret', 'fb_exchange_token', 'input_token')
+
+# 隨執行日期變動的參數，完全比對失敗時忽略
+VOLATILE_PARAMS = ('since', 'until', 'time_range')
+
+REDACTED = 'REDACTED'
+
+# 不保存的回應標頭（內容已解壓縮並重新計算長度）
+DROPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding', 'connection', 'set-cookie')
+
+# 注入的節流錯誤（與 Graph API 的 App 層級節流相同）
+THROTTLE_BODY = {'error': {'message': '(#4) Application request limit reached', 'type': 'OAuthException',
+                           'code': 4, 'fbtrace_id': 'cassette'}}
+THROTTLE_HEADERS = {'content-type': 'application/json; charset=UTF-8'}
+
+_SECRET_PATTERN = re.compile(
+    r'((?:%s)(?:=|\\?"\s*:\s*\\?"))([^&"\\\s]+)' % '|'.join(SECRET_PARAMS))
+
+
+def scrub(text: str, secrets: Iterable[str] = ()) -> str:
+    """遮蔽文字中的憑證（查詢字串、JSON 欄位與已知的 token 值）"""
+    for secret in secrets:
+        if secret:
+            text = text.replace(secret, REDACTED)
+    return _SECRET_PATTERN.sub(lambda m: m.group(1) + REDACTED, text)
+
+
+def _pairs(text: str) -> List[Tuple[str, str]]:
+    return parse_qsl(text, keep_blank_values=True) if text and '=' in text else []
+
+
+def request_key(method: str, url: str, body=None, loose: bool = False) -> str:
+    """請求的比對鍵（路徑 + 排序後的查詢與表單參數，不含主機與憑證）"""
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', 'replace')
+    ignored = SECRET_PARAMS + (VOLATILE_PARAMS if loose else ())
+    parts = urlsplit(url)
+    params = [(k, v) for k, v in _pairs(parts.query) + _pairs(body or '') if k not in ignored]
+    return json.dumps([method.upper(), parts.path, sorted(params)], ensure_ascii=False)
+
+
+def request_secrets(url: str, body=None) -> List[str]:
+    """請求中的憑證值（用來遮蔽回應內容中出現的相同字串）"""
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', 'replace')
+    pairs = _pairs(urlsplit(url).query) + _pairs(body or '')
+    return [v for k, v in pairs if k in SECRET_PARAMS and v]
+
+
+class Cassette:
+    """
+    錄製或重播的 Graph API 回應
+
+    Args:
+        path: 檔案路徑（.jsonl.gz）
+        mode: 'record'（連網並錄製）或 'replay'（不連網）
+        latency: 重播時每個請求的延遲秒數；'recorded' 使用錄製時的實際耗時
+        throttle_every: 重播時每 N 個請求注入一次節流錯誤（None 表示不注入）
+        throttle_rate: 重播時以此機率注入節流錯誤（以 seed 決定，可重現）
+    """
+
+    def __init__(self, path: str, mode: str = 'replay', latency=0.0, throttle_every: Optional[int] = None,
+                 throttle_rate: float = 0.0, seed: int = 0):
+        if mode not in MODES:
+            raise ValueError(f"未知的 cassette 模式: {mode}（可用: {', '.join(MODES)}）")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.interactions = []
+        self.secrets = set()
+        self.stats = {'recorded': 0, 'replayed': 0, 'misses': 0, 'injected_throttles': 0}
+        self._exact = {}
+        self._loose = {}
+        self._calls = 0
+        if mode == 'replay':
+            self.load()
+
+    # ---- 檔案 ----
+
+    def load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"找不到 cassette: {self.path}")
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            if header.get('version') != FORMAT_VERSION:
+                raise ValueError(f"不支援的 cassette 版本: {header.get('version')}")
+            self.interactions = [json.loads(line) for line in f if line.strip()]
+        self._exact, self._loose = {}, {}
+        for interaction in self.interactions:
+            self._exact.setdefault(interaction['key'], []).append(interaction)
+            self._loose.setdefault(interaction['loose_key'], []).append(interaction)
+
+    def save(self):
+        """寫入檔案（先寫暫存檔再取代，中斷時不會留下不完整的 cassette）"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            interactions = list(self.interactions)
+            secrets = set(self.secrets)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8') as f:
+                header = {'version': FORMAT_VERSION, 'recorded_at': datetime.now().isoformat(timespec='seconds'),
+                          'interactions': len(interactions)}
+                f.write(json.dumps(header) + '\n')
+                for interaction in interactions:
+                    # 錄製期間才出現的 token 也要從較早的內容中遮蔽
+                    f.write(scrub(json.dumps(interaction, ensure_ascii=False), secrets) + '\n')
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    # ---- 錄製 / 重播 ----
+
+    def record(self, method: str, url: str, body, status: int, headers, content: bytes, elapsed: float):
+        secrets = request_secrets(url, body)
+        headers = {k.lower(): v for k, v in headers.items() if k.lower() not in DROPPED_HEADERS}
+        interaction = {
+            'key': request_key(method, url, body),
+            'loose_key': request_key(method, url, body, loose=True),
+            'method': method.upper(),
+            'url': scrub(url, secrets),
+            'status': status,
+            'headers': headers,
+            'content': scrub(content.decode('utf-8', 'replace'), secrets),
+            'elapsed': round(elapsed, 4),
+        }
+        with self.lock:
+            self.secrets.update(secrets)
+            self.interactions.append(interaction)
+            self.stats['recorded'] += 1
+
+    def _throttle_now(self) -> bool:
+        self._calls += 1
+        if self.throttle_every and self._calls % self.throttle_every == 0:
+            return True
+        return self.throttle_rate > 0 and self.random.random() < self.throttle_rate
+
+    def lookup(self, method: str, url: str, body) -> Tuple[Optional[Dict], float]:
+        """
+        取得重播的回應
+
+        Returns:
+            ({'status', 'headers', 'content'} 或 None（未錄製）, 延遲秒數)
+        """
+        with self.lock:
+            if self._throttle_now():
+                self.stats['injected_throttles'] += 1
+                delay = self.latency if isinstance(self.latency, (int, float)) else 0.0
+                return {'status': 400, 'headers': THROTTLE_HEADERS, 'content': json.dumps(THROTTLE_BODY)}, delay
+
+            interaction = None
+            for table, key in ((self._exact, request_key(method, url, body)),
+                               (self._loose, request_key(method, url, body, loose=True))):
+                queue = table.get(key)
+                if queue:
+                    interaction = queue.pop(0) if len(queue) > 1 else queue[0]
+                    break
+            if interaction is None:
+                self.stats['misses'] += 1
+                return None, 0.0
+            self.stats['replayed'] += 1
+        delay = interaction['elapsed'] if self.latency == 'recorded' else float(self.latency or 0)
+        return interaction, delay
+
+    # ---- 傳輸層 ----
+
+    def adapter(self, **kwargs) -> 'CassetteAdapter':
+        """GraphClient 使用的 requests adapter"""
+        return CassetteAdapter(self, **kwargs)
+
+    def async_transport(self, **kwargs):
+        """非同步引擎使用的 httpx transport"""
+        return _async_transport_class()(self, **kwargs)
+
+
+class CassetteAdapter(HTTPAdapter):
+    """record 模式轉送到真實連線並錄製；replay 模式直接回傳錄製的回應"""
+
+    def __init__(self, cassette: Cassette, **kwargs):
+        self.cassette = cassette
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if self.cassette.mode == 'record':
+            start = time.perf_counter()
+            response = super().send(request, **kwargs)
+            self.cassette.record(request.method, request.url, request.body, response.status_code,
+                                 response.headers, response.content, time.perf_counter() - start)
+            return response
+
+        interaction, delay = self.cassette.lookup(request.method, request.url, request.body)
+        if delay:
+            time.sleep(delay)
+        if interaction is None:
+            raise requests.ConnectionError(f"cassette 中沒有此請求: {request.method} {scrub(request.url)}",
+                                           request=request)
+        response = requests.Response()
+        response.status_code = interaction['status']
+        response.headers = CaseInsensitiveDict(interaction['headers'])
+        response._content = interaction['content'].encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+
+def _async_transport_class():
+    """延後匯入 httpx（只有非同步引擎需要）"""
+    import httpx
+
+    class CassetteAsyncTransport(httpx.AsyncBaseTransport):
+        def __init__(self, cassette: Cassette, **kwargs):
+            self.cassette = cassette
+            self.real = httpx.AsyncHTTPTransport(**kwargs) if cassette.mode == 'record' else None
+
+        async def handle_async_request(self, request):
+            import asyncio
+
+            body = request.content if request.method != 'GET' else None
+            if self.real is not None:
+                start = time.perf_counter()
+                response = await self.real.handle_async_request(request)
+                content = await response.aread()
+                self.cassette.record(request.method, str(request.url), body, response.status_code,
+                                     response.headers, content, time.perf_counter() - start)
+                headers = [(k, v) for k, v in response.headers.items() if k.lower() not in DROPPED_HEADERS]
+                return httpx.Response(response.status_code, headers=headers, content=content, request=request)
+
+            interaction, delay = self.cassette.lookup(request.method, str(request.url), body)
+            if delay:
+                await asyncio.sleep(delay)
+            if interaction is None:
+                raise httpx.ConnectError(f"cassette 中沒有此請求: {request.method} {scrub(str(request.url))}",
+                                         request=request)
+            return httpx.Response(interaction['status'], headers=interaction['headers'],
+                                  content=interaction['content'].encode('utf-8'), request=request)
+
+        async def aclose(self):
+            if self.real is not None:
+                await self.real.aclose()
+
+    return CassetteAsyncTransport
+
+
+_active = None
+_env_checked = False
+_active_lock = threading.Lock()
+
+
+def get_active() -> Optional[Cassette]:
+    """
+    目前使用中的 cassette
+
+    尚未以 activate 設定時，依環境變數 GRAPH_CASSETTE / GRAPH_CASSETTE_MODE /
+    GRAPH_CASSETTE_LATENCY / GRAPH_CASSETTE_THROTTLE_EVERY 建立（record 模式在結束時寫入檔案）
+    """
+    global _active, _env_checked
+    with _active_lock:
+        if _active is None and not _env_checked:
+            _env_checked = True
+            path = os.environ.get('GRAPH_CASSETTE')
+            if path:
+                latency = os.environ.get('GRAPH_CASSETTE_LATENCY', '0')
+                throttle_every = os.environ.get('GRAPH_CASSETTE_THROTTLE_EVERY')
+                _active = Cassette(path, mode=os.environ.get('GRAPH_CASSETTE_MODE', 'replay'),
+                                   latency=latency if latency == 'recorded' else float(latency),
+                                   throttle_every=int(throttle_every) if throttle_every else None)
+                if _active.mode == 'record':
+                    atexit.register(_active.save)
+        return _active
+
+
+def activate(cassette: Optional[Cassette]):
+    """設定（或以 None 取消）所有 Graph API 請求使用的 cassette"""
+    global _active, _env_checked
+    from utils import graph_client
+
+    with _active_lock:
+        _active = cassette
+        _env_checked = True
+    # 共用用戶端在下次 get_client 時以新的 cassette 重新建立
+    graph_client.set_client(None)
+
+
+@contextmanager
+def use(path: str, mode: str = 'replay', **kwargs):
+    """在 with 區塊內錄製或重播（record 模式在離開時寫入檔案）"""
+    cassette = Cassette(path, mode=mode, **kwargs)
+    activate(cassette)
+    try:
+        yield cassette
+    finally:
+        activate(None)
+        if mode == 'record':
+            cassette.save()
@@ -6,8 +6,15 @@ FACEBOOK_CONFIG = {
     'api_version': 'v23.0'
 }
 
+# Graph API 端點（測試時可在 config dict 以 'base_url' 指向本機 Fake 伺服器）
+GRAPH_API_BASE = 'https://graph.facebook.com'
+
 DB_PATH = 'data/engagement_data.db'
 
+# post_insights_snapshots 只在指標有變動時新增一筆，未變動的日子只更新該筆的 last_checked
+# （讀取端以 post_insights_daily view 還原為每日的階梯函數）
+SNAPSHOT_CHANGES_ONLY = False
+
 # Page Level Metrics
 PAGE_METRICS = [
     'page_impressions_unique',
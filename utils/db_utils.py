@@ -1,21 +1,66 @@
 # db_utils.py
+import itertools
+import os
 import sqlite3
+from pathlib import Path
 from utils.config import DB_PATH
 
+# BatchWriter 預設每累積多少列寫入一次
+BATCH_SIZE = 500
+
+# 等待其他連線釋放寫入鎖的秒數（取代立即回報 database is locked）
+BUSY_TIMEOUT_SECONDS = 30
+
+# 每個連線的設定（journal_mode=WAL 另外設定，且只用於可寫入的連線）
+CONNECTION_PRAGMAS = [
+    ('synchronous', 'NORMAL'),         # WAL 下只在 checkpoint 時 fsync
+    ('mmap_size', 256 * 1024 * 1024),
+    ('cache_size', -64 * 1024),        # 負值單位為 KiB（64 MB）
+    ('temp_store', 'MEMORY'),
+]
+
+# 本行程已檢查過 schema 版本的資料庫
+_initialized_paths = set()
+
+def connect(path=None, readonly=False, row_factory=True):
+    """
+    開啟 SQLite 連線（各模組的 get_connection 都透過此函式）
+
+    可寫入的連線使用 WAL：報表讀取與 pipeline 寫入互不阻擋，寫入之間則等待 busy timeout
+
+    Args:
+        path: 資料庫路徑（預設 DB_PATH）
+        readonly: 以 mode=ro 開啟，供報表與匯出等只讀取的使用者
+        row_factory: 使用 sqlite3.Row
+    """
+    path = path or DB_PATH
+    if readonly:
+        conn = sqlite3.connect(f"{Path(path).absolute().as_uri()}?mode=ro", uri=True, timeout=BUSY_TIMEOUT_SECONDS)
+    else:
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS)
+        conn.execute("PRAGMA journal_mode = WAL")
+    for name, value in CONNECTION_PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    if row_factory:
+        conn.row_factory = sqlite3.Row
+    return conn
+
 def get_db_connection():
     try:
         # Ensure data directory exists
-        import os
         db_dir = os.path.dirname(DB_PATH)
         if db_dir and not os.path.exists(db_dir):
             os.makedirs(db_dir)
 
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
+        path = os.path.abspath(DB_PATH)
+        existed = os.path.exists(path)
+        conn = connect(DB_PATH)
 
-        # Initialize database schema if needed
-        from utils.setup_database import create_tables
-        create_tables(conn)
+        # Apply pending schema migrations (checked once per process and database file)
+        if not existed or path not in _initialized_paths:
+            from utils import migrations
+            migrations.migrate(conn)
+            _initialized_paths.add(path)
 
         return conn
     except sqlite3.Error as e:
@@ -36,124 +81,285 @@ def upsert_page_info(conn, page_id, page_name):
     except sqlite3.Error as e:
         print(f"Error upserting page info: {e}")
 
-def upsert_page_daily_metrics(conn, page_id, date, metrics_data):
+def page_daily_metrics_statement(page_id, date, metrics_data):
+    """upsert_page_daily_metrics 的 (sql, values)，供 BatchWriter 以 executemany 寫入"""
+    columns = [
+        'page_id', 'date', 'fan_count', 'followers_count',
+        'page_impressions_unique', 'page_post_engagements', 'page_video_views',
+        'reactions_like', 'reactions_love', 'reactions_wow',
+        'reactions_haha', 'reactions_sorry', 'reactions_anger', 'reactions_total'
+    ]
+
+    values = (page_id, date) + tuple(metrics_data.get(col) for col in columns[2:])
+
+    placeholders = ', '.join(['?'] * len(columns))
+    columns_str = ', '.join(columns)
+
+    # 未提供的欄位保留既有值（例如回補舊日期時不覆寫 fan_count）
+    update_clause = ', '.join([f"{col}=COALESCE(excluded.{col}, {col})" for col in columns if col not in ('page_id', 'date')])
+
+    sql = f"""
+        INSERT INTO page_daily_metrics ({columns_str})
+        VALUES ({placeholders})
+        ON CONFLICT(page_id, date) DO UPDATE SET
+        {update_clause};
+    """
+    return sql, values
+
+def upsert_page_daily_metrics(conn, page_id, date, metrics_data, commit=True):
+    try:
+        conn.execute(*page_daily_metrics_statement(page_id, date, metrics_data))
+        if commit:
+            conn.commit()
+        return True
+    except sqlite3.Error as e:
+        print(f"Error upserting page metrics: {e}")
+        return False
+
+POST_UPSERT_SQL = """
+    INSERT INTO posts (
+        post_id, page_id, created_time, message, type, permalink_url
+    ) VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(post_id) DO UPDATE SET
+    message = excluded.message,
+    type = excluded.type,
+    permalink_url = excluded.permalink_url,
+    is_deleted = 0;
+"""
+
+def post_statement(post_data):
+    """upsert_post 的 (sql, values)"""
+    return POST_UPSERT_SQL, (
+        post_data['id'],
+        post_data['page_id'],
+        post_data['created_time'],
+        post_data.get('message'),
+        post_data.get('type'), # Might be None if not available or deprecated logic isn't used
+        post_data.get('permalink_url')
+    )
+
+def upsert_post(conn, post_data, commit=True):
+    try:
+        conn.execute(*post_statement(post_data))
+        if commit:
+            conn.commit()
+        return True
+    except sqlite3.Error as e:
+        print(f"Error upserting post: {e}")
+        return False
+
+SNAPSHOT_METRIC_COLUMNS = [
+    'likes_count', 'comments_count', 'shares_count',
+    'post_clicks', 'post_impressions_unique',
+    # 移除已棄用的欄位: post_impressions, post_impressions_organic, post_impressions_paid
+    'post_video_views', 'post_video_views_organic', 'post_video_views_paid',
+    'post_reactions_like_total', 'post_reactions_love_total',
+    'post_reactions_wow_total', 'post_reactions_haha_total',
+    'post_reactions_sorry_total', 'post_reactions_anger_total'
+]
+
+# post_insights_snapshots 為 view：INSTEAD OF INSERT trigger 配發 post_key 並寫入 post_insights_store，
+# 相同 (post_id, fetch_date) 已存在時覆寫指標
+POST_INSIGHTS_UPSERT_SQL = f"""
+    INSERT INTO post_insights_snapshots (post_id, fetch_date, {', '.join(SNAPSHOT_METRIC_COLUMNS)})
+    VALUES ({', '.join(['?'] * (len(SNAPSHOT_METRIC_COLUMNS) + 2))});
+"""
+
+def post_insights_statement(post_id, fetch_date, insights_data, basic_stats=None):
+    """upsert_post_insights（完整寫入）的 (sql, values)"""
+    # Merge basic stats (reactions, comments, shares from post object) with insights
+    if basic_stats:
+        insights_data.update(basic_stats)
+    # 未提供的指標預設為 0
+    return POST_INSIGHTS_UPSERT_SQL, (post_id, fetch_date) + tuple(insights_data.get(col, 0) for col in SNAPSHOT_METRIC_COLUMNS)
+
+def upsert_post_insights(conn, post_id, fetch_date, insights_data, basic_stats=None, changes_only=None, commit=True):
+    """
+    寫入貼文 insights snapshot
+
+    changes_only（預設依 config.SNAPSHOT_CHANGES_ONLY）：與 fetch_date 之前最新的一筆比較，
+    指標都沒變時不新增列，只把該筆的 last_checked 延到 fetch_date
+
+    post_latest_metrics（最新值與各指標最大值）由資料庫 trigger 在同一個交易中更新
+    """
     try:
         cursor = conn.cursor()
-        
-        # Prepare columns and values dynamically based on Schema
-        # We need to extract specific keys from metrics_data
-        
-        columns = [
-            'page_id', 'date', 'fan_count', 'followers_count',
-            'page_impressions_unique', 'page_post_engagements', 'page_video_views',
-            'reactions_like', 'reactions_love', 'reactions_wow',
-            'reactions_haha', 'reactions_sorry', 'reactions_anger', 'reactions_total'
-        ]
-        
-        values = [
-            page_id,
-            date,
-            metrics_data.get('fan_count'),
-            metrics_data.get('followers_count'),
-            metrics_data.get('page_impressions_unique'),
-            metrics_data.get('page_post_engagements'),
-            metrics_data.get('page_video_views'),
-            metrics_data.get('reactions_like'),
-            metrics_data.get('reactions_love'),
-            metrics_data.get('reactions_wow'),
-            metrics_data.get('reactions_haha'),
-            metrics_data.get('reactions_sorry'),
-            metrics_data.get('reactions_anger'),
-            metrics_data.get('reactions_total')
-        ]
-        
-        placeholders = ', '.join(['?'] * len(columns))
-        columns_str = ', '.join(columns)
-        
-        update_clause = ', '.join([f"{col}=excluded.{col}" for col in columns if col not in ('page_id', 'date')])
-        
-        sql = f"""
-            INSERT INTO page_daily_metrics ({columns_str})
-            VALUES ({placeholders})
-            ON CONFLICT(page_id, date) DO UPDATE SET
-            {update_clause};
-        """
-        
+        sql, values = post_insights_statement(post_id, fetch_date, insights_data, basic_stats)
+
+        if changes_only is None:
+            from utils import config
+            changes_only = config.SNAPSHOT_CHANGES_ONLY
+        if changes_only:
+            cursor.execute(f"""
+                SELECT fetch_date, {', '.join(SNAPSHOT_METRIC_COLUMNS)}
+                FROM post_insights_snapshots
+                WHERE post_id = ? AND fetch_date <= ?
+                ORDER BY fetch_date DESC LIMIT 1
+            """, (post_id, fetch_date))
+            latest = cursor.fetchone()
+            if latest and latest[0] != fetch_date and tuple(latest[1:]) == values[2:]:
+                # 未變動：只記錄檢查日期
+                cursor.execute("""
+                    UPDATE post_insights_snapshots
+                    SET last_checked = MAX(COALESCE(last_checked, fetch_date), ?)
+                    WHERE post_id = ? AND fetch_date = ?
+                """, (fetch_date, post_id, latest[0]))
+                if commit:
+                    conn.commit()
+                return True
+
         cursor.execute(sql, values)
-        conn.commit()
+        if commit:
+            conn.commit()
         return True
     except sqlite3.Error as e:
-        print(f"Error upserting page metrics: {e}")
+        print(f"Error upserting post insights: {e}")
         return False
 
-def upsert_post(conn, post_data):
+def get_post_watermark(conn, page_id):
+    """取得專頁的貼文列表水位，尚未建立時回傳 None"""
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT page_id, max_created_time, last_listed_at, last_reconciled_at
+            FROM post_watermarks WHERE page_id = ?
+        """, (page_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip(['page_id', 'max_created_time', 'last_listed_at', 'last_reconciled_at'], row))
+    except sqlite3.Error as e:
+        print(f"Error reading post watermark: {e}")
+        return None
+
+def update_post_watermark(conn, page_id, listed_at=None, reconciled_at=None):
+    """
+    以 posts 表中該專頁最新的 created_time 更新水位
+    listed_at / reconciled_at 為 None 時保留原值
+    """
     try:
         cursor = conn.cursor()
         cursor.execute("""
-            INSERT INTO posts (
-                post_id, page_id, created_time, message, type, permalink_url
-            ) VALUES (?, ?, ?, ?, ?, ?)
-            ON CONFLICT(post_id) DO UPDATE SET
-            message = excluded.message,
-            type = excluded.type,
-            permalink_url = excluded.permalink_url;
-        """, (
-            post_data['id'],
-            post_data['page_id'],
-            post_data['created_time'],
-            post_data.get('message'),
-            post_data.get('type'), # Might be None if not available or deprecated logic isn't used
-            post_data.get('permalink_url')
-        ))
+            INSERT INTO post_watermarks (page_id, max_created_time, last_listed_at, last_reconciled_at)
+            VALUES (?, (SELECT MAX(created_time) FROM posts WHERE page_id = ?), ?, ?)
+            ON CONFLICT(page_id) DO UPDATE SET
+            max_created_time = excluded.max_created_time,
+            last_listed_at = COALESCE(excluded.last_listed_at, last_listed_at),
+            last_reconciled_at = COALESCE(excluded.last_reconciled_at, last_reconciled_at);
+        """, (page_id, page_id, listed_at, reconciled_at))
         conn.commit()
         return True
     except sqlite3.Error as e:
-        print(f"Error upserting post: {e}")
+        print(f"Error updating post watermark: {e}")
         return False
 
-def upsert_post_insights(conn, post_id, fetch_date, insights_data, basic_stats=None):
+def mark_deleted_posts(conn, page_id, seen_post_ids, since_date, until_date):
+    """
+    對帳：created_time 落在 [since_date, until_date] 但未出現在列表中的貼文標記為已刪除
+    （再次出現在列表中的貼文由 upsert_post 取消標記）
+
+    Returns:
+        新標記為已刪除的貼文數
+    """
     try:
         cursor = conn.cursor()
-        
-        # Merge basic stats (reactions, comments, shares from post object) with insights
-        if basic_stats:
-            insights_data.update(basic_stats)
-            
-        columns = [
-            'post_id', 'fetch_date',
-            'likes_count', 'comments_count', 'shares_count',
-            'post_clicks', 'post_impressions_unique',
-            # 移除已棄用的欄位: post_impressions, post_impressions_organic, post_impressions_paid
-            'post_video_views', 'post_video_views_organic', 'post_video_views_paid',
-            'post_reactions_like_total', 'post_reactions_love_total',
-            'post_reactions_wow_total', 'post_reactions_haha_total',
-            'post_reactions_sorry_total', 'post_reactions_anger_total'
-        ]
-        
-        # Prepare values dict with defaults
-        vals = {col: insights_data.get(col, 0) for col in columns if col not in ('post_id', 'fetch_date')}
-        vals['post_id'] = post_id
-        vals['fetch_date'] = fetch_date
-        
-        # Construct SQL
-        placeholders = ', '.join(['?'] * len(columns))
-        columns_str = ', '.join(columns)
-        
-        update_clause = ', '.join([f"{col}=excluded.{col}" for col in columns if col not in ('post_id', 'fetch_date')])
-        
-        sql = f"""
-            INSERT INTO post_insights_snapshots ({columns_str})
-            VALUES ({placeholders})
-            ON CONFLICT(post_id, fetch_date) DO UPDATE SET
-            {update_clause};
-        """
-        
-        # Create tuple in correct order
-        values_tuple = tuple(vals[col] for col in columns)
-        
-        cursor.execute(sql, values_tuple)
+        cursor.execute("""
+            SELECT post_id, COALESCE(is_deleted, 0) FROM posts
+            WHERE page_id = ? AND created_date BETWEEN ? AND ?
+        """, (page_id, since_date, until_date))
+        rows = cursor.fetchall()
+
+        seen = set(seen_post_ids)
+        deleted = [(row[0],) for row in rows if row[0] not in seen and not row[1]]
+
+        cursor.executemany("UPDATE posts SET is_deleted = 1 WHERE post_id = ?", deleted)
         conn.commit()
-        return True
+        return len(deleted)
     except sqlite3.Error as e:
-        print(f"Error upserting post insights: {e}")
+        print(f"Error marking deleted posts: {e}")
+        return 0
+
+class BatchWriter:
+    """
+    批次寫入：緩衝 upsert 的列，每 flush_every 列（或離開 with 區塊時）在單一交易中以 executemany 寫入，
+    取代每列一次 commit（每次 commit 都是一次 fsync）
+
+    用法:
+        with db_utils.BatchWriter(conn) as writer:
+            for post in posts:
+                writer.upsert_post(post)
+        print(writer.stats)
+
+    整批寫入失敗時 rollback 後逐列重試，只略過有問題的列（stats['failed']）
+    """
+
+    def __init__(self, conn, flush_every=BATCH_SIZE, changes_only=None):
+        if changes_only is None:
+            from utils import config
+            changes_only = config.SNAPSHOT_CHANGES_ONLY
+        self.conn = conn
+        self.flush_every = flush_every
+        self.changes_only = changes_only
+        self.rows = []
+        self.stats = {'written': 0, 'failed': 0, 'flushes': 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 發生例外時仍寫入已取得的資料
+        self.flush()
         return False
+
+    def add(self, sql, values):
+        """加入一列；sql 也可以是 fn(conn, *values, commit=False) -> bool（需要先查詢的寫入）"""
+        self.rows.append((sql, values))
+        if len(self.rows) >= self.flush_every:
+            self.flush()
+
+    def upsert_post(self, post_data):
+        self.add(*post_statement(post_data))
+
+    def upsert_page_daily_metrics(self, page_id, date, metrics_data):
+        self.add(*page_daily_metrics_statement(page_id, date, metrics_data))
+
+    def upsert_post_insights(self, post_id, fetch_date, insights_data, basic_stats=None):
+        if self.changes_only:
+            # 需要與最新的 snapshot 比較，寫入時逐列執行（仍在同一個交易中）
+            self.add(_upsert_post_insights_changes_only, (post_id, fetch_date, insights_data, basic_stats))
+        else:
+            self.add(*post_insights_statement(post_id, fetch_date, insights_data, basic_stats))
+
+    def _execute(self, sql, group):
+        if isinstance(sql, str):
+            self.conn.executemany(sql, group)
+            return len(group)
+        return sum(1 for values in group if sql(self.conn, *values, commit=False))
+
+    def flush(self):
+        """寫入目前緩衝的列並 commit，回傳成功寫入的列數"""
+        rows, self.rows = self.rows, []
+        if not rows:
+            return 0
+        # 相鄰且相同 SQL 的列合併為一次 executemany
+        groups = [(sql, [values for _, values in items]) for sql, items in itertools.groupby(rows, key=lambda row: row[0])]
+        try:
+            written = sum(self._execute(sql, group) for sql, group in groups)
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            print(f"Error writing batch of {len(rows)} rows ({e}), retrying row by row")
+            written = 0
+            for sql, values in rows:
+                try:
+                    written += self._execute(sql, [values])
+                except sqlite3.Error as row_error:
+                    print(f"Error writing row: {row_error}")
+            self.conn.commit()
+        self.stats['written'] += written
+        self.stats['failed'] += len(rows) - written
+        self.stats['flushes'] += 1
+        return written
+
+def _upsert_post_insights_changes_only(conn, post_id, fetch_date, insights_data, basic_stats=None, commit=True):
+    return upsert_post_insights(conn, post_id, fetch_date, insights_data, basic_stats, changes_only=True, commit=commit)
@@ -0,0 +1,182 @@
+"""
+Graph API 批次請求傳輸層
+將多個 GET 子請求打包成 batch 請求（每批最多 50 個），
+再把回應拆回 db_utils.upsert_post_insights 使用的 insights / basic_stats 格式
+"""
+
+import json
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import requests
+
+from utils import rate_limiter
+from utils.graph_client import get_client, graph_post
+from utils.config import GRAPH_API_BASE
+
+# Graph API 單一 batch 的子請求上限
+BATCH_LIMIT = 50
+
+# 每則貼文需要的子請求數（insights、reactions、comments、shares）
+REQUESTS_PER_POST = 4
+
+# 單一 batch 可容納的貼文數
+POSTS_PER_BATCH = BATCH_LIMIT // REQUESTS_PER_POST
+
+
+def graph_base_url(config: Dict) -> str:
+    """取得含版本號的 Graph API 網址（config 可用 'base_url' 覆寫主機）"""
+    return f"{config.get('base_url', GRAPH_API_BASE)}/{config['api_version']}"
+
+
+def build_relative_url(path: str, params: Optional[Dict] = None) -> str:
+    """組出 batch 子請求的 relative_url"""
+    if not params:
+        return path
+    return f"{path}?{urlencode(params)}"
+
+
+def post_refresh_requests(post_id: str, metrics: List[str]) -> List[Dict]:
+    """單一貼文更新所需的 4 個子請求（順序與 parse_post_refresh 對應）"""
+    return [
+        {'method': 'GET', 'relative_url': build_relative_url(f"{post_id}/insights", {'metric': ','.join(metrics)})},
+        {'method': 'GET', 'relative_url': build_relative_url(f"{post_id}/reactions", {'summary': 'total_count', 'limit': 0})},
+        {'method': 'GET', 'relative_url': build_relative_url(f"{post_id}/comments", {'summary': 'total_count', 'limit': 0})},
+        {'method': 'GET', 'relative_url': build_relative_url(post_id, {'fields': 'shares'})},
+    ]
+
+
+def parse_batch_item(item: Optional[Dict]) -> Optional[Dict]:
+    """
+    解析單一子請求回應
+
+    Returns:
+        {'code': HTTP 狀態碼, 'body': 解析後的 JSON}；子請求逾時（null）時回傳 None
+    """
+    if item is None:
+        return None
+    try:
+        body = json.loads(item.get('body') or '{}')
+    except (TypeError, ValueError):
+        body = {}
+    return {'code': item.get('code', 0), 'body': body}
+
+
+def execute_batch(config: Dict, sub_requests: List[Dict], timeout: int = 60, retries: int = 1) -> List[Optional[Dict]]:
+    """
+    以 batch 請求執行子請求，依 BATCH_LIMIT 自動分批
+
+    逾時回傳 null 或被節流 (4/17/32/613) 的子請求會在下一輪重送（最多 retries 次）。
+
+    Args:
+        config: 含 access_token / api_version 的設定
+        sub_requests: [{'method': 'GET', 'relative_url': ...}, ...]
+        timeout: 每個 batch HTTP 請求的逾時秒數
+        retries: null 子請求的重送次數
+
+    Returns:
+        與 sub_requests 對齊的解析結果列表（失敗者為 None）
+    """
+    results: List[Optional[Dict]] = [None] * len(sub_requests)
+    pending = list(range(len(sub_requests)))
+
+    # 啟用回應快取時，未過期的 GET 子請求不再送出（見 utils.response_cache）
+    cache = get_client().cache
+    base_url = graph_base_url(config)
+    if cache is not None:
+        for i, sub_request in enumerate(sub_requests):
+            if sub_request.get('method', 'GET') == 'GET':
+                entry = cache.get(f"{base_url}/{sub_request['relative_url']}")
+                if entry is not None:
+                    results[i] = parse_batch_item({'code': entry['status'], 'body': entry['content']})
+        pending = [i for i in pending if results[i] is None]
+
+    for _ in range(retries + 1):
+        if not pending:
+            break
+        still_pending = []
+        for start in range(0, len(pending), BATCH_LIMIT):
+            indexes = pending[start:start + BATCH_LIMIT]
+            chunk = [sub_requests[i] for i in indexes]
+            try:
+                # 每個子請求都計入 Graph API 配額
+                response = graph_post(f"{base_url}/", data={
+                    'access_token': config['access_token'],
+                    'batch': json.dumps(chunk),
+                    'include_headers': 'false'
+                }, timeout=timeout, cost=len(chunk))
+                response.raise_for_status()
+                items = response.json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"  ✗ Batch 請求失敗 ({len(chunk)} 個子請求): {e}")
+                still_pending.extend(indexes)
+                continue
+
+            for index, item in zip(indexes, items):
+                parsed = parse_batch_item(item)
+                if parsed is None:
+                    still_pending.append(index)
+                elif rate_limiter.get_limiter().observe(parsed['code'], None, parsed['body']):
+                    # 子請求被節流：限制器已退避，下一輪重送
+                    still_pending.append(index)
+                else:
+                    results[index] = parsed
+                    if cache is not None and sub_requests[index].get('method', 'GET') == 'GET':
+                        cache.put(f"{base_url}/{sub_requests[index]['relative_url']}", None,
+                                  parsed['code'], None, item.get('body') or '')
+        pending = still_pending
+
+    return results
+
+
+def parse_insights(body: Dict) -> Dict:
+    """將 insights 回應轉為 {metric_name: value}（與 main.fetch_post_insights 相同規則）"""
+    insights_dict = {}
+    for metric_data in body.get('data', []):
+        values = metric_data.get('values', [])
+        if values:
+            insights_dict[metric_data.get('name')] = values[0].get('value', 0)
+    return insights_dict
+
+
+def parse_post_refresh(results: List[Optional[Dict]]) -> Tuple[Dict, Dict]:
+    """
+    將單一貼文的 4 個子請求結果拆成 (insights, basic_stats)
+
+    只有成功的子請求會寫入 basic_stats，與逐筆請求時 `if resp.ok` 的行為一致
+    """
+    insights_result, reactions_result, comments_result, shares_result = results
+
+    insights = {}
+    if insights_result and insights_result['code'] == 200:
+        insights = parse_insights(insights_result['body'])
+
+    basic_stats = {}
+    if reactions_result and reactions_result['code'] == 200:
+        basic_stats['likes_count'] = reactions_result['body'].get('summary', {}).get('total_count', 0)
+    if comments_result and comments_result['code'] == 200:
+        basic_stats['comments_count'] = comments_result['body'].get('summary', {}).get('total_count', 0)
+    if shares_result and shares_result['code'] == 200:
+        basic_stats['shares_count'] = shares_result['body'].get('shares', {}).get('count', 0)
+
+    return insights, basic_stats
+
+
+def fetch_posts_refresh(config: Dict, post_ids: List[str], metrics: List[str]) -> Dict[str, Tuple[Dict, Dict]]:
+    """
+    以 batch 請求取得多則貼文的 insights 與基本統計
+
+    Returns:
+        {post_id: (insights, basic_stats)}，可直接傳入 db_utils.upsert_post_insights
+    """
+    sub_requests = []
+    for post_id in post_ids:
+        sub_requests.extend(post_refresh_requests(post_id, metrics))
+
+    results = execute_batch(config, sub_requests)
+
+    refreshed = {}
+    for i, post_id in enumerate(post_ids):
+        offset = i * REQUESTS_PER_POST
+        refreshed[post_id] = parse_post_refresh(results[offset:offset + REQUESTS_PER_POST])
+    return refreshed
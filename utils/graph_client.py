@@ -0,0 +1,189 @@
+"""
+共用 Graph API HTTP 用戶端
+以單一 requests.Session 維持 keep-alive 連線池，提供預設逾時、
+冪等請求的指數退避重試與 gzip 壓縮，並統計連線重用率與重試率。
+所有請求都經過 rate_limiter 的共用限制器。
+使用 cassette（utils.cassette）時改以錄製 / 重播的 adapter 送出請求；
+啟用回應快取（utils.response_cache）時，未過期的 GET 回應不再送出請求。
+"""
+
+import threading
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils import cassette as cassette_module, rate_limiter, response_cache
+
+# 預設逾時（連線, 讀取）秒數
+DEFAULT_TIMEOUT = (5, 30)
+
+# 連線池大小（同時連往同一主機的連線數）
+POOL_SIZE = 20
+
+# 連線錯誤與 5xx 的重試次數與退避係數（0.5, 1, 2 秒...）
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+RETRY_STATUS = (500, 502, 503, 504)
+
+
+class CountingRetry(Retry):
+    """會累計重試次數的 urllib3 Retry"""
+
+    counter = None
+
+    def new(self, **kwargs):
+        retry = super().new(**kwargs)
+        retry.counter = self.counter
+        return retry
+
+    def increment(self, *args, **kwargs):
+        if self.counter is not None:
+            self.counter.add('retries')
+        return super().increment(*args, **kwargs)
+
+
+class _Counter:
+    def __init__(self):
+        self.values = {'requests': 0, 'retries': 0}
+        self.lock = threading.Lock()
+
+    def add(self, key: str, amount: int = 1):
+        with self.lock:
+            self.values[key] += amount
+
+
+class GraphClient:
+    """共用連線池的 Graph API 用戶端"""
+
+    def __init__(self, pool_size: int = POOL_SIZE, max_retries: int = MAX_RETRIES,
+                 backoff_factor: float = BACKOFF_FACTOR, timeout=DEFAULT_TIMEOUT,
+                 limiter: Optional[rate_limiter.GraphRateLimiter] = None,
+                 cassette: Optional[cassette_module.Cassette] = None,
+                 cache: Optional[response_cache.ResponseCache] = None):
+        """
+        Args:
+            cassette: 錄製或重播請求的 cassette（None 時使用 cassette.get_active()）
+            cache: GET 回應快取（None 時使用 response_cache.get_cache()）
+        """
+        self.timeout = timeout
+        self.limiter = limiter
+        self.counter = _Counter()
+
+        retry = CountingRetry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=frozenset(['GET', 'HEAD', 'OPTIONS']),
+            raise_on_status=False,
+            respect_retry_after_header=True,
+        )
+        retry.counter = self.counter
+
+        self.cache = cache or response_cache.get_cache()
+        self.cassette = cassette or cassette_module.get_active()
+        if self.cassette:
+            self.adapter = self.cassette.adapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        else:
+            self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+
+    def request(self, method: str, url: str, cost: float = 1, **kwargs) -> requests.Response:
+        """經過限制器與連線池送出請求"""
+        use_cache = self.cache is not None and method == 'GET'
+        if use_cache:
+            entry = self.cache.get(url, kwargs.get('params'))
+            if entry is not None:
+                return response_cache.to_response(entry, url)
+
+        kwargs.setdefault('timeout', self.timeout)
+        self.counter.add('requests')
+        response = rate_limiter.throttled_request(method, url, cost=cost, limiter=self.limiter,
+                                                  session=self.session, **kwargs)
+        if use_cache:
+            self.cache.put(url, kwargs.get('params'), response.status_code, response.headers, response.text)
+        return response
+
+    def get(self, url: str, params: Optional[Dict] = None, **kwargs) -> requests.Response:
+        return self.request('GET', url, params=params, **kwargs)
+
+    def post(self, url: str, data: Optional[Dict] = None, **kwargs) -> requests.Response:
+        return self.request('POST', url, data=data, **kwargs)
+
+    def stats(self) -> Dict:
+        """
+        連線與重試統計
+
+        Returns:
+            {'requests', 'connections', 'reused', 'reuse_rate', 'retries', 'retry_rate'}
+        """
+        connections = 0
+        http_requests = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            http_requests += pool.num_requests
+
+        with self.counter.lock:
+            calls = self.counter.values['requests']
+            retries = self.counter.values['retries']
+
+        reused = max(0, http_requests - connections)
+        return {
+            'requests': calls,
+            'connections': connections,
+            'reused': reused,
+            'reuse_rate': reused / http_requests if http_requests else 0.0,
+            'retries': retries,
+            'retry_rate': retries / calls if calls else 0.0,
+        }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"  HTTP 請求: {stats['requests']} / 新建連線: {stats['connections']} "
+              f"(重用率 {stats['reuse_rate']:.0%}) / 重試: {stats['retries']} "
+              f"(重試率 {stats['retry_rate']:.1%})")
+        if self.cache is not None:
+            self.cache.print_stats()
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_client() -> GraphClient:
+    """取得所有收集器共用的用戶端"""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = GraphClient()
+        return _default_client
+
+
+def set_client(client: Optional[GraphClient]):
+    """替換共用用戶端（傳入 None 時下次 get_client 會重新建立）"""
+    global _default_client
+    with _default_lock:
+        if _default_client is not None and _default_client is not client:
+            _default_client.close()
+        _default_client = client
+
+
+def graph_get(url: str, params: Optional[Dict] = None, **kwargs) -> requests.Response:
+    """以共用用戶端送出 GET 請求"""
+    return get_client().get(url, params=params, **kwargs)
+
+
+def graph_post(url: str, data: Optional[Dict] = None, **kwargs) -> requests.Response:
+    """以共用用戶端送出 POST 請求"""
+    return get_client().post(url, data=data, **kwargs)
@@ -0,0 +1,452 @@
+"""
+資料庫 schema 版本管理
+schema_version 表記錄已套用的遷移；migrate() 依版本順序只執行尚未套用的遷移，每個遷移一個交易。
+schema 已是最新時只需一次查詢，因此連線時的設定成本接近零。
+
+新增資料表 / 欄位 / 索引時在 MIGRATIONS 末尾加入新版本，不要修改已發布的遷移。
+
+用法:
+    python -m utils.migrations          # 套用待執行的遷移並顯示目前版本
+"""
+
+from typing import List
+
+from utils import setup_database
+
+
+def create_daily_view(conn):
+    # post_insights_daily - 把 snapshot 展開為每日一列（fetch_date 到 last_checked 之間數值不變）
+    # 只儲存變動時（SNAPSHOT_CHANGES_ONLY）讀取端仍可看到與每日完整寫入相同的列；carried = 1 表示沿用前一筆
+    conn.execute("""
+        CREATE VIEW IF NOT EXISTS post_insights_daily AS
+        WITH RECURSIVE days(id, day) AS (
+            SELECT id, fetch_date FROM post_insights_snapshots
+            UNION ALL
+            SELECT d.id, date(d.day, '+1 day')
+            FROM days d JOIN post_insights_snapshots s ON s.id = d.id
+            WHERE d.day < s.last_checked
+        )
+        SELECT s.post_id, d.day AS fetch_date,
+               s.likes_count, s.comments_count, s.shares_count,
+               s.post_clicks, s.post_impressions_unique,
+               s.post_video_views, s.post_video_views_organic, s.post_video_views_paid,
+               s.post_reactions_like_total, s.post_reactions_love_total,
+               s.post_reactions_wow_total, s.post_reactions_haha_total,
+               s.post_reactions_sorry_total, s.post_reactions_anger_total,
+               d.day != s.fetch_date AS carried
+        FROM days d JOIN post_insights_snapshots s ON s.id = d.id;
+    """)
+
+
+def create_pipeline_runs(conn):
+    # pipeline_runs - 每次執行的結果（run_pipeline.log_pipeline_run 寫入，匯出到 pipeline_logs 分頁）
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pipeline_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_date TEXT NOT NULL,
+            run_time TEXT NOT NULL,
+            status TEXT NOT NULL,
+            posts_collected INTEGER,
+            posts_analyzed INTEGER,
+            sheets_exported INTEGER,
+            error_message TEXT,
+            duration_seconds REAL
+        )
+    """)
+
+
+def add_ad_potential_columns(conn):
+    # 投廣潛力分數（analytics.ad_predictor.update_all_ad_potentials 寫入）
+    add_columns(conn, 'posts_classification', [('ad_potential_score', 'REAL'), ('ad_recommendation', 'TEXT')])
+
+
+# created_time 為 Graph API 格式 '2025-12-11T01:30:00+0000'（偏移也可能是 '+00:00' 或省略）
+_OFFSET_SECONDS = """
+    CASE WHEN substr(created_time, 20, 1) IN ('+', '-') THEN
+        (CASE substr(created_time, 20, 1) WHEN '-' THEN -1 ELSE 1 END) *
+        (CAST(substr(created_time, 21, 2) AS INTEGER) * 3600 +
+         CAST(substr(replace(substr(created_time, 21), ':', ''), 3, 2) AS INTEGER) * 60)
+    ELSE 0 END
+"""
+
+# ISO 週以 UTC 日期計算（與其他以 UTC 日期分組的報表一致）；SQLite 3.40 的 strftime 沒有 %V / %G，
+# 改以同週的星期四推算：ISO 年 = 星期四所在年份，週數 = (星期四的年內序號 - 1) / 7 + 1
+_THURSDAY = "date(created_date, printf('%+d days', 3 - (strftime('%w', created_date) + 6) % 7))"
+
+POST_TIMESTAMP_COLUMNS = [
+    ('created_ts', 'INTEGER'),           # UTC epoch 秒
+    ('created_date', 'TEXT'),            # UTC 日期 YYYY-MM-DD
+    ('created_local_date', 'TEXT'),      # GMT+8 日期
+    ('created_local_hour', 'INTEGER'),   # GMT+8 小時 0-23
+    ('created_week', 'TEXT'),            # ISO 週 YYYY-Www
+]
+
+
+def post_timestamp_updates(where: str) -> List[str]:
+    """由 created_time 計算正規化時間欄位的 UPDATE（先算 created_ts，其餘欄位再由它推導）"""
+    return [
+        f"UPDATE posts SET created_ts = CAST(strftime('%s', substr(created_time, 1, 19)) AS INTEGER) - {_OFFSET_SECONDS} WHERE {where}",
+        f"""UPDATE posts SET
+                created_date = date(created_ts, 'unixepoch'),
+                created_local_date = date(created_ts + 28800, 'unixepoch'),
+                created_local_hour = CAST(strftime('%H', created_ts + 28800, 'unixepoch') AS INTEGER)
+            WHERE {where}""",
+        f"""UPDATE posts SET created_week =
+                strftime('%Y', {_THURSDAY}) || '-W' || printf('%02d', (strftime('%j', {_THURSDAY}) - 1) / 7 + 1)
+            WHERE {where}""",
+    ]
+
+
+def add_post_timestamp_columns(conn):
+    # 日期篩選 / 分組改用預先計算並建立索引的欄位，不必每次查詢逐列解析 created_time
+    add_columns(conn, 'posts', POST_TIMESTAMP_COLUMNS)
+    for statement in post_timestamp_updates('created_time IS NOT NULL'):
+        conn.execute(statement)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_created_ts ON posts(created_ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_created_date ON posts(created_date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_created_local_date ON posts(created_local_date)")
+
+    # 寫入時由 trigger 維護，所有寫入路徑（upsert_post、BatchWriter、補資料腳本）都不需修改
+    body = ";\n".join(post_timestamp_updates('post_id = NEW.post_id'))
+    for event in ('INSERT', 'UPDATE OF created_time'):
+        name = 'trg_posts_timestamps_' + event.split()[0].lower()
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON posts
+            BEGIN
+                {body};
+            END
+        """)
+
+
+def _latest_metrics_refresh(post_id: str) -> str:
+    """
+    由 post_insights_snapshots 重新計算單一貼文的 post_latest_metrics 列（需先刪除舊列）
+
+    trigger 內的 INSERT OR REPLACE 會被外層語句的衝突處理方式覆蓋，因此改為先刪除再插入
+    """
+    from utils.db_utils import SNAPSHOT_METRIC_COLUMNS
+    return f"""
+        INSERT INTO post_latest_metrics
+        SELECT l.post_id, l.fetch_date, {', '.join(f'l.{col}' for col in SNAPSHOT_METRIC_COLUMNS)},
+               {', '.join(f'b.best_{col}' for col in SNAPSHOT_METRIC_COLUMNS)}
+        FROM (SELECT * FROM post_insights_snapshots WHERE post_id = {post_id}
+              ORDER BY fetch_date DESC LIMIT 1) l,
+             (SELECT {', '.join(f'MAX({col}) AS best_{col}' for col in SNAPSHOT_METRIC_COLUMNS)}
+              FROM post_insights_snapshots WHERE post_id = {post_id}) b
+    """
+
+
+def _latest_metrics_merge(source: str) -> str:
+    """把一筆新 snapshot（source 依序為 post_id, fetch_date, 指標, 指標）併入 post_latest_metrics"""
+    from utils.db_utils import SNAPSHOT_METRIC_COLUMNS
+    newer = "excluded.fetch_date >= post_latest_metrics.fetch_date"
+    return f"""
+        INSERT INTO post_latest_metrics (post_id, fetch_date, {', '.join(SNAPSHOT_METRIC_COLUMNS)},
+                                         {', '.join(f'best_{col}' for col in SNAPSHOT_METRIC_COLUMNS)})
+        {source}
+        ON CONFLICT(post_id) DO UPDATE SET
+            fetch_date = CASE WHEN {newer} THEN excluded.fetch_date ELSE post_latest_metrics.fetch_date END,
+            {', '.join(f"{col} = CASE WHEN {newer} THEN excluded.{col} ELSE post_latest_metrics.{col} END"
+                       for col in SNAPSHOT_METRIC_COLUMNS)},
+            {', '.join(f"best_{col} = COALESCE(MAX(best_{col}, excluded.{col}), best_{col}, excluded.{col})"
+                       for col in SNAPSHOT_METRIC_COLUMNS)}
+    """
+
+
+def create_post_latest_metrics(conn):
+    # post_latest_metrics - 每則貼文一列：最新 snapshot 的數值與各指標歷史最大值（best_*）
+    # 取代各報表 / 匯出中反覆出現的「(post_id, MAX(fetch_date))」子查詢與 MAX 彙總
+    from utils.db_utils import SNAPSHOT_METRIC_COLUMNS
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS post_latest_metrics (
+            post_id TEXT PRIMARY KEY,
+            fetch_date DATE NOT NULL,
+            {', '.join(f'{col} INTEGER' for col in SNAPSHOT_METRIC_COLUMNS)},
+            {', '.join(f'best_{col} INTEGER' for col in SNAPSHOT_METRIC_COLUMNS)}
+        )
+    """)
+
+    # 由 trigger 在寫入 snapshot 的同一個交易中維護（upsert_post_insights、BatchWriter、修正腳本皆適用）
+    # 新增列：增量更新；改寫既有列的指標或刪除列：重新計算該貼文（只掃描該貼文的 snapshot）
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_post_latest_metrics_insert
+        AFTER INSERT ON post_insights_snapshots
+        BEGIN
+            {_latest_metrics_merge(f"VALUES (NEW.post_id, NEW.fetch_date, {', '.join(f'NEW.{col}' for col in SNAPSHOT_METRIC_COLUMNS * 2)})")};
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_post_latest_metrics_update
+        AFTER UPDATE OF post_id, fetch_date, {', '.join(SNAPSHOT_METRIC_COLUMNS)} ON post_insights_snapshots
+        BEGIN
+            DELETE FROM post_latest_metrics WHERE post_id IN (OLD.post_id, NEW.post_id);
+            {_latest_metrics_refresh('OLD.post_id')};
+            {_latest_metrics_refresh('NEW.post_id')} WHERE NEW.post_id != OLD.post_id;
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_post_latest_metrics_delete
+        AFTER DELETE ON post_insights_snapshots
+        BEGIN
+            DELETE FROM post_latest_metrics WHERE post_id = OLD.post_id;
+            {_latest_metrics_refresh('OLD.post_id')};
+        END
+    """)
+
+    # 既有資料：一次彙總全部 snapshot
+    conn.execute("DELETE FROM post_latest_metrics")
+    conn.execute(f"""
+        INSERT INTO post_latest_metrics
+        SELECT s.post_id, s.fetch_date, {', '.join(f's.{col}' for col in SNAPSHOT_METRIC_COLUMNS)},
+               {', '.join(f'b.best_{col}' for col in SNAPSHOT_METRIC_COLUMNS)}
+        FROM post_insights_snapshots s
+        JOIN (
+            SELECT post_id, MAX(fetch_date) AS fetch_date,
+                   {', '.join(f'MAX({col}) AS best_{col}' for col in SNAPSHOT_METRIC_COLUMNS)}
+            FROM post_insights_snapshots
+            GROUP BY post_id
+        ) b ON s.post_id = b.post_id AND s.fetch_date = b.fetch_date
+    """)
+
+
+# post_insights_store 的日期以 1970-01-01 起算的日數（整數）儲存
+def _day(value: str) -> str:
+    return f"CAST(julianday({value}) - 2440587.5 AS INTEGER)"
+
+
+def _date(day: str) -> str:
+    return f"date({day} + 2440587.5)"
+
+
+def _post_key(post_id: str) -> str:
+    return f"(SELECT post_key FROM post_keys WHERE post_id = {post_id})"
+
+
+def _ensure_post_key(post_id: str) -> str:
+    # trigger 內的 INSERT OR IGNORE 會被外層語句的衝突處理方式覆蓋，改以 NOT EXISTS 判斷
+    return f"""
+        INSERT INTO post_keys (post_id)
+        SELECT {post_id} WHERE NOT EXISTS (SELECT 1 FROM post_keys WHERE post_id = {post_id})
+    """
+
+
+def cluster_post_insights(conn):
+    # post_insights_store - 以 (post_key, day) 為主鍵的 WITHOUT ROWID 表：同一貼文的 snapshot 在檔案中相鄰，
+    # 單一貼文的範圍查詢只需走一次主鍵 B-tree，不必經過 (post_id, fetch_date) 次要索引再回表
+    # post_keys - 長文字 post_id（如 103640919705348_1234567890）對應的整數代理鍵
+    # post_insights_snapshots 改為相容 view（含 INSTEAD OF trigger），既有查詢與寫入語句不需修改
+    from utils.db_utils import SNAPSHOT_METRIC_COLUMNS
+    metrics = ', '.join(SNAPSHOT_METRIC_COLUMNS)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS post_keys (
+            post_key INTEGER PRIMARY KEY,
+            post_id TEXT NOT NULL UNIQUE
+        )
+    """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS post_insights_store (
+            post_key INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            {', '.join(f'{col} INTEGER' for col in SNAPSHOT_METRIC_COLUMNS)},
+            last_checked INTEGER,
+            PRIMARY KEY (post_key, day)
+        ) WITHOUT ROWID
+    """)
+
+    # 既有資料：依貼文排序後寫入，讓 B-tree 依序填滿
+    conn.execute("""
+        INSERT INTO post_keys (post_id)
+        SELECT DISTINCT post_id FROM post_insights_snapshots
+        WHERE post_id NOT IN (SELECT post_id FROM post_keys)
+        ORDER BY post_id
+    """)
+    conn.execute(f"""
+        INSERT OR REPLACE INTO post_insights_store (post_key, day, {metrics}, last_checked)
+        SELECT k.post_key, {_day('s.fetch_date')}, {', '.join(f's.{col}' for col in SNAPSHOT_METRIC_COLUMNS)},
+               {_day('s.last_checked')}
+        FROM post_insights_snapshots s JOIN post_keys k ON k.post_id = s.post_id
+        ORDER BY k.post_key, s.fetch_date
+    """)
+    conn.execute("DROP VIEW IF EXISTS post_insights_daily")
+    conn.execute("DROP TABLE post_insights_snapshots")
+
+    # id 由 (post_key, day) 組成，只為相容舊查詢保留
+    conn.execute(f"""
+        CREATE VIEW post_insights_snapshots AS
+        SELECT (s.post_key << 20) + s.day AS id, k.post_id, {_date('s.day')} AS fetch_date,
+               {', '.join(f's.{col}' for col in SNAPSHOT_METRIC_COLUMNS)},
+               {_date('s.last_checked')} AS last_checked
+        FROM post_insights_store s JOIN post_keys k ON k.post_key = s.post_key
+    """)
+    # 寫入 view：相同 (post_id, fetch_date) 時覆寫指標（與原本 upsert_post_insights 的 ON CONFLICT 相同）
+    conn.execute(f"""
+        CREATE TRIGGER trg_post_insights_snapshots_insert
+        INSTEAD OF INSERT ON post_insights_snapshots
+        BEGIN
+            {_ensure_post_key('NEW.post_id')};
+            INSERT INTO post_insights_store (post_key, day, {metrics}, last_checked)
+            SELECT post_key, {_day('NEW.fetch_date')}, {', '.join(f'NEW.{col}' for col in SNAPSHOT_METRIC_COLUMNS)},
+                   {_day('NEW.last_checked')}
+            FROM post_keys WHERE post_id = NEW.post_id
+            ON CONFLICT(post_key, day) DO UPDATE SET
+            {', '.join(f"{col} = excluded.{col}" for col in SNAPSHOT_METRIC_COLUMNS)};
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER trg_post_insights_snapshots_update
+        INSTEAD OF UPDATE ON post_insights_snapshots
+        BEGIN
+            {_ensure_post_key('NEW.post_id')};
+            UPDATE post_insights_store SET
+                post_key = {_post_key('NEW.post_id')},
+                day = {_day('NEW.fetch_date')},
+                {', '.join(f"{col} = NEW.{col}" for col in SNAPSHOT_METRIC_COLUMNS)},
+                last_checked = {_day('NEW.last_checked')}
+            WHERE post_key = {_post_key('OLD.post_id')} AND day = {_day('OLD.fetch_date')};
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER trg_post_insights_snapshots_delete
+        INSTEAD OF DELETE ON post_insights_snapshots
+        BEGIN
+            DELETE FROM post_insights_store
+            WHERE post_key = {_post_key('OLD.post_id')} AND day = {_day('OLD.fetch_date')};
+        END
+    """)
+
+    # post_latest_metrics 改由 post_insights_store 的 trigger 維護（原 trigger 已隨舊表刪除）
+    # 只更新 last_checked 時（只儲存變動的未變動日）不需重新計算
+    post_id = "(SELECT post_id FROM post_keys WHERE post_key = {}.post_key)".format
+    changed = ' OR '.join(f"OLD.{col} IS NOT NEW.{col}" for col in ['post_key', 'day'] + SNAPSHOT_METRIC_COLUMNS)
+    conn.execute(f"""
+        CREATE TRIGGER trg_post_latest_metrics_insert
+        AFTER INSERT ON post_insights_store
+        BEGIN
+            {_latest_metrics_merge(f"SELECT post_id, {_date('NEW.day')}, {', '.join(f'NEW.{col}' for col in SNAPSHOT_METRIC_COLUMNS * 2)} FROM post_keys WHERE post_key = NEW.post_key")};
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER trg_post_latest_metrics_update
+        AFTER UPDATE ON post_insights_store
+        WHEN {changed}
+        BEGIN
+            DELETE FROM post_latest_metrics WHERE post_id IN ({post_id('OLD')}, {post_id('NEW')});
+            {_latest_metrics_refresh(post_id('OLD'))};
+            {_latest_metrics_refresh(post_id('NEW'))} WHERE NEW.post_key != OLD.post_key;
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER trg_post_latest_metrics_delete
+        AFTER DELETE ON post_insights_store
+        BEGIN
+            DELETE FROM post_latest_metrics WHERE post_id = {post_id('OLD')};
+            {_latest_metrics_refresh(post_id('OLD'))};
+        END
+    """)
+
+    # post_insights_daily - 與版本 3 相同的每日展開，改以整數日數遞增
+    conn.execute(f"""
+        CREATE VIEW post_insights_daily AS
+        WITH RECURSIVE days(post_key, start, day) AS (
+            SELECT post_key, day, day FROM post_insights_store
+            UNION ALL
+            SELECT d.post_key, d.start, d.day + 1
+            FROM days d JOIN post_insights_store s ON s.post_key = d.post_key AND s.day = d.start
+            WHERE d.day < s.last_checked
+        )
+        SELECT k.post_id, {_date('d.day')} AS fetch_date,
+               {', '.join(f's.{col}' for col in SNAPSHOT_METRIC_COLUMNS)},
+               d.day != s.day AS carried
+        FROM days d
+        JOIN post_insights_store s ON s.post_key = d.post_key AND s.day = d.start
+        JOIN post_keys k ON k.post_key = s.post_key
+    """)
+
+
+def add_columns(conn, table: str, columns):
+    """新增尚不存在的欄位（舊版曾在執行期間自行建立的欄位可能已存在）"""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for column, col_type in columns:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}")
+
+
+# (版本, 名稱, 函式)：依版本順序執行，已發布的項目不可修改
+MIGRATIONS = [
+    (1, 'baseline', setup_database.create_base_tables),
+    (2, 'add_missing_columns', setup_database.migrate_add_columns),
+    (3, 'post_insights_daily_view', create_daily_view),
+    (4, 'pipeline_runs', create_pipeline_runs),
+    (5, 'ad_potential_columns', add_ad_potential_columns),
+    (6, 'post_timestamp_columns', add_post_timestamp_columns),
+    (7, 'post_latest_metrics', create_post_latest_metrics),
+    (8, 'clustered_post_insights', cluster_post_insights),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn) -> int:
+    """資料庫目前的 schema 版本（尚未建立 schema_version 時為 0）"""
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except Exception:
+        return 0
+    return row[0] or 0
+
+
+def migrate(conn, target: int = LATEST_VERSION) -> List[int]:
+    """
+    依序套用尚未執行的遷移（直到 target 版本）
+
+    每個遷移在 BEGIN IMMEDIATE 交易中執行並記錄版本；多個行程同時啟動時，
+    取得寫入鎖後會重新檢查版本，因此每個遷移只執行一次
+
+    Returns:
+        本次套用的版本列表
+    """
+    if current_version(conn) >= target:
+        return []
+
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    applied = []
+    for version, name, apply in MIGRATIONS:
+        if version > target:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)).fetchone():
+                conn.rollback()
+                continue
+            apply(conn)
+            conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+
+    if applied:
+        print(f"✓ 資料庫 schema 更新至版本 {applied[-1]}（套用 {len(applied)} 個遷移）")
+    return applied
+
+
+if __name__ == '__main__':
+    from utils import db_utils
+
+    conn = db_utils.connect()
+    migrate(conn)
+    print(f"schema 版本: {current_version(conn)} / 最新: {LATEST_VERSION}")
+    for version, name, applied_at in conn.execute("SELECT version, name, applied_at FROM schema_version ORDER BY version"):
+        print(f"  {version:3d} {name:28s} {applied_at}")
+    conn.close()
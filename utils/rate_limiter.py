@@ -0,0 +1,301 @@
+"""
+Graph API 自適應速率限制器
+以 token bucket 控制請求速率，並依每個回應的 X-App-Usage / X-Page-Usage /
+X-Business-Use-Case-Usage 標頭連續調整速率；遇到節流錯誤碼 (4/17/32/613)
+時以指數退避加隨機抖動暫停。所有收集器共用同一個限制器。
+
+多專頁模式下另為每個 access token 建立限制器：共用限制器只處理 App 層級的
+用量與節流，專頁 / 使用者層級的用量與節流只影響該 token 的請求。
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+# Graph API 節流錯誤碼
+# 4: App 請求上限 / 17: 使用者請求上限 / 32: Page 請求上限 / 613: 呼叫頻率過高
+THROTTLE_ERROR_CODES = {4, 17, 32, 613}
+
+USAGE_HEADERS = ('X-App-Usage', 'X-Page-Usage', 'X-Business-Use-Case-Usage')
+
+# 多專頁模式的分工：App 層級（共用限制器）與 access token 層級
+APP_USAGE_HEADERS = ('X-App-Usage',)
+APP_THROTTLE_CODES = {4}
+TOKEN_USAGE_HEADERS = ('X-Page-Usage', 'X-Business-Use-Case-Usage')
+TOKEN_THROTTLE_CODES = {17, 32, 613}
+
+# 用量低於此百分比時以最高速率執行，高於此值後線性降速
+SLOWDOWN_USAGE = 50
+
+# 單次退避的上限（秒）
+MAX_BACKOFF = 300
+
+
+def parse_usage_headers(headers, names=USAGE_HEADERS) -> Dict:
+    """
+    解析 Graph API 用量標頭（只看 names 列出的標頭）
+
+    Returns:
+        {'usage': 各標頭中最高的用量百分比 (0-100),
+         'regain_seconds': estimated_time_to_regain_access 換算的秒數}
+    """
+    usage = 0.0
+    regain_minutes = 0.0
+
+    def scan(entry):
+        nonlocal usage, regain_minutes
+        if not isinstance(entry, dict):
+            return
+        for key in ('call_count', 'total_cputime', 'total_time', 'acc_id_util_pct'):
+            value = entry.get(key)
+            if isinstance(value, (int, float)):
+                usage = max(usage, float(value))
+        regain = entry.get('estimated_time_to_regain_access')
+        if isinstance(regain, (int, float)):
+            regain_minutes = max(regain_minutes, float(regain))
+
+    for name in names:
+        raw = headers.get(name) if headers else None
+        if not raw:
+            continue
+        try:
+            data = json.loads(raw)
+        except (TypeError, ValueError):
+            continue
+        if name == 'X-Business-Use-Case-Usage':
+            # {"<business_id>": [{"type": "pages", "call_count": 5, ...}, ...]}
+            for entries in data.values():
+                for entry in entries if isinstance(entries, list) else [entries]:
+                    scan(entry)
+        else:
+            scan(data)
+
+    return {'usage': min(usage, 100.0), 'regain_seconds': regain_minutes * 60}
+
+
+def error_code_of(body) -> Optional[int]:
+    """取出 Graph API 錯誤碼（無錯誤時回傳 None）"""
+    if isinstance(body, dict) and isinstance(body.get('error'), dict):
+        code = body['error'].get('code')
+        return int(code) if isinstance(code, (int, str)) and str(code).isdigit() else None
+    return None
+
+
+class GraphRateLimiter:
+    """
+    Token bucket 速率限制器（執行緒安全，亦提供 asyncio 版本的 acquire）
+
+    Args:
+        max_rate: 用量低時的最高速率（請求/秒）
+        min_rate: 用量接近上限時的最低速率（請求/秒）
+        burst: bucket 容量（可連續送出的請求數）
+        base_backoff: 節流錯誤的初始退避秒數
+        usage_headers: 依哪些用量標頭調整速率
+        throttle_codes: 視為節流的錯誤碼
+    """
+
+    def __init__(self, max_rate: float = 20.0, min_rate: float = 0.2, burst: int = 10,
+                 base_backoff: float = 2.0, usage_headers=USAGE_HEADERS, throttle_codes=THROTTLE_ERROR_CODES):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.base_backoff = base_backoff
+        self.usage_headers = usage_headers
+        self.throttle_codes = throttle_codes
+        self.rate = max_rate
+        self.tokens = float(burst)
+        self.usage = 0.0
+        self.blocked_until = 0.0
+        self.consecutive_throttles = 0
+        self.stats = {'requests': 0, 'throttled': 0, 'waited_seconds': 0.0}
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, cost: float) -> float:
+        """預扣 token，回傳需要等待的秒數"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.tokens -= cost
+            wait = max(0.0, -self.tokens / self.rate, self.blocked_until - now)
+            self.stats['requests'] += cost
+            self.stats['waited_seconds'] += wait
+            return wait
+
+    def acquire(self, cost: float = 1):
+        """取得送出 cost 個請求的額度（必要時阻塞等待）"""
+        wait = self._reserve(cost)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, cost: float = 1):
+        """acquire 的 asyncio 版本"""
+        wait = self._reserve(cost)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def observe(self, status_code: int, headers=None, body=None) -> bool:
+        """
+        依回應更新速率
+
+        headers 為 None（batch 子請求沒有用量 header）時只依錯誤碼退避，保留由外層回應得知的用量與速率
+
+        Returns:
+            True 表示此回應為節流錯誤，呼叫端應稍後重試
+        """
+        code = error_code_of(body)
+        throttled = code in self.throttle_codes
+
+        with self._lock:
+            now = time.monotonic()
+            if headers is not None:
+                usage = parse_usage_headers(headers, self.usage_headers)
+                self.usage = usage['usage']
+                if self.usage <= SLOWDOWN_USAGE:
+                    target_rate = self.max_rate
+                else:
+                    ratio = (100 - self.usage) / (100 - SLOWDOWN_USAGE)
+                    target_rate = self.min_rate + (self.max_rate - self.min_rate) * ratio
+                self.rate = max(self.min_rate, target_rate)
+                if usage['regain_seconds'] > 0:
+                    self.blocked_until = max(self.blocked_until, now + min(usage['regain_seconds'], MAX_BACKOFF))
+
+            if throttled:
+                self.consecutive_throttles += 1
+                self.stats['throttled'] += 1
+                backoff = min(MAX_BACKOFF, self.base_backoff * 2 ** (self.consecutive_throttles - 1))
+                backoff += random.uniform(0, backoff / 2)
+                self.blocked_until = max(self.blocked_until, now + backoff)
+                self.rate = self.min_rate
+                self.tokens = min(self.tokens, 0.0)
+            elif 200 <= status_code < 300:
+                self.consecutive_throttles = 0
+
+        return throttled
+
+    def observe_response(self, response: requests.Response) -> bool:
+        """observe 的 requests.Response 版本"""
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return self.observe(response.status_code, response.headers, body)
+
+
+_default_limiter = None
+_default_lock = threading.Lock()
+
+
+def get_limiter() -> GraphRateLimiter:
+    """取得所有收集器共用的限制器"""
+    global _default_limiter
+    with _default_lock:
+        if _default_limiter is None:
+            _default_limiter = GraphRateLimiter()
+        return _default_limiter
+
+
+def set_limiter(limiter: Optional[GraphRateLimiter]):
+    """替換共用限制器（傳入 None 時下次 get_limiter 會重新建立預設限制器）"""
+    global _default_limiter
+    with _default_lock:
+        _default_limiter = limiter
+
+
+_token_limiters = {}
+_token_settings = None
+
+
+def enable_token_limits(**settings):
+    """
+    啟用每個 access token 各自的限制器（多專頁模式）
+
+    Args:
+        settings: 建立 token 限制器時傳給 GraphRateLimiter 的參數（max_rate、burst 等）
+    """
+    global _token_settings
+    with _default_lock:
+        _token_settings = settings
+        _token_limiters.clear()
+    limiter = get_limiter()
+    limiter.usage_headers = APP_USAGE_HEADERS
+    limiter.throttle_codes = APP_THROTTLE_CODES
+
+
+def disable_token_limits():
+    """停用 token 限制器，共用限制器恢復處理所有用量標頭與節流錯誤碼"""
+    global _token_settings
+    with _default_lock:
+        _token_settings = None
+        _token_limiters.clear()
+    limiter = get_limiter()
+    limiter.usage_headers = USAGE_HEADERS
+    limiter.throttle_codes = THROTTLE_ERROR_CODES
+
+
+def get_token_limiter(access_token: Optional[str]) -> Optional[GraphRateLimiter]:
+    """取得 access token 的限制器（未啟用 token 限制時回傳 None）"""
+    with _default_lock:
+        if _token_settings is None or not access_token:
+            return None
+        if access_token not in _token_limiters:
+            _token_limiters[access_token] = GraphRateLimiter(
+                usage_headers=TOKEN_USAGE_HEADERS, throttle_codes=TOKEN_THROTTLE_CODES, **_token_settings)
+        return _token_limiters[access_token]
+
+
+def token_stats() -> Dict[str, Dict]:
+    """各 token 限制器的統計（以 token 末 6 碼識別，避免輸出完整 token）"""
+    with _default_lock:
+        return {f"...{token[-6:]}": dict(limiter.stats) for token, limiter in _token_limiters.items()}
+
+
+def request_token(url: str, params: Optional[Dict] = None, data: Optional[Dict] = None) -> Optional[str]:
+    """請求使用的 access token：params / data，或 URL 查詢字串（分頁的 next URL 已含 token，params 為空）"""
+    token = (params or {}).get('access_token') or (data or {}).get('access_token')
+    if token:
+        return token
+    return (parse_qs(urlsplit(url).query).get('access_token') or [None])[0]
+
+
+def throttled_request(method: str, url: str, cost: float = 1, max_retries: int = 3,
+                      limiter: Optional[GraphRateLimiter] = None, session: Optional[requests.Session] = None,
+                      **kwargs) -> requests.Response:
+    """
+    經過限制器送出請求；遇到節流錯誤時退避後重試（最多 max_retries 次）
+
+    Args:
+        cost: 此請求消耗的額度（batch 請求為子請求數）
+        session: 使用的 requests.Session（預設不共用連線）
+    """
+    limiter = limiter or get_limiter()
+    token = request_token(url, kwargs.get('params'), kwargs.get('data'))
+    token_limiter = get_token_limiter(token)
+    kwargs.setdefault('timeout', 15)
+    for attempt in range(max_retries + 1):
+        limiter.acquire(cost)
+        if token_limiter:
+            token_limiter.acquire(cost)
+        response = (session or requests).request(method, url, **kwargs)
+        throttled = limiter.observe_response(response)
+        if token_limiter:
+            throttled = token_limiter.observe_response(response) or throttled
+        if not throttled or attempt == max_retries:
+            return response
+
+
+def throttled_get(url: str, params: Optional[Dict] = None, **kwargs) -> requests.Response:
+    """requests.get 的限速版本"""
+    return throttled_request('GET', url, params=params, **kwargs)
+
+
+def throttled_post(url: str, data: Optional[Dict] = None, **kwargs) -> requests.Response:
+    """requests.post 的限速版本"""
+    return throttled_request('POST', url, data=data, **kwargs)
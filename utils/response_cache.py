@@ -0,0 +1,314 @@
+"""
+Graph API GET 回應的磁碟快取（可選）
+同一天重跑 pipeline、或接著執行 backfill 時，未過期的回應直接從磁碟讀取，不再下載也不消耗呼叫額度。
+
+- 鍵：方法 + 路徑 + 參數（不含 access token 與主機）的 sha256，檔案依鍵的前兩碼分目錄存放
+- TTL 依端點決定（DEFAULT_TTLS）；90 天以上的舊貼文數據幾乎不再變動，保留一週
+- 貼文列表、廣告與報表等需要即時的請求不快取
+- 以檔案修改時間記錄最近使用時間，總大小超過上限時淘汰最久未使用的項目（LRU）
+- 先寫暫存檔再 os.replace，多個 worker 同時寫入不會產生損壞的檔案
+
+用法:
+    python run_pipeline.py --cache data/graph_cache
+    GRAPH_CACHE_DIR=data/graph_cache python -m collectors.backfill_insights
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from utils import cassette
+
+DEFAULT_DIR = 'data/graph_cache'
+
+# 快取總大小上限（位元組）
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+# 淘汰時降到上限的比例，避免每次寫入都觸發淘汰
+EVICT_TARGET = 0.9
+
+# 建立時間超過此天數的貼文使用 *_old 的 TTL
+OLD_POST_DAYS = 90
+
+# 各端點的 TTL（秒），0 表示不快取
+DEFAULT_TTLS = {
+    'object': 3600,                      # 專頁 / 物件基本資訊
+    'page_insights': 3600,
+    'post_object': 900,                  # 貼文欄位（分享數等）
+    'post_insights': 900,
+    'post_edges': 900,                   # reactions / comments 總數
+    'post_object_old': 7 * 86400,
+    'post_insights_old': 7 * 86400,
+    'post_edges_old': 7 * 86400,
+}
+
+# 不快取的 edge（需要即時資料或會建立資源）
+UNCACHED_EDGES = {'posts', 'published_posts', 'feed', 'ads', 'campaigns', 'adsets'}
+
+
+def endpoint_of(url: str) -> Optional[str]:
+    """依路徑判斷端點類型（None 表示不快取）"""
+    parts = [p for p in urlsplit(url).path.split('/') if p]
+    if parts and parts[0].startswith('v') and parts[0][1:2].isdigit():
+        parts = parts[1:]
+    if not parts or len(parts) > 2 or parts[0].startswith('act_'):
+        return None
+    object_id, edge = parts[0], parts[1] if len(parts) > 1 else None
+    is_post = '_' in object_id
+    if edge is None:
+        return 'post_object' if is_post else 'object'
+    if edge == 'insights':
+        return 'post_insights' if is_post else 'page_insights'
+    if is_post and edge in ('reactions', 'comments'):
+        return 'post_edges'
+    return None
+
+
+def full_url(url: str, params: Optional[Dict] = None) -> str:
+    """合併 url 與 params（與 requests 送出的網址相同）"""
+    return requests.Request('GET', url, params=params).prepare().url
+
+
+def cache_key(url: str) -> str:
+    return hashlib.sha256(cassette.request_key('GET', url).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Graph API GET 回應的磁碟快取（執行緒與行程間皆可共用同一個目錄）
+
+    Args:
+        directory: 快取目錄
+        max_bytes: 總大小上限，超過時淘汰最久未使用的項目
+        ttls: 覆寫 DEFAULT_TTLS 中的部分端點
+        post_age: post_age(post_id) -> 貼文建立至今的天數（None 表示未知）；預設查詢 posts 表
+    """
+
+    def __init__(self, directory: str = DEFAULT_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttls: Optional[Dict[str, int]] = None, post_age: Optional[Callable] = None,
+                 clock: Callable[[], float] = time.time):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.post_age = post_age or self._post_age_from_db
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'stores': 0, 'evictions': 0, 'bytes_saved': 0}
+        self._ages = {}
+        os.makedirs(directory, exist_ok=True)
+        self._size = self._scan_size()
+
+    # ---- TTL ----
+
+    def _post_age_from_db(self, post_id: str) -> Optional[float]:
+        from utils import db_utils
+
+        if not os.path.exists(db_utils.DB_PATH):
+            return None
+        try:
+            conn = db_utils.connect(readonly=True, row_factory=False)
+            try:
+                row = conn.execute("""
+                    SELECT julianday('now') - julianday(substr(created_time, 1, 10))
+                    FROM posts WHERE post_id = ?
+                """, (post_id,)).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None
+        return row[0] if row and row[0] is not None else None
+
+    def ttl_for(self, url: str) -> int:
+        """此網址的 TTL（秒），0 表示不快取"""
+        endpoint = endpoint_of(url)
+        if endpoint is None:
+            return 0
+        if endpoint.startswith('post_'):
+            post_id = [p for p in urlsplit(url).path.split('/') if '_' in p][0]
+            with self.lock:
+                if post_id not in self._ages:
+                    self._ages[post_id] = self.post_age(post_id)
+                age = self._ages[post_id]
+            if age is not None and age >= OLD_POST_DAYS:
+                endpoint += '_old'
+        return self.ttls.get(endpoint, 0)
+
+    # ---- 讀寫 ----
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def get(self, url: str, params: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        讀取未過期的回應
+
+        Returns:
+            {'status', 'headers', 'content'}；未快取、已過期或不快取的端點回傳 None
+        """
+        url = full_url(url, params)
+        if not self.ttl_for(url):
+            return None
+        path = self._path(cache_key(url))
+        try:
+            with open(path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+        except (OSError, ValueError):
+            # 無法解析的檔案視為未快取（下次寫入時取代）
+            self._count('misses')
+            return None
+        if entry.get('expires_at', 0) <= self.clock():
+            self._count('expired')
+            self._count('misses')
+            return None
+        try:
+            # 更新最近使用時間（LRU 依檔案修改時間淘汰）
+            os.utime(path)
+        except OSError:
+            pass
+        self._count('hits')
+        self._count('bytes_saved', len(entry['content']))
+        return entry
+
+    def put(self, url: str, params: Optional[Dict], status: int, headers, content: str) -> bool:
+        """寫入成功的回應（錯誤回應與不快取的端點略過），回傳是否寫入"""
+        url = full_url(url, params)
+        ttl = self.ttl_for(url)
+        if not ttl or status != 200 or '"error"' in content[:200]:
+            return False
+        keep = {k.lower(): v for k, v in (headers or {}).items() if k.lower() == 'content-type'}
+        entry = {'url': cassette.scrub(url), 'status': status, 'headers': keep, 'content': content,
+                 'stored_at': self.clock(), 'expires_at': self.clock() + ttl}
+        path = self._path(cache_key(url))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(entry, ensure_ascii=False).encode('utf-8')
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+        with self.lock:
+            self.stats['stores'] += 1
+            self._size += len(data) - old_size
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+        return True
+
+    # ---- 淘汰 ----
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.json'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self) -> int:
+        """淘汰最久未使用的項目直到總大小低於上限的 EVICT_TARGET，回傳淘汰數"""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICT_TARGET
+        removed = 0
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        with self.lock:
+            self._size = total
+            self.stats['evictions'] += removed
+        return removed
+
+    def clear(self):
+        for path, _, _ in list(self._entries()):
+            os.remove(path)
+        with self.lock:
+            self._size = 0
+
+    # ---- 統計 ----
+
+    def summary(self) -> Dict:
+        with self.lock:
+            stats = dict(self.stats)
+            stats['bytes'] = self._size
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def print_stats(self):
+        stats = self.summary()
+        print(f"  回應快取: 命中 {stats['hits']} / 未命中 {stats['misses']} (命中率 {stats['hit_rate']:.0%}) / "
+              f"節省 {stats['bytes_saved'] / 1024:.0f} KB / 快取大小 {stats['bytes'] / 1024 / 1024:.1f} MB"
+              f"（淘汰 {stats['evictions']}）")
+
+
+def to_response(entry: Dict, url: str) -> requests.Response:
+    """把快取項目轉成 requests.Response"""
+    response = requests.Response()
+    response.status_code = entry['status']
+    response.headers = CaseInsensitiveDict(entry['headers'])
+    response._content = entry['content'].encode('utf-8')
+    response.encoding = 'utf-8'
+    response.url = url
+    return response
+
+
+_active = None
+_env_checked = False
+_active_lock = threading.Lock()
+
+
+def get_cache() -> Optional[ResponseCache]:
+    """目前啟用的快取；尚未以 enable 設定時依環境變數 GRAPH_CACHE_DIR 建立"""
+    global _active, _env_checked
+    with _active_lock:
+        if _active is None and not _env_checked:
+            _env_checked = True
+            directory = os.environ.get('GRAPH_CACHE_DIR')
+            if directory:
+                max_mb = os.environ.get('GRAPH_CACHE_MAX_MB')
+                _active = ResponseCache(directory, max_bytes=int(max_mb) * 1024 * 1024 if max_mb else DEFAULT_MAX_BYTES)
+        return _active
+
+
+def enable(cache: Optional[ResponseCache]):
+    """啟用（或以 None 停用）所有 Graph API GET 使用的快取"""
+    global _active, _env_checked
+    from utils import graph_client
+
+    with _active_lock:
+        _active = cache
+        _env_checked = True
+    graph_client.set_client(None)
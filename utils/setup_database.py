@@ -1,17 +1,20 @@
-import sqlite3
 import os
 
 DB_PATH = 'engagement_data.db'
 
 
 def migrate_add_columns(conn):
-    """Add missing columns to existing tables (for schema migrations)"""
+    """Add missing columns to existing tables (schema migration 2, see utils.migrations)"""
     cursor = conn.cursor()
 
     # Check and add missing columns to posts_classification
     migrations = [
         ('posts_classification', 'format_type', 'TEXT'),
         ('posts_classification', 'issue_topic', 'TEXT'),
+        ('posts', 'is_deleted', 'BOOLEAN DEFAULT 0'),
+        ('pages', 'access_token', 'TEXT'),
+        ('pages', 'is_active', 'INTEGER DEFAULT 1'),
+        ('post_insights_snapshots', 'last_checked', 'DATE'),
     ]
 
     for table, column, col_type in migrations:
@@ -27,218 +30,293 @@ def migrate_add_columns(conn):
             # Column might already exist or table doesn't exist yet
             pass
 
-    conn.commit()
-
 
 def create_connection():
     """Create a database connection to the SQLite database specified by DB_PATH."""
     conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
+        from utils import db_utils
+        conn = db_utils.connect(DB_PATH, row_factory=False)
         return conn
     except Exception as e:
         print(f"Error connecting to database: {e}")
     return conn
 
 def create_tables(conn):
-    """Create tables in the database."""
+    """Create tables in the database (applies pending migrations, see utils.migrations)."""
     try:
-        cursor = conn.cursor()
-
-        # 1. pages
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS pages (
-                page_id TEXT PRIMARY KEY,
-                page_name TEXT,
-                last_scraped_at DATETIME
-            );
-        """)
-
-        # 2. page_daily_metrics
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS page_daily_metrics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                page_id TEXT NOT NULL,
-                date DATE NOT NULL,
-                fan_count INTEGER,
-                followers_count INTEGER,
-                page_impressions_unique INTEGER,
-                page_post_engagements INTEGER,
-                page_video_views INTEGER,
-                reactions_like INTEGER,
-                reactions_love INTEGER,
-                reactions_wow INTEGER,
-                reactions_haha INTEGER,
-                reactions_sorry INTEGER,
-                reactions_anger INTEGER,
-                reactions_total INTEGER,
-                FOREIGN KEY (page_id) REFERENCES pages (page_id),
-                UNIQUE(page_id, date)
-            );
-        """)
-
-        # 3. posts
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS posts (
-                post_id TEXT PRIMARY KEY,
-                page_id TEXT NOT NULL,
-                created_time DATETIME,
-                message TEXT,
-                type TEXT,
-                permalink_url TEXT,
-                FOREIGN KEY (page_id) REFERENCES pages (page_id)
-            );
-        """)
-
-        # 4. post_insights_snapshots
-        # 更新日期: 2025-12-12 - 移除已棄用的 impressions 相關欄位
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS post_insights_snapshots (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                post_id TEXT NOT NULL,
-                fetch_date DATE NOT NULL,
-                likes_count INTEGER,
-                comments_count INTEGER,
-                shares_count INTEGER,
-                post_clicks INTEGER,
-                post_impressions_unique INTEGER,
-                -- 已移除: post_impressions, post_impressions_organic, post_impressions_paid (已棄用)
-                post_video_views INTEGER,
-                post_video_views_organic INTEGER,
-                post_video_views_paid INTEGER,
-                post_reactions_like_total INTEGER,
-                post_reactions_love_total INTEGER,
-                post_reactions_wow_total INTEGER,
-                post_reactions_haha_total INTEGER,
-                post_reactions_sorry_total INTEGER,
-                post_reactions_anger_total INTEGER,
-                FOREIGN KEY (post_id) REFERENCES posts (post_id),
-                UNIQUE(post_id, fetch_date)
-            );
-        """)
-
-        # 5. posts_classification - 內容分類表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS posts_classification (
-                post_id TEXT PRIMARY KEY,
-                media_type TEXT,
-                has_link BOOLEAN DEFAULT 0,
-                has_hashtag BOOLEAN DEFAULT 0,
-                hashtag_count INTEGER DEFAULT 0,
-                message_length INTEGER DEFAULT 0,
-                message_length_tier TEXT,
-                word_count INTEGER DEFAULT 0,
-                topic_primary TEXT,
-                topic_secondary TEXT,
-                format_type TEXT,
-                issue_topic TEXT,
-                campaign_id TEXT,
-                sentiment_score FLOAT,
-                has_cta BOOLEAN DEFAULT 0,
-                cta_type TEXT,
-                is_sponsored BOOLEAN DEFAULT 0,
-                is_reshare BOOLEAN DEFAULT 0,
-                hour_of_day INTEGER,
-                day_of_week INTEGER,
-                week_of_year INTEGER,
-                month INTEGER,
-                is_weekend BOOLEAN DEFAULT 0,
-                time_slot TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (post_id) REFERENCES posts (post_id)
-            );
-        """)
-
-        # 6. posts_performance - 貼文表現快照表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS posts_performance (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                post_id TEXT NOT NULL,
-                snapshot_date DATE NOT NULL,
-                engagement_rate FLOAT,
-                click_through_rate FLOAT,
-                share_rate FLOAT,
-                comment_rate FLOAT,
-                vs_page_avg_7d FLOAT,
-                vs_page_avg_30d FLOAT,
-                performance_tier TEXT,
-                percentile_rank FLOAT,
-                organic_ratio FLOAT,
-                reach_efficiency FLOAT,
-                virality_score FLOAT,
-                discussion_depth FLOAT,
-                UNIQUE(post_id, snapshot_date),
-                FOREIGN KEY (post_id) REFERENCES posts (post_id)
-            );
-        """)
-
-        # 7. analytics_summary - 聚合統計表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS analytics_summary (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                summary_date DATE NOT NULL,
-                granularity TEXT NOT NULL,
-                time_period TEXT,
-                topic TEXT,
-                media_type TEXT,
-                time_slot TEXT,
-                day_of_week TEXT,
-                post_count INTEGER DEFAULT 0,
-                total_impressions INTEGER DEFAULT 0,
-                total_reach INTEGER DEFAULT 0,
-                total_reactions INTEGER DEFAULT 0,
-                total_comments INTEGER DEFAULT 0,
-                total_shares INTEGER DEFAULT 0,
-                total_clicks INTEGER DEFAULT 0,
-                total_video_views INTEGER DEFAULT 0,
-                avg_engagement_rate FLOAT,
-                avg_ctr FLOAT,
-                avg_reach_per_post FLOAT,
-                vs_prev_period_pct FLOAT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-
-        # 8. benchmarks - 成效基準表
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS benchmarks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                benchmark_type TEXT NOT NULL,
-                benchmark_key TEXT NOT NULL,
-                period TEXT NOT NULL,
-                avg_engagement_rate FLOAT,
-                median_engagement_rate FLOAT,
-                p25_engagement_rate FLOAT,
-                p75_engagement_rate FLOAT,
-                p95_engagement_rate FLOAT,
-                avg_reach FLOAT,
-                avg_reactions FLOAT,
-                avg_comments FLOAT,
-                avg_shares FLOAT,
-                avg_clicks FLOAT,
-                sample_size INTEGER,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(benchmark_type, benchmark_key, period)
-            );
-        """)
-
-        # Create indexes for analytics tables
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_classification_topic ON posts_classification(topic_primary);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_classification_media ON posts_classification(media_type);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_classification_time_slot ON posts_classification(time_slot);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_performance_tier ON posts_performance(performance_tier);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_performance_date ON posts_performance(snapshot_date);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_summary_granularity ON analytics_summary(granularity, summary_date);")
-
-        # Migration: Add missing columns to existing tables
-        migrate_add_columns(conn)
-
-        conn.commit()
+        from utils import migrations
+        migrations.migrate(conn)
         print("Tables created successfully.")
     except Exception as e:
         print(f"Error creating tables: {e}")
 
+def create_base_tables(conn):
+    """Baseline schema (migration 1). Later schema changes go into utils.migrations.MIGRATIONS."""
+    cursor = conn.cursor()
+
+    # 1. pages
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pages (
+            page_id TEXT PRIMARY KEY,
+            page_name TEXT,
+            last_scraped_at DATETIME,
+            access_token TEXT,
+            is_active INTEGER DEFAULT 1
+        );
+    """)
+
+    # 2. page_daily_metrics
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS page_daily_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            page_id TEXT NOT NULL,
+            date DATE NOT NULL,
+            fan_count INTEGER,
+            followers_count INTEGER,
+            page_impressions_unique INTEGER,
+            page_post_engagements INTEGER,
+            page_video_views INTEGER,
+            reactions_like INTEGER,
+            reactions_love INTEGER,
+            reactions_wow INTEGER,
+            reactions_haha INTEGER,
+            reactions_sorry INTEGER,
+            reactions_anger INTEGER,
+            reactions_total INTEGER,
+            FOREIGN KEY (page_id) REFERENCES pages (page_id),
+            UNIQUE(page_id, date)
+        );
+    """)
+
+    # 3. posts
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS posts (
+            post_id TEXT PRIMARY KEY,
+            page_id TEXT NOT NULL,
+            created_time DATETIME,
+            message TEXT,
+            type TEXT,
+            permalink_url TEXT,
+            is_deleted BOOLEAN DEFAULT 0,
+            FOREIGN KEY (page_id) REFERENCES pages (page_id)
+        );
+    """)
+
+    # 3b. post_watermarks - 每個專頁的貼文列表水位（增量收集用）
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS post_watermarks (
+            page_id TEXT PRIMARY KEY,
+            max_created_time DATETIME,
+            last_listed_at DATETIME,
+            last_reconciled_at DATETIME,
+            FOREIGN KEY (page_id) REFERENCES pages (page_id)
+        );
+    """)
+
+    # 4. post_insights_snapshots
+    # 更新日期: 2025-12-12 - 移除已棄用的 impressions 相關欄位
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS post_insights_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            post_id TEXT NOT NULL,
+            fetch_date DATE NOT NULL,
+            likes_count INTEGER,
+            comments_count INTEGER,
+            shares_count INTEGER,
+            post_clicks INTEGER,
+            post_impressions_unique INTEGER,
+            -- 已移除: post_impressions, post_impressions_organic, post_impressions_paid (已棄用)
+            post_video_views INTEGER,
+            post_video_views_organic INTEGER,
+            post_video_views_paid INTEGER,
+            post_reactions_like_total INTEGER,
+            post_reactions_love_total INTEGER,
+            post_reactions_wow_total INTEGER,
+            post_reactions_haha_total INTEGER,
+            post_reactions_sorry_total INTEGER,
+            post_reactions_anger_total INTEGER,
+            -- 只儲存變動時：數值確認未變的最後日期（NULL 表示只有 fetch_date 當天）
+            last_checked DATE,
+            FOREIGN KEY (post_id) REFERENCES posts (post_id),
+            UNIQUE(post_id, fetch_date)
+        );
+    """)
+
+    # 4b. refresh_queue - 貼文 insights 更新排程（依貼文年齡與成長趨勢決定下次更新日）
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS refresh_queue (
+            post_id TEXT PRIMARY KEY,
+            next_due_date DATE NOT NULL,
+            interval_days INTEGER,
+            reason TEXT,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (post_id) REFERENCES posts (post_id)
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_refresh_queue_due ON refresh_queue(next_due_date);")
+
+    # 4c. deferred_fetches - 因呼叫預算或執行期限而延後的貼文
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS deferred_fetches (
+            post_id TEXT PRIMARY KEY,
+            source TEXT,
+            reason TEXT,
+            score FLOAT,
+            deferred_at DATETIME,
+            times_deferred INTEGER DEFAULT 1,
+            FOREIGN KEY (post_id) REFERENCES posts (post_id)
+        );
+    """)
+
+    # 4d. refresh_tasks - 貼文 insights 收集工作佇列（多個 worker 以租約領取，見 collectors.work_queue）
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS refresh_tasks (
+            task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            post_id TEXT NOT NULL,
+            page_id TEXT,
+            fetch_date DATE NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            lease_owner TEXT,
+            lease_expires_at REAL,
+            available_at REAL NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            completed_at DATETIME,
+            UNIQUE(post_id, fetch_date)
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_refresh_tasks_status ON refresh_tasks(status, lease_expires_at);")
+
+    # 4e. backfill_checkpoints - 補收作業的檢查點（每個項目的狀態，見 collectors.backfill_checkpoint）
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+            job TEXT NOT NULL,
+            item_key TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (job, item_key)
+        );
+    """)
+
+    # 5. posts_classification - 內容分類表
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS posts_classification (
+            post_id TEXT PRIMARY KEY,
+            media_type TEXT,
+            has_link BOOLEAN DEFAULT 0,
+            has_hashtag BOOLEAN DEFAULT 0,
+            hashtag_count INTEGER DEFAULT 0,
+            message_length INTEGER DEFAULT 0,
+            message_length_tier TEXT,
+            word_count INTEGER DEFAULT 0,
+            topic_primary TEXT,
+            topic_secondary TEXT,
+            format_type TEXT,
+            issue_topic TEXT,
+            campaign_id TEXT,
+            sentiment_score FLOAT,
+            has_cta BOOLEAN DEFAULT 0,
+            cta_type TEXT,
+            is_sponsored BOOLEAN DEFAULT 0,
+            is_reshare BOOLEAN DEFAULT 0,
+            hour_of_day INTEGER,
+            day_of_week INTEGER,
+            week_of_year INTEGER,
+            month INTEGER,
+            is_weekend BOOLEAN DEFAULT 0,
+            time_slot TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (post_id) REFERENCES posts (post_id)
+        );
+    """)
+
+    # 6. posts_performance - 貼文表現快照表
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS posts_performance (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            post_id TEXT NOT NULL,
+            snapshot_date DATE NOT NULL,
+            engagement_rate FLOAT,
+            click_through_rate FLOAT,
+            share_rate FLOAT,
+            comment_rate FLOAT,
+            vs_page_avg_7d FLOAT,
+            vs_page_avg_30d FLOAT,
+            performance_tier TEXT,
+            percentile_rank FLOAT,
+            organic_ratio FLOAT,
+            reach_efficiency FLOAT,
+            virality_score FLOAT,
+            discussion_depth FLOAT,
+            UNIQUE(post_id, snapshot_date),
+            FOREIGN KEY (post_id) REFERENCES posts (post_id)
+        );
+    """)
+
+    # 7. analytics_summary - 聚合統計表
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS analytics_summary (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            summary_date DATE NOT NULL,
+            granularity TEXT NOT NULL,
+            time_period TEXT,
+            topic TEXT,
+            media_type TEXT,
+            time_slot TEXT,
+            day_of_week TEXT,
+            post_count INTEGER DEFAULT 0,
+            total_impressions INTEGER DEFAULT 0,
+            total_reach INTEGER DEFAULT 0,
+            total_reactions INTEGER DEFAULT 0,
+            total_comments INTEGER DEFAULT 0,
+            total_shares INTEGER DEFAULT 0,
+            total_clicks INTEGER DEFAULT 0,
+            total_video_views INTEGER DEFAULT 0,
+            avg_engagement_rate FLOAT,
+            avg_ctr FLOAT,
+            avg_reach_per_post FLOAT,
+            vs_prev_period_pct FLOAT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+    # 8. benchmarks - 成效基準表
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS benchmarks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            benchmark_type TEXT NOT NULL,
+            benchmark_key TEXT NOT NULL,
+            period TEXT NOT NULL,
+            avg_engagement_rate FLOAT,
+            median_engagement_rate FLOAT,
+            p25_engagement_rate FLOAT,
+            p75_engagement_rate FLOAT,
+            p95_engagement_rate FLOAT,
+            avg_reach FLOAT,
+            avg_reactions FLOAT,
+            avg_comments FLOAT,
+            avg_shares FLOAT,
+            avg_clicks FLOAT,
+            sample_size INTEGER,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(benchmark_type, benchmark_key, period)
+        );
+    """)
+
+    # Create indexes for analytics tables
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_classification_topic ON posts_classification(topic_primary);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_classification_media ON posts_classification(media_type);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_classification_time_slot ON posts_classification(time_slot);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_performance_tier ON posts_performance(performance_tier);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_performance_date ON posts_performance(snapshot_date);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_summary_granularity ON analytics_summary(granularity, summary_date);")
+
 def main():
     if os.path.exists(DB_PATH):
         print(f"Database {DB_PATH} already exists. Updating schema if needed...")
@@ -0,0 +1,262 @@
+"""
+post_insights snapshot 的保留政策與冷資料封存
+熱資料庫（部署時複製進映像）只保留近期的完整解析度；多年前貼文的每日 snapshot 降採樣後移至 Parquet。
+
+- 降採樣：貼文發布後 DAILY_DAYS 天內保留每日 snapshot，之後到 WEEKLY_DAYS 天每週保留一筆、再之後每月一筆
+  （保留區間內最後一筆；指標為累計值，即區間末的數值）
+- 封存：收集日早於 ARCHIVE_DAYS 天前的 snapshot 移至依年份分區、zstd 壓縮的 Parquet
+  （<ARCHIVE_DIR>/year=YYYY/part-*.parquet，檔內依 post_id 排序，讀取單一貼文時可依 row group 統計略過）
+- 封存目錄須明確設定（SNAPSHOT_ARCHIVE_DIR 環境變數或 archive_dir 參數），且應為持久儲存：
+  Cloud Run 的本機檔案系統在執行結束後即消失，資料會在刪除後遺失；未設定時只降採樣、不封存
+- 每則貼文最近 KEEP_RECENT 筆不降採樣也不封存（post_latest_metrics 與 refresh_scheduler 讀取最近的收集結果）；
+  post_latest_metrics 不受影響，best_* 仍為完整歷史的最大值
+- 先寫入 Parquet（暫存檔 + os.replace）再刪除資料庫中的列；中途失敗時兩邊可能重複，讀取時以資料庫為準並去除重複
+- 讀取：read_archived_snapshots；analytics_trends.get_post_lifecycle_curve 會自動合併冷熱資料
+- 封存需要 pyarrow；未安裝時只執行降採樣
+
+用法:
+    python -m utils.snapshot_archive --archive-dir data/archive/post_insights   # 降採樣 + 封存
+    python -m utils.snapshot_archive --vacuum   # 完成後 VACUUM 縮小資料庫檔案（建置映像前執行）
+"""
+
+import os
+import uuid
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from utils import db_utils
+from utils.db_utils import SNAPSHOT_METRIC_COLUMNS
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# 封存目錄（持久儲存）；未設定時不封存
+ARCHIVE_DIR = os.environ.get('SNAPSHOT_ARCHIVE_DIR')
+
+# 貼文發布後保留每日 snapshot 的天數；之後到 WEEKLY_DAYS 天每週一筆，再之後每月一筆
+DAILY_DAYS = 90
+WEEKLY_DAYS = 365
+
+# 收集日早於此天數的 snapshot 移至 Parquet
+ARCHIVE_DAYS = 730
+
+# 每則貼文最近的 snapshot 數，不降採樣也不封存
+KEEP_RECENT = 2
+
+# 封存時每次從資料庫讀取的列數（每批寫成一個 row group）
+ARCHIVE_CHUNK = 100_000
+
+ARCHIVE_COLUMNS = ['post_id', 'fetch_date'] + SNAPSHOT_METRIC_COLUMNS + ['last_checked']
+
+# 每筆 snapshot 的貼文年齡（發布後天數；缺 created_time 時以第一筆 snapshot 起算）與新到舊的序號
+_RANKED = """
+    births AS (
+        SELECT s.post_key, COALESCE(MIN(p.created_ts) / 86400, MIN(s.day)) AS birth
+        FROM post_insights_store s
+        JOIN post_keys k ON k.post_key = s.post_key
+        LEFT JOIN posts p ON p.post_id = k.post_id
+        GROUP BY s.post_key
+    ),
+    ranked AS (
+        SELECT s.post_key, s.day, s.day - b.birth AS age,
+               ROW_NUMBER() OVER (PARTITION BY s.post_key ORDER BY s.day DESC) AS recent
+        FROM post_insights_store s JOIN births b ON b.post_key = s.post_key
+    )
+"""
+
+
+def _schema():
+    return pa.schema([('post_id', pa.string()), ('fetch_date', pa.string())] +
+                     [(col, pa.int64()) for col in SNAPSHOT_METRIC_COLUMNS] +
+                     [('last_checked', pa.string())])
+
+
+def _begin(conn):
+    # DDL（暫存表、trigger）不會自動開始交易，需明確開始
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    conn.execute("DROP TABLE IF EXISTS temp.retention_rows")
+
+
+def _delete_rows(conn, commit: bool) -> int:
+    """
+    刪除 temp.retention_rows 列出的 snapshot
+
+    保留政策不刪除每則貼文最新的 snapshot，也不應降低 best_*；post_latest_metrics 的 delete trigger
+    會逐列重新計算整則貼文，大量刪除時很慢，因此在同一個交易中暫時移除（其他連線看不到中間狀態）
+    """
+    name = 'trg_post_latest_metrics_delete'
+    trigger_sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                               (name,)).fetchone()[0]
+    try:
+        conn.execute(f"DROP TRIGGER {name}")
+        deleted = conn.execute("""
+            DELETE FROM post_insights_store
+            WHERE (post_key, day) IN (SELECT post_key, day FROM temp.retention_rows)
+        """).rowcount
+        conn.execute(trigger_sql)
+        conn.execute("DROP TABLE temp.retention_rows")
+    except Exception:
+        conn.rollback()
+        raise
+    if commit:
+        conn.commit()
+    return deleted
+
+
+def downsample_snapshots(conn, daily_days: int = DAILY_DAYS, weekly_days: int = WEEKLY_DAYS,
+                         commit: bool = True) -> int:
+    """
+    依貼文年齡降採樣：daily_days 天內保留每日，weekly_days 天內每週（週一起算）一筆，之後每月一筆
+
+    Returns:
+        刪除的 snapshot 數
+    """
+    _begin(conn)
+    conn.execute(f"""
+        CREATE TEMP TABLE retention_rows AS
+        WITH {_RANKED},
+        bucketed AS (
+            SELECT post_key, day, recent,
+                   CASE WHEN age < ? THEN 'd' || day
+                        WHEN age < ? THEN 'w' || ((day + 3) / 7)
+                        ELSE 'm' || substr(date(day + 2440587.5), 1, 7) END AS bucket
+            FROM ranked
+        )
+        SELECT post_key, day FROM (
+            SELECT post_key, day, recent,
+                   ROW_NUMBER() OVER (PARTITION BY post_key, bucket ORDER BY day DESC) AS rn
+            FROM bucketed
+        )
+        WHERE rn > 1 AND recent > ?
+    """, (daily_days, weekly_days, KEEP_RECENT))
+    return _delete_rows(conn, commit)
+
+
+def archive_snapshots(conn, today: Optional[date] = None, archive_days: int = ARCHIVE_DAYS,
+                      archive_dir: Optional[str] = None, commit: bool = True) -> int:
+    """
+    把收集日早於 today - archive_days 的 snapshot 寫入 Parquet 後從資料庫刪除
+
+    每年份分區每次執行新增一個檔案（不改寫既有檔案）
+
+    Args:
+        archive_dir: 封存目錄（預設 ARCHIVE_DIR）；兩者皆未設定時不封存
+
+    Returns:
+        封存的 snapshot 數
+    """
+    archive_dir = archive_dir or ARCHIVE_DIR
+    if not archive_dir:
+        print("⚠ 未設定封存目錄，略過 snapshot 封存 (設定 SNAPSHOT_ARCHIVE_DIR 為持久儲存的路徑)")
+        return 0
+    if not PYARROW_AVAILABLE:
+        print("⚠ 未安裝 pyarrow，略過 snapshot 封存 (pip install pyarrow)")
+        return 0
+
+    today = today or date.today()
+    cutoff = (today - timedelta(days=archive_days) - date(1970, 1, 1)).days
+
+    _begin(conn)
+    conn.execute(f"""
+        CREATE TEMP TABLE retention_rows AS
+        WITH {_RANKED}
+        SELECT post_key, day FROM ranked WHERE day < ? AND recent > ?
+    """, (cutoff, KEEP_RECENT))
+
+    schema = _schema()
+    years = [row[0] for row in conn.execute(
+        "SELECT DISTINCT substr(date(day + 2440587.5), 1, 4) FROM temp.retention_rows ORDER BY 1")]
+    name = f"part-{today.isoformat()}-{uuid.uuid4().hex[:8]}.parquet"
+    for year in years:
+        cursor = conn.execute(f"""
+            SELECT k.post_id, date(s.day + 2440587.5),
+                   {', '.join(f's.{col}' for col in SNAPSHOT_METRIC_COLUMNS)},
+                   date(s.last_checked + 2440587.5)
+            FROM temp.retention_rows r
+            JOIN post_insights_store s ON s.post_key = r.post_key AND s.day = r.day
+            JOIN post_keys k ON k.post_key = s.post_key
+            WHERE substr(date(r.day + 2440587.5), 1, 4) = ?
+            ORDER BY k.post_id, s.day
+        """, (year,))
+        directory = os.path.join(archive_dir, f'year={year}')
+        os.makedirs(directory, exist_ok=True)
+        # 以 . 開頭的暫存檔不會被讀取端列入
+        tmp_path = os.path.join(directory, f'.{name}.tmp')
+        try:
+            with pq.ParquetWriter(tmp_path, schema, compression='zstd') as writer:
+                while True:
+                    rows = cursor.fetchmany(ARCHIVE_CHUNK)
+                    if not rows:
+                        break
+                    writer.write_table(pa.Table.from_pylist(
+                        [dict(zip(ARCHIVE_COLUMNS, row)) for row in rows], schema=schema))
+            os.replace(tmp_path, os.path.join(directory, name))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            conn.rollback()
+            raise
+
+    return _delete_rows(conn, commit)
+
+
+def read_archived_snapshots(post_id: str, archive_dir: Optional[str] = None) -> List[Dict]:
+    """
+    單一貼文已封存的 snapshot（依 fetch_date 排序，欄位同 post_insights_snapshots，不含 id）
+
+    未設定封存目錄、尚未封存或未安裝 pyarrow 時回傳空列表
+    """
+    archive_dir = archive_dir or ARCHIVE_DIR
+    if not archive_dir or not os.path.isdir(archive_dir):
+        return []
+    if not PYARROW_AVAILABLE:
+        print("⚠ 未安裝 pyarrow，無法讀取封存的 snapshot")
+        return []
+    dataset = ds.dataset(archive_dir, schema=_schema(), format='parquet', partitioning='hive')
+    table = dataset.to_table(columns=ARCHIVE_COLUMNS, filter=ds.field('post_id') == post_id)
+    # 重試封存時可能重複寫入同一筆
+    rows = {row['fetch_date']: row for row in table.to_pylist()}
+    return [rows[fetch_date] for fetch_date in sorted(rows)]
+
+
+def run_retention(conn, today: Optional[date] = None, archive_dir: Optional[str] = None,
+                  vacuum: bool = False) -> Dict:
+    """
+    執行保留政策：先降採樣，再封存超過期限的 snapshot
+
+    Args:
+        vacuum: 完成後 VACUUM，釋放刪除的頁面以縮小資料庫檔案
+
+    Returns:
+        {'downsampled': 刪除的列數, 'archived': 封存的列數}
+    """
+    downsampled = downsample_snapshots(conn)
+    print(f"✓ 降採樣: 刪除 {downsampled} 筆 snapshot")
+    archived = archive_snapshots(conn, today, archive_dir=archive_dir)
+    if archived:
+        print(f"✓ 封存: {archived} 筆 snapshot → {archive_dir or ARCHIVE_DIR}")
+    if vacuum:
+        conn.execute("VACUUM")
+        # WAL 模式下 VACUUM 寫入 WAL，checkpoint 後資料庫檔案才會縮小
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        print("✓ VACUUM 完成")
+    return {'downsampled': downsampled, 'archived': archived}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='post_insights snapshot 降採樣與 Parquet 封存')
+    parser.add_argument('--archive-dir', default=None, help='封存目錄，應為持久儲存 (預設: SNAPSHOT_ARCHIVE_DIR；未設定時不封存)')
+    parser.add_argument('--vacuum', action='store_true', help='完成後 VACUUM 縮小資料庫檔案')
+    args = parser.parse_args()
+
+    conn = db_utils.get_db_connection()
+    run_retention(conn, archive_dir=args.archive_dir, vacuum=args.vacuum)
+    conn.close()